@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import asyncio
+import datetime as dt
+import logging
+import time
+
+import httpx
+from sqlalchemy import or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.llm_proxy import extract_content_generation_status_and_usage
+from app.api.metrics import observe_usage_tokens
+from app.core.config import settings
+from app.db import SessionLocal
+from app.models.llm_channel import LlmChannel
+from app.models.llm_content_generation_task import CONTENT_GENERATION_TERMINAL_STATUSES, LlmContentGenerationTask
+from app.storage.content_generation_tasks import (
+    ContentGenerationResult,
+    is_terminal_content_generation_status,
+    next_content_generation_poll_delay_seconds,
+    settle_content_generation_task,
+)
+from app.storage.models_db import get_model_config, resolve_usage_pricing
+
+logger = logging.getLogger(__name__)
+
+POLL_BATCH_SIZE = 100
+
+_http_client: httpx.AsyncClient | None = None
+
+
+def _get_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        concurrency = max(1, int(settings.content_generation_poll_concurrency or 1))
+        _http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(20.0, connect=10.0),
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+        )
+    return _http_client
+
+
+async def close_content_generation_poll_client() -> None:
+    global _http_client
+    client, _http_client = _http_client, None
+    if client is not None and not client.is_closed:
+        await client.aclose()
+
+
+async def _due_task_ids(session: AsyncSession, *, now: dt.datetime, limit: int) -> list[str]:
+    max_age = dt.timedelta(hours=max(1, int(settings.content_generation_poll_max_age_hours or 24)))
+    rows = (
+        await session.execute(
+            select(LlmContentGenerationTask.upstream_task_id)
+            .where(
+                LlmContentGenerationTask.result_status_code.is_(None),
+                LlmContentGenerationTask.channel_id.is_not(None),
+                or_(
+                    LlmContentGenerationTask.status.is_(None),
+                    LlmContentGenerationTask.status.not_in(CONTENT_GENERATION_TERMINAL_STATUSES),
+                ),
+                LlmContentGenerationTask.created_at >= now - max_age,
+                or_(
+                    LlmContentGenerationTask.next_poll_at.is_(None),
+                    LlmContentGenerationTask.next_poll_at <= now,
+                ),
+            )
+            .order_by(LlmContentGenerationTask.next_poll_at.asc().nulls_first())
+            .limit(limit)
+        )
+    ).all()
+    return [str(row[0]) for row in rows]
+
+
+async def poll_content_generation_task(task_id: str) -> None:
+    async with SessionLocal() as session:
+        row = await session.get(LlmContentGenerationTask, task_id)
+        if row is None or row.result_status_code is not None or is_terminal_content_generation_status(row.status):
+            return
+        channel = await session.get(LlmChannel, row.channel_id) if row.channel_id is not None else None
+        now = dt.datetime.now(dt.timezone.utc)
+        attempts = int(row.poll_attempts or 0) + 1
+        row.poll_attempts = attempts
+        row.next_poll_at = now + dt.timedelta(seconds=next_content_generation_poll_delay_seconds(attempts))
+        if channel is None or channel.org_id != row.org_id:
+            # Tasks without a channel are never due, so this parks the task instead of re-polling it.
+            row.channel_id = None
+            row.next_poll_at = None
+            await session.commit()
+            return
+        org_id, user_id, api_key_id, channel_id, model_id = (
+            row.org_id,
+            row.user_id,
+            row.api_key_id,
+            row.channel_id,
+            str(row.model_id),
+        )
+        cfg = await get_model_config(session, org_id=org_id, model_id=model_id)
+        pricing = await resolve_usage_pricing(session, org_id=org_id, cfg=cfg, model_id=model_id)
+        upstream_url = f"{str(channel.base_url).rstrip('/')}/contents/generations/tasks/{task_id}"
+        upstream_api_key = str(channel.api_key)
+        # Commit the next poll time before the upstream call so a slow provider never pins a transaction.
+        await session.commit()
+
+    started = time.perf_counter()
+    try:
+        res = await _get_http_client().get(
+            upstream_url,
+            headers={"authorization": f"Bearer {upstream_api_key}", "accept": "application/json"},
+        )
+    except httpx.HTTPError as exc:
+        logger.warning("content generation poll: %s failed: %s", task_id, type(exc).__name__)
+        return
+    total_ms = int((time.perf_counter() - started) * 1000)
+    if res.status_code >= 400:
+        logger.info("content generation poll: %s returned %s", task_id, res.status_code)
+        return
+
+    body = res.content
+    status, usage_tokens = extract_content_generation_status_and_usage(body)
+    input_tokens, cached_tokens, output_tokens, total_tokens, cost_micros = await settle_content_generation_task(
+        task_id=task_id,
+        org_id=org_id,
+        user_id=user_id,
+        api_key_id=api_key_id,
+        channel_id=channel_id,
+        model_id=model_id,
+        pricing=pricing,
+        source_ip=None,
+        status=status,
+        usage_tokens=usage_tokens,
+        result=ContentGenerationResult(
+            status_code=int(res.status_code),
+            content_type=res.headers.get("content-type") or "application/json",
+            body=body,
+        ),
+        status_code=int(res.status_code),
+        total_duration_ms=total_ms,
+        ttft_ms=total_ms,
+        request_endpoint=f"{settings.api_prefix}/contents/generations/tasks/{task_id}",
+    )
+    # No client response here, so only the settled tokens and spend are counted.
+    if total_tokens > 0:
+        observe_usage_tokens(
+            model_id=model_id,
+            input_tokens=input_tokens,
+            cached_tokens=cached_tokens,
+            output_tokens=output_tokens,
+            cost_usd_micros=cost_micros,
+        )
+
+
+async def poll_due_content_generation_tasks(*, limit: int = POLL_BATCH_SIZE) -> int:
+    now = dt.datetime.now(dt.timezone.utc)
+    async with SessionLocal() as session:
+        task_ids = await _due_task_ids(session, now=now, limit=limit)
+    semaphore = asyncio.Semaphore(max(1, int(settings.content_generation_poll_concurrency or 1)))
+
+    async def poll_one(task_id: str) -> None:
+        async with semaphore:
+            try:
+                await poll_content_generation_task(task_id)
+            except Exception:
+                logger.exception("content generation poll: task %s failed", task_id)
+
+    await asyncio.gather(*(poll_one(task_id) for task_id in task_ids))
+    return len(task_ids)
+
+
+async def run_content_generation_poll_worker(stop_event: asyncio.Event) -> None:
+    interval = max(1, int(settings.content_generation_poll_interval_seconds or 2))
+    try:
+        while not stop_event.is_set():
+            if settings.content_generation_poll_enabled:
+                try:
+                    await poll_due_content_generation_tasks()
+                except Exception:
+                    logger.exception("content generation poll worker failed")
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                continue
+    finally:
+        await close_content_generation_poll_client()
@@ -1,13 +1,26 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field, replace
+import json
+from typing import Callable
 import uuid
 
+from app.pricing import UsagePricing
+from app.rate_limit import RateLimitGrant
+
 
 @dataclass(frozen=True)
-class UsagePricing:
-    input_usd_micros_per_m: int | None
-    output_usd_micros_per_m: int | None
+class UpstreamTarget:
+    channel_id: uuid.UUID | None
+    base_url: str
+    api_key: str
+    # Set on hedge candidates so a key is only taken from the channel's rotation once the hedge starts.
+    pick_api_key: Callable[[], str] | None = field(default=None, compare=False, repr=False)
+
+    def with_picked_key(self) -> UpstreamTarget:
+        if self.pick_api_key is None:
+            return self
+        return replace(self, api_key=self.pick_api_key(), pick_api_key=None)
 
 
 @dataclass(frozen=True)
@@ -22,26 +35,119 @@ class LlmProxyContext:
     upstream_api_key: str
     pricing: UsagePricing
     channel_id: uuid.UUID | None = None
+    rate_limit_grant: RateLimitGrant | None = None
+    response_cache_enabled: bool = False
+    # Other eligible channels a slow stream may be hedged onto, and the model's configured TTFT deadline.
+    hedge_targets: tuple[UpstreamTarget, ...] = ()
+    hedge_ttft_ms: int | None = None
+
+
+def primary_upstream_target(context: LlmProxyContext) -> UpstreamTarget:
+    return UpstreamTarget(
+        channel_id=context.channel_id,
+        base_url=context.upstream_base_url,
+        api_key=context.upstream_api_key,
+    )
+
+
+def _safe_int(value: object) -> int:
+    try:
+        return int(value)  # type: ignore[arg-type]
+    except Exception:
+        return 0
+
+
+def _sum_usage_token_fields(usage: dict, fields: tuple[str, ...]) -> int:
+    total = 0
+    for name in fields:
+        total += max(_safe_int(usage.get(name) or 0), 0)
+    return total
+
+
+def extract_usage_tokens(obj: dict) -> tuple[int, int, int, int] | None:
+    usage = obj.get("usage")
+    if not isinstance(usage, dict):
+        message = obj.get("message")
+        if isinstance(message, dict):
+            usage = message.get("usage")
+    if not isinstance(usage, dict):
+        response = obj.get("response")
+        if isinstance(response, dict):
+            usage = response.get("usage")
+    if not isinstance(usage, dict):
+        return None
+
+    # OpenAI chat.completions usage
+    if "prompt_tokens" in usage or "completion_tokens" in usage:
+        prompt = _safe_int(usage.get("prompt_tokens") or 0)
+        completion = _safe_int(usage.get("completion_tokens") or 0)
+        total_raw = usage.get("total_tokens")
+        total = _safe_int(total_raw) if total_raw is not None else 0
+        details = usage.get("prompt_tokens_details")
+        cached = 0
+        if isinstance(details, dict):
+            cached = _safe_int(details.get("cached_tokens") or 0)
+
+        output = max(total - prompt, 0) if total > 0 else completion
+        total_tokens = total if total > 0 else (prompt + output)
+        cached_tokens = min(max(cached, 0), max(prompt, 0))
+        return prompt, cached_tokens, output, total_tokens
+
+    # OpenAI responses usage
+    if "input_tokens" in usage or "output_tokens" in usage:
+        input_tokens = max(_safe_int(usage.get("input_tokens") or 0), 0)
+        output_tokens = max(_safe_int(usage.get("output_tokens") or 0), 0)
+        total_raw = usage.get("total_tokens")
+        total_tokens = _safe_int(total_raw) if total_raw is not None else 0
+        details = usage.get("input_tokens_details")
+        cached = 0
+        if isinstance(details, dict):
+            cached = _safe_int(details.get("cached_tokens") or 0)
+
+        # Anthropic Messages usage. Claude reports cache reads/creations outside
+        # input_tokens, while this service records one input bucket plus cached.
+        anthropic_cache_read = max(_safe_int(usage.get("cache_read_input_tokens") or 0), 0)
+        anthropic_cache_creation = max(_safe_int(usage.get("cache_creation_input_tokens") or 0), 0)
+        cache_creation = usage.get("cache_creation")
+        if anthropic_cache_creation <= 0 and isinstance(cache_creation, dict):
+            anthropic_cache_creation = _sum_usage_token_fields(
+                cache_creation,
+                ("ephemeral_5m_input_tokens", "ephemeral_1h_input_tokens"),
+            )
+        has_anthropic_cache_usage = (
+            "cache_read_input_tokens" in usage
+            or "cache_creation_input_tokens" in usage
+            or isinstance(cache_creation, dict)
+        )
+        if has_anthropic_cache_usage:
+            input_tokens += anthropic_cache_read + anthropic_cache_creation
+            cached = anthropic_cache_read
+
+        if output_tokens <= 0 and total_tokens > 0:
+            output_tokens = max(total_tokens - input_tokens, 0)
+        if has_anthropic_cache_usage or total_tokens <= 0:
+            total_tokens = input_tokens + output_tokens
+
+        cached_tokens = min(max(cached, 0), max(input_tokens, 0))
+        return input_tokens, cached_tokens, output_tokens, total_tokens
 
+    return None
 
-def estimate_cost_usd_micros(
-    *,
-    pricing: UsagePricing,
-    input_tokens: int,
-    cached_tokens: int,
-    output_tokens: int,
-) -> int:
-    cost_micros = 0
 
-    if pricing.input_usd_micros_per_m is not None and input_tokens > 0:
-        cached = min(max(int(cached_tokens), 0), int(input_tokens))
-        uncached = max(int(input_tokens) - cached, 0)
-        if uncached > 0:
-            cost_micros += int((uncached * int(pricing.input_usd_micros_per_m) + 999_999) // 1_000_000)
-        if cached > 0:
-            cost_micros += int((cached * int(pricing.input_usd_micros_per_m) + 9_999_999) // 10_000_000)
+def parse_json_object(raw: bytes) -> dict | None:
+    try:
+        parsed = json.loads(raw.decode("utf-8"))
+    except Exception:
+        return None
+    return parsed if isinstance(parsed, dict) else None
 
-    if pricing.output_usd_micros_per_m is not None and output_tokens > 0:
-        cost_micros += int((int(output_tokens) * int(pricing.output_usd_micros_per_m) + 999_999) // 1_000_000)
 
-    return int(max(cost_micros, 0))
+def extract_content_generation_status_and_usage(
+    raw: bytes,
+) -> tuple[str | None, tuple[int, int, int, int] | None]:
+    obj = parse_json_object(raw)
+    if not obj:
+        return None, None
+    raw_status = obj.get("status")
+    status = raw_status.strip().lower() if isinstance(raw_status, str) and raw_status.strip() else None
+    return status, extract_usage_tokens(obj)
@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import asyncio
+import datetime as dt
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Any
+
+from app.api.metrics import EVENT_LOOP_LAG_SECONDS, EVENT_LOOP_SLOW_CALLBACKS
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+STACK_LIMIT = 30
+
+
+class LoopMonitor:
+    """Samples event loop lag and captures the stack of whatever blocks the loop past `slow_callback_ms`.
+
+    The loop side only runs one timer per interval; a daemon watchdog thread notices a missed timer and
+    snapshots the loop thread's frame while the blocking code is still on it.
+    """
+
+    def __init__(self, *, interval_ms: int, slow_callback_ms: int, buffer_size: int) -> None:
+        self.interval_s = max(int(interval_ms), 1) / 1000
+        self.slow_s = max(int(slow_callback_ms), 1) / 1000
+        self.samples = 0
+        self.lag_total_s = 0.0
+        self.lag_max_s = 0.0
+        self.last_lag_s = 0.0
+        self.slow_total = 0
+        self.slow_callbacks: deque[dict[str, Any]] = deque(maxlen=max(int(buffer_size), 1))
+        self._lock = threading.Lock()
+        self._last_beat = time.perf_counter()
+        self._stall: dict[str, Any] | None = None
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def beat(self, lag_s: float) -> None:
+        lag_s = max(lag_s, 0.0)
+        EVENT_LOOP_LAG_SECONDS.observe(lag_s)
+        self.samples += 1
+        self.lag_total_s += lag_s
+        self.lag_max_s = max(self.lag_max_s, lag_s)
+        self.last_lag_s = lag_s
+        with self._lock:
+            self._last_beat = time.perf_counter()
+            stall, self._stall = self._stall, None
+        if stall is None:
+            return
+        stall["lagMs"] = round(lag_s * 1000, 1)
+        EVENT_LOOP_SLOW_CALLBACKS.inc()
+        logger.warning("event loop blocked for %.0fms; stack at detection:\n%s", lag_s * 1000, stall["stack"])
+
+    def check(self, loop_thread_id: int) -> None:
+        with self._lock:
+            if self._stall is not None:
+                return
+            blocked_s = time.perf_counter() - self._last_beat - self.interval_s
+            if blocked_s < self.slow_s:
+                return
+            frame = sys._current_frames().get(loop_thread_id)
+            self._stall = {
+                "at": dt.datetime.now(dt.timezone.utc).isoformat(),
+                "blockedMs": round(blocked_s * 1000, 1),
+                "lagMs": None,
+                "stack": "".join(traceback.format_stack(frame, limit=STACK_LIMIT)) if frame is not None else "",
+            }
+            self.slow_callbacks.append(self._stall)
+            self.slow_total += 1
+
+    def start_watchdog(self, loop_thread_id: int) -> None:
+        check_interval_s = max(self.slow_s / 4, 0.005)
+
+        def watch() -> None:
+            while not self._stop.wait(check_interval_s):
+                self.check(loop_thread_id)
+
+        self._thread = threading.Thread(target=watch, name="uni-loop-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop_watchdog(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            items = [dict(item) for item in reversed(self.slow_callbacks)]
+        return {
+            "running": self._thread is not None and self._thread.is_alive(),
+            "intervalMs": round(self.interval_s * 1000),
+            "slowCallbackMs": round(self.slow_s * 1000),
+            "lag": {
+                "samples": self.samples,
+                "lastMs": round(self.last_lag_s * 1000, 1),
+                "meanMs": round(self.lag_total_s * 1000 / self.samples, 2) if self.samples else 0.0,
+                "maxMs": round(self.lag_max_s * 1000, 1),
+            },
+            "slowCallbacks": {"total": self.slow_total, "items": items},
+        }
+
+
+_monitor: LoopMonitor | None = None
+
+
+def loop_monitor_stats() -> dict[str, Any]:
+    if _monitor is None:
+        return {"running": False}
+    return _monitor.stats()
+
+
+async def run_loop_monitor(stop_event: asyncio.Event) -> None:
+    global _monitor
+    if not settings.loop_monitor_enabled:
+        return
+    monitor = LoopMonitor(
+        interval_ms=settings.loop_monitor_interval_ms,
+        slow_callback_ms=settings.loop_slow_callback_ms,
+        buffer_size=settings.loop_slow_callback_buffer_size,
+    )
+    _monitor = monitor
+    monitor.start_watchdog(threading.get_ident())
+    try:
+        while not stop_event.is_set():
+            due = time.perf_counter() + monitor.interval_s
+            await asyncio.sleep(monitor.interval_s)
+            monitor.beat(time.perf_counter() - due)
+    finally:
+        monitor.stop_watchdog()
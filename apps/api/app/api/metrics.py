@@ -0,0 +1,285 @@
+from __future__ import annotations
+
+import bisect
+import logging
+import math
+import re
+import uuid
+from abc import ABC, abstractmethod
+from typing import Callable, Iterable
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+OVERFLOW_LABEL = "__other__"
+_INF_BUCKET = 'le="+Inf"'
+
+# Seconds; covers fast cache hits through long generations.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+OVERHEAD_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+_ID_SEGMENT = re.compile(r"^(?=.*\d)[A-Za-z0-9_\-.:]{16,}$")
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def route_label(path: str | None) -> str:
+    """Collapses id-like path segments so task and object ids never become label values."""
+    raw = (path or "").split("?", 1)[0].strip()
+    if not raw:
+        return "unknown"
+    return "/".join("{id}" if _ID_SEGMENT.match(segment) else segment for segment in raw.split("/"))
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, label_names: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self._series: dict[tuple[str, ...], object] = {}
+
+    def _key(self, labels: dict[str, object]) -> tuple[str, ...]:
+        key = tuple(str(labels.get(name, "") or "") for name in self.label_names)
+        if key in self._series:
+            return key
+        # Past the per-metric series budget new label sets share one overflow series.
+        if len(self._series) >= max(int(settings.metrics_max_series_per_metric or 0), 1):
+            return tuple(OVERFLOW_LABEL for _ in self.label_names)
+        return key
+
+    def _header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    @abstractmethod
+    def render(self) -> list[str]: ...
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels: object) -> None:
+        if amount < 0:
+            return
+        key = self._key(labels)
+        self._series[key] = float(self._series.get(key, 0.0)) + amount
+
+    def set_total(self, value: float, **labels: object) -> None:
+        """Mirrors a running total that is counted elsewhere; used by scrape-time collectors."""
+        self._series[self._key(labels)] = float(value)
+
+    def value(self, **labels: object) -> float:
+        return float(self._series.get(self._key(labels), 0.0))
+
+    def render(self) -> list[str]:
+        lines = self._header()
+        for key, value in self._series.items():
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {_format_value(float(value))}")
+        return lines
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: object) -> None:
+        self._series[self._key(labels)] = float(value)
+
+    def inc(self, amount: float = 1, **labels: object) -> None:
+        key = self._key(labels)
+        self._series[key] = float(self._series.get(key, 0.0)) + amount
+
+    def dec(self, amount: float = 1, **labels: object) -> None:
+        self.inc(-amount, **labels)
+
+    def value(self, **labels: object) -> float:
+        return float(self._series.get(self._key(labels), 0.0))
+
+    def render(self) -> list[str]:
+        lines = self._header()
+        for key, value in self._series.items():
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {_format_value(float(value))}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: tuple[str, ...] = (),
+        *,
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels: object) -> None:
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [[0] * len(self.buckets), 0, 0.0]
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[0][index] += 1
+        series[1] += 1
+        series[2] += max(float(value), 0.0)
+
+    def count(self, **labels: object) -> int:
+        series = self._series.get(self._key(labels))
+        return int(series[1]) if series else 0
+
+    def render(self) -> list[str]:
+        lines = self._header()
+        for key, (bucket_counts, count, total) in self._series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, _INF_BUCKET)} {count}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(total)}")
+        return lines
+
+
+_METRICS: list[_Metric] = []
+_COLLECTORS: list[Callable[[], None]] = []
+
+
+def _register(metric: _Metric) -> _Metric:
+    _METRICS.append(metric)
+    return metric
+
+
+def register_collector(collect: Callable[[], None]) -> None:
+    """`collect` runs on every scrape to refresh gauges that mirror state kept elsewhere."""
+    _COLLECTORS.append(collect)
+
+
+def render_metrics() -> str:
+    for collect in _COLLECTORS:
+        try:
+            collect()
+        except Exception:
+            logger.exception("metrics: collector failed")
+    lines: list[str] = []
+    for metric in _METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def _counter(name: str, documentation: str, label_names: Iterable[str] = ()) -> Counter:
+    return _register(Counter(name, documentation, tuple(label_names)))  # type: ignore[return-value]
+
+
+def _gauge(name: str, documentation: str, label_names: Iterable[str] = ()) -> Gauge:
+    return _register(Gauge(name, documentation, tuple(label_names)))  # type: ignore[return-value]
+
+
+def _histogram(
+    name: str, documentation: str, label_names: Iterable[str] = (), *, buckets: tuple[float, ...] = LATENCY_BUCKETS
+) -> Histogram:
+    return _register(Histogram(name, documentation, tuple(label_names), buckets=buckets))  # type: ignore[return-value]
+
+
+_PROXY_LABELS = ("route", "model", "channel")
+
+UPSTREAM_TTFT_SECONDS = _histogram(
+    "uni_upstream_ttft_seconds", "Time from upstream send to the first response byte.", _PROXY_LABELS
+)
+UPSTREAM_DURATION_SECONDS = _histogram(
+    "uni_upstream_duration_seconds", "Time from upstream send to the end of the response.", _PROXY_LABELS
+)
+GATEWAY_OVERHEAD_SECONDS = _histogram(
+    "uni_gateway_overhead_seconds",
+    "Time from request arrival to the upstream send.",
+    _PROXY_LABELS,
+    buckets=OVERHEAD_BUCKETS,
+)
+PROXY_RESPONSES = _counter(
+    "uni_proxy_responses_total", "Proxied requests by final status code.", ("route", "model", "code")
+)
+UPSTREAM_ERRORS = _counter(
+    "uni_upstream_errors_total", "Upstream requests that failed before a response.", ("route", "model", "channel")
+)
+PROXY_TOKENS = _counter("uni_proxy_tokens_total", "Tokens recorded on proxied requests.", ("model", "kind"))
+PROXY_SPEND_USD_MICROS = _counter("uni_proxy_spend_usd_micros_total", "Spend recorded on proxied requests.", ("model",))
+STREAMS_IN_FLIGHT = _gauge("uni_streams_in_flight", "Streaming responses currently being relayed.")
+USAGE_WRITE_SECONDS = _histogram(
+    "uni_usage_write_seconds", "Latency of writing one usage event to the database.", buckets=OVERHEAD_BUCKETS + (5.0,)
+)
+DB_POOL_CHECKED_OUT = _gauge("uni_db_pool_checked_out", "Database connections currently checked out of the pool.")
+SINGLE_FLIGHT_CALLS = _counter(
+    "uni_single_flight_calls_total", "Coalescable non-stream upstream calls by outcome.", ("outcome",)
+)
+SINGLE_FLIGHT_IN_FLIGHT = _gauge("uni_single_flight_in_flight", "Upstream calls currently open for sharing.")
+BACKGROUND_QUEUE_DEPTH = _gauge(
+    "uni_background_queue_depth", "Items waiting in in-process background queues.", ("queue",)
+)
+EVENT_LOOP_LAG_SECONDS = _histogram(
+    "uni_event_loop_lag_seconds", "How late the event loop ran the lag sampler's timer.", buckets=OVERHEAD_BUCKETS
+)
+EVENT_LOOP_SLOW_CALLBACKS = _counter(
+    "uni_event_loop_slow_callbacks_total", "Times the event loop was blocked longer than loop_slow_callback_ms."
+)
+
+
+def observe_usage_tokens(
+    *, model_id: str, input_tokens: int, cached_tokens: int, output_tokens: int, cost_usd_micros: int
+) -> None:
+    PROXY_TOKENS.inc(max(input_tokens - cached_tokens, 0), model=model_id, kind="input")
+    PROXY_TOKENS.inc(max(cached_tokens, 0), model=model_id, kind="cached")
+    PROXY_TOKENS.inc(max(output_tokens, 0), model=model_id, kind="output")
+    PROXY_SPEND_USD_MICROS.inc(max(cost_usd_micros, 0), model=model_id)
+
+
+def observe_usage_metrics(
+    *,
+    route: str,
+    model_id: str,
+    channel_id: uuid.UUID | None,
+    status_code: int,
+    input_tokens: int,
+    cached_tokens: int,
+    output_tokens: int,
+    cost_usd_micros: int,
+    total_duration_ms: int,
+    ttft_ms: int,
+) -> None:
+    PROXY_RESPONSES.inc(route=route, model=model_id, code=str(status_code))
+    observe_usage_tokens(
+        model_id=model_id,
+        input_tokens=input_tokens,
+        cached_tokens=cached_tokens,
+        output_tokens=output_tokens,
+        cost_usd_micros=cost_usd_micros,
+    )
+    # Cache hits and client disconnects never measured an upstream round trip.
+    if channel_id is None or status_code == 499:
+        return
+    labels = {"route": route, "model": model_id, "channel": str(channel_id)}
+    UPSTREAM_DURATION_SECONDS.observe(max(total_duration_ms, 0) / 1000, **labels)
+    if ttft_ms > 0:
+        UPSTREAM_TTFT_SECONDS.observe(ttft_ms / 1000, **labels)
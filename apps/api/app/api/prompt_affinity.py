@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Callable, TypeVar
+
+from app.core.config import settings
+
+_T = TypeVar("_T")
+
+# Leading request fields that upstream prompt caches key on, in the order providers assemble them.
+_PREFIX_FIELDS = ("tools", "system", "instructions")
+_CONVERSATION_FIELDS = ("messages", "input")
+
+
+@dataclass
+class _ChannelState:
+    requests: int = 0
+    input_tokens: int = 0
+    cached_tokens: int = 0
+    consecutive_failures: int = 0
+    last_failure_at: float = 0.0
+
+
+_CHANNELS: dict[uuid.UUID, _ChannelState] = {}
+_STATS = {"routed": 0, "preferred": 0, "fallbacks": 0}
+
+
+def _leading_turns(conversation: object) -> object:
+    if not isinstance(conversation, list):
+        return conversation
+    # Everything up to the first user turn is shared by every later turn of the conversation.
+    for index, item in enumerate(conversation):
+        if isinstance(item, dict) and item.get("role") not in {"system", "developer"}:
+            return conversation[: index + 1]
+    return conversation
+
+
+def prompt_prefix_fingerprint(payload: dict[str, object] | None) -> str | None:
+    if not isinstance(payload, dict):
+        return None
+    prefix: dict[str, object] = {name: payload[name] for name in _PREFIX_FIELDS if name in payload}
+    for name in _CONVERSATION_FIELDS:
+        if name in payload:
+            prefix[name] = _leading_turns(payload[name])
+    if not prefix:
+        return None
+    try:
+        encoded = json.dumps(prefix, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    except (TypeError, ValueError):
+        return None
+    limit = int(settings.prompt_affinity_prefix_chars or 0)
+    if limit > 0:
+        encoded = encoded[:limit]
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def prompt_affinity_key(
+    payload: dict[str, object] | None, *, api_key_id: uuid.UUID, user_id: uuid.UUID
+) -> str | None:
+    if not settings.prompt_affinity_enabled:
+        return None
+    fingerprint = prompt_prefix_fingerprint(payload)
+    if fingerprint is None:
+        return None
+    scope = user_id if (settings.prompt_affinity_scope or "").strip().lower() == "user" else api_key_id
+    return f"{scope}:{fingerprint}"
+
+
+def _rendezvous_weight(key: str, channel_id: object) -> bytes:
+    return hashlib.sha256(f"{key}|{channel_id}".encode("utf-8")).digest()
+
+
+def order_by_affinity(
+    candidates: list[_T],
+    *,
+    key: str,
+    id_of: Callable[[_T], object],
+    healthy: Callable[[_T], bool],
+) -> list[_T]:
+    """Orders candidates by rendezvous hash of `key`, moving the first healthy one to the front.
+
+    Adding or removing a channel only remaps the conversations that hashed to it.
+    """
+    if len(candidates) < 2:
+        return list(candidates)
+    ranked = sorted(candidates, key=lambda c: _rendezvous_weight(key, id_of(c)), reverse=True)
+    _STATS["routed"] += 1
+    for index, candidate in enumerate(ranked):
+        if healthy(candidate):
+            _STATS["preferred" if index == 0 else "fallbacks"] += 1
+            return [candidate, *ranked[:index], *ranked[index + 1 :]]
+    _STATS["preferred"] += 1
+    return ranked
+
+
+def _channel_state(channel_id: uuid.UUID) -> _ChannelState:
+    state = _CHANNELS.get(channel_id)
+    if state is None:
+        state = _CHANNELS[channel_id] = _ChannelState()
+    return state
+
+
+def observe_channel_outcome(
+    channel_id: uuid.UUID, *, status_code: int, input_tokens: int = 0, cached_tokens: int = 0
+) -> None:
+    if status_code == 499:
+        return
+    state = _channel_state(channel_id)
+    if status_code == 429 or status_code >= 500:
+        state.consecutive_failures += 1
+        state.last_failure_at = time.monotonic()
+        return
+    state.consecutive_failures = 0
+    if status_code < 400:
+        state.requests += 1
+        state.input_tokens += max(int(input_tokens), 0)
+        state.cached_tokens += max(min(int(cached_tokens), int(input_tokens)), 0)
+
+
+def channel_is_healthy(channel_id: uuid.UUID | None) -> bool:
+    state = _CHANNELS.get(channel_id) if channel_id is not None else None
+    if state is None or state.consecutive_failures < max(int(settings.prompt_affinity_failure_threshold or 0), 1):
+        return True
+    return time.monotonic() - state.last_failure_at >= float(settings.prompt_affinity_failure_cooldown_seconds or 0)
+
+
+def prompt_affinity_stats() -> dict[str, object]:
+    channels = []
+    for channel_id, state in _CHANNELS.items():
+        channels.append(
+            {
+                "channelId": str(channel_id),
+                "healthy": channel_is_healthy(channel_id),
+                "consecutiveFailures": state.consecutive_failures,
+                "requests": state.requests,
+                "inputTokens": state.input_tokens,
+                "cachedTokens": state.cached_tokens,
+                "cacheHitRatio": round(state.cached_tokens / state.input_tokens, 4) if state.input_tokens else 0.0,
+            }
+        )
+    return {"enabled": bool(settings.prompt_affinity_enabled), **_STATS, "channels": channels}
+
+
+def forget_channel(channel_id: uuid.UUID) -> None:
+    _CHANNELS.pop(channel_id, None)
@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import datetime as dt
+import functools
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterator, TypeVar
+
+from fastapi import HTTPException, Request
+from starlette.responses import Response, StreamingResponse
+
+from app.api.metrics import route_label
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+TIMING_OPT_IN_HEADER = "x-uni-timing"
+# Server-Timing order; stages that did not run are omitted.
+STAGES = ("body", "parse", "auth", "resolve", "connect", "ttfb", "upstream", "finalize")
+
+_R = TypeVar("_R")
+
+
+class RequestTiming:
+    def __init__(self, *, method: str, path: str, opted_in: bool) -> None:
+        self.arrived = time.perf_counter()
+        self.method = method
+        self.route = route_label(path)
+        self.reveal = opted_in
+        self.stages: dict[str, float] = {}
+        self.model_id: str | None = None
+        self.status_code: int | None = None
+        self.stream = False
+        self.upstream_started: float | None = None
+        self.upstream_done: float | None = None
+
+    def add(self, name: str, ms: float) -> None:
+        self.stages[name] = self.stages.get(name, 0.0) + max(float(ms), 0.0)
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.arrived) * 1000
+
+    def server_timing(self) -> str:
+        parts = [f"{name};dur={self.stages[name]:.1f}" for name in STAGES if name in self.stages]
+        parts.append(f"total;dur={self.elapsed_ms():.1f}")
+        return ", ".join(parts)
+
+    def snapshot(self, total_ms: float) -> dict[str, Any]:
+        return {
+            "at": dt.datetime.now(dt.timezone.utc).isoformat(),
+            "method": self.method,
+            "route": self.route,
+            "model": self.model_id,
+            "status": self.status_code,
+            "stream": self.stream,
+            "totalMs": round(total_ms, 1),
+            "stagesMs": {name: round(self.stages[name], 1) for name in STAGES if name in self.stages},
+        }
+
+
+_current: ContextVar[RequestTiming | None] = ContextVar("uni_request_timing", default=None)
+_SLOW: deque[dict[str, Any]] = deque(maxlen=max(1, int(settings.request_timing_slow_buffer_size or 1)))
+
+
+def current_request_timing() -> RequestTiming | None:
+    return _current.get()
+
+
+@contextmanager
+def timed_stage(name: str) -> Iterator[None]:
+    timing = _current.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timing is not None:
+            timing.add(name, (time.perf_counter() - started) * 1000)
+
+
+def record_stage_ms(name: str, ms: float) -> None:
+    timing = _current.get()
+    if timing is not None:
+        timing.add(name, ms)
+
+
+def note_request_model(model_id: str, *, is_admin: bool = False) -> None:
+    timing = _current.get()
+    if timing is not None:
+        timing.model_id = model_id
+        timing.reveal = timing.reveal or is_admin
+
+
+def note_upstream_started(at: float) -> None:
+    timing = _current.get()
+    if timing is not None:
+        timing.upstream_started = at
+
+
+def note_upstream_done(at: float) -> None:
+    timing = _current.get()
+    if timing is not None:
+        timing.upstream_done = at
+
+
+def upstream_trace_extensions() -> dict[str, Any]:
+    """httpx request extensions that record connection setup (TCP + TLS) as the `connect` stage."""
+    timing = _current.get()
+    if timing is None:
+        return {}
+    connecting: dict[str, float] = {}
+
+    async def trace(event_name: str, info: dict[str, Any]) -> None:
+        _ = info
+        if event_name in {"connection.connect_tcp.started", "connection.connect_unix_socket.started"}:
+            connecting["at"] = time.perf_counter()
+        elif event_name in {"connection.connect_tcp.complete", "connection.start_tls.complete"} and connecting:
+            timing.stages["connect"] = (time.perf_counter() - connecting["at"]) * 1000
+
+    return {"trace": trace}
+
+
+def slow_request_samples() -> dict[str, Any]:
+    return {"thresholdMs": int(settings.request_timing_slow_ms or 0), "items": list(reversed(_SLOW))}
+
+
+def _finish(timing: RequestTiming, *, slow_ms: float) -> None:
+    total_ms = timing.elapsed_ms()
+    logger.info(
+        "llm request timing: method=%s route=%s model=%s status=%s stream=%s total_ms=%.1f %s",
+        timing.method,
+        timing.route,
+        timing.model_id or "-",
+        timing.status_code if timing.status_code is not None else "-",
+        "true" if timing.stream else "false",
+        total_ms,
+        " ".join(f"{name}_ms={timing.stages[name]:.1f}" for name in STAGES if name in timing.stages),
+        extra={"timing": timing.snapshot(total_ms)},
+    )
+    threshold = int(settings.request_timing_slow_ms or 0)
+    if threshold > 0 and slow_ms >= threshold:
+        _SLOW.append(timing.snapshot(total_ms))
+
+
+async def _timed_stream(timing: RequestTiming, body: AsyncIterator[Any]) -> AsyncIterator[Any]:
+    first_byte_ms: float | None = None
+    try:
+        async for chunk in body:
+            if first_byte_ms is None:
+                first_byte_ms = timing.elapsed_ms()
+                if "ttfb" not in timing.stages and timing.upstream_started is not None:
+                    timing.add("ttfb", (time.perf_counter() - timing.upstream_started) * 1000)
+            yield chunk
+    finally:
+        if timing.upstream_started is not None:
+            timing.add("upstream", (time.perf_counter() - timing.upstream_started) * 1000)
+        # A long generation is not slow; a stream is judged by how long the client waited for its first byte.
+        _finish(timing, slow_ms=first_byte_ms if first_byte_ms is not None else timing.elapsed_ms())
+
+
+def timed_proxy_request(
+    handler: Callable[..., Awaitable[_R]],
+) -> Callable[..., Awaitable[_R]]:
+    """Times the stages of one proxied request; see STAGES."""
+
+    @functools.wraps(handler)
+    async def wrapper(request: Request, *args: Any, **kwargs: Any) -> _R:
+        opt_in = (request.headers.get(TIMING_OPT_IN_HEADER) or "").strip().lower() in {"1", "true", "yes", "on"}
+        timing = RequestTiming(
+            method=str(getattr(request, "method", "") or ""),
+            path=str(getattr(getattr(request, "url", None), "path", "") or ""),
+            opted_in=opt_in,
+        )
+        token = _current.set(timing)
+        try:
+            response = await handler(request, *args, **kwargs)
+        except HTTPException as exc:
+            timing.status_code = exc.status_code
+            if timing.reveal:
+                exc.headers = {**(exc.headers or {}), "server-timing": timing.server_timing()}
+            _finish(timing, slow_ms=timing.elapsed_ms())
+            raise
+        finally:
+            _current.reset(token)
+
+        if isinstance(response, Response):
+            timing.status_code = response.status_code
+            if isinstance(response, StreamingResponse):
+                timing.stream = True
+                response.body_iterator = _timed_stream(timing, response.body_iterator)
+            elif timing.upstream_done is not None:
+                timing.add("finalize", (time.perf_counter() - timing.upstream_done) * 1000)
+            if timing.reveal:
+                response.headers["server-timing"] = timing.server_timing()
+        if not timing.stream:
+            _finish(timing, slow_ms=timing.elapsed_ms())
+        return response
+
+    return wrapper
@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Mapping
+
+from app.core.config import settings
+
+# Callers opt in per request with `x-uni-cache: on`; the model must also allow it in admin config.
+RESPONSE_CACHE_HEADER = "x-uni-cache"
+CACHEABLE_UPSTREAM_PATHS = frozenset({"/chat/completions", "/responses", "/messages"})
+_OPT_IN_VALUES = frozenset({"1", "on", "true", "yes"})
+# Forwarded request headers that change what the upstream returns for the same body.
+RESPONSE_VARY_HEADERS = ("anthropic-version", "anthropic-beta")
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    content_type: str
+    body: bytes
+    usage_tokens: tuple[int, int, int, int]
+
+
+def canonical_request_hash(
+    *,
+    model_id: str,
+    upstream_path: str,
+    raw: bytes,
+    query: str = "",
+    headers: Mapping[str, str] | None = None,
+) -> str | None:
+    try:
+        payload = json.loads(raw.decode("utf-8"))
+    except (UnicodeDecodeError, ValueError):
+        return None
+    if not isinstance(payload, dict):
+        return None
+    # Key order and whitespace do not change what the upstream computes, so they must not split the cache.
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    digest = hashlib.sha256()
+    vary = [(headers or {}).get(name) or "" for name in RESPONSE_VARY_HEADERS]
+    for part in (model_id, upstream_path, query, *vary, canonical):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def response_cache_opted_in(header_value: str | None) -> bool:
+    return (header_value or "").strip().lower() in _OPT_IN_VALUES
+
+
+def response_cache_key(
+    *,
+    org_id: uuid.UUID,
+    model_id: str,
+    upstream_path: str,
+    raw: bytes,
+    query: str = "",
+    headers: Mapping[str, str] | None = None,
+) -> str | None:
+    if upstream_path not in CACHEABLE_UPSTREAM_PATHS:
+        return None
+    digest = canonical_request_hash(
+        model_id=model_id, upstream_path=upstream_path, raw=raw, query=query, headers=headers
+    )
+    return f"{org_id}:{digest}" if digest else None
+
+
+class ResponseCache:
+    """In-process LRU of successful JSON responses, bounded by total body bytes and a TTL."""
+
+    def __init__(
+        self,
+        *,
+        max_bytes: int,
+        ttl_seconds: float,
+        max_entry_bytes: int,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._max_bytes = max(0, int(max_bytes))
+        self._ttl_seconds = max(0.0, float(ttl_seconds))
+        self._max_entry_bytes = max(0, int(max_entry_bytes))
+        self._clock = clock
+        # key -> (expires at, response)
+        self._entries: OrderedDict[str, tuple[float, CachedResponse]] = OrderedDict()
+        self._bytes = 0
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expired": 0}
+
+    def get(self, key: str) -> CachedResponse | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            self._stats["misses"] += 1
+            return None
+        expires_at, value = entry
+        if expires_at <= self._clock():
+            self._drop(key)
+            self._stats["expired"] += 1
+            self._stats["misses"] += 1
+            return None
+        self._entries.move_to_end(key)
+        self._stats["hits"] += 1
+        return value
+
+    def put(self, key: str, value: CachedResponse) -> bool:
+        size = len(value.body)
+        if self._ttl_seconds <= 0 or size > self._max_entry_bytes or size > self._max_bytes:
+            return False
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (self._clock() + self._ttl_seconds, value)
+        self._bytes += size
+        self._stats["stores"] += 1
+        while self._bytes > self._max_bytes:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self._stats["evictions"] += 1
+        return True
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> dict[str, float | int]:
+        lookups = self._stats["hits"] + self._stats["misses"]
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "maxBytes": self._max_bytes,
+            **self._stats,
+            "hitRate": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+        }
+
+    def _drop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[1].body)
+
+
+_cache: ResponseCache | None = None
+
+
+def get_response_cache() -> ResponseCache:
+    global _cache
+    if _cache is None:
+        _cache = ResponseCache(
+            max_bytes=int(settings.response_cache_max_bytes or 0),
+            ttl_seconds=int(settings.response_cache_ttl_seconds or 0),
+            max_entry_bytes=int(settings.response_cache_max_entry_bytes or 0),
+        )
+    return _cache
+
+
+def response_cache_stats() -> dict[str, float | int]:
+    return get_response_cache().stats()
@@ -1,8 +1,10 @@
 from __future__ import annotations
 
 import asyncio
-from dataclasses import dataclass
+from contextlib import suppress
+from dataclasses import dataclass, replace
 from email.parser import BytesParser
+from functools import partial
 from email.policy import default as email_policy
 import logging
 import uuid
@@ -11,6 +13,7 @@ import datetime as dt
 import secrets
 import hashlib
 import hmac
+from typing import AsyncIterator, Awaitable, Callable, TypeVar
 
 from fastapi import APIRouter, Depends, HTTPException, Request, Query
 from sqlalchemy import func, select
@@ -22,14 +25,59 @@ import httpx
 import json
 
 from app.api.client_ip import extract_request_client_ip, extract_request_client_ip_or_localhost
-from app.api.llm_proxy import LlmProxyContext, UsagePricing, estimate_cost_usd_micros
+from app.api.llm_proxy import (
+    LlmProxyContext,
+    UpstreamTarget,
+    extract_content_generation_status_and_usage,
+    extract_usage_tokens,
+    parse_json_object,
+    primary_upstream_target,
+)
+from app.api.loop_monitor import loop_monitor_stats
+from app.pricing import estimate_cost_usd_micros
+from app.api.request_timing import (
+    note_request_model,
+    note_upstream_done,
+    note_upstream_started,
+    record_stage_ms,
+    slow_request_samples,
+    timed_proxy_request,
+    timed_stage,
+    upstream_trace_extensions,
+)
+from app.api.response_cache import (
+    RESPONSE_CACHE_HEADER,
+    CachedResponse,
+    get_response_cache,
+    response_cache_key,
+    response_cache_opted_in,
+    response_cache_stats,
+)
+from app.api.single_flight import SingleFlight
+from app.api.stream_finalizer import submit_stream_finalization
+from app.api.metrics import (
+    GATEWAY_OVERHEAD_SECONDS,
+    STREAMS_IN_FLIGHT,
+    UPSTREAM_ERRORS,
+    USAGE_WRITE_SECONDS,
+    observe_usage_metrics,
+    route_label,
+)
+from app.api.prompt_affinity import (
+    channel_is_healthy,
+    forget_channel,
+    observe_channel_outcome,
+    order_by_affinity,
+    prompt_affinity_key,
+    prompt_affinity_stats,
+)
+from app.api.stream_hedging import hedge_deadline_ms, observe_stream_ttft, open_hedged_stream, stream_hedging_stats
 from app.api.upstream_headers import _build_upstream_headers, _filter_upstream_response_headers
 from app.auth import get_current_membership, get_current_user, require_admin
 from app.constants import ACCOUNT_TEMPORARILY_LIMITED_DETAIL
 from app.models.api_key import ApiKey
 from app.models.llm_channel import LlmChannel
 from app.models.llm_content_generation_task import LlmContentGenerationTask
-from app.models.llm_usage_event import LlmUsageEvent
 from app.models.membership import Membership
 from app.models.oauth_identity import OAuthIdentity
 from app.models.user import User
@@ -103,6 +151,12 @@ from app.schemas.models_admin import (
     AdminModelUpdateRequest,
     AdminModelUpdateResponse,
 )
+from app.schemas.rate_limits import (
+    RateLimitPoliciesListResponse,
+    RateLimitPolicyDeleteResponse,
+    RateLimitPolicyUpdateResponse,
+    RateLimitPolicyUpsertRequest,
+)
 from app.db import get_db_session
 from app.storage.announcements_db import (
     create_announcement,
@@ -111,8 +165,8 @@ from app.storage.announcements_db import (
     update_announcement,
 )
 from app.storage.admin_users_db import delete_admin_user, list_admin_users, update_admin_user
-from app.storage.analytics_outbox import enqueue_analytics_event, get_dataocean_status
-from app.storage.orgs_db import ensure_default_org, ensure_membership
+from app.storage.analytics_outbox import buffer_analytics_event, enqueue_analytics_event, get_dataocean_status
+from app.storage.orgs_db import ADMIN_LIKE_ROLES, ensure_default_org, ensure_membership
 from app.storage.auth_db import grant_admin_role
 from app.storage.auth_db import get_user_by_token
 from app.storage.auth_db import login as auth_login
@@ -123,24 +177,43 @@ from app.storage.api_key_auth import authenticate_api_key
 from app.storage.channels_db import (
     create_channel,
     delete_channel,
+    channel_api_keys,
     list_channels,
-    pick_channel_for_group,
+    pick_channel_api_key,
     update_channel,
 )
 from app.storage.models_db import (
     UNSET,
     create_model_pricing_rule,
     delete_model_pricing_rule,
+    forget_channel_models,
     get_model_config,
-    get_price_detail_for_model,
     list_admin_model_pricing,
     list_admin_models,
+    list_channels_for_model,
     list_user_models,
     model_pricing_rule_to_item,
+    refresh_channel_models_by_id,
+    resolve_usage_pricing,
     update_model_pricing_rule,
     upsert_model_config,
 )
 from app.storage.usage_db import list_usage_events, record_usage_event
+from app.storage.content_generation_tasks import (
+    ContentGenerationResult,
+    cached_content_generation_result,
+    is_terminal_content_generation_status,
+    next_content_generation_poll_delay_seconds,
+    record_content_generation_task_created,
+    settle_content_generation_task,
+)
+from app.storage.rate_limits_db import (
+    delete_rate_limit_policy,
+    list_rate_limit_policies,
+    rate_limit_policy_to_item,
+    rate_limit_rules_for_request,
+    upsert_rate_limit_policy,
+)
 from app.storage.keys_db import (
     create_api_key,
     delete_api_key,
@@ -156,15 +229,24 @@ from app.schemas.logs import LogsListResponse
 from app.db import SessionLocal
 from app.storage.email_verification_db import request_email_code, verify_email_code
 from app.models.organization import Organization
-from app.security_password import hash_password, verify_password
+from app.security_password import hash_password_async, verify_password_async
 from app.core.config import settings
+from app.rate_limit import (
+    GcraBuckets,
+    RateLimitExceeded,
+    RateLimitGrant,
+    charge_rate_limit_tokens,
+    enforce_rate_limits,
+    rate_limit_headers,
+    release_rate_limit_grant,
+)
+from app.upstream_keys import get_upstream_key_pool
 from app.core.zhupay import (
     ZhupayError,
     convert_credits_to_money,
     create_jump_order,
     is_configured as zhupay_is_configured,
     money_to_cents as zhupay_money_to_cents,
-    query_order as zhupay_query_order,
     verify_payload as zhupay_verify_payload,
 )
 from app.storage.topups_db import (
@@ -184,8 +266,7 @@ from app.storage.referrals_db import process_referral_refund
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
-_ANALYTICS_RATE_LIMIT: dict[str, tuple[float, int]] = {}
-_ANALYTICS_RATE_LIMIT_WINDOW_SECONDS = 60
+_ANALYTICS_RATE_LIMIT = GcraBuckets(max_keys=10000)
 _ANALYTICS_RATE_LIMIT_MAX_EVENTS = 240
 
 def _safe_int(value: object) -> int:
@@ -195,13 +276,6 @@ def _safe_int(value: object) -> int:
         return 0
 
 
-def _sum_usage_token_fields(usage: dict, fields: tuple[str, ...]) -> int:
-    total = 0
-    for field in fields:
-        total += max(_safe_int(usage.get(field) or 0), 0)
-    return total
-
-
 def _normalize_public_url(raw: str) -> str:
     value = (raw or "").strip()
     if value == "":
@@ -395,92 +469,6 @@ def _extract_creem_payer_email(obj: dict) -> str | None:
     return None
 
 
-def _topup_provider(topup) -> str | None:
-    provider = str(getattr(topup, "provider", "") or "").strip().lower()
-    if provider:
-        return provider
-    currency = str(getattr(topup, "currency", "") or "").strip().upper()
-    if currency == "CNY":
-        return "zhupay"
-    if currency == "USD":
-        return "creem"
-    return None
-
-
-async def _sync_pending_topup_from_zhupay(
-    session: AsyncSession,
-    *,
-    topup,
-):
-    if str(getattr(topup, "status", "") or "").strip().lower() != "pending":
-        return topup
-    if _topup_provider(topup) != "zhupay":
-        return topup
-    if not zhupay_is_configured():
-        return topup
-
-    try:
-        remote = await zhupay_query_order(out_trade_no=str(topup.request_id))
-    except ZhupayError:
-        return topup
-
-    expected_cents = int(getattr(topup, "amount_total_cents", 0) or 0) or None
-    if expected_cents is not None and remote.money_cents is not None and remote.money_cents != expected_cents:
-        synced = await mark_billing_topup_failed(
-            session,
-            request_id=str(topup.request_id),
-            provider="zhupay",
-            checkout_id=remote.trade_no,
-            order_id=remote.api_trade_no,
-            currency="CNY",
-            amount_total_cents=remote.money_cents,
-        )
-        return synced or topup
-
-    if remote.status == 1:
-        synced = await complete_billing_topup(
-            session,
-            request_id=str(topup.request_id),
-            provider="zhupay",
-            checkout_id=remote.trade_no,
-            order_id=remote.api_trade_no,
-            currency="CNY",
-            amount_total_cents=remote.money_cents,
-            payer_email=None,
-        )
-        return synced or topup
-
-    if remote.status in {2, 3, 4}:
-        synced = await mark_billing_topup_failed(
-            session,
-            request_id=str(topup.request_id),
-            provider="zhupay",
-            checkout_id=remote.trade_no,
-            order_id=remote.api_trade_no,
-            currency="CNY",
-            amount_total_cents=remote.money_cents,
-        )
-        return synced or topup
-
-    if (
-        getattr(topup, "checkout_id", None) != remote.trade_no
-        or (remote.api_trade_no and getattr(topup, "order_id", None) != remote.api_trade_no)
-    ):
-        synced = await set_billing_topup_status(
-            session,
-            request_id=str(topup.request_id),
-            status="pending",
-            provider="zhupay",
-            checkout_id=remote.trade_no,
-            order_id=remote.api_trade_no,
-            currency="CNY",
-            amount_total_cents=remote.money_cents,
-        )
-        return synced or topup
-
-    return topup
-
-
 async def _compute_cost_usd_micros(
     session: AsyncSession,
     *,
@@ -491,7 +479,7 @@ async def _compute_cost_usd_micros(
     output_tokens: int,
 ) -> int:
     cfg = await get_model_config(session, org_id=org_id, model_id=model_id.strip())
-    pricing = await _resolve_usage_pricing(session, org_id=org_id, cfg=cfg, model_id=model_id.strip())
+    pricing = await resolve_usage_pricing(session, org_id=org_id, cfg=cfg, model_id=model_id.strip())
     return estimate_cost_usd_micros(
         pricing=pricing,
         input_tokens=input_tokens,
@@ -519,9 +507,15 @@ async def _record_usage_event_best_effort(
     request_endpoint: str | None,
     is_streaming: bool,
     recompute_cost: bool = True,
+    channel_id: uuid.UUID | None = None,
 ) -> None:
     computed_cost = int(max(cost_usd_micros, 0))
+    if channel_id is not None:
+        observe_channel_outcome(
+            channel_id, status_code=status_code, input_tokens=input_tokens, cached_tokens=cached_tokens
+        )
 
+    write_started = time.perf_counter()
     try:
         async with SessionLocal() as s:
             if recompute_cost and ok and total_tokens > 0 and computed_cost <= 0:
@@ -559,6 +553,35 @@ async def _record_usage_event_best_effort(
             )
     except Exception:
         logger.exception("usage: record failed")
+    USAGE_WRITE_SECONDS.observe(time.perf_counter() - write_started)
+    observe_usage_metrics(
+        route=route_label(request_endpoint),
+        model_id=model_id,
+        channel_id=channel_id,
+        status_code=status_code,
+        input_tokens=input_tokens,
+        cached_tokens=cached_tokens,
+        output_tokens=output_tokens,
+        cost_usd_micros=computed_cost,
+        total_duration_ms=total_duration_ms,
+        ttft_ms=ttft_ms,
+    )
+    await charge_rate_limit_tokens(
+        api_key_id=api_key_id,
+        user_id=user_id,
+        org_id=org_id,
+        tokens=max(int(total_tokens), int(input_tokens) + int(output_tokens)),
+    )
+
+
+def _observe_gateway_overhead(request: Request, *, context: LlmProxyContext, arrived: float, started: float) -> None:
+    note_upstream_started(started)
+    GATEWAY_OVERHEAD_SECONDS.observe(
+        max(started - arrived, 0.0),
+        route=route_label(_request_endpoint(request)),
+        model=context.model_id,
+        channel=str(context.channel_id or ""),
+    )
 
 
 async def _record_upstream_http_error_usage(
@@ -570,6 +593,10 @@ async def _record_upstream_http_error_usage(
     is_streaming: bool,
 ) -> HTTPException:
     error = _translate_upstream_http_error(exc)
+    UPSTREAM_ERRORS.inc(
+        route=route_label(_request_endpoint(request)), model=context.model_id, channel=str(context.channel_id or "")
+    )
+    await release_rate_limit_grant(context.rate_limit_grant)
     await _record_usage_event_best_effort(
         org_id=context.org_id,
         user_id=context.user_id,
@@ -588,10 +615,41 @@ async def _record_upstream_http_error_usage(
         request_endpoint=_request_endpoint(request),
         is_streaming=is_streaming,
         recompute_cost=False,
+        channel_id=context.channel_id,
     )
     return error
 
 
+async def _record_client_disconnect_usage(
+    *,
+    request: Request,
+    context: LlmProxyContext,
+    started: float,
+    is_streaming: bool,
+) -> None:
+    await release_rate_limit_grant(context.rate_limit_grant)
+    await _record_usage_event_best_effort(
+        org_id=context.org_id,
+        user_id=context.user_id,
+        api_key_id=context.api_key_id,
+        model_id=context.model_id,
+        ok=False,
+        status_code=499,
+        input_tokens=0,
+        cached_tokens=0,
+        output_tokens=0,
+        total_tokens=0,
+        cost_usd_micros=0,
+        total_duration_ms=int((time.perf_counter() - started) * 1000),
+        ttft_ms=0,
+        source_ip=context.source_ip,
+        request_endpoint=_request_endpoint(request),
+        is_streaming=is_streaming,
+        recompute_cost=False,
+        channel_id=context.channel_id,
+    )
+
+
 def _request_endpoint(request: Request) -> str | None:
     path = str(request.url.path or "").strip()
     return path[:255] if path else None
@@ -604,124 +662,367 @@ def _build_llm_upstream_url(*, upstream_base_url: str, upstream_path: str, query
 
 async def _read_request_body_or_499(request: Request) -> bytes:
     try:
-        return await request.body()
+        with timed_stage("body"):
+            return await request.body()
     except ClientDisconnect as exc:
         raise HTTPException(status_code=499, detail="client disconnected") from exc
 
 
-def _extract_usage_tokens(obj: dict) -> tuple[int, int, int, int] | None:
-    usage = obj.get("usage")
-    if not isinstance(usage, dict):
-        message = obj.get("message")
-        if isinstance(message, dict):
-            usage = message.get("usage")
-    if not isinstance(usage, dict):
-        response = obj.get("response")
-        if isinstance(response, dict):
-            usage = response.get("usage")
-    if not isinstance(usage, dict):
-        return None
+_T = TypeVar("_T")
 
-    # OpenAI chat.completions usage
-    if "prompt_tokens" in usage or "completion_tokens" in usage:
-        prompt = _safe_int(usage.get("prompt_tokens") or 0)
-        completion = _safe_int(usage.get("completion_tokens") or 0)
-        total_raw = usage.get("total_tokens")
-        total = _safe_int(total_raw) if total_raw is not None else 0
-        details = usage.get("prompt_tokens_details")
-        cached = 0
-        if isinstance(details, dict):
-            cached = _safe_int(details.get("cached_tokens") or 0)
-
-        output = max(total - prompt, 0) if total > 0 else completion
-        total_tokens = total if total > 0 else (prompt + output)
-        cached_tokens = min(max(cached, 0), max(prompt, 0))
-        return prompt, cached_tokens, output, total_tokens
-
-    # OpenAI responses usage
-    if "input_tokens" in usage or "output_tokens" in usage:
-        input_tokens = max(_safe_int(usage.get("input_tokens") or 0), 0)
-        output_tokens = max(_safe_int(usage.get("output_tokens") or 0), 0)
-        total_raw = usage.get("total_tokens")
-        total_tokens = _safe_int(total_raw) if total_raw is not None else 0
-        details = usage.get("input_tokens_details")
-        cached = 0
-        if isinstance(details, dict):
-            cached = _safe_int(details.get("cached_tokens") or 0)
-
-        # Anthropic Messages usage. Claude reports cache reads/creations outside
-        # input_tokens, while this service records one input bucket plus cached.
-        anthropic_cache_read = max(_safe_int(usage.get("cache_read_input_tokens") or 0), 0)
-        anthropic_cache_creation = max(_safe_int(usage.get("cache_creation_input_tokens") or 0), 0)
-        cache_creation = usage.get("cache_creation")
-        if anthropic_cache_creation <= 0 and isinstance(cache_creation, dict):
-            anthropic_cache_creation = _sum_usage_token_fields(
-                cache_creation,
-                ("ephemeral_5m_input_tokens", "ephemeral_1h_input_tokens"),
+
+class _ClientDisconnected(Exception):
+    pass
+
+
+async def _wait_for_client_disconnect(request: Request) -> None:
+    # The body has already been read, so the next ASGI message is the disconnect.
+    receive = getattr(request, "receive", None)
+    if receive is not None:
+        try:
+            while True:
+                message = await receive()
+                if message.get("type") == "http.disconnect":
+                    return
+        except Exception:
+            pass
+    await asyncio.Event().wait()
+
+
+async def _await_unless_client_disconnects(request: Request, awaitable: Awaitable[_T]) -> _T:
+    work = asyncio.ensure_future(awaitable)
+    watcher = asyncio.ensure_future(_wait_for_client_disconnect(request))
+    try:
+        await asyncio.wait({work, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+        if not work.done():
+            # Cancelling the read unwinds its `async with` blocks, closing the upstream connection.
+            work.cancel()
+            with suppress(asyncio.CancelledError):
+                await work
+    if work.cancelled():
+        raise _ClientDisconnected()
+    return work.result()
+
+
+@dataclass(frozen=True)
+class _UpstreamReply:
+    status_code: int
+    content_type: str
+    headers: dict[str, str]
+    body: bytes
+    ttft_ms: int
+    total_ms: int
+    # True when this caller received bytes fetched by an identical in-flight request.
+    shared: bool = False
+
+
+_upstream_flights: SingleFlight[_UpstreamReply] = SingleFlight()
+
+
+async def _read_upstream_reply(
+    *,
+    method: str,
+    url: str,
+    headers: object,
+    content: bytes,
+    timeout: httpx.Timeout,
+    started: float,
+) -> _UpstreamReply:
+    async with httpx.AsyncClient(timeout=timeout) as client:
+        async with client.stream(
+            method, url, headers=headers, content=content, extensions=upstream_trace_extensions()
+        ) as res:
+            body_bytes = bytearray()
+            ttft_ms = 0
+            first = None
+            async for chunk in res.aiter_bytes():
+                if first is None:
+                    first = time.perf_counter()
+                    ttft_ms = int((first - started) * 1000)
+                body_bytes.extend(chunk)
+            return _UpstreamReply(
+                status_code=int(res.status_code),
+                content_type=res.headers.get("content-type") or "application/json",
+                headers=_filter_upstream_response_headers(dict(res.headers)),
+                body=bytes(body_bytes),
+                ttft_ms=ttft_ms,
+                total_ms=int((time.perf_counter() - started) * 1000),
             )
-        has_anthropic_cache_usage = (
-            "cache_read_input_tokens" in usage
-            or "cache_creation_input_tokens" in usage
-            or isinstance(cache_creation, dict)
+
+
+async def _fetch_upstream_or_499(
+    request: Request,
+    *,
+    context: LlmProxyContext,
+    method: str,
+    url: str,
+    headers: object,
+    content: bytes,
+    timeout: httpx.Timeout,
+    started: float,
+    flight_key: str | None = None,
+) -> _UpstreamReply:
+    def read() -> Awaitable[_UpstreamReply]:
+        return _read_upstream_reply(
+            method=method, url=url, headers=headers, content=content, timeout=timeout, started=started
+        )
+
+    try:
+        reply = await _await_unless_client_disconnects(
+            request,
+            read() if flight_key is None else _coalesced_upstream_reply(flight_key, read, started=started),
+        )
+    except httpx.HTTPError as exc:
+        error = await _record_upstream_http_error_usage(
+            request=request,
+            context=context,
+            exc=exc,
+            started=started,
+            is_streaming=False,
+        )
+        raise error from exc
+    except _ClientDisconnected as exc:
+        await _record_client_disconnect_usage(request=request, context=context, started=started, is_streaming=False)
+        raise HTTPException(status_code=499, detail="client disconnected") from exc
+    record_stage_ms("ttfb", reply.ttft_ms)
+    record_stage_ms("upstream", reply.total_ms)
+    note_upstream_done(time.perf_counter())
+    if not reply.shared:
+        get_upstream_key_pool().observe(
+            context.channel_id, context.upstream_api_key, status_code=reply.status_code, headers=reply.headers
         )
-        if has_anthropic_cache_usage:
-            input_tokens += anthropic_cache_read + anthropic_cache_creation
-            cached = anthropic_cache_read
+    return reply
+
+
+async def _coalesced_upstream_reply(
+    flight_key: str, read: Callable[[], Awaitable[_UpstreamReply]], *, started: float
+) -> _UpstreamReply:
+    reply, shared = await _upstream_flights.run(
+        flight_key,
+        read,
+        max_wait=float(settings.single_flight_max_wait_seconds or 0),
+        # An upstream 429 or 5xx is the leader's to handle; followers make their own attempt.
+        shareable=lambda leader_reply: leader_reply.status_code < 400,
+    )
+    if not shared:
+        return reply
+    elapsed_ms = int((time.perf_counter() - started) * 1000)
+    return replace(reply, shared=True, ttft_ms=elapsed_ms, total_ms=elapsed_ms)
 
-        if output_tokens <= 0 and total_tokens > 0:
-            output_tokens = max(total_tokens - input_tokens, 0)
-        if has_anthropic_cache_usage or total_tokens <= 0:
-            total_tokens = input_tokens + output_tokens
 
-        cached_tokens = min(max(cached, 0), max(input_tokens, 0))
-        return input_tokens, cached_tokens, output_tokens, total_tokens
+def single_flight_stats() -> dict[str, int]:
+    return _upstream_flights.stats()
 
-    return None
+
+def _payload_is_deterministic(payload: dict[str, object] | None) -> bool:
+    if not isinstance(payload, dict):
+        return False
+    temperature = payload.get("temperature")
+    n = payload.get("n")
+    return (
+        isinstance(temperature, (int, float))
+        and not isinstance(temperature, bool)
+        and temperature == 0
+        and n in (None, 1)
+    )
+
+
+def _single_flight_key_for(
+    request: Request,
+    *,
+    context: LlmProxyContext,
+    upstream_path: str,
+    raw: bytes,
+    payload: dict[str, object] | None,
+) -> str | None:
+    if not settings.single_flight_enabled:
+        return None
+    # Sampled requests (temperature > 0, n > 1) from different callers must get their own completions.
+    if not _payload_is_deterministic(payload) and not response_cache_opted_in(
+        request.headers.get(RESPONSE_CACHE_HEADER)
+    ):
+        return None
+    return response_cache_key(
+        org_id=context.org_id,
+        model_id=context.model_id,
+        upstream_path=upstream_path,
+        raw=raw,
+        query=request.url.query,
+        headers=request.headers,
+    )
 
 
-def _parse_json_object(raw: bytes) -> dict | None:
+def _reply_cost_usd_micros(
+    reply: _UpstreamReply,
+    *,
+    context: LlmProxyContext,
+    input_tokens: int,
+    cached_tokens: int,
+    output_tokens: int,
+) -> int:
+    if reply.shared and (settings.single_flight_billing or "").strip().lower() == "leader":
+        return 0
+    return estimate_cost_usd_micros(
+        pricing=context.pricing,
+        input_tokens=input_tokens,
+        cached_tokens=cached_tokens,
+        output_tokens=output_tokens,
+    )
+
+
+async def _open_upstream_stream_or_499(
+    request: Request,
+    *,
+    context: LlmProxyContext,
+    client: httpx.AsyncClient,
+    upstream_request: httpx.Request,
+    started: float,
+) -> httpx.Response:
     try:
-        parsed = json.loads(raw.decode("utf-8"))
-    except Exception:
+        res = await _await_unless_client_disconnects(request, client.send(upstream_request, stream=True))
+    except (httpx.HTTPError, _ClientDisconnected) as exc:
+        try:
+            await client.aclose()
+        except Exception:
+            pass
+        if isinstance(exc, _ClientDisconnected):
+            await _record_client_disconnect_usage(request=request, context=context, started=started, is_streaming=True)
+            raise HTTPException(status_code=499, detail="client disconnected") from exc
+        error = await _record_upstream_http_error_usage(
+            request=request,
+            context=context,
+            exc=exc,
+            started=started,
+            is_streaming=True,
+        )
+        raise error from exc
+    get_upstream_key_pool().observe(
+        context.channel_id, context.upstream_api_key, status_code=res.status_code, headers=res.headers
+    )
+    return res
+
+
+def _response_cache_key_for(
+    request: Request, *, context: LlmProxyContext, upstream_path: str, raw: bytes
+) -> str | None:
+    if not context.response_cache_enabled or not response_cache_opted_in(request.headers.get(RESPONSE_CACHE_HEADER)):
         return None
-    return parsed if isinstance(parsed, dict) else None
+    return response_cache_key(
+        org_id=context.org_id,
+        model_id=context.model_id,
+        upstream_path=upstream_path,
+        raw=raw,
+        query=request.url.query,
+        headers=request.headers,
+    )
+
+
+async def _serve_cached_response(
+    request: Request, *, context: LlmProxyContext, cache_key: str, started: float
+) -> Response | None:
+    cached = get_response_cache().get(cache_key)
+    if cached is None:
+        return None
+    await release_rate_limit_grant(context.rate_limit_grant)
+    input_tokens, cached_tokens, output_tokens, total_tokens = cached.usage_tokens
+    elapsed_ms = int((time.perf_counter() - started) * 1000)
+    # A hit never reaches the upstream, so it is logged with its usage but costs nothing.
+    await _record_usage_event_best_effort(
+        org_id=context.org_id,
+        user_id=context.user_id,
+        api_key_id=context.api_key_id,
+        model_id=context.model_id,
+        ok=True,
+        status_code=200,
+        input_tokens=input_tokens,
+        cached_tokens=cached_tokens,
+        output_tokens=output_tokens,
+        total_tokens=total_tokens,
+        cost_usd_micros=0,
+        total_duration_ms=elapsed_ms,
+        ttft_ms=elapsed_ms,
+        source_ip=context.source_ip,
+        request_endpoint=_request_endpoint(request),
+        is_streaming=False,
+        recompute_cost=False,
+    )
+    return Response(
+        content=cached.body,
+        status_code=200,
+        media_type=cached.content_type,
+        headers={"cache-control": "no-cache", RESPONSE_CACHE_HEADER: "hit"},
+    )
+
+
+def _store_cached_response(
+    cache_key: str | None, *, reply: _UpstreamReply, usage_tokens: tuple[int, int, int, int]
+) -> None:
+    if cache_key is None or reply.status_code != 200 or not reply.content_type.startswith("application/json"):
+        return
+    get_response_cache().put(
+        cache_key, CachedResponse(content_type=reply.content_type, body=reply.body, usage_tokens=usage_tokens)
+    )
+
+
+async def _open_llm_stream_or_499(
+    request: Request,
+    *,
+    context: LlmProxyContext,
+    build_request: Callable[[httpx.AsyncClient, UpstreamTarget], httpx.Request],
+    timeout: httpx.Timeout,
+    started: float,
+) -> tuple[httpx.AsyncClient, httpx.Response, AsyncIterator[bytes], UpstreamTarget]:
+    """Opens the upstream stream; also returns the target that served it, which differs when a hedge won."""
+    primary = primary_upstream_target(context)
+    if not context.hedge_targets:
+        client = httpx.AsyncClient(timeout=timeout)
+        res = await _open_upstream_stream_or_499(
+            request, context=context, client=client, upstream_request=build_request(client, primary), started=started
+        )
+        return client, res, res.aiter_bytes(), primary
+
+    try:
+        attempt = await _await_unless_client_disconnects(
+            request,
+            open_hedged_stream(
+                primary,
+                context.hedge_targets,
+                build_request=build_request,
+                timeout=timeout,
+                deadline_ms=hedge_deadline_ms(context.model_id, context.hedge_ttft_ms),
+            ),
+        )
+    except httpx.HTTPError as exc:
+        error = await _record_upstream_http_error_usage(
+            request=request,
+            context=context,
+            exc=exc,
+            started=started,
+            is_streaming=True,
+        )
+        raise error from exc
+    except _ClientDisconnected as exc:
+        await _record_client_disconnect_usage(request=request, context=context, started=started, is_streaming=True)
+        raise HTTPException(status_code=499, detail="client disconnected") from exc
+    get_upstream_key_pool().observe(
+        attempt.target.channel_id,
+        attempt.target.api_key,
+        status_code=attempt.response.status_code,
+        headers=attempt.response.headers,
+    )
+    return attempt.client, attempt.response, attempt.chunks, attempt.target
 
 
 def _extract_content_generation_task_id(raw: bytes) -> str | None:
-    obj = _parse_json_object(raw)
+    obj = parse_json_object(raw)
     task_id = obj.get("id") if obj else None
     if isinstance(task_id, str) and task_id.strip():
         return task_id.strip()
     return None
 
 
-def _extract_content_generation_status_and_usage(
-    raw: bytes,
-) -> tuple[str | None, tuple[int, int, int, int] | None]:
-    obj = _parse_json_object(raw)
-    if not obj:
-        return None, None
-    raw_status = obj.get("status")
-    status = raw_status.strip().lower() if isinstance(raw_status, str) and raw_status.strip() else None
-    return status, _extract_usage_tokens(obj)
-
-
-def _parse_content_generation_task_id_timestamp(task_id: str) -> dt.datetime | None:
-    raw = (task_id or "").strip()
-    if len(raw) < 18 or not raw.startswith("cgt-"):
-        return None
-    timestamp = raw[4:18]
-    if not timestamp.isdigit():
-        return None
-    try:
-        # Upstream cgt-* ids use Beijing time in the embedded timestamp.
-        local_created_at = dt.datetime.strptime(timestamp, "%Y%m%d%H%M%S")
-    except ValueError:
-        return None
-    china_tz = dt.timezone(dt.timedelta(hours=8))
-    return local_created_at.replace(tzinfo=china_tz).astimezone(dt.timezone.utc)
-
-
 async def _remember_content_generation_task(
     *,
     task_id: str,
@@ -745,6 +1046,8 @@ async def _remember_content_generation_task(
                     status=status,
                     created_at=now,
                     updated_at=now,
+                    poll_attempts=0,
+                    next_poll_at=now + dt.timedelta(seconds=next_content_generation_poll_delay_seconds(0)),
                 )
                 s.add(row)
             else:
@@ -752,50 +1055,53 @@ async def _remember_content_generation_task(
                 row.status = status or row.status
                 row.channel_id = context.channel_id or row.channel_id
                 row.api_key_id = row.api_key_id or context.api_key_id
+            if is_terminal_content_generation_status(row.status):
+                row.next_poll_at = None
+            if row.status == "deleted":
+                row.result_status_code = None
+                row.result_content_type = None
+                row.result_body = None
             await s.commit()
     except Exception:
         logger.exception("content generation task: remember failed")
 
 
-async def _infer_content_generation_task_model_id(
-    session: AsyncSession,
+async def _record_content_generation_task_created(
     *,
     task_id: str,
-    org_id: uuid.UUID,
-    user_id: uuid.UUID,
-    api_key_id: uuid.UUID | None,
-) -> str | None:
-    created_at = _parse_content_generation_task_id_timestamp(task_id)
-    if created_at is None:
-        return None
-
-    conditions = [
-        LlmUsageEvent.org_id == org_id,
-        LlmUsageEvent.user_id == user_id,
-        LlmUsageEvent.request_endpoint == "/v1/contents/generations/tasks",
-        LlmUsageEvent.ok.is_(True),
-        LlmUsageEvent.status_code >= 200,
-        LlmUsageEvent.status_code < 300,
-        LlmUsageEvent.created_at >= created_at - dt.timedelta(seconds=1),
-        LlmUsageEvent.created_at < created_at + dt.timedelta(seconds=5),
-    ]
-    if api_key_id is None:
-        conditions.append(LlmUsageEvent.api_key_id.is_(None))
-    else:
-        conditions.append(LlmUsageEvent.api_key_id == api_key_id)
-
-    rows = (
-        await session.execute(
-            select(LlmUsageEvent.model_id)
-            .where(*conditions)
-            .order_by(LlmUsageEvent.created_at.asc())
-            .limit(5)
-        )
-    ).scalars().all()
-    model_ids = {str(model_id).strip() for model_id in rows if str(model_id).strip()}
-    if len(model_ids) == 1:
-        return next(iter(model_ids))
-    return None
+    context: LlmProxyContext,
+    status_code: int,
+    total_duration_ms: int,
+    ttft_ms: int,
+    request_endpoint: str | None,
+) -> bool:
+    recorded = await record_content_generation_task_created(
+        task_id=task_id,
+        org_id=context.org_id,
+        user_id=context.user_id,
+        api_key_id=context.api_key_id,
+        channel_id=context.channel_id,
+        model_id=context.model_id,
+        source_ip=context.source_ip,
+        status_code=status_code,
+        total_duration_ms=total_duration_ms,
+        ttft_ms=ttft_ms,
+        request_endpoint=request_endpoint,
+    )
+    if recorded:
+        observe_usage_metrics(
+            route=route_label(request_endpoint),
+            model_id=context.model_id,
+            channel_id=context.channel_id,
+            status_code=status_code,
+            input_tokens=0,
+            cached_tokens=0,
+            output_tokens=0,
+            cost_usd_micros=0,
+            total_duration_ms=total_duration_ms,
+            ttft_ms=ttft_ms,
+        )
+    return recorded
 
 
 async def _record_content_generation_usage_once(
@@ -808,81 +1114,40 @@ async def _record_content_generation_usage_once(
     total_duration_ms: int,
     ttft_ms: int,
     request_endpoint: str | None,
+    result: ContentGenerationResult | None = None,
 ) -> tuple[int, int, int, int, int]:
-    if status != "succeeded" or not usage_tokens:
-        return 0, 0, 0, 0, 0
-
-    input_tokens, cached_tokens, output_tokens, total_tokens = usage_tokens
-    if total_tokens <= 0:
-        return 0, 0, 0, 0, 0
-
-    cost_micros = estimate_cost_usd_micros(
+    recorded = await settle_content_generation_task(
+        task_id=task_id,
+        org_id=context.org_id,
+        user_id=context.user_id,
+        api_key_id=context.api_key_id,
+        channel_id=context.channel_id,
+        model_id=context.model_id,
         pricing=context.pricing,
-        input_tokens=input_tokens,
-        cached_tokens=cached_tokens,
-        output_tokens=output_tokens,
+        source_ip=context.source_ip,
+        status=status,
+        usage_tokens=usage_tokens,
+        result=result,
+        status_code=status_code,
+        total_duration_ms=total_duration_ms,
+        ttft_ms=ttft_ms,
+        request_endpoint=request_endpoint,
     )
-    now = dt.datetime.now(dt.timezone.utc)
-
-    try:
-        async with SessionLocal() as s:
-            row = (
-                await s.execute(
-                    select(LlmContentGenerationTask)
-                    .where(LlmContentGenerationTask.upstream_task_id == task_id)
-                    .with_for_update()
-                )
-            ).scalar_one_or_none()
-            if row is None:
-                row = LlmContentGenerationTask(
-                    upstream_task_id=task_id,
-                    org_id=context.org_id,
-                    user_id=context.user_id,
-                    api_key_id=context.api_key_id,
-                    channel_id=context.channel_id,
-                    model_id=context.model_id,
-                    created_at=now,
-                    updated_at=now,
-                )
-                s.add(row)
-
-            row.status = status
-            row.updated_at = now
-            if row.billed_at is not None:
-                await s.commit()
-                return 0, 0, 0, 0, 0
-
-            api_key_id = row.api_key_id or context.api_key_id
-            row.billed_at = now
-            row.billed_input_tokens = input_tokens
-            row.billed_cached_tokens = cached_tokens
-            row.billed_output_tokens = output_tokens
-            row.billed_total_tokens = total_tokens
-            row.billed_cost_usd_micros = cost_micros
-
-            await record_usage_event(
-                s,
-                org_id=context.org_id,
-                user_id=context.user_id,
-                api_key_id=api_key_id,
-                model_id=context.model_id,
-                ok=True,
-                status_code=status_code,
-                input_tokens=input_tokens,
-                cached_tokens=cached_tokens,
-                output_tokens=output_tokens,
-                total_tokens=total_tokens,
-                cost_usd_micros=cost_micros,
-                total_duration_ms=total_duration_ms,
-                ttft_ms=ttft_ms,
-                source_ip=context.source_ip,
-                request_endpoint=request_endpoint,
-                is_streaming=False,
-            )
-            return input_tokens, cached_tokens, output_tokens, total_tokens, cost_micros
-    except Exception:
-        logger.exception("content generation task: usage record failed")
-        return 0, 0, 0, 0, 0
+    input_tokens, cached_tokens, output_tokens, total_tokens, cost_micros = recorded
+    if total_tokens > 0:
+        observe_usage_metrics(
+            route=route_label(request_endpoint),
+            model_id=context.model_id,
+            channel_id=context.channel_id,
+            status_code=status_code,
+            input_tokens=input_tokens,
+            cached_tokens=cached_tokens,
+            output_tokens=output_tokens,
+            cost_usd_micros=cost_micros,
+            total_duration_ms=total_duration_ms,
+            ttft_ms=ttft_ms,
+        )
+    return recorded
 
 
 class _SseLineBuffer:
@@ -933,7 +1198,7 @@ def _extract_usage_tokens_from_sse_line(raw_line: bytes) -> tuple[int, int, int,
     if not isinstance(obj, dict):
         return None
 
-    return _extract_usage_tokens(obj)
+    return extract_usage_tokens(obj)
 
 
 @dataclass(frozen=True)
@@ -946,6 +1211,7 @@ class _ParsedLlmRequest:
 class _ParsedProxyRequest:
     model_id: str
     stream: bool
+    payload: dict[str, object] | None = None
 
 
 def _parse_llm_request(raw: bytes) -> _ParsedLlmRequest:
@@ -1017,7 +1283,9 @@ def _parse_proxy_request(raw: bytes, *, content_type: str, allow_multipart: bool
         return _ParsedProxyRequest(model_id=model_raw.strip(), stream=_coerce_form_bool(fields.get("stream")))
 
     parsed = _parse_llm_request(raw)
-    return _ParsedProxyRequest(model_id=parsed.model_id, stream=bool(parsed.payload.get("stream")))
+    return _ParsedProxyRequest(
+        model_id=parsed.model_id, stream=bool(parsed.payload.get("stream")), payload=parsed.payload
+    )
 
 
 def _extract_source_ip(request: Request) -> str | None:
@@ -1034,34 +1302,15 @@ def _extract_bearer_token(value: str | None) -> str | None:
     return token or None
 
 
-async def _get_optional_current_user(request: Request, session: AsyncSession) -> User | None:
-    from app.constants import SESSION_COOKIE_NAME
-
-    token = _extract_bearer_token(request.headers.get("authorization")) or request.cookies.get(SESSION_COOKIE_NAME)
-    if not token:
-        return None
-    user = await get_user_by_token(session, token)
-    if not user or user.banned_at is not None:
-        return None
-    return user
-
-
 def _check_analytics_rate_limit(request: Request) -> None:
     key = _extract_source_ip(request) or request.headers.get("user-agent") or "unknown"
-    now = time.time()
-    window_start, count = _ANALYTICS_RATE_LIMIT.get(key, (now, 0))
-    if now - window_start >= _ANALYTICS_RATE_LIMIT_WINDOW_SECONDS:
-        window_start = now
-        count = 0
-    count += 1
-    _ANALYTICS_RATE_LIMIT[key] = (window_start, count)
-    if len(_ANALYTICS_RATE_LIMIT) > 10000:
-        expired_before = now - _ANALYTICS_RATE_LIMIT_WINDOW_SECONDS
-        for existing_key, (existing_start, _) in list(_ANALYTICS_RATE_LIMIT.items()):
-            if existing_start < expired_before:
-                _ANALYTICS_RATE_LIMIT.pop(existing_key, None)
-    if count > _ANALYTICS_RATE_LIMIT_MAX_EVENTS:
-        raise HTTPException(status_code=429, detail="too many analytics events")
+    state = _ANALYTICS_RATE_LIMIT.take(key, limit=_ANALYTICS_RATE_LIMIT_MAX_EVENTS)
+    if not state.allowed:
+        raise HTTPException(
+            status_code=429,
+            detail="too many analytics events",
+            headers=rate_limit_headers(state, dimension="requests"),
+        )
 
 
 def _normalize_browser_analytics_time(value: dt.datetime | None) -> dt.datetime:
@@ -1080,13 +1329,10 @@ def _browser_analytics_context(
     payload: AnalyticsCollectRequest,
     anonymous_id: str,
     session_id: str,
-    user: User | None,
 ) -> dict:
     context = dict(payload.context)
     context["anonymousId"] = anonymous_id
     context["sessionId"] = session_id
-    if user:
-        context["userId"] = str(user.id)
     context["gateway"] = {
         "name": "uni-api-web-api",
         "source": "browser",
@@ -1116,21 +1362,6 @@ def _log_llm_request_received(
     )
 
 
-async def _resolve_usage_pricing(
-    session: AsyncSession, *, org_id: uuid.UUID, cfg: object | None, model_id: str
-) -> UsagePricing:
-    rule_in, rule_out, _, _, _ = await get_price_detail_for_model(
-        session, org_id=org_id, model_id=model_id.strip()
-    )
-    input_price = getattr(cfg, "input_usd_micros_per_m", None)
-    output_price = getattr(cfg, "output_usd_micros_per_m", None)
-
-    return UsagePricing(
-        input_usd_micros_per_m=input_price if input_price is not None else rule_in,
-        output_usd_micros_per_m=output_price if output_price is not None else rule_out,
-    )
-
-
 def _auth_error_status(detail: str) -> int:
     if detail == ACCOUNT_TEMPORARILY_LIMITED_DETAIL:
         return 429
@@ -1139,18 +1370,73 @@ def _auth_error_status(detail: str) -> int:
     return 401
 
 
+async def _enforce_proxy_rate_limits(
+    session: AsyncSession,
+    *,
+    api_key: ApiKey,
+    user: User,
+    org_id: uuid.UUID,
+    stream: bool,
+) -> RateLimitGrant:
+    rules = await rate_limit_rules_for_request(
+        session,
+        org_id=org_id,
+        user_id=user.id,
+        group_name=str(getattr(user, "group_name", "") or ""),
+        api_key_id=api_key.id,
+    )
+    try:
+        return await enforce_rate_limits(rules, stream=stream)
+    except RateLimitExceeded as e:
+        raise HTTPException(status_code=429, detail=e.detail, headers=e.headers) from e
+
+
+async def _eligible_channels_for_model(
+    session: AsyncSession, *, org_id: uuid.UUID, group_name: str, model_id: str
+) -> list[LlmChannel]:
+    group_channels, channels = await list_channels_for_model(
+        session, org_id=org_id, group_name=group_name, model_id=model_id
+    )
+    if not group_channels:
+        raise HTTPException(status_code=503, detail="no channel configured")
+    if not channels:
+        raise HTTPException(status_code=404, detail="model not found")
+    return channels
+
+
+async def _pick_channel_for_model(
+    session: AsyncSession, *, org_id: uuid.UUID, group_name: str, model_id: str
+) -> LlmChannel:
+    channels = await _eligible_channels_for_model(
+        session, org_id=org_id, group_name=group_name, model_id=model_id
+    )
+    return channels[0]
+
+
+def _channel_accepts_traffic(channel: LlmChannel) -> bool:
+    channel_id = getattr(channel, "id", None)
+    if not channel_is_healthy(channel_id):
+        return False
+    return not get_upstream_key_pool().exhausted(channel_id, channel_api_keys(channel))
+
+
 async def _resolve_llm_proxy_context(
     request: Request,
     session: AsyncSession,
     *,
     model_id: str,
+    stream: bool = False,
+    payload: dict[str, object] | None = None,
+    rotate_api_key: bool = True,
 ) -> LlmProxyContext:
     auth = request.headers.get("authorization")
     try:
-        api_key, user = await authenticate_api_key(session, authorization=auth)
+        with timed_stage("auth"):
+            api_key, user = await authenticate_api_key(session, authorization=auth)
     except ValueError as e:
         detail = str(e) or "unauthorized"
         raise HTTPException(status_code=_auth_error_status(detail), detail=detail) from e
+    resolve_started = time.perf_counter()
 
     from app.storage.balance_math import remaining_usd_micros
 
@@ -1165,9 +1451,33 @@ async def _resolve_llm_proxy_context(
     if cfg and not cfg.enabled:
         raise HTTPException(status_code=403, detail="model disabled")
 
-    channel = await pick_channel_for_group(session, org_id=membership.org_id, group_name=user.group_name)
-    if not channel:
-        raise HTTPException(status_code=503, detail="no channel configured")
+    channels = await _eligible_channels_for_model(
+        session, org_id=membership.org_id, group_name=user.group_name, model_id=model_id
+    )
+    affinity_key = prompt_affinity_key(payload, api_key_id=api_key.id, user_id=user.id)
+    if affinity_key is not None:
+        channels = order_by_affinity(
+            channels,
+            key=affinity_key,
+            id_of=lambda c: getattr(c, "id", None),
+            healthy=_channel_accepts_traffic,
+        )
+    channel = channels[0]
+    hedge_targets: tuple[UpstreamTarget, ...] = ()
+    if stream and settings.stream_hedging_enabled:
+        hedge_targets = tuple(
+            UpstreamTarget(
+                channel_id=getattr(c, "id", None),
+                base_url=str(c.base_url).rstrip("/"),
+                api_key="",
+                pick_api_key=partial(pick_channel_api_key, c),
+            )
+            for c in channels[1:2]
+        )
+    pricing = await resolve_usage_pricing(session, org_id=membership.org_id, cfg=cfg, model_id=model_id)
+    rate_limit_grant = await _enforce_proxy_rate_limits(
+        session, api_key=api_key, user=user, org_id=membership.org_id, stream=stream
+    )
 
     context = LlmProxyContext(
         api_key_id=api_key.id,
@@ -1177,14 +1487,21 @@ async def _resolve_llm_proxy_context(
         model_id=model_id,
         source_ip=_extract_source_ip(request),
         upstream_base_url=str(channel.base_url).rstrip("/"),
-        upstream_api_key=str(channel.api_key),
-        pricing=await _resolve_usage_pricing(session, org_id=membership.org_id, cfg=cfg, model_id=model_id),
+        # Content generation tasks are polled later with the primary key, so they must be created with it too.
+        upstream_api_key=pick_channel_api_key(channel) if rotate_api_key else str(channel.api_key),
+        pricing=pricing,
         channel_id=getattr(channel, "id", None),
+        rate_limit_grant=rate_limit_grant,
+        response_cache_enabled=bool(cfg and cfg.response_cache_enabled),
+        hedge_targets=hedge_targets,
+        hedge_ttft_ms=cfg.hedge_ttft_ms if cfg else None,
     )
 
     # Streaming responses can stay open for a long time; release the request-scoped
     # SQLAlchemy session before any upstream I/O so we do not pin a DB transaction.
     await session.close()
+    record_stage_ms("resolve", (time.perf_counter() - resolve_started) * 1000)
+    note_request_model(model_id, is_admin=getattr(membership, "role", None) in ADMIN_LIKE_ROLES)
     return context
 
 
@@ -1194,13 +1511,16 @@ async def _resolve_content_generation_task_context(
     *,
     task_id: str,
     fallback_model_id: str | None = None,
-) -> LlmProxyContext:
+    allow_cached: bool = False,
+) -> LlmProxyContext | ContentGenerationResult:
     auth = request.headers.get("authorization")
     try:
-        api_key, user = await authenticate_api_key(session, authorization=auth)
+        with timed_stage("auth"):
+            api_key, user = await authenticate_api_key(session, authorization=auth)
     except ValueError as e:
         detail = str(e) or "unauthorized"
         raise HTTPException(status_code=_auth_error_status(detail), detail=detail) from e
+    resolve_started = time.perf_counter()
 
     from app.storage.balance_math import remaining_usd_micros
 
@@ -1214,20 +1534,13 @@ async def _resolve_content_generation_task_context(
     if row is not None:
         if row.org_id != membership.org_id or row.user_id != user.id:
             raise HTTPException(status_code=404, detail="content generation task not found")
+        cached = cached_content_generation_result(row) if allow_cached else None
+        if cached is not None:
+            await session.close()
+            return cached
         model_id = str(row.model_id)
     else:
         model_id = (fallback_model_id or "").strip()
-        if not model_id:
-            model_id = (
-                await _infer_content_generation_task_model_id(
-                    session,
-                    task_id=task_id,
-                    org_id=membership.org_id,
-                    user_id=user.id,
-                    api_key_id=getattr(api_key, "id", None),
-                )
-                or ""
-            )
         if not model_id:
             raise HTTPException(status_code=404, detail="content generation task not found")
 
@@ -1243,9 +1556,13 @@ async def _resolve_content_generation_task_context(
         if channel is None:
             raise HTTPException(status_code=503, detail="task channel unavailable")
     else:
-        channel = await pick_channel_for_group(session, org_id=membership.org_id, group_name=user.group_name)
-        if not channel:
-            raise HTTPException(status_code=503, detail="no channel configured")
+        channel = await _pick_channel_for_model(
+            session, org_id=membership.org_id, group_name=user.group_name, model_id=model_id
+        )
+    pricing = await resolve_usage_pricing(session, org_id=membership.org_id, cfg=cfg, model_id=model_id)
+    rate_limit_grant = await _enforce_proxy_rate_limits(
+        session, api_key=api_key, user=user, org_id=membership.org_id, stream=False
+    )
 
     context = LlmProxyContext(
         api_key_id=api_key.id,
@@ -1256,11 +1573,14 @@ async def _resolve_content_generation_task_context(
         source_ip=_extract_source_ip(request),
         upstream_base_url=str(channel.base_url).rstrip("/"),
         upstream_api_key=str(channel.api_key),
-        pricing=await _resolve_usage_pricing(session, org_id=membership.org_id, cfg=cfg, model_id=model_id),
+        pricing=pricing,
         channel_id=getattr(channel, "id", None),
+        rate_limit_grant=rate_limit_grant,
     )
 
     await session.close()
+    record_stage_ms("resolve", (time.perf_counter() - resolve_started) * 1000)
+    note_request_model(model_id, is_admin=getattr(membership, "role", None) in ADMIN_LIKE_ROLES)
     return context
 
 
@@ -1363,13 +1683,48 @@ async def admin_dataocean_status(
     return await get_dataocean_status(session)
 
 
+@router.get("/admin/response-cache")
+async def admin_response_cache_status(admin_user=Depends(require_admin)) -> dict:
+    _ = admin_user
+    return response_cache_stats()
+
+
+@router.get("/admin/single-flight")
+async def admin_single_flight_status(admin_user=Depends(require_admin)) -> dict:
+    _ = admin_user
+    return single_flight_stats()
+
+
+@router.get("/admin/stream-hedging")
+async def admin_stream_hedging_status(admin_user=Depends(require_admin)) -> dict:
+    _ = admin_user
+    return stream_hedging_stats()
+
+
+@router.get("/admin/prompt-affinity")
+async def admin_prompt_affinity_status(admin_user=Depends(require_admin)) -> dict:
+    _ = admin_user
+    return prompt_affinity_stats()
+
+
+@router.get("/admin/slow-requests")
+async def admin_slow_requests(admin_user=Depends(require_admin)) -> dict:
+    _ = admin_user
+    return slow_request_samples()
+
+
+@router.get("/admin/event-loop")
+async def admin_event_loop_status(admin_user=Depends(require_admin)) -> dict:
+    _ = admin_user
+    return loop_monitor_stats()
+
+
 @router.post("/analytics/collect", status_code=202)
 async def collect_browser_analytics(
     payload: AnalyticsCollectRequest,
     request: Request,
-    session: AsyncSession = Depends(get_db_session),
 ) -> dict:
-    from app.constants import DEVICE_ID_COOKIE_NAME
+    from app.constants import DEVICE_ID_COOKIE_NAME, SESSION_COOKIE_NAME
 
     _check_analytics_rate_limit(request)
     anonymous_id = payload.anonymous_id or request.cookies.get(DEVICE_ID_COOKIE_NAME)
@@ -1377,11 +1732,9 @@ async def collect_browser_analytics(
     if not anonymous_id or not session_id:
         raise HTTPException(status_code=400, detail="missing analytics ids")
 
-    current_user = await _get_optional_current_user(request, session)
-    row = await enqueue_analytics_event(
-        session,
+    # No DB I/O here: the session token is resolved to a user when the buffer is flushed.
+    event_id = buffer_analytics_event(
         name=payload.name,
-        user_id=str(current_user.id) if current_user else None,
         anonymous_id=anonymous_id,
         session_id=session_id,
         occurred_at=_normalize_browser_analytics_time(payload.timestamp),
@@ -1391,14 +1744,15 @@ async def collect_browser_analytics(
             payload=payload,
             anonymous_id=anonymous_id,
             session_id=session_id,
-            user=current_user,
         ),
         event_id=payload.event_id,
+        session_token=_extract_bearer_token(request.headers.get("authorization"))
+        or request.cookies.get(SESSION_COOKIE_NAME),
     )
     return {
         "ok": True,
-        "queued": bool(row),
-        "eventId": row.event_id if row else payload.event_id,
+        "queued": event_id is not None,
+        "eventId": event_id or payload.event_id,
     }
 
 
@@ -1721,7 +2075,7 @@ async def password_set(
 
     _validate_password_value(payload.password)
     now = dt.datetime.now(dt.timezone.utc)
-    current_user.password_hash = hash_password(payload.password)
+    current_user.password_hash = await hash_password_async(payload.password)
     current_user.password_set_at = now
     await session.commit()
     await session.refresh(current_user)
@@ -1780,7 +2134,7 @@ async def password_reset(
         raise HTTPException(status_code=400, detail=str(e)) from e
 
     now = dt.datetime.now(dt.timezone.utc)
-    user.password_hash = hash_password(payload.password)
+    user.password_hash = await hash_password_async(payload.password)
     user.password_set_at = now
     await session.commit()
     await session.refresh(user)
@@ -1796,12 +2150,12 @@ async def password_change(
     session: AsyncSession = Depends(get_db_session),
     current_user=Depends(get_current_user),
 ) -> AuthMethodsResponse:
-    if not verify_password(payload.current_password, current_user.password_hash):
+    if not await verify_password_async(payload.current_password, current_user.password_hash):
         raise HTTPException(status_code=400, detail="invalid current password")
 
     _validate_password_value(payload.new_password)
     now = dt.datetime.now(dt.timezone.utc)
-    current_user.password_hash = hash_password(payload.new_password)
+    current_user.password_hash = await hash_password_async(payload.new_password)
     current_user.password_set_at = now
     await session.commit()
     await session.refresh(current_user)
@@ -1834,7 +2188,7 @@ async def password_remove(
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e)) from e
 
-    current_user.password_hash = hash_password(secrets.token_urlsafe(32))
+    current_user.password_hash = await hash_password_async(secrets.token_urlsafe(32))
     current_user.password_set_at = None
     await session.commit()
     await session.refresh(current_user)
@@ -2316,6 +2670,25 @@ async def admin_delete_user(
     return deleted
 
 
+_channel_model_refreshes: set[asyncio.Task[None]] = set()
+
+
+def _channel_models_refresh_done(task: asyncio.Task[None]) -> None:
+    _channel_model_refreshes.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("channel model refresh failed", exc_info=task.exception())
+
+
+def _schedule_channel_models_refresh(channel_id: str) -> None:
+    try:
+        parsed = uuid.UUID(channel_id)
+    except ValueError:
+        return
+    task = asyncio.create_task(refresh_channel_models_by_id(parsed))
+    _channel_model_refreshes.add(task)
+    task.add_done_callback(_channel_models_refresh_done)
+
+
 @router.get("/admin/channels", response_model=LlmChannelsListResponse)
 async def admin_list_channels(
     session: AsyncSession = Depends(get_db_session),
@@ -2335,9 +2708,11 @@ async def admin_create_channel(
 ) -> LlmChannelCreateResponse:
     _ = admin_user
     try:
-        return await create_channel(session, org_id=membership.org_id, input=payload)
+        created = await create_channel(session, org_id=membership.org_id, input=payload)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e)) from e
+    _schedule_channel_models_refresh(created.item.id)
+    return created
 
 
 @router.patch("/admin/channels/{channel_id}", response_model=LlmChannelUpdateResponse)
@@ -2359,6 +2734,7 @@ async def admin_update_channel(
         raise HTTPException(status_code=400, detail=str(e)) from e
     if not updated:
         raise HTTPException(status_code=404, detail="not found")
+    _schedule_channel_models_refresh(updated.item.id)
     return updated
 
 
@@ -2377,16 +2753,27 @@ async def admin_delete_channel(
     deleted = await delete_channel(session, org_id=membership.org_id, channel_id=parsed)
     if not deleted:
         raise HTTPException(status_code=404, detail="not found")
+    forget_channel_models(parsed)
+    forget_channel(parsed)
     return deleted
 
 
 @router.post("/chat/completions")
 async def chat_completions(request: Request, session: AsyncSession = Depends(get_db_session)):
+    return await _proxy_chat_completions_request(request, session)
+
+
+@timed_proxy_request
+async def _proxy_chat_completions_request(request: Request, session: AsyncSession):
+    arrived = time.perf_counter()
     raw = await _read_request_body_or_499(request)
-    parsed = _parse_llm_request(raw)
+    with timed_stage("parse"):
+        parsed = _parse_llm_request(raw)
     payload = parsed.payload
-    context = await _resolve_llm_proxy_context(request, session, model_id=parsed.model_id)
     stream = bool(payload.get("stream"))
+    context = await _resolve_llm_proxy_context(
+        request, session, model_id=parsed.model_id, stream=stream, payload=payload
+    )
     _log_llm_request_received(request, context=context, stream=stream)
 
     upstream_url = f"{context.upstream_base_url}/chat/completions"
@@ -2403,6 +2790,7 @@ async def chat_completions(request: Request, session: AsyncSession = Depends(get
     timeout = _llm_upstream_timeout()
 
     started = time.perf_counter()
+    _observe_gateway_overhead(request, context=context, arrived=arrived, started=started)
     ttft_ms = 0
     total_ms = 0
 
@@ -2410,39 +2798,39 @@ async def chat_completions(request: Request, session: AsyncSession = Depends(get
         # Important: do NOT use `async with client.stream(...)` here, otherwise the upstream
         # stream is closed immediately when the request handler returns. Keep the stream open
         # and close it inside the generator's `finally`.
-        client = httpx.AsyncClient(timeout=timeout)
-        try:
-            req_up = client.build_request("POST", upstream_url, headers=headers, content=raw)
-            res = await client.send(req_up, stream=True)
-        except httpx.HTTPError as exc:
-            try:
-                await client.aclose()
-            except Exception:
-                pass
-            error = await _record_upstream_http_error_usage(
-                request=request,
-                context=context,
-                exc=exc,
-                started=started,
-                is_streaming=True,
+        def build_request(client: httpx.AsyncClient, target: UpstreamTarget) -> httpx.Request:
+            return client.build_request(
+                "POST",
+                f"{target.base_url}/chat/completions",
+                headers={**headers, "authorization": f"Bearer {target.api_key}"},
+                content=raw,
+                extensions=upstream_trace_extensions(),
             )
-            raise error from exc
+
+        client, res, chunks, served_by = await _open_llm_stream_or_499(
+            request, context=context, build_request=build_request, timeout=timeout, started=started
+        )
         content_type = res.headers.get("content-type") or "application/json"
         ok = res.status_code < 400
         input_tokens = 0
         cached_tokens = 0
         output_tokens = 0
         total_tokens = 0
+        client_disconnected = False
 
         async def iterator():
             nonlocal ttft_ms, total_ms, input_tokens, cached_tokens, output_tokens, total_tokens
+            nonlocal client_disconnected
             first = None
             sse_lines = _SseLineBuffer()
+            STREAMS_IN_FLIGHT.inc()
             try:
-                async for chunk in res.aiter_bytes():
+                async for chunk in chunks:
                     if first is None:
                         first = time.perf_counter()
                         ttft_ms = int((first - started) * 1000)
+                        if ok:
+                            observe_stream_ttft(context.model_id, ttft_ms)
                     if ok and content_type.startswith("text/event-stream"):
                         for raw_line in sse_lines.feed(chunk):
                             parsed = _extract_usage_tokens_from_sse_line(raw_line)
@@ -2450,6 +2838,9 @@ async def chat_completions(request: Request, session: AsyncSession = Depends(get
                                 continue
                             input_tokens, cached_tokens, output_tokens, total_tokens = parsed
                     yield chunk
+            except (asyncio.CancelledError, GeneratorExit):
+                client_disconnected = True
+                raise
             except (
                 httpx.ReadError,
                 httpx.ReadTimeout,
@@ -2461,6 +2852,7 @@ async def chat_completions(request: Request, session: AsyncSession = Depends(get
                 # Treat upstream disconnects/cancellation as a normal stream termination.
                 pass
             finally:
+                STREAMS_IN_FLIGHT.dec()
                 total_ms_local = int((time.perf_counter() - started) * 1000)
 
                 async def finalize() -> None:
@@ -2472,6 +2864,7 @@ async def chat_completions(request: Request, session: AsyncSession = Depends(get
                         await client.aclose()
                     except Exception:
                         pass
+                    await release_rate_limit_grant(context.rate_limit_grant)
 
                     cost_micros = estimate_cost_usd_micros(
                         pricing=context.pricing,
@@ -2479,13 +2872,15 @@ async def chat_completions(request: Request, session: AsyncSession = Depends(get
                         cached_tokens=cached_tokens,
                         output_tokens=output_tokens,
                     )
+                    record_ok = ok and not client_disconnected
+                    record_status_code = 499 if client_disconnected else int(res.status_code)
                     await _record_usage_event_best_effort(
                         org_id=context.org_id,
                         user_id=context.user_id,
                         api_key_id=context.api_key_id,
                         model_id=context.model_id,
-                        ok=ok,
-                        status_code=int(res.status_code),
+                        ok=record_ok,
+                        status_code=record_status_code,
                         input_tokens=input_tokens,
                         cached_tokens=cached_tokens,
                         output_tokens=output_tokens,
@@ -2497,9 +2892,10 @@ async def chat_completions(request: Request, session: AsyncSession = Depends(get
                         request_endpoint=_request_endpoint(request),
                         is_streaming=True,
                         recompute_cost=False,
+                        channel_id=served_by.channel_id,
                     )
 
-                asyncio.create_task(finalize())
+                submit_stream_finalization(finalize)
 
         return StreamingResponse(
             iterator(),
@@ -2508,30 +2904,31 @@ async def chat_completions(request: Request, session: AsyncSession = Depends(get
             headers={"cache-control": "no-cache", "x-accel-buffering": "no"},
         )
 
+    cache_key = _response_cache_key_for(request, context=context, upstream_path="/chat/completions", raw=raw)
+    if cache_key is not None:
+        cached_response = await _serve_cached_response(request, context=context, cache_key=cache_key, started=started)
+        if cached_response is not None:
+            return cached_response
+
     # Non-stream response: read full body then close the upstream response/client.
-    try:
-        async with httpx.AsyncClient(timeout=timeout) as client:
-            async with client.stream("POST", upstream_url, headers=headers, content=raw) as res:
-                content_type = res.headers.get("content-type") or "application/json"
-                ok = res.status_code < 400
-
-                body_bytes = bytearray()
-                first = None
-                async for chunk in res.aiter_bytes():
-                    if first is None:
-                        first = time.perf_counter()
-                        ttft_ms = int((first - started) * 1000)
-                    body_bytes.extend(chunk)
-                total_ms = int((time.perf_counter() - started) * 1000)
-    except httpx.HTTPError as exc:
-        error = await _record_upstream_http_error_usage(
-            request=request,
-            context=context,
-            exc=exc,
-            started=started,
-            is_streaming=False,
-        )
-        raise error from exc
+    reply = await _fetch_upstream_or_499(
+        request,
+        context=context,
+        method="POST",
+        url=upstream_url,
+        headers=headers,
+        content=raw,
+        timeout=timeout,
+        started=started,
+        flight_key=_single_flight_key_for(
+            request, context=context, upstream_path="/chat/completions", raw=raw, payload=parsed.payload
+        ),
+    )
+    content_type = reply.content_type
+    ok = reply.status_code < 400
+    body_bytes = reply.body
+    ttft_ms = reply.ttft_ms
+    total_ms = reply.total_ms
 
     # Record usage/spend for dashboard and logs.
     input_tokens = 0
@@ -2558,8 +2955,9 @@ async def chat_completions(request: Request, session: AsyncSession = Depends(get
         except Exception:
             pass
 
-    cost_micros = estimate_cost_usd_micros(
-        pricing=context.pricing,
+    cost_micros = _reply_cost_usd_micros(
+        reply,
+        context=context,
         input_tokens=input_tokens,
         cached_tokens=cached_tokens,
         output_tokens=output_tokens,
@@ -2571,7 +2969,7 @@ async def chat_completions(request: Request, session: AsyncSession = Depends(get
         api_key_id=context.api_key_id,
         model_id=context.model_id,
         ok=ok,
-        status_code=int(res.status_code),
+        status_code=reply.status_code,
         input_tokens=input_tokens,
         cached_tokens=cached_tokens,
         output_tokens=output_tokens,
@@ -2583,11 +2981,21 @@ async def chat_completions(request: Request, session: AsyncSession = Depends(get
         request_endpoint=_request_endpoint(request),
         is_streaming=False,
         recompute_cost=False,
+        channel_id=context.channel_id,
     )
 
-    return Response(content=bytes(body_bytes), status_code=int(res.status_code), media_type=content_type)
+    _store_cached_response(
+        cache_key, reply=reply, usage_tokens=(input_tokens, cached_tokens, output_tokens, total_tokens)
+    )
+    return Response(
+        content=bytes(body_bytes),
+        status_code=reply.status_code,
+        media_type=content_type,
+        headers={RESPONSE_CACHE_HEADER: "miss"} if cache_key is not None else None,
+    )
 
 
+@timed_proxy_request
 async def _proxy_responses_request(
     request: Request,
     session: AsyncSession,
@@ -2595,13 +3003,17 @@ async def _proxy_responses_request(
     upstream_path: str,
     allow_multipart: bool = False,
 ):
+    arrived = time.perf_counter()
     raw = await _read_request_body_or_499(request)
-    parsed = _parse_proxy_request(
-        raw,
-        content_type=request.headers.get("content-type") or "",
-        allow_multipart=allow_multipart,
+    with timed_stage("parse"):
+        parsed = _parse_proxy_request(
+            raw,
+            content_type=request.headers.get("content-type") or "",
+            allow_multipart=allow_multipart,
+        )
+    context = await _resolve_llm_proxy_context(
+        request, session, model_id=parsed.model_id, stream=parsed.stream, payload=parsed.payload
     )
-    context = await _resolve_llm_proxy_context(request, session, model_id=parsed.model_id)
     _log_llm_request_received(request, context=context, stream=parsed.stream)
 
     upstream_url = _build_llm_upstream_url(
@@ -2614,27 +3026,25 @@ async def _proxy_responses_request(
     timeout = _llm_upstream_timeout()
 
     started = time.perf_counter()
+    _observe_gateway_overhead(request, context=context, arrived=arrived, started=started)
     ttft_ms = 0
     total_ms = 0
 
     if parsed.stream:
-        client = httpx.AsyncClient(timeout=timeout)
-        try:
-            req_up = client.build_request("POST", upstream_url, headers=headers, content=raw)
-            res = await client.send(req_up, stream=True)
-        except httpx.HTTPError as exc:
-            try:
-                await client.aclose()
-            except Exception:
-                pass
-            error = await _record_upstream_http_error_usage(
-                request=request,
-                context=context,
-                exc=exc,
-                started=started,
-                is_streaming=True,
+        def build_request(client: httpx.AsyncClient, target: UpstreamTarget) -> httpx.Request:
+            return client.build_request(
+                "POST",
+                _build_llm_upstream_url(
+                    upstream_base_url=target.base_url, upstream_path=upstream_path, query=request.url.query
+                ),
+                headers=_build_upstream_headers(request, upstream_api_key=target.api_key),
+                content=raw,
+                extensions=upstream_trace_extensions(),
             )
-            raise error from exc
+
+        client, res, chunks, served_by = await _open_llm_stream_or_499(
+            request, context=context, build_request=build_request, timeout=timeout, started=started
+        )
         content_type = res.headers.get("content-type") or "application/json"
         ok = res.status_code < 400
         input_tokens = 0
@@ -2651,11 +3061,14 @@ async def _proxy_responses_request(
             nonlocal client_disconnected
             first = None
             sse_lines = _SseLineBuffer()
+            STREAMS_IN_FLIGHT.inc()
             try:
-                async for chunk in res.aiter_bytes():
+                async for chunk in chunks:
                     if first is None:
                         first = time.perf_counter()
                         ttft_ms = int((first - started) * 1000)
+                        if ok:
+                            observe_stream_ttft(context.model_id, ttft_ms)
                     if ok and content_type.startswith("text/event-stream"):
                         for raw_line in sse_lines.feed(chunk):
                             parsed = _extract_usage_tokens_from_sse_line(raw_line)
@@ -2676,6 +3089,7 @@ async def _proxy_responses_request(
             ):
                 pass
             finally:
+                STREAMS_IN_FLIGHT.dec()
                 total_ms_local = int((time.perf_counter() - started) * 1000)
 
                 async def finalize() -> None:
@@ -2687,6 +3101,7 @@ async def _proxy_responses_request(
                         await client.aclose()
                     except Exception:
                         pass
+                    await release_rate_limit_grant(context.rate_limit_grant)
 
                     cost_micros = estimate_cost_usd_micros(
                         pricing=context.pricing,
@@ -2714,9 +3129,10 @@ async def _proxy_responses_request(
                         request_endpoint=_request_endpoint(request),
                         is_streaming=True,
                         recompute_cost=False,
+                        channel_id=served_by.channel_id,
                     )
 
-                asyncio.create_task(finalize())
+                submit_stream_finalization(finalize)
 
         return StreamingResponse(
             iterator(),
@@ -2725,30 +3141,31 @@ async def _proxy_responses_request(
             headers=upstream_headers,
         )
 
-    try:
-        async with httpx.AsyncClient(timeout=timeout) as client:
-            async with client.stream("POST", upstream_url, headers=headers, content=raw) as res:
-                content_type = res.headers.get("content-type") or "application/json"
-                ok = res.status_code < 400
-
-                body_bytes = bytearray()
-                first = None
-                async for chunk in res.aiter_bytes():
-                    if first is None:
-                        first = time.perf_counter()
-                        ttft_ms = int((first - started) * 1000)
-                    body_bytes.extend(chunk)
-                total_ms = int((time.perf_counter() - started) * 1000)
-                upstream_headers = _filter_upstream_response_headers(dict(res.headers))
-    except httpx.HTTPError as exc:
-        error = await _record_upstream_http_error_usage(
-            request=request,
-            context=context,
-            exc=exc,
-            started=started,
-            is_streaming=False,
-        )
-        raise error from exc
+    cache_key = _response_cache_key_for(request, context=context, upstream_path=upstream_path, raw=raw)
+    if cache_key is not None:
+        cached_response = await _serve_cached_response(request, context=context, cache_key=cache_key, started=started)
+        if cached_response is not None:
+            return cached_response
+
+    reply = await _fetch_upstream_or_499(
+        request,
+        context=context,
+        method="POST",
+        url=upstream_url,
+        headers=headers,
+        content=raw,
+        timeout=timeout,
+        started=started,
+        flight_key=_single_flight_key_for(
+            request, context=context, upstream_path=upstream_path, raw=raw, payload=parsed.payload
+        ),
+    )
+    content_type = reply.content_type
+    ok = reply.status_code < 400
+    body_bytes = reply.body
+    ttft_ms = reply.ttft_ms
+    total_ms = reply.total_ms
+    upstream_headers = dict(reply.headers)
 
     input_tokens = 0
     cached_tokens = 0
@@ -2758,14 +3175,15 @@ async def _proxy_responses_request(
         try:
             body = json.loads(body_bytes.decode("utf-8"))
             if isinstance(body, dict):
-                parsed = _extract_usage_tokens(body)
+                parsed = extract_usage_tokens(body)
                 if parsed:
                     input_tokens, cached_tokens, output_tokens, total_tokens = parsed
         except Exception:
             pass
 
-    cost_micros = estimate_cost_usd_micros(
-        pricing=context.pricing,
+    cost_micros = _reply_cost_usd_micros(
+        reply,
+        context=context,
         input_tokens=input_tokens,
         cached_tokens=cached_tokens,
         output_tokens=output_tokens,
@@ -2777,7 +3195,7 @@ async def _proxy_responses_request(
         api_key_id=context.api_key_id,
         model_id=context.model_id,
         ok=ok,
-        status_code=int(res.status_code),
+        status_code=reply.status_code,
         input_tokens=input_tokens,
         cached_tokens=cached_tokens,
         output_tokens=output_tokens,
@@ -2789,17 +3207,24 @@ async def _proxy_responses_request(
         request_endpoint=_request_endpoint(request),
         is_streaming=False,
         recompute_cost=False,
+        channel_id=context.channel_id,
     )
 
+    _store_cached_response(
+        cache_key, reply=reply, usage_tokens=(input_tokens, cached_tokens, output_tokens, total_tokens)
+    )
     upstream_headers.setdefault("cache-control", "no-cache")
+    if cache_key is not None:
+        upstream_headers[RESPONSE_CACHE_HEADER] = "miss"
     return Response(
         content=bytes(body_bytes),
-        status_code=int(res.status_code),
+        status_code=reply.status_code,
         media_type=content_type,
         headers=upstream_headers,
     )
 
 
+@timed_proxy_request
 async def _proxy_content_generation_task_request(
     request: Request,
     session: AsyncSession,
@@ -2809,19 +3234,32 @@ async def _proxy_content_generation_task_request(
     task_id: str | None = None,
 ):
     method_upper = method.upper()
+    arrived = time.perf_counter()
     raw = await _read_request_body_or_499(request)
 
     if method_upper == "POST":
-        parsed = _parse_llm_request(raw)
-        context = await _resolve_llm_proxy_context(request, session, model_id=parsed.model_id)
+        with timed_stage("parse"):
+            parsed = _parse_llm_request(raw)
+        context = await _resolve_llm_proxy_context(
+            request, session, model_id=parsed.model_id, rotate_api_key=False
+        )
     else:
         fallback_model_id = request.query_params.get("model")
-        context = await _resolve_content_generation_task_context(
+        resolved = await _resolve_content_generation_task_context(
             request,
             session,
             task_id=(task_id or "").strip(),
             fallback_model_id=fallback_model_id,
+            allow_cached=method_upper == "GET",
         )
+        if isinstance(resolved, ContentGenerationResult):
+            return Response(
+                content=resolved.body,
+                status_code=resolved.status_code,
+                media_type=resolved.content_type,
+                headers={"cache-control": "no-cache"},
+            )
+        context = resolved
 
     _log_llm_request_received(request, context=context, stream=False)
 
@@ -2834,67 +3272,66 @@ async def _proxy_content_generation_task_request(
     timeout = _llm_upstream_timeout()
 
     started = time.perf_counter()
+    _observe_gateway_overhead(request, context=context, arrived=arrived, started=started)
     ttft_ms = 0
     total_ms = 0
 
-    try:
-        async with httpx.AsyncClient(timeout=timeout) as client:
-            async with client.stream(method_upper, upstream_url, headers=headers, content=raw) as res:
-                content_type = res.headers.get("content-type") or "application/json"
-                ok = res.status_code < 400
-
-                body_bytes = bytearray()
-                first = None
-                async for chunk in res.aiter_bytes():
-                    if first is None:
-                        first = time.perf_counter()
-                        ttft_ms = int((first - started) * 1000)
-                    body_bytes.extend(chunk)
-                total_ms = int((time.perf_counter() - started) * 1000)
-                upstream_headers = _filter_upstream_response_headers(dict(res.headers))
-    except httpx.HTTPError as exc:
-        error = await _record_upstream_http_error_usage(
-            request=request,
-            context=context,
-            exc=exc,
-            started=started,
-            is_streaming=False,
-        )
-        raise error from exc
+    reply = await _fetch_upstream_or_499(
+        request,
+        context=context,
+        method=method_upper,
+        url=upstream_url,
+        headers=headers,
+        content=raw,
+        timeout=timeout,
+        started=started,
+    )
+    content_type = reply.content_type
+    ok = reply.status_code < 400
+    ttft_ms = reply.ttft_ms
+    total_ms = reply.total_ms
+    upstream_headers = dict(reply.headers)
 
-    body = bytes(body_bytes)
+    body = reply.body
     recorded_tokens = (0, 0, 0, 0, 0)
+    usage_recorded = False
     response_task_id = _extract_content_generation_task_id(body)
     effective_task_id = response_task_id or task_id
 
     if ok and method_upper == "POST" and response_task_id:
-        await _remember_content_generation_task(task_id=response_task_id, context=context)
+        usage_recorded = await _record_content_generation_task_created(
+            task_id=response_task_id,
+            context=context,
+            status_code=reply.status_code,
+            total_duration_ms=total_ms,
+            ttft_ms=ttft_ms,
+            request_endpoint=_request_endpoint(request),
+        )
     elif ok and method_upper == "DELETE" and effective_task_id:
         await _remember_content_generation_task(task_id=effective_task_id, context=context, status="deleted")
 
     if ok and method_upper == "GET" and effective_task_id:
-        status, usage_tokens = _extract_content_generation_status_and_usage(body)
-        if status is not None:
-            await _remember_content_generation_task(task_id=effective_task_id, context=context, status=status)
+        status, usage_tokens = extract_content_generation_status_and_usage(body)
         recorded_tokens = await _record_content_generation_usage_once(
             task_id=effective_task_id,
             context=context,
             status=status,
             usage_tokens=usage_tokens,
-            status_code=int(res.status_code),
+            status_code=reply.status_code,
             total_duration_ms=total_ms,
             ttft_ms=ttft_ms,
             request_endpoint=_request_endpoint(request),
+            result=ContentGenerationResult(status_code=reply.status_code, content_type=content_type, body=body),
         )
 
-    if recorded_tokens == (0, 0, 0, 0, 0):
+    if recorded_tokens == (0, 0, 0, 0, 0) and not usage_recorded:
         await _record_usage_event_best_effort(
             org_id=context.org_id,
             user_id=context.user_id,
             api_key_id=context.api_key_id,
             model_id=context.model_id,
             ok=ok,
-            status_code=int(res.status_code),
+            status_code=reply.status_code,
             input_tokens=0,
             cached_tokens=0,
             output_tokens=0,
@@ -2906,12 +3343,13 @@ async def _proxy_content_generation_task_request(
             request_endpoint=_request_endpoint(request),
             is_streaming=False,
             recompute_cost=False,
+            channel_id=context.channel_id,
         )
 
     upstream_headers.setdefault("cache-control", "no-cache")
     return Response(
         content=body,
-        status_code=int(res.status_code),
+        status_code=reply.status_code,
         media_type=content_type,
         headers=upstream_headers,
     )
@@ -3020,6 +3458,8 @@ async def admin_update_model(
     enabled = payload.enabled if "enabled" in fields_set else None
     input_price = payload.input_usd_per_m if "input_usd_per_m" in fields_set else UNSET
     output_price = payload.output_usd_per_m if "output_usd_per_m" in fields_set else UNSET
+    response_cache = payload.response_cache if "response_cache" in fields_set else None
+    hedge_ttft_ms = payload.hedge_ttft_ms if "hedge_ttft_ms" in fields_set else UNSET
 
     try:
         row = await upsert_model_config(
@@ -3029,6 +3469,8 @@ async def admin_update_model(
             enabled=enabled,
             input_usd_per_m=input_price,
             output_usd_per_m=output_price,
+            response_cache_enabled=response_cache,
+            hedge_ttft_ms=hedge_ttft_ms,
         )
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e)) from e
@@ -3036,7 +3478,14 @@ async def admin_update_model(
     items = await list_admin_models(session, org_id=membership.org_id)
     item = next((x for x in items if x.get("model") == row.model_id), None)
     if not item:
-        item = {"model": row.model_id, "enabled": bool(row.enabled), "sources": 0, "available": False}
+        item = {
+            "model": row.model_id,
+            "enabled": bool(row.enabled),
+            "responseCache": bool(row.response_cache_enabled),
+            "hedgeTtftMs": row.hedge_ttft_ms,
+            "sources": 0,
+            "available": False,
+        }
     return AdminModelUpdateResponse(item=item)  # type: ignore[arg-type]
 
 
@@ -3113,6 +3562,54 @@ async def admin_delete_model_pricing(
     return AdminModelPricingDeleteResponse(ok=True, prefix=prefix)
 
 
+@router.get("/admin/rate-limits", response_model=RateLimitPoliciesListResponse)
+async def admin_list_rate_limits(
+    session: AsyncSession = Depends(get_db_session),
+    admin_user=Depends(require_admin),
+    membership=Depends(get_current_membership),
+) -> RateLimitPoliciesListResponse:
+    _ = admin_user
+    rows = await list_rate_limit_policies(session, org_id=membership.org_id)
+    return RateLimitPoliciesListResponse(items=[rate_limit_policy_to_item(row) for row in rows])  # type: ignore[misc]
+
+
+@router.put("/admin/rate-limits", response_model=RateLimitPolicyUpdateResponse)
+async def admin_upsert_rate_limit(
+    payload: RateLimitPolicyUpsertRequest,
+    session: AsyncSession = Depends(get_db_session),
+    admin_user=Depends(require_admin),
+    membership=Depends(get_current_membership),
+) -> RateLimitPolicyUpdateResponse:
+    _ = admin_user
+    try:
+        row = await upsert_rate_limit_policy(
+            session,
+            org_id=membership.org_id,
+            scope=payload.scope,
+            subject=payload.subject,
+            rpm_limit=payload.rpm_limit,
+            tpm_limit=payload.tpm_limit,
+            max_concurrent_streams=payload.max_concurrent_streams,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    return RateLimitPolicyUpdateResponse(item=rate_limit_policy_to_item(row))  # type: ignore[arg-type]
+
+
+@router.delete("/admin/rate-limits/{policy_id}", response_model=RateLimitPolicyDeleteResponse)
+async def admin_delete_rate_limit(
+    policy_id: uuid.UUID,
+    session: AsyncSession = Depends(get_db_session),
+    admin_user=Depends(require_admin),
+    membership=Depends(get_current_membership),
+) -> RateLimitPolicyDeleteResponse:
+    _ = admin_user
+    ok = await delete_rate_limit_policy(session, org_id=membership.org_id, policy_id=policy_id)
+    if not ok:
+        raise HTTPException(status_code=404, detail="not found")
+    return RateLimitPolicyDeleteResponse(ok=True, id=str(policy_id))
+
+
 @router.get("/usage", response_model=UsageResponse)
 async def usage(
     tz: str = "UTC",
@@ -3340,8 +3837,7 @@ async def billing_topup_status(
     if not topup:
         raise HTTPException(status_code=404, detail="not found")
 
-    topup = await _sync_pending_topup_from_zhupay(session, topup=topup)
-
+    # Pending ZhuPay topups are reconciled by the background worker; polling only reads the row.
     status = str(topup.status or "pending")
     units = int(getattr(topup, "units", 0) or 0)
     out: dict[str, object] = {"requestId": str(topup.request_id), "status": status, "units": units}
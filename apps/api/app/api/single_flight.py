@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Awaitable, Callable, Generic, TypeVar
+
+_T = TypeVar("_T")
+
+
+class SingleFlight(Generic[_T]):
+    """Collapses concurrent calls with the same key into one; duplicates share the first call's result.
+
+    A duplicate that waits longer than `max_wait`, or whose leader fails, is cancelled or returns a
+    result `shareable` rejects, falls back to making its own call.
+    """
+
+    def __init__(self) -> None:
+        # key -> leader outcome; None means the leader produced nothing to share.
+        self._flights: dict[str, asyncio.Future[_T | None]] = {}
+        self._stats = {"leaders": 0, "followers": 0, "shared": 0, "fallbacks": 0}
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    async def run(
+        self,
+        key: str,
+        call: Callable[[], Awaitable[_T]],
+        *,
+        max_wait: float,
+        shareable: Callable[[_T], bool] | None = None,
+    ) -> tuple[_T, bool]:
+        flight = self._flights.get(key)
+        if flight is not None:
+            self._stats["followers"] += 1
+            try:
+                # Shielded so a follower giving up never cancels the leader's flight.
+                result = await asyncio.wait_for(asyncio.shield(flight), timeout=max(0.0, max_wait))
+            except asyncio.TimeoutError:
+                result = None
+            if result is not None:
+                self._stats["shared"] += 1
+                return result, True
+            self._stats["fallbacks"] += 1
+            return await call(), False
+
+        flight = asyncio.get_running_loop().create_future()
+        self._flights[key] = flight
+        self._stats["leaders"] += 1
+        result: _T | None = None
+        try:
+            result = await call()
+            return result, False
+        finally:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            flight.set_result(result if result is not None and (shareable is None or shareable(result)) else None)
+
+    def stats(self) -> dict[str, int]:
+        return {"inFlight": len(self._flights), **self._stats}
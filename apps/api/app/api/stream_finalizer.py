@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import deque
+from contextlib import suppress
+from typing import Awaitable, Callable
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+StreamFinalization = Callable[[], Awaitable[None]]
+
+_PENDING: deque[StreamFinalization] = deque()
+_STATS = {"submitted": 0, "completed": 0, "failed": 0, "abandoned": 0}
+_in_flight = 0
+_workers = 0
+_wakeup: asyncio.Event | None = None
+# Finalizations started while no pool is running (tests, scripts) are kept here so they are not collected.
+_detached: set[asyncio.Task[None]] = set()
+
+
+def submit_stream_finalization(job: StreamFinalization) -> None:
+    _STATS["submitted"] += 1
+    if _wakeup is None:
+        task = asyncio.get_running_loop().create_task(_run(job))
+        _detached.add(task)
+        task.add_done_callback(_detached.discard)
+        return
+    _PENDING.append(job)
+    _wakeup.set()
+
+
+def stream_finalizer_stats() -> dict[str, int]:
+    return {
+        "pending": len(_PENDING),
+        "inFlight": _in_flight,
+        "workers": _workers,
+        **_STATS,
+    }
+
+
+async def _run(job: StreamFinalization) -> None:
+    global _in_flight
+    _in_flight += 1
+    try:
+        await job()
+    except Exception:
+        _STATS["failed"] += 1
+        logger.exception("stream finalizer: finalization failed")
+    else:
+        _STATS["completed"] += 1
+    finally:
+        _in_flight -= 1
+
+
+async def _finalizer(wakeup: asyncio.Event) -> None:
+    while True:
+        while _PENDING:
+            await _run(_PENDING.popleft())
+        wakeup.clear()
+        await wakeup.wait()
+
+
+async def _wait_until_idle() -> None:
+    while _PENDING or _in_flight or _detached:
+        await asyncio.sleep(0.05)
+
+
+async def run_stream_finalizer(stop_event: asyncio.Event) -> None:
+    global _wakeup, _workers
+    wakeup = asyncio.Event()
+    count = max(1, int(settings.stream_finalizer_workers or 1))
+    tasks = [asyncio.create_task(_finalizer(wakeup)) for _ in range(count)]
+    _wakeup = wakeup
+    _workers = count
+    if _PENDING:
+        wakeup.set()
+    try:
+        await stop_event.wait()
+        # Streams that ended while the server was shutting down still get their usage written.
+        await _wait_until_idle()
+    finally:
+        _wakeup = None
+        _workers = 0
+        abandoned = len(_PENDING) + _in_flight
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            with suppress(asyncio.CancelledError):
+                await task
+        _PENDING.clear()
+        if abandoned:
+            _STATS["abandoned"] += abandoned
+            logger.warning("stream finalizer: %s finalizations abandoned at shutdown", abandoned)
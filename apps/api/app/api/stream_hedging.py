@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import asyncio
+import math
+from collections import deque
+from contextlib import suppress
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable
+
+import httpx
+
+from app.api.llm_proxy import UpstreamTarget
+from app.core.config import settings
+
+TTFT_SAMPLE_WINDOW = 200
+# Fewer samples than this and the learned p95 is too noisy to hedge on.
+TTFT_MIN_SAMPLES = 20
+# The hedge budget is a share of this many most recent hedgeable streams.
+HEDGE_BUDGET_WINDOW = 200
+
+_TTFT_SAMPLES: dict[str, deque[int]] = {}
+_RECENT_HEDGES: deque[bool] = deque(maxlen=HEDGE_BUDGET_WINDOW)
+_STATS = {"streams": 0, "hedged": 0, "hedgeWins": 0, "hedgesOverBudget": 0}
+
+
+@dataclass
+class StreamAttempt:
+    target: UpstreamTarget
+    client: httpx.AsyncClient
+    response: httpx.Response
+    chunks: AsyncIterator[bytes]
+
+    async def aclose(self) -> None:
+        with suppress(Exception):
+            await self.response.aclose()
+        with suppress(Exception):
+            await self.client.aclose()
+
+
+def observe_stream_ttft(model_id: str, ttft_ms: int) -> None:
+    samples = _TTFT_SAMPLES.get(model_id)
+    if samples is None:
+        samples = _TTFT_SAMPLES[model_id] = deque(maxlen=TTFT_SAMPLE_WINDOW)
+    samples.append(max(0, int(ttft_ms)))
+
+
+def learned_ttft_p95_ms(model_id: str) -> int | None:
+    samples = _TTFT_SAMPLES.get(model_id)
+    if not samples or len(samples) < TTFT_MIN_SAMPLES:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, math.ceil(len(ordered) * 0.95) - 1)]
+
+
+def hedge_deadline_ms(model_id: str, configured_ms: int | None) -> int:
+    if configured_ms:
+        return int(configured_ms)
+    learned = learned_ttft_p95_ms(model_id)
+    if learned is None:
+        return int(settings.stream_hedging_default_ttft_ms or 0)
+    low = int(settings.stream_hedging_min_ttft_ms or 0)
+    high = max(low, int(settings.stream_hedging_max_ttft_ms or 0))
+    return min(max(learned, low), high)
+
+
+def stream_hedging_stats() -> dict[str, float | int]:
+    streams = _STATS["streams"]
+    return {
+        **_STATS,
+        "hedgeRate": round(_STATS["hedged"] / streams, 4) if streams else 0.0,
+        "recentHedges": sum(_RECENT_HEDGES),
+        "trackedModels": len(_TTFT_SAMPLES),
+    }
+
+
+def _hedge_budget_allows() -> bool:
+    # When an upstream degrades for everyone every stream would hedge; cap it so the
+    # remaining channels do not take double load.
+    budget = HEDGE_BUDGET_WINDOW * max(int(settings.stream_hedging_max_hedge_percent or 0), 0) // 100
+    return sum(_RECENT_HEDGES) < budget
+
+
+async def _replay(first: bytes | None, rest: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    if first is not None:
+        yield first
+    async for chunk in rest:
+        yield chunk
+
+
+async def open_stream_attempt(
+    target: UpstreamTarget,
+    *,
+    build_request: Callable[[httpx.AsyncClient, UpstreamTarget], httpx.Request],
+    timeout: httpx.Timeout,
+) -> StreamAttempt:
+    client = httpx.AsyncClient(timeout=timeout)
+    res: httpx.Response | None = None
+    try:
+        res = await client.send(build_request(client, target), stream=True)
+        chunks = res.aiter_bytes()
+        # The attempt only counts as started once the first body byte arrives, not just the headers.
+        try:
+            first: bytes | None = await chunks.__anext__()
+        except StopAsyncIteration:
+            first = None
+        return StreamAttempt(target=target, client=client, response=res, chunks=_replay(first, chunks))
+    except BaseException:
+        if res is not None:
+            with suppress(Exception):
+                await res.aclose()
+        with suppress(Exception):
+            await client.aclose()
+        raise
+
+
+async def open_hedged_stream(
+    primary: UpstreamTarget,
+    alternates: tuple[UpstreamTarget, ...],
+    *,
+    build_request: Callable[[httpx.AsyncClient, UpstreamTarget], httpx.Request],
+    timeout: httpx.Timeout,
+    deadline_ms: int,
+) -> StreamAttempt:
+    _STATS["streams"] += 1
+    tasks = {
+        asyncio.ensure_future(open_stream_attempt(primary, build_request=build_request, timeout=timeout)): primary
+    }
+    pending = set(tasks)
+    winner: StreamAttempt | None = None
+    fallback: StreamAttempt | None = None
+    error: BaseException | None = None
+    kept: StreamAttempt | None = None
+    try:
+        _, pending = await asyncio.wait(pending, timeout=max(0, deadline_ms) / 1000)
+        hedged = bool(pending and alternates) and _hedge_budget_allows()
+        if pending and alternates and not hedged:
+            _STATS["hedgesOverBudget"] += 1
+        # Recorded at decision time so streams that hit the deadline together share one budget.
+        _RECENT_HEDGES.append(hedged)
+        if hedged:
+            _STATS["hedged"] += 1
+            alternate = alternates[0].with_picked_key()
+            hedge = asyncio.ensure_future(open_stream_attempt(alternate, build_request=build_request, timeout=timeout))
+            tasks[hedge] = alternate
+            pending.add(hedge)
+        done = {task for task in tasks if task.done()}
+        while True:
+            for task in done:
+                if task.exception() is not None:
+                    error = error or task.exception()
+                    continue
+                attempt = task.result()
+                if winner is None and attempt.response.status_code < 400:
+                    winner = attempt
+                elif fallback is None:
+                    fallback = attempt
+            if winner is not None or not pending:
+                break
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        # With no healthy attempt, the first error response is passed through like an unhedged stream.
+        kept = winner or fallback
+    finally:
+        for task in pending:
+            task.cancel()
+        for task in pending:
+            with suppress(BaseException):
+                await task
+        for task in tasks:
+            if task.done() and not task.cancelled() and task.exception() is None and task.result() is not kept:
+                await task.result().aclose()
+
+    if kept is None:
+        raise error or httpx.ConnectError("no upstream attempt succeeded")
+    if kept.target is not primary:
+        _STATS["hedgeWins"] += 1
+    return kept
@@ -3,8 +3,10 @@ from __future__ import annotations
 from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 
 from app.core.config import settings
+from app.query_profiler import install_query_profiler
 
 engine: AsyncEngine = create_async_engine(settings.database_url, pool_pre_ping=True)
+install_query_profiler(engine)
 SessionLocal = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 
 
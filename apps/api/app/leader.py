@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from contextlib import suppress
+from typing import Any, Awaitable, Callable, Protocol
+
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.db import engine
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderLease(Protocol):
+    async def acquire(self) -> bool: ...
+
+    async def heartbeat(self) -> bool: ...
+
+    async def release(self) -> None: ...
+
+
+class AdvisoryLockConnection:
+    """One connection carrying every session-level advisory lock this process holds.
+
+    Leader jobs share it instead of each pinning a pooled connection. Postgres drops
+    the locks as soon as the backend goes away, so losing the connection ends every
+    lease on it and a crashed leader is replaced on the next follower retry.
+    """
+
+    def __init__(self) -> None:
+        self._conn: Any | None = None
+        self._held: set[int] = set()
+        # One asyncpg connection cannot run statements concurrently.
+        self._lock = asyncio.Lock()
+
+    async def try_lock(self, lock_id: int) -> Any | None:
+        async with self._lock:
+            # Session advisory locks are reentrant, so a second local claim has to be refused here.
+            if lock_id in self._held:
+                return None
+            if self._conn is None:
+                conn = await engine.connect()
+                try:
+                    self._conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+                except Exception:
+                    await conn.close()
+                    raise
+            conn = self._conn
+            try:
+                locked = (
+                    await conn.execute(text("SELECT pg_try_advisory_lock(:lock_id)"), {"lock_id": lock_id})
+                ).scalar()
+            except Exception:
+                await self._drop()
+                raise
+            if not bool(locked):
+                await self._close_if_idle()
+                return None
+            self._held.add(lock_id)
+            return conn
+
+    async def ping(self, lock_id: int, conn: Any) -> bool:
+        async with self._lock:
+            if conn is not self._conn or lock_id not in self._held:
+                return False
+            try:
+                await conn.execute(text("SELECT 1"))
+            except Exception:
+                logger.warning("leader lock connection lost")
+                await self._drop()
+                return False
+            return True
+
+    async def unlock(self, lock_id: int, conn: Any) -> None:
+        async with self._lock:
+            if conn is not self._conn or lock_id not in self._held:
+                return
+            self._held.discard(lock_id)
+            try:
+                await conn.execute(text("SELECT pg_advisory_unlock(:lock_id)"), {"lock_id": lock_id})
+            except Exception:
+                logger.warning("leader lease %s unlock failed", lock_id)
+                await self._drop()
+                return
+            await self._close_if_idle()
+
+    async def _close_if_idle(self) -> None:
+        if not self._held:
+            await self._drop()
+
+    async def _drop(self) -> None:
+        conn, self._conn = self._conn, None
+        self._held.clear()
+        if conn is not None:
+            with suppress(Exception):
+                await conn.close()
+
+
+_lock_connection = AdvisoryLockConnection()
+
+
+class AdvisoryLockLease:
+    def __init__(self, lock_id: int, *, connection: AdvisoryLockConnection | None = None) -> None:
+        self._lock_id = int(lock_id)
+        self._connection = connection or _lock_connection
+        self._conn: Any | None = None
+
+    async def acquire(self) -> bool:
+        self._conn = await self._connection.try_lock(self._lock_id)
+        return self._conn is not None
+
+    async def heartbeat(self) -> bool:
+        if self._conn is None:
+            return False
+        if not await self._connection.ping(self._lock_id, self._conn):
+            logger.warning("leader lease %s lost its connection", self._lock_id)
+            return False
+        return True
+
+    async def release(self) -> None:
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            await self._connection.unlock(self._lock_id, conn)
+
+
+async def _wait(stop_event: asyncio.Event, timeout: float) -> bool:
+    try:
+        await asyncio.wait_for(stop_event.wait(), timeout=timeout)
+    except asyncio.TimeoutError:
+        return False
+    return True
+
+
+async def run_as_leader(
+    name: str,
+    lock_id: int,
+    stop_event: asyncio.Event,
+    job: Callable[[asyncio.Event], Awaitable[None]],
+    *,
+    lease_factory: Callable[[int], LeaderLease] = AdvisoryLockLease,
+) -> None:
+    if not settings.leader_election_enabled:
+        await job(stop_event)
+        return
+
+    retry_seconds = max(1, int(settings.leader_election_retry_seconds or 10))
+    heartbeat_seconds = max(1, int(settings.leader_election_heartbeat_seconds or 10))
+    while not stop_event.is_set():
+        lease = lease_factory(lock_id)
+        try:
+            acquired = await lease.acquire()
+        except Exception:
+            logger.exception("leader election for %s failed", name)
+            acquired = False
+        if not acquired:
+            if await _wait(stop_event, retry_seconds):
+                return
+            continue
+
+        logger.info("acquired leadership for %s", name)
+        leader_stop = asyncio.Event()
+        job_task = asyncio.create_task(job(leader_stop))
+        try:
+            while not stop_event.is_set() and not job_task.done():
+                if await _wait(stop_event, heartbeat_seconds):
+                    break
+                if not await lease.heartbeat():
+                    logger.warning("lost leadership for %s", name)
+                    break
+        finally:
+            leader_stop.set()
+            if not job_task.done():
+                job_task.cancel()
+            try:
+                await job_task
+            except asyncio.CancelledError:
+                pass
+            except Exception:
+                logger.exception("%s worker failed", name)
+            await lease.release()
+        if not stop_event.is_set() and job_task.done() and not job_task.cancelled():
+            if await _wait(stop_event, retry_seconds):
+                return
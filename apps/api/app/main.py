@@ -2,24 +2,53 @@ from __future__ import annotations
 
 import asyncio
 import datetime as dt
+import hashlib
+import hmac
 import logging
 import re
+import time
 from contextlib import asynccontextmanager, suppress
 from typing import Any
 
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy import text
 
 from app.core.config import settings
-from app.api.router import router as api_router
+from app.api.content_generation_poller import run_content_generation_poll_worker
+from app.api.loop_monitor import run_loop_monitor
+from app.api.metrics import (
+    BACKGROUND_QUEUE_DEPTH,
+    CONTENT_TYPE,
+    DB_POOL_CHECKED_OUT,
+    SINGLE_FLIGHT_CALLS,
+    SINGLE_FLIGHT_IN_FLIGHT,
+    register_collector,
+    render_metrics,
+)
+from app.api.router import router as api_router, single_flight_stats
+from app.api.stream_finalizer import run_stream_finalizer, stream_finalizer_stats
 from app.db import SessionLocal, engine
+from app.leader import run_as_leader
+from app.query_profiler import QueryProfilerMiddleware
 from app.models.base import Base
 from app.storage.announcements_db import ensure_seed_announcements
-from app.storage.analytics_outbox import run_dataocean_outbox_worker
-from app.storage.models_db import ensure_default_model_pricing_rules
-from app.storage.orgs_db import ensure_default_org, ensure_membership
+from app.storage.email_outbox import run_email_outbox_worker
+from app.security_password import password_hash_pool_stats, shutdown_password_hash_pool
+from app.storage.analytics_outbox import (
+    analytics_buffer_stats,
+    run_analytics_buffer_flusher,
+    run_dataocean_outbox_worker,
+)
+from app.storage.models_db import (
+    ensure_default_model_pricing_rules,
+    model_availability_bucket_start,
+    run_model_catalog_refresh_worker,
+)
+from app.storage.orgs_db import backfill_default_memberships, ensure_default_org
 from app.storage.referrals_db import confirm_due_referral_bonuses
+from app.storage.retention_db import purge_expired_rows
+from app.storage.topup_reconciler import run_zhupay_reconcile_worker
 
 import app.models  # noqa: F401
 
@@ -27,6 +56,12 @@ logger = logging.getLogger(__name__)
 
 _STARTUP_MIGRATION_LOCK_ID = 177895882971965
 _USAGE_MAINTENANCE_LOCK_ID = 177895882971966
+_BACKGROUND_BACKFILL_LOCK_ID = 177895882971967
+_REFERRAL_WORKER_LEADER_LOCK_ID = 177895882971968
+_DATAOCEAN_WORKER_LEADER_LOCK_ID = 177895882971969
+_USAGE_MAINTENANCE_LEADER_LOCK_ID = 177895882971970
+_ZHUPAY_RECONCILE_LEADER_LOCK_ID = 177895882971971
+_CONTENT_GENERATION_POLL_LEADER_LOCK_ID = 177895882971972
 _MIN_USAGE_EVENTS_RETENTION_DAYS = 7
 _MIN_USAGE_HOURLY_STATS_RETENTION_DAYS = 30
 _MIN_USAGE_RETENTION_BATCH_SIZE = 1000
@@ -34,6 +69,73 @@ _MAX_USAGE_RETENTION_BATCH_SIZE = 100000
 _MIN_USAGE_RETENTION_MAX_BATCHES = 1
 _MAX_USAGE_RETENTION_MAX_BATCHES = 100
 _MIN_USAGE_MAINTENANCE_INTERVAL_SECONDS = 3600
+_MODEL_AVAILABILITY_STATS_RETENTION_HOURS = 48
+_BACKGROUND_BACKFILL_BATCH_SIZE = 5000
+_MIGRATION_LEDGER_TABLE_SQL = (
+    "CREATE TABLE IF NOT EXISTS schema_migrations ("
+    "  checksum varchar(64) PRIMARY KEY,"
+    "  position integer NOT NULL,"
+    "  statement text NOT NULL,"
+    "  duration_ms integer NOT NULL DEFAULT 0,"
+    "  applied_at timestamptz NOT NULL DEFAULT now()"
+    ")"
+)
+# Content generation tasks created before the task mapping was written with the usage event:
+# recover the mapping from the successful task GETs that were logged for them. Each batch drains the
+# candidates materialized by _BACKGROUND_BACKFILL_PREPARE and counts drained rows, not inserted ones.
+_CONTENT_GENERATION_TASK_BACKFILL = (
+    "WITH batch AS ("
+    "  SELECT ctid AS row_ctid, task_id, org_id, user_id, api_key_id, model_id, created_at "
+    "  FROM content_generation_task_backfill "
+    "  LIMIT :batch_size"
+    "), inserted AS ("
+    "  INSERT INTO llm_content_generation_tasks ("
+    "    upstream_task_id, org_id, user_id, api_key_id, model_id, created_at, updated_at, "
+    "    billed_input_tokens, billed_cached_tokens, billed_output_tokens, billed_total_tokens, "
+    "    billed_cost_usd_micros, poll_attempts"
+    "  ) "
+    "  SELECT task_id, org_id, user_id, api_key_id, model_id, created_at, created_at, 0, 0, 0, 0, 0, 0 "
+    "  FROM batch "
+    "  ON CONFLICT (upstream_task_id) DO NOTHING"
+    ") "
+    "DELETE FROM content_generation_task_backfill "
+    "WHERE ctid = ANY(ARRAY(SELECT row_ctid FROM batch))"
+)
+# Data backfills that scan whole tables run after startup in small batches.
+# Each statement must touch at most :batch_size rows per execution.
+_BACKGROUND_BACKFILLS: tuple[str, ...] = (
+    "WITH batch AS ("
+    "  SELECT u.id FROM users u "
+    "  WHERE u.password_set_at IS NULL "
+    "  AND NOT EXISTS (SELECT 1 FROM oauth_identities oi WHERE oi.user_id = u.id) "
+    "  LIMIT :batch_size"
+    ") "
+    "UPDATE users u "
+    "SET password_set_at = u.created_at "
+    "FROM batch "
+    "WHERE u.id = batch.id",
+    _CONTENT_GENERATION_TASK_BACKFILL,
+)
+# Statements run once on the backfill connection before a backfill's batches, e.g. to materialize the
+# candidate rows so each batch drains a small temp table instead of rescanning the source table.
+_BACKGROUND_BACKFILL_PREPARE: dict[str, tuple[str, ...]] = {
+    _CONTENT_GENERATION_TASK_BACKFILL: (
+        "DROP TABLE IF EXISTS pg_temp.content_generation_task_backfill",
+        "CREATE TEMP TABLE content_generation_task_backfill AS "
+        "SELECT DISTINCT ON (t.task_id) t.task_id, t.org_id, t.user_id, t.api_key_id, t.model_id, t.created_at "
+        "FROM ("
+        "  SELECT split_part(e.request_endpoint, '/contents/generations/tasks/', 2) AS task_id, "
+        "  e.org_id, e.user_id, e.api_key_id, e.model_id, e.created_at "
+        "  FROM llm_usage_events e "
+        "  WHERE e.request_endpoint LIKE '%/contents/generations/tasks/_%' AND e.ok IS TRUE"
+        ") t "
+        "WHERE t.task_id <> '' AND length(t.task_id) <= 128 "
+        "AND NOT EXISTS ("
+        "  SELECT 1 FROM llm_content_generation_tasks c WHERE c.upstream_task_id = t.task_id"
+        ") "
+        "ORDER BY t.task_id, t.created_at ASC",
+    ),
+}
 _ADD_COLUMN_IF_MISSING_RE = re.compile(
     r"^\s*ALTER\s+TABLE\s+IF\s+EXISTS\s+([a-zA-Z_][a-zA-Z0-9_]*)\s+"
     r"ADD\s+COLUMN\s+IF\s+NOT\s+EXISTS\s+([a-zA-Z_][a-zA-Z0-9_]*)\b",
@@ -66,9 +168,22 @@ _USAGE_TOTAL_BACKFILL_RE = re.compile(
 )
 
 
+def _migration_checksum(statement: str) -> str:
+    normalized = re.sub(r"\s+", " ", statement.strip())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+async def _load_migration_ledger(conn: Any) -> set[str]:
+    await conn.exec_driver_sql(_MIGRATION_LEDGER_TABLE_SQL)
+    result = await conn.execute(text("SELECT checksum FROM schema_migrations"))
+    return {str(row[0]) for row in result.all()}
+
+
 class _StartupMigrationConnection:
-    def __init__(self, conn: Any):
+    def __init__(self, conn: Any, *, applied: set[str] | None = None):
         self._conn = conn
+        self._applied = applied
+        self._position = 0
 
     async def run_sync(self, *args: Any, **kwargs: Any) -> Any:
         return await self._conn.run_sync(*args, **kwargs)
@@ -76,6 +191,32 @@ class _StartupMigrationConnection:
     async def exec_driver_sql(self, statement: str, *args: Any, **kwargs: Any) -> Any:
         if self._should_skip_usage_total_backfill(statement):
             return None
+        self._position += 1
+        if self._applied is None:
+            return await self._exec_unless_applied(statement, *args, **kwargs)
+
+        checksum = _migration_checksum(statement)
+        if checksum in self._applied:
+            return None
+        started = time.perf_counter()
+        result = await self._exec_unless_applied(statement, *args, **kwargs)
+        await self._conn.execute(
+            text(
+                "INSERT INTO schema_migrations (checksum, position, statement, duration_ms) "
+                "VALUES (:checksum, :position, :statement, :duration_ms) "
+                "ON CONFLICT (checksum) DO NOTHING"
+            ),
+            {
+                "checksum": checksum,
+                "position": self._position,
+                "statement": statement,
+                "duration_ms": int((time.perf_counter() - started) * 1000),
+            },
+        )
+        self._applied.add(checksum)
+        return result
+
+    async def _exec_unless_applied(self, statement: str, *args: Any, **kwargs: Any) -> Any:
         if await self._should_skip_add_column(statement):
             return None
         if await self._should_skip_create_index(statement):
@@ -294,7 +435,11 @@ async def _run_usage_table_maintenance_once() -> None:
                 )
                 now = dt.datetime.now(dt.timezone.utc)
                 raw_cutoff = now - dt.timedelta(days=retention_days)
-                hourly_cutoff = now - dt.timedelta(days=hourly_retention_days)
+                # Rollups overwrite whole buckets, so their windows must start on a bucket boundary.
+                hourly_cutoff = (now - dt.timedelta(days=hourly_retention_days)).replace(
+                    minute=0, second=0, microsecond=0
+                )
+                availability_cutoff = model_availability_bucket_start(now - dt.timedelta(hours=24))
 
                 await _ensure_usage_maintenance_indexes(conn)
                 await conn.execute(
@@ -359,6 +504,40 @@ async def _run_usage_table_maintenance_once() -> None:
                     ),
                     {"hourly_cutoff": hourly_cutoff},
                 )
+                await conn.execute(
+                    text(
+                        """
+                        WITH rollup AS (
+                          SELECT
+                            org_id,
+                            model_id,
+                            to_timestamp(floor(extract(epoch FROM created_at) / 1800) * 1800) AS bucket_start,
+                            COUNT(*)::bigint AS total,
+                            COALESCE(SUM(CASE WHEN status_code >= 500 THEN 1 ELSE 0 END), 0)::bigint AS failed
+                          FROM llm_usage_events
+                          WHERE created_at >= :availability_cutoff
+                            AND created_at < to_timestamp(floor(extract(epoch FROM now()) / 1800) * 1800)
+                            AND (status_code < 400 OR status_code >= 500)
+                          GROUP BY org_id, model_id, to_timestamp(floor(extract(epoch FROM created_at) / 1800) * 1800)
+                        )
+                        INSERT INTO llm_model_availability_stats (
+                          org_id,
+                          model_id,
+                          bucket_start,
+                          total,
+                          failed,
+                          updated_at
+                        )
+                        SELECT org_id, model_id, bucket_start, total, failed, now()
+                        FROM rollup
+                        ON CONFLICT (org_id, model_id, bucket_start) DO UPDATE SET
+                          total = EXCLUDED.total,
+                          failed = EXCLUDED.failed,
+                          updated_at = now()
+                        """
+                    ),
+                    {"availability_cutoff": availability_cutoff},
+                )
                 deleted_total = 0
                 for _ in range(max_batches):
                     result = await conn.execute(
@@ -386,6 +565,11 @@ async def _run_usage_table_maintenance_once() -> None:
                     text("DELETE FROM llm_usage_hourly_stats WHERE bucket_start < :hourly_cutoff"),
                     {"hourly_cutoff": hourly_cutoff},
                 )
+                await conn.execute(
+                    text("DELETE FROM llm_model_availability_stats WHERE bucket_start < :availability_cutoff"),
+                    {"availability_cutoff": now - dt.timedelta(hours=_MODEL_AVAILABILITY_STATS_RETENTION_HOURS)},
+                )
+                await purge_expired_rows(conn)
                 await conn.execute(text("ANALYZE llm_usage_events"))
                 await conn.execute(text("ANALYZE llm_usage_hourly_stats"))
                 stats = (
@@ -417,6 +601,64 @@ async def _run_usage_table_maintenance_once() -> None:
         logger.exception("usage table maintenance failed")
 
 
+async def _run_background_backfills(stop_event: asyncio.Event) -> None:
+    try:
+        async with engine.connect() as raw_conn:
+            conn = await raw_conn.execution_options(isolation_level="AUTOCOMMIT")
+            locked = (
+                await conn.execute(
+                    text("SELECT pg_try_advisory_lock(:lock_id)"),
+                    {"lock_id": _BACKGROUND_BACKFILL_LOCK_ID},
+                )
+            ).scalar()
+            if not bool(locked):
+                return
+            try:
+                applied = {
+                    str(row[0]) for row in (await conn.execute(text("SELECT checksum FROM schema_migrations"))).all()
+                }
+                for position, statement in enumerate(_BACKGROUND_BACKFILLS, start=1):
+                    checksum = _migration_checksum(statement)
+                    if checksum in applied:
+                        continue
+                    started = time.perf_counter()
+                    for prepare in _BACKGROUND_BACKFILL_PREPARE.get(statement, ()):
+                        await conn.execute(text(prepare))
+                    updated_total = 0
+                    while not stop_event.is_set():
+                        result = await conn.execute(
+                            text(statement), {"batch_size": _BACKGROUND_BACKFILL_BATCH_SIZE}
+                        )
+                        updated = max(int(result.rowcount or 0), 0)
+                        updated_total += updated
+                        if updated < _BACKGROUND_BACKFILL_BATCH_SIZE:
+                            break
+                        await asyncio.sleep(0.05)
+                    if stop_event.is_set():
+                        return
+                    await conn.execute(
+                        text(
+                            "INSERT INTO schema_migrations (checksum, position, statement, duration_ms) "
+                            "VALUES (:checksum, :position, :statement, :duration_ms) "
+                            "ON CONFLICT (checksum) DO NOTHING"
+                        ),
+                        {
+                            "checksum": checksum,
+                            "position": -position,
+                            "statement": statement,
+                            "duration_ms": int((time.perf_counter() - started) * 1000),
+                        },
+                    )
+                    logger.info("background backfill %s updated %s rows", position, updated_total)
+            finally:
+                await conn.execute(
+                    text("SELECT pg_advisory_unlock(:lock_id)"),
+                    {"lock_id": _BACKGROUND_BACKFILL_LOCK_ID},
+                )
+    except Exception:
+        logger.exception("background backfill failed")
+
+
 async def _run_usage_table_maintenance_worker(stop_event: asyncio.Event) -> None:
     while not stop_event.is_set():
         await _run_usage_table_maintenance_once()
@@ -430,6 +672,20 @@ async def _run_usage_table_maintenance_worker(stop_event: asyncio.Event) -> None
             continue
 
 
+def _collect_runtime_metrics() -> None:
+    DB_POOL_CHECKED_OUT.set(engine.pool.checkedout())
+    BACKGROUND_QUEUE_DEPTH.set(analytics_buffer_stats()["pending"], queue="analytics_buffer")
+    BACKGROUND_QUEUE_DEPTH.set(stream_finalizer_stats()["pending"], queue="stream_finalizer")
+    BACKGROUND_QUEUE_DEPTH.set(password_hash_pool_stats()["queued"], queue="password_hash")
+    flights = single_flight_stats()
+    SINGLE_FLIGHT_IN_FLIGHT.set(flights["inFlight"])
+    for outcome in ("leaders", "followers", "shared", "fallbacks"):
+        SINGLE_FLIGHT_CALLS.set_total(flights[outcome], outcome=outcome)
+
+
+register_collector(_collect_runtime_metrics)
+
+
 def create_app() -> FastAPI:
     @asynccontextmanager
     async def lifespan(_app: FastAPI):
@@ -437,7 +693,7 @@ def create_app() -> FastAPI:
             await raw_conn.exec_driver_sql(
                 f"SELECT pg_advisory_xact_lock({_STARTUP_MIGRATION_LOCK_ID})"
             )
-            conn = _StartupMigrationConnection(raw_conn)
+            conn = _StartupMigrationConnection(raw_conn, applied=await _load_migration_ledger(raw_conn))
             await conn.run_sync(Base.metadata.create_all)
             # Minimal dev-time migration for early-stage schema changes.
             await conn.exec_driver_sql(
@@ -560,12 +816,6 @@ def create_app() -> FastAPI:
                 "ON users(invite_code) "
                 "WHERE invite_code IS NOT NULL"
             )
-            await conn.exec_driver_sql(
-                "UPDATE users u "
-                "SET password_set_at = u.created_at "
-                "WHERE password_set_at IS NULL "
-                "AND NOT EXISTS (SELECT 1 FROM oauth_identities oi WHERE oi.user_id = u.id)"
-            )
             await conn.exec_driver_sql(
                 "DELETE FROM oauth_identities WHERE id IN ("
                 "  SELECT id FROM ("
@@ -661,6 +911,71 @@ def create_app() -> FastAPI:
                 "CREATE INDEX IF NOT EXISTS ix_llm_content_generation_tasks_billed_at "
                 "ON llm_content_generation_tasks(billed_at)"
             )
+            await conn.exec_driver_sql(
+                "CREATE INDEX IF NOT EXISTS ix_llm_content_generation_tasks_updated_at "
+                "ON llm_content_generation_tasks(updated_at)"
+            )
+            await conn.exec_driver_sql(
+                "ALTER TABLE IF EXISTS llm_content_generation_tasks "
+                "ADD COLUMN IF NOT EXISTS poll_attempts integer NOT NULL DEFAULT 0"
+            )
+            await conn.exec_driver_sql(
+                "ALTER TABLE IF EXISTS llm_content_generation_tasks "
+                "ADD COLUMN IF NOT EXISTS next_poll_at timestamptz"
+            )
+            await conn.exec_driver_sql(
+                "ALTER TABLE IF EXISTS llm_content_generation_tasks "
+                "ADD COLUMN IF NOT EXISTS result_status_code integer"
+            )
+            await conn.exec_driver_sql(
+                "ALTER TABLE IF EXISTS llm_content_generation_tasks "
+                "ADD COLUMN IF NOT EXISTS result_content_type varchar(200)"
+            )
+            await conn.exec_driver_sql(
+                "ALTER TABLE IF EXISTS llm_content_generation_tasks "
+                "ADD COLUMN IF NOT EXISTS result_body bytea"
+            )
+            await conn.exec_driver_sql(
+                "CREATE INDEX IF NOT EXISTS ix_llm_content_generation_tasks_poll_due "
+                "ON llm_content_generation_tasks(next_poll_at) "
+                "WHERE result_status_code IS NULL"
+            )
+            await conn.exec_driver_sql(
+                "CREATE INDEX IF NOT EXISTS ix_sessions_expires_at "
+                "ON sessions(expires_at)"
+            )
+            await conn.exec_driver_sql(
+                "CREATE INDEX IF NOT EXISTS ix_email_verification_codes_expires_at "
+                "ON email_verification_codes(expires_at)"
+            )
+            await conn.exec_driver_sql(
+                "CREATE INDEX IF NOT EXISTS ix_invite_visits_created_at "
+                "ON invite_visits(created_at)"
+            )
+            await conn.exec_driver_sql(
+                "ALTER TABLE IF EXISTS llm_channels "
+                "ADD COLUMN IF NOT EXISTS models jsonb NOT NULL DEFAULT '[]'::jsonb"
+            )
+            await conn.exec_driver_sql(
+                "ALTER TABLE IF EXISTS llm_channels "
+                "ADD COLUMN IF NOT EXISTS model_prefixes jsonb NOT NULL DEFAULT '[]'::jsonb"
+            )
+            await conn.exec_driver_sql(
+                "ALTER TABLE IF EXISTS llm_channels "
+                "ADD COLUMN IF NOT EXISTS extra_api_keys jsonb NOT NULL DEFAULT '[]'::jsonb"
+            )
+            await conn.exec_driver_sql(
+                "ALTER TABLE IF EXISTS llm_channels "
+                "ADD COLUMN IF NOT EXISTS key_rotation varchar(32) NOT NULL DEFAULT 'round_robin'"
+            )
+            await conn.exec_driver_sql(
+                "ALTER TABLE IF EXISTS llm_model_configs "
+                "ADD COLUMN IF NOT EXISTS response_cache_enabled boolean NOT NULL DEFAULT false"
+            )
+            await conn.exec_driver_sql(
+                "ALTER TABLE IF EXISTS llm_model_configs "
+                "ADD COLUMN IF NOT EXISTS hedge_ttft_ms integer"
+            )
 
             await conn.exec_driver_sql(
                 "ALTER TABLE IF EXISTS email_verification_codes "
@@ -890,6 +1205,22 @@ def create_app() -> FastAPI:
                 "CREATE INDEX IF NOT EXISTS ix_billing_topups_checkout_id "
                 "ON billing_topups(checkout_id)"
             )
+            await conn.exec_driver_sql(
+                "ALTER TABLE IF EXISTS billing_topups "
+                "ADD COLUMN IF NOT EXISTS reconcile_attempts integer NOT NULL DEFAULT 0"
+            )
+            await conn.exec_driver_sql(
+                "ALTER TABLE IF EXISTS billing_topups "
+                "ADD COLUMN IF NOT EXISTS next_reconcile_at timestamptz"
+            )
+            await conn.exec_driver_sql(
+                "ALTER TABLE IF EXISTS billing_topups "
+                "ADD COLUMN IF NOT EXISTS last_reconciled_at timestamptz"
+            )
+            await conn.exec_driver_sql(
+                "CREATE INDEX IF NOT EXISTS ix_billing_topups_pending_reconcile "
+                "ON billing_topups(next_reconcile_at) WHERE status = 'pending'"
+            )
 
             await conn.exec_driver_sql(
                 "ALTER TABLE IF EXISTS announcements "
@@ -1049,58 +1380,119 @@ def create_app() -> FastAPI:
                 "CREATE INDEX IF NOT EXISTS ix_analytics_outbox_created_at "
                 "ON analytics_outbox_events(created_at DESC)"
             )
+            await conn.exec_driver_sql(
+                "CREATE INDEX IF NOT EXISTS ix_analytics_outbox_backlog_created_at "
+                "ON analytics_outbox_events(created_at) "
+                "WHERE status IN ('pending', 'failed')"
+            )
+            await conn.exec_driver_sql(
+                "CREATE INDEX IF NOT EXISTS ix_analytics_outbox_sent_at "
+                "ON analytics_outbox_events(sent_at) "
+                "WHERE status = 'sent'"
+            )
         # Bootstrap the default org and backfill memberships for existing users.
         async with SessionLocal() as session:
             org = await ensure_default_org(session)
             await ensure_default_model_pricing_rules(session, org_id=org.id)
-            from sqlalchemy import select
-            from app.models.user import User
-            from app.models.membership import Membership
-
-            users = (await session.execute(select(User).order_by(User.created_at.asc()))).scalars().all()
-            existing = (
-                await session.execute(
-                    select(Membership.user_id).where(Membership.org_id == org.id)
-                )
-            ).scalars().all()
-            existing_ids = set(existing)
-            for idx, user in enumerate(users):
-                if user.id in existing_ids:
-                    continue
-                role = "owner" if idx == 0 else "developer"
-                await ensure_membership(session, org_id=org.id, user_id=user.id, role=role)
+            await backfill_default_memberships(session, org_id=org.id)
         if settings.app_env == "dev" and settings.seed_demo_data:
             async with SessionLocal() as session:
                 await ensure_seed_announcements(session)
 
         stop_event = asyncio.Event()
 
-        async def referral_worker():
-            while not stop_event.is_set():
+        async def referral_worker(leader_stop: asyncio.Event):
+            while not leader_stop.is_set():
                 try:
                     async with SessionLocal() as session:
                         await confirm_due_referral_bonuses(session)
                 except Exception:
                     logger.exception("referral bonus worker failed")
                 try:
-                    await asyncio.wait_for(stop_event.wait(), timeout=300)
+                    await asyncio.wait_for(leader_stop.wait(), timeout=300)
                 except asyncio.TimeoutError:
                     continue
 
-        referral_task = asyncio.create_task(referral_worker())
-        dataocean_task = asyncio.create_task(run_dataocean_outbox_worker(stop_event))
-        usage_maintenance_task = asyncio.create_task(_run_usage_table_maintenance_worker(stop_event))
+        backfill_task = asyncio.create_task(_run_background_backfills(stop_event))
+        referral_task = asyncio.create_task(
+            run_as_leader("referral bonus worker", _REFERRAL_WORKER_LEADER_LOCK_ID, stop_event, referral_worker)
+        )
+        dataocean_task = asyncio.create_task(
+            run_as_leader(
+                "dataocean outbox worker",
+                _DATAOCEAN_WORKER_LEADER_LOCK_ID,
+                stop_event,
+                run_dataocean_outbox_worker,
+            )
+        )
+        usage_maintenance_task = asyncio.create_task(
+            run_as_leader(
+                "usage maintenance worker",
+                _USAGE_MAINTENANCE_LEADER_LOCK_ID,
+                stop_event,
+                _run_usage_table_maintenance_worker,
+            )
+        )
+        zhupay_reconcile_task = asyncio.create_task(
+            run_as_leader(
+                "zhupay reconcile worker",
+                _ZHUPAY_RECONCILE_LEADER_LOCK_ID,
+                stop_event,
+                run_zhupay_reconcile_worker,
+            )
+        )
+        content_generation_poll_task = asyncio.create_task(
+            run_as_leader(
+                "content generation poll worker",
+                _CONTENT_GENERATION_POLL_LEADER_LOCK_ID,
+                stop_event,
+                run_content_generation_poll_worker,
+            )
+        )
+        model_catalog_task = asyncio.create_task(run_model_catalog_refresh_worker(stop_event))
+        # Every process buffers its own browser events, so the flusher is not leader-elected.
+        analytics_buffer_task = asyncio.create_task(run_analytics_buffer_flusher(stop_event))
+        email_outbox_task = asyncio.create_task(run_email_outbox_worker(stop_event))
+        stream_finalizer_task = asyncio.create_task(run_stream_finalizer(stop_event))
+        loop_monitor_task = asyncio.create_task(run_loop_monitor(stop_event))
         yield
         stop_event.set()
+        # Streams finished during shutdown still owe their usage writes; wait for them up to the deadline.
+        with suppress(asyncio.CancelledError, asyncio.TimeoutError):
+            await asyncio.wait_for(
+                stream_finalizer_task, timeout=max(1, int(settings.stream_finalizer_drain_timeout_seconds or 1))
+            )
+        # Let the flusher drain what is still buffered before the engine goes away.
+        with suppress(asyncio.CancelledError, asyncio.TimeoutError):
+            await asyncio.wait_for(analytics_buffer_task, timeout=10)
+        backfill_task.cancel()
         referral_task.cancel()
         dataocean_task.cancel()
         usage_maintenance_task.cancel()
+        zhupay_reconcile_task.cancel()
+        content_generation_poll_task.cancel()
+        model_catalog_task.cancel()
+        email_outbox_task.cancel()
+        loop_monitor_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await backfill_task
         with suppress(asyncio.CancelledError):
             await referral_task
         with suppress(asyncio.CancelledError):
             await dataocean_task
         with suppress(asyncio.CancelledError):
             await usage_maintenance_task
+        with suppress(asyncio.CancelledError):
+            await zhupay_reconcile_task
+        with suppress(asyncio.CancelledError):
+            await content_generation_poll_task
+        with suppress(asyncio.CancelledError):
+            await model_catalog_task
+        with suppress(asyncio.CancelledError):
+            await email_outbox_task
+        with suppress(asyncio.CancelledError):
+            await loop_monitor_task
+        shutdown_password_hash_pool()
 
     app = FastAPI(title=settings.app_name, lifespan=lifespan)
 
@@ -1111,11 +1503,22 @@ def create_app() -> FastAPI:
         allow_methods=["*"],
         allow_headers=["*"],
     )
+    if settings.query_profiler_enabled:
+        app.add_middleware(QueryProfilerMiddleware)
 
     @app.get("/healthz", include_in_schema=False)
     async def healthz() -> dict[str, bool]:
         return {"ok": True}
 
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics(request: Request) -> Response:
+        token = (settings.metrics_bearer_token or "").strip()
+        if not settings.metrics_enabled or not token:
+            raise HTTPException(status_code=404, detail="Not Found")
+        if not hmac.compare_digest(request.headers.get("authorization") or "", f"Bearer {token}"):
+            raise HTTPException(status_code=401, detail="unauthorized")
+        return Response(content=render_metrics(), media_type=CONTENT_TYPE)
+
     app.include_router(api_router, prefix=settings.api_prefix)
     return app
 
@@ -4,11 +4,13 @@ from app.models.api_key import ApiKey as ApiKey
 from app.models.balance_ledger_entry import BalanceLedgerEntry as BalanceLedgerEntry
 from app.models.billing_topup import BillingTopup as BillingTopup
 from app.models.creem_event import CreemEvent as CreemEvent
+from app.models.email_outbox_message import EmailOutboxMessage as EmailOutboxMessage
 from app.models.email_verification_code import EmailVerificationCode as EmailVerificationCode
 from app.models.invite_visit import InviteVisit as InviteVisit
 from app.models.llm_channel import LlmChannel as LlmChannel
 from app.models.llm_channel_group import LlmChannelGroup as LlmChannelGroup
 from app.models.llm_content_generation_task import LlmContentGenerationTask as LlmContentGenerationTask
+from app.models.llm_model_availability_stat import LlmModelAvailabilityStat as LlmModelAvailabilityStat
 from app.models.llm_model_config import LlmModelConfig as LlmModelConfig
 from app.models.llm_model_pricing_rule import LlmModelPricingRule as LlmModelPricingRule
 from app.models.llm_usage_event import LlmUsageEvent as LlmUsageEvent
@@ -16,6 +18,9 @@ from app.models.llm_usage_hourly_stat import LlmUsageHourlyStat as LlmUsageHourl
 from app.models.membership import Membership as Membership
 from app.models.oauth_identity import OAuthIdentity as OAuthIdentity
 from app.models.organization import Organization as Organization
+from app.models.rate_limit_bucket import RateLimitBucket as RateLimitBucket
+from app.models.rate_limit_policy import RateLimitPolicy as RateLimitPolicy
+from app.models.rate_limit_stream_lease import RateLimitStreamLease as RateLimitStreamLease
 from app.models.referral_bonus_event import ReferralBonusEvent as ReferralBonusEvent
 from app.models.session import Session as Session
 from app.models.user import User as User
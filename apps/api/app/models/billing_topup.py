@@ -3,7 +3,7 @@ from __future__ import annotations
 import datetime as dt
 import uuid
 
-from sqlalchemy import DateTime, ForeignKey, Integer, String
+from sqlalchemy import DateTime, ForeignKey, Index, Integer, String, text
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import Mapped, mapped_column
 
@@ -12,6 +12,13 @@ from app.models.base import Base
 
 class BillingTopup(Base):
     __tablename__ = "billing_topups"
+    __table_args__ = (
+        Index(
+            "ix_billing_topups_pending_reconcile",
+            "next_reconcile_at",
+            postgresql_where=text("status = 'pending'"),
+        ),
+    )
 
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     org_id: Mapped[uuid.UUID] = mapped_column(
@@ -46,3 +53,8 @@ class BillingTopup(Base):
         nullable=False,
     )
     completed_at: Mapped[dt.datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+
+    # Background provider reconciliation for pending topups.
+    reconcile_attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    next_reconcile_at: Mapped[dt.datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    last_reconciled_at: Mapped[dt.datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
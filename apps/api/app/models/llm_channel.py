@@ -4,7 +4,7 @@ import datetime as dt
 import uuid
 
 from sqlalchemy import DateTime, ForeignKey, String, Text
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.dialects.postgresql import JSONB, UUID
 from sqlalchemy.orm import Mapped, mapped_column
 
 from app.models.base import Base
@@ -21,6 +21,11 @@ class LlmChannel(Base):
     name: Mapped[str] = mapped_column(String(64), nullable=False)
     base_url: Mapped[str] = mapped_column(String(400), nullable=False)
     api_key: Mapped[str] = mapped_column(Text, nullable=False)
+    # Additional provider keys rotated alongside api_key; see app.upstream_keys.
+    extra_api_keys: Mapped[list[str]] = mapped_column(JSONB, nullable=False, default=list)
+    key_rotation: Mapped[str] = mapped_column(String(32), nullable=False, default="round_robin")
+    models: Mapped[list[str]] = mapped_column(JSONB, nullable=False, default=list)
+    model_prefixes: Mapped[list[str]] = mapped_column(JSONB, nullable=False, default=list)
 
     created_at: Mapped[dt.datetime] = mapped_column(
         DateTime(timezone=True), default=lambda: dt.datetime.now(dt.timezone.utc), nullable=False
@@ -3,12 +3,14 @@ from __future__ import annotations
 import datetime as dt
 import uuid
 
-from sqlalchemy import DateTime, ForeignKey, Index, Integer, String
+from sqlalchemy import DateTime, ForeignKey, Index, Integer, LargeBinary, String, text
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import Mapped, mapped_column
 
 from app.models.base import Base
 
+CONTENT_GENERATION_TERMINAL_STATUSES = ("succeeded", "failed", "cancelled", "canceled", "expired", "deleted")
+
 
 class LlmContentGenerationTask(Base):
     __tablename__ = "llm_content_generation_tasks"
@@ -16,6 +18,12 @@ class LlmContentGenerationTask(Base):
         Index("ix_llm_content_generation_tasks_org_created_at", "org_id", "created_at"),
         Index("ix_llm_content_generation_tasks_user_created_at", "user_id", "created_at"),
         Index("ix_llm_content_generation_tasks_billed_at", "billed_at"),
+        Index("ix_llm_content_generation_tasks_updated_at", "updated_at"),
+        Index(
+            "ix_llm_content_generation_tasks_poll_due",
+            "next_poll_at",
+            postgresql_where=text("result_status_code IS NULL"),
+        ),
     )
 
     upstream_task_id: Mapped[str] = mapped_column(String(128), primary_key=True)
@@ -48,3 +56,10 @@ class LlmContentGenerationTask(Base):
     billed_output_tokens: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
     billed_total_tokens: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
     billed_cost_usd_micros: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+    poll_attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    next_poll_at: Mapped[dt.datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    # Terminal upstream response, served to client polls instead of another upstream round-trip.
+    result_status_code: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    result_content_type: Mapped[str | None] = mapped_column(String(200), nullable=True)
+    result_body: Mapped[bytes | None] = mapped_column(LargeBinary, nullable=True)
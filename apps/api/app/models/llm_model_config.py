@@ -24,6 +24,10 @@ class LlmModelConfig(Base):
 
     input_usd_micros_per_m: Mapped[int | None] = mapped_column(Integer, nullable=True)
     output_usd_micros_per_m: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    # Lets callers opt in to the exact-match response cache for this model.
+    response_cache_enabled: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
+    # Streams with no first byte after this long are hedged onto another channel; null learns it from history.
+    hedge_ttft_ms: Mapped[int | None] = mapped_column(Integer, nullable=True)
 
     created_at: Mapped[dt.datetime] = mapped_column(
         DateTime(timezone=True), default=lambda: dt.datetime.now(dt.timezone.utc), nullable=False
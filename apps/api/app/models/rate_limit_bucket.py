@@ -0,0 +1,22 @@
+from __future__ import annotations
+
+import datetime as dt
+
+from sqlalchemy import DateTime, Float, Index, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.models.base import Base
+
+
+# GCRA state shared by all API workers when rate limits run in Postgres mode.
+class RateLimitBucket(Base):
+    __tablename__ = "rate_limit_buckets"
+    __table_args__ = (Index("ix_rate_limit_buckets_updated_at", "updated_at"),)
+
+    bucket_key: Mapped[str] = mapped_column(String(200), primary_key=True)
+    # Theoretical arrival time (unix seconds) and seconds of budget one unit costs.
+    tat: Mapped[float] = mapped_column(Float, nullable=False)
+    interval_seconds: Mapped[float] = mapped_column(Float, nullable=False)
+    updated_at: Mapped[dt.datetime] = mapped_column(
+        DateTime(timezone=True), default=lambda: dt.datetime.now(dt.timezone.utc), nullable=False
+    )
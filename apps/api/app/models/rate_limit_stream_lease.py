@@ -0,0 +1,19 @@
+from __future__ import annotations
+
+import datetime as dt
+import uuid
+
+from sqlalchemy import DateTime, Index, String
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.models.base import Base
+
+
+class RateLimitStreamLease(Base):
+    __tablename__ = "rate_limit_stream_leases"
+    __table_args__ = (Index("ix_rate_limit_stream_leases_bucket_key", "bucket_key", "expires_at"),)
+
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    bucket_key: Mapped[str] = mapped_column(String(200), nullable=False)
+    expires_at: Mapped[dt.datetime] = mapped_column(DateTime(timezone=True), nullable=False)
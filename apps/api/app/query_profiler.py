@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import logging
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+QUERY_COUNT_HEADER = "x-db-query-count"
+QUERY_TIME_HEADER = "x-db-time-ms"
+FINGERPRINT_MAX_CHARS = 300
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PARAM = re.compile(r"\$\d+|%\(\w+\)s|%s|\?")
+_VALUE_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE = re.compile(r"\s+")
+
+
+def fingerprint_statement(statement: str) -> str:
+    """Normalizes `statement` so the same query with different parameters groups together."""
+    text = _STRING_LITERAL.sub("?", statement or "")
+    text = _PARAM.sub("?", text)
+    text = _NUMBER.sub("?", text)
+    text = _VALUE_LIST.sub("(?, ...)", text)
+    return _SPACE.sub(" ", text).strip()[:FINGERPRINT_MAX_CHARS]
+
+
+class QueryProfile:
+    def __init__(self, parent: QueryProfile | None = None) -> None:
+        self.parent = parent
+        self.count = 0
+        self.total_ms = 0.0
+        self.statements: dict[str, list[float]] = {}
+
+    def record(self, statement: str, ms: float) -> None:
+        fingerprint = fingerprint_statement(statement)
+        profile: QueryProfile | None = self
+        while profile is not None:
+            profile.count += 1
+            profile.total_ms += ms
+            entry = profile.statements.setdefault(fingerprint, [0, 0.0])
+            entry[0] += 1
+            entry[1] += ms
+            profile = profile.parent
+
+    def top(self, limit: int = 10) -> list[dict[str, Any]]:
+        ranked = sorted(self.statements.items(), key=lambda item: (-item[1][1], -item[1][0]))
+        return [
+            {"fingerprint": fingerprint, "count": int(count), "totalMs": round(ms, 2)}
+            for fingerprint, (count, ms) in ranked[: max(limit, 0)]
+        ]
+
+    def summary(self, limit: int = 10) -> dict[str, Any]:
+        return {"queries": self.count, "totalMs": round(self.total_ms, 2), "statements": self.top(limit)}
+
+
+_current: ContextVar[QueryProfile | None] = ContextVar("uni_query_profile", default=None)
+
+
+def current_query_profile() -> QueryProfile | None:
+    return _current.get()
+
+
+@contextmanager
+def profile_queries() -> Iterator[QueryProfile]:
+    """Attributes every query executed in this context (and tasks spawned from it) to the yielded profile."""
+    profile = QueryProfile(parent=_current.get())
+    token = _current.set(profile)
+    try:
+        yield profile
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def query_budget(max_queries: int, *, max_ms: float | None = None) -> Iterator[QueryProfile]:
+    """Test helper: fails with the offending statements when the block exceeds its query budget."""
+    with profile_queries() as profile:
+        yield profile
+    over_count = profile.count > max_queries
+    over_time = max_ms is not None and profile.total_ms > max_ms
+    if over_count or over_time:
+        lines = [f"  {entry['count']}x {entry['totalMs']}ms {entry['fingerprint']}" for entry in profile.top(50)]
+        limit = f"{max_queries} queries" + (f" / {max_ms}ms" if max_ms is not None else "")
+        raise AssertionError(
+            f"query budget exceeded: {profile.count} queries in {profile.total_ms:.1f}ms (budget {limit})\n"
+            + "\n".join(lines)
+        )
+
+
+def _before_cursor_execute(conn: Any, cursor: Any, statement: str, *args: Any) -> None:
+    if _current.get() is not None:
+        conn.info.setdefault("query_profiler_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn: Any, cursor: Any, statement: str, *args: Any) -> None:
+    _finish_query(conn, statement)
+
+
+def _handle_error(exception_context: Any) -> None:
+    if exception_context.connection is not None:
+        _finish_query(exception_context.connection, exception_context.statement or "")
+
+
+def _finish_query(conn: Any, statement: str) -> None:
+    profile = _current.get()
+    started = conn.info.get("query_profiler_started")
+    if profile is None or not started:
+        return
+    profile.record(statement, (time.perf_counter() - started.pop()) * 1000)
+
+
+def install_query_profiler(engine: AsyncEngine | Engine) -> None:
+    target = engine.sync_engine if isinstance(engine, AsyncEngine) else engine
+    if event.contains(target, "after_cursor_execute", _after_cursor_execute):
+        return
+    event.listen(target, "before_cursor_execute", _before_cursor_execute)
+    event.listen(target, "after_cursor_execute", _after_cursor_execute)
+    event.listen(target, "handle_error", _handle_error)
+
+
+class QueryProfilerMiddleware:
+    """Debug-only ASGI middleware reporting per-request query count and DB time."""
+
+    def __init__(self, app: Any) -> None:
+        self.app = app
+
+    async def __call__(self, scope: dict[str, Any], receive: Any, send: Any) -> None:
+        if scope.get("type") != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with profile_queries() as profile:
+
+            async def send_with_profile(message: dict[str, Any]) -> None:
+                if message.get("type") == "http.response.start":
+                    headers = list(message.get("headers") or [])
+                    headers.append((QUERY_COUNT_HEADER.encode(), str(profile.count).encode()))
+                    headers.append((QUERY_TIME_HEADER.encode(), f"{profile.total_ms:.1f}".encode()))
+                    message = {**message, "headers": headers}
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_profile)
+            finally:
+                logger.info(
+                    "db queries: method=%s path=%s queries=%s db_ms=%.1f",
+                    scope.get("method") or "-",
+                    scope.get("path") or "-",
+                    profile.count,
+                    profile.total_ms,
+                    extra={"queries": profile.summary()},
+                )
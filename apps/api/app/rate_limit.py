@@ -0,0 +1,422 @@
+from __future__ import annotations
+
+import logging
+import math
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Protocol
+
+from sqlalchemy import bindparam, text
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_PERIOD_SECONDS = 60.0
+# First key of the two-int advisory lock used to serialise stream lease counting per bucket.
+_STREAM_LEASE_LOCK_NAMESPACE = 7204
+
+
+@dataclass(frozen=True)
+class RateLimitState:
+    allowed: bool
+    limit: int
+    remaining: int
+    reset_seconds: float
+    retry_after_seconds: float = 0.0
+
+
+@dataclass(frozen=True)
+class RateLimitRule:
+    # Bucket identity without the dimension, e.g. "api_key:<id>", "user:<id>" or "org:<id>".
+    bucket: str
+    rpm: int | None = None
+    tpm: int | None = None
+    max_concurrent_streams: int | None = None
+
+
+@dataclass(frozen=True)
+class RateLimitGrant:
+    stream_leases: tuple[tuple[str, str], ...] = ()
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, detail: str, *, headers: dict[str, str]) -> None:
+        super().__init__(detail)
+        self.detail = detail
+        self.headers = headers
+
+
+def gcra(
+    tat: float,
+    now: float,
+    *,
+    limit: int,
+    cost: int = 1,
+    period: float = RATE_LIMIT_PERIOD_SECONDS,
+) -> tuple[float, RateLimitState]:
+    """Generic cell rate algorithm: a bucket of `limit` units that refills over `period`.
+
+    Returns the new theoretical arrival time (unchanged when the request is rejected).
+    """
+    interval = period / limit
+    base = max(tat, now)
+    new_tat = base + cost * interval
+    if new_tat - now > period:
+        state = RateLimitState(
+            allowed=False,
+            limit=limit,
+            remaining=max(0, int((period - (base - now)) // interval)),
+            reset_seconds=base - now,
+            retry_after_seconds=new_tat - now - period,
+        )
+        return tat, state
+    state = RateLimitState(
+        allowed=True,
+        limit=limit,
+        remaining=max(0, int((period - (new_tat - now)) // interval)),
+        reset_seconds=new_tat - now,
+    )
+    return new_tat, state
+
+
+class GcraBuckets:
+    """In-process GCRA buckets with an LRU cap, so every operation is O(1)."""
+
+    def __init__(self, *, max_keys: int = 100_000, clock: Callable[[], float] = time.monotonic) -> None:
+        self._max_keys = max(1, int(max_keys))
+        self._clock = clock
+        # key -> (theoretical arrival time, seconds per unit)
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def take(
+        self,
+        key: str,
+        *,
+        limit: int,
+        cost: int = 1,
+        consume: bool = True,
+        period: float = RATE_LIMIT_PERIOD_SECONDS,
+    ) -> RateLimitState:
+        now = self._clock()
+        tat = self._buckets.get(key, (now, 0.0))[0]
+        new_tat, state = gcra(tat, now, limit=limit, cost=cost, period=period)
+        # Remember the unit cost even for peeks so later charges use the current limit.
+        self._store(key, new_tat if consume else tat, period / limit)
+        return state
+
+    def charge(self, key: str, cost: int) -> None:
+        entry = self._buckets.get(key)
+        if entry is None or cost <= 0:
+            return
+        tat, interval = entry
+        self._store(key, max(tat, self._clock()) + cost * interval, interval)
+
+    def refund(self, key: str, cost: int = 1) -> None:
+        entry = self._buckets.get(key)
+        if entry is None or cost <= 0:
+            return
+        tat, interval = entry
+        self._store(key, tat - cost * interval, interval)
+
+    def _store(self, key: str, tat: float, interval: float) -> None:
+        self._buckets[key] = (tat, interval)
+        self._buckets.move_to_end(key)
+        if len(self._buckets) > self._max_keys:
+            # Evicting the coldest bucket only ever forgets old debt.
+            self._buckets.popitem(last=False)
+
+
+class RateLimitBackend(Protocol):
+    async def take(self, key: str, *, limit: int, cost: int = 1, consume: bool = True) -> RateLimitState: ...
+
+    async def charge(self, keys: list[str], cost: int) -> None: ...
+
+    async def refund(self, keys: list[str], cost: int = 1) -> None: ...
+
+    async def acquire_stream(self, key: str, *, limit: int, ttl_seconds: float) -> tuple[str | None, int]: ...
+
+    async def release_stream(self, key: str, lease_id: str) -> None: ...
+
+
+class MemoryRateLimitBackend:
+    def __init__(self, *, max_keys: int = 100_000, clock: Callable[[], float] = time.monotonic) -> None:
+        self._clock = clock
+        self._buckets = GcraBuckets(max_keys=max_keys, clock=clock)
+        self._streams: dict[str, dict[str, float]] = {}
+
+    async def take(self, key: str, *, limit: int, cost: int = 1, consume: bool = True) -> RateLimitState:
+        return self._buckets.take(key, limit=limit, cost=cost, consume=consume)
+
+    async def charge(self, keys: list[str], cost: int) -> None:
+        for key in keys:
+            self._buckets.charge(key, cost)
+
+    async def refund(self, keys: list[str], cost: int = 1) -> None:
+        for key in keys:
+            self._buckets.refund(key, cost)
+
+    async def acquire_stream(self, key: str, *, limit: int, ttl_seconds: float) -> tuple[str | None, int]:
+        now = self._clock()
+        leases = self._streams.setdefault(key, {})
+        # Leases normally end through release_stream; the TTL only covers streams that never finalize.
+        for lease_id in [lease_id for lease_id, expires_at in leases.items() if expires_at <= now]:
+            leases.pop(lease_id, None)
+        if len(leases) >= limit:
+            return None, len(leases)
+        lease_id = uuid.uuid4().hex
+        leases[lease_id] = now + ttl_seconds
+        return lease_id, len(leases)
+
+    async def release_stream(self, key: str, lease_id: str) -> None:
+        leases = self._streams.get(key)
+        if not leases:
+            return
+        leases.pop(lease_id, None)
+        if not leases:
+            self._streams.pop(key, None)
+
+
+class PostgresRateLimitBackend:
+    """Shares bucket state between API workers through Postgres row locks."""
+
+    def __init__(self, engine: object | None = None) -> None:
+        if engine is None:
+            from app.db import engine as default_engine
+
+            engine = default_engine
+        self._engine = engine
+
+    async def take(self, key: str, *, limit: int, cost: int = 1, consume: bool = True) -> RateLimitState:
+        interval = RATE_LIMIT_PERIOD_SECONDS / limit
+        async with self._engine.begin() as conn:  # type: ignore[attr-defined]
+            await conn.execute(
+                text(
+                    "INSERT INTO rate_limit_buckets (bucket_key, tat, interval_seconds, updated_at) "
+                    "VALUES (:key, 0, :interval, now()) ON CONFLICT (bucket_key) DO NOTHING"
+                ),
+                {"key": key, "interval": interval},
+            )
+            row = (
+                await conn.execute(
+                    text(
+                        "SELECT tat, extract(epoch FROM clock_timestamp()) "
+                        "FROM rate_limit_buckets WHERE bucket_key = :key FOR UPDATE"
+                    ),
+                    {"key": key},
+                )
+            ).first()
+            tat, now = float(row[0]), float(row[1])
+            new_tat, state = gcra(tat, now, limit=limit, cost=cost)
+            await conn.execute(
+                text(
+                    "UPDATE rate_limit_buckets SET tat = :tat, interval_seconds = :interval, updated_at = now() "
+                    "WHERE bucket_key = :key"
+                ),
+                {"key": key, "tat": new_tat if consume else tat, "interval": interval},
+            )
+        return state
+
+    async def charge(self, keys: list[str], cost: int) -> None:
+        if not keys or cost <= 0:
+            return
+        statement = text(
+            "UPDATE rate_limit_buckets "
+            "SET tat = GREATEST(tat, extract(epoch FROM clock_timestamp())) + :cost * interval_seconds, "
+            "updated_at = now() "
+            "WHERE bucket_key IN :keys"
+        ).bindparams(bindparam("keys", expanding=True))
+        async with self._engine.begin() as conn:  # type: ignore[attr-defined]
+            await conn.execute(statement, {"cost": int(cost), "keys": list(keys)})
+
+    async def refund(self, keys: list[str], cost: int = 1) -> None:
+        if not keys or cost <= 0:
+            return
+        statement = text(
+            "UPDATE rate_limit_buckets SET tat = tat - :cost * interval_seconds, updated_at = now() "
+            "WHERE bucket_key IN :keys"
+        ).bindparams(bindparam("keys", expanding=True))
+        async with self._engine.begin() as conn:  # type: ignore[attr-defined]
+            await conn.execute(statement, {"cost": int(cost), "keys": list(keys)})
+
+    async def acquire_stream(self, key: str, *, limit: int, ttl_seconds: float) -> tuple[str | None, int]:
+        async with self._engine.begin() as conn:  # type: ignore[attr-defined]
+            await conn.execute(
+                text("SELECT pg_advisory_xact_lock(:namespace, hashtext(:key))"),
+                {"namespace": _STREAM_LEASE_LOCK_NAMESPACE, "key": key},
+            )
+            await conn.execute(
+                text("DELETE FROM rate_limit_stream_leases WHERE bucket_key = :key AND expires_at <= now()"),
+                {"key": key},
+            )
+            active = int(
+                (
+                    await conn.execute(
+                        text("SELECT count(*) FROM rate_limit_stream_leases WHERE bucket_key = :key"),
+                        {"key": key},
+                    )
+                ).scalar()
+                or 0
+            )
+            if active >= limit:
+                return None, active
+            lease_id = uuid.uuid4()
+            await conn.execute(
+                text(
+                    "INSERT INTO rate_limit_stream_leases (id, bucket_key, expires_at) "
+                    "VALUES (:id, :key, now() + make_interval(secs => :ttl))"
+                ),
+                {"id": lease_id, "key": key, "ttl": float(ttl_seconds)},
+            )
+        return str(lease_id), active + 1
+
+    async def release_stream(self, key: str, lease_id: str) -> None:
+        async with self._engine.begin() as conn:  # type: ignore[attr-defined]
+            await conn.execute(
+                text("DELETE FROM rate_limit_stream_leases WHERE id = :id AND bucket_key = :key"),
+                {"id": uuid.UUID(lease_id), "key": key},
+            )
+
+
+_backend: RateLimitBackend | None = None
+
+
+def get_rate_limit_backend() -> RateLimitBackend:
+    global _backend
+    if _backend is None:
+        if (settings.rate_limit_backend or "memory").strip().lower() == "postgres":
+            _backend = PostgresRateLimitBackend()
+        else:
+            _backend = MemoryRateLimitBackend(max_keys=int(settings.rate_limit_max_tracked_keys or 100_000))
+    return _backend
+
+
+def _format_reset(seconds: float) -> str:
+    seconds = max(0.0, float(seconds))
+    if seconds >= 60:
+        return f"{int(seconds // 60)}m{int(seconds % 60)}s"
+    return f"{round(seconds, 3):g}s"
+
+
+def rate_limit_headers(state: RateLimitState, *, dimension: str) -> dict[str, str]:
+    headers = {
+        f"x-ratelimit-limit-{dimension}": str(state.limit),
+        f"x-ratelimit-remaining-{dimension}": str(state.remaining),
+        f"x-ratelimit-reset-{dimension}": _format_reset(state.reset_seconds),
+    }
+    if not state.allowed:
+        headers["retry-after"] = str(max(1, math.ceil(state.retry_after_seconds)))
+    return headers
+
+
+async def enforce_rate_limits(
+    rules: list[RateLimitRule],
+    *,
+    stream: bool,
+    backend: RateLimitBackend | None = None,
+) -> RateLimitGrant:
+    if not rules or not settings.rate_limit_enabled:
+        return RateLimitGrant()
+    backend = backend or get_rate_limit_backend()
+
+    # Token usage is only known after the response, so admission just requires the bucket not to be in debt.
+    for rule in rules:
+        if rule.tpm:
+            state = await backend.take(f"tpm:{rule.bucket}", limit=rule.tpm, consume=False)
+            if not state.allowed:
+                raise RateLimitExceeded(
+                    "token rate limit exceeded", headers=rate_limit_headers(state, dimension="tokens")
+                )
+    # A request only counts against its RPM buckets once it is admitted, so a rejection hands back what it took.
+    taken: list[str] = []
+    for rule in rules:
+        if rule.rpm:
+            key = f"rpm:{rule.bucket}"
+            state = await backend.take(key, limit=rule.rpm)
+            if not state.allowed:
+                await _refund_requests(backend, taken)
+                raise RateLimitExceeded(
+                    "request rate limit exceeded", headers=rate_limit_headers(state, dimension="requests")
+                )
+            taken.append(key)
+
+    leases: list[tuple[str, str]] = []
+    if stream:
+        ttl_seconds = max(60, int(settings.rate_limit_stream_lease_seconds or 900))
+        for rule in rules:
+            if not rule.max_concurrent_streams:
+                continue
+            key = f"streams:{rule.bucket}"
+            lease_id, active = await backend.acquire_stream(
+                key, limit=rule.max_concurrent_streams, ttl_seconds=ttl_seconds
+            )
+            if lease_id is None:
+                await release_rate_limit_grant(RateLimitGrant(stream_leases=tuple(leases)), backend=backend)
+                await _refund_requests(backend, taken)
+                raise RateLimitExceeded(
+                    "too many concurrent streams",
+                    headers={
+                        "x-ratelimit-limit-streams": str(rule.max_concurrent_streams),
+                        "x-ratelimit-remaining-streams": "0",
+                        "retry-after": "1",
+                    },
+                )
+            leases.append((key, lease_id))
+    return RateLimitGrant(stream_leases=tuple(leases))
+
+
+async def _refund_requests(backend: RateLimitBackend, keys: list[str]) -> None:
+    if not keys:
+        return
+    try:
+        await backend.refund(keys)
+    except Exception:
+        logger.exception("rate limit: refunding requests failed")
+
+
+async def release_rate_limit_grant(grant: RateLimitGrant | None, *, backend: RateLimitBackend | None = None) -> None:
+    if grant is None or not grant.stream_leases:
+        return
+    backend = backend or get_rate_limit_backend()
+    for key, lease_id in grant.stream_leases:
+        try:
+            await backend.release_stream(key, lease_id)
+        except Exception:
+            logger.exception("rate limit: releasing stream lease failed")
+
+
+def rate_limit_buckets(
+    *, api_key_id: uuid.UUID | None, user_id: uuid.UUID | None, org_id: uuid.UUID | None
+) -> list[str]:
+    buckets: list[str] = []
+    if api_key_id is not None:
+        buckets.append(f"api_key:{api_key_id}")
+    if user_id is not None:
+        buckets.append(f"user:{user_id}")
+    if org_id is not None:
+        buckets.append(f"org:{org_id}")
+    return buckets
+
+
+async def charge_rate_limit_tokens(
+    *,
+    api_key_id: uuid.UUID | None,
+    user_id: uuid.UUID | None,
+    org_id: uuid.UUID | None,
+    tokens: int,
+    backend: RateLimitBackend | None = None,
+) -> None:
+    if tokens <= 0 or not settings.rate_limit_enabled:
+        return
+    backend = backend or get_rate_limit_backend()
+    keys = [f"tpm:{bucket}" for bucket in rate_limit_buckets(api_key_id=api_key_id, user_id=user_id, org_id=org_id)]
+    try:
+        # Only buckets that a TPM limit has already touched exist, so this is a no-op for unlimited subjects.
+        await backend.charge(keys, int(tokens))
+    except Exception:
+        logger.exception("rate limit: charging tokens failed")
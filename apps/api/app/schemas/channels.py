@@ -3,12 +3,25 @@ from __future__ import annotations
 from pydantic import BaseModel, Field
 
 
+class LlmChannelKeyHealth(BaseModel):
+    masked: str
+    healthy: bool
+    cooldown_until: str | None = Field(default=None, alias="cooldownUntil")
+    last_rate_limited_at: str | None = Field(default=None, alias="lastRateLimitedAt")
+    requests: int = 0
+    rate_limited: int = Field(default=0, alias="rateLimited")
+
+
 class LlmChannelItem(BaseModel):
     id: str
     name: str
     base_url: str = Field(alias="baseUrl")
     api_key_masked: str = Field(alias="apiKeyMasked")
+    api_keys: list[LlmChannelKeyHealth] = Field(default_factory=list, alias="apiKeys")
+    key_rotation: str = Field(default="round_robin", alias="keyRotation")
     allow_groups: list[str] = Field(alias="allowGroups")
+    models: list[str] = Field(default_factory=list)
+    model_prefixes: list[str] = Field(default_factory=list, alias="modelPrefixes")
     created_at: str = Field(alias="createdAt")
     updated_at: str = Field(alias="updatedAt")
 
@@ -21,7 +34,11 @@ class LlmChannelCreateRequest(BaseModel):
     name: str
     base_url: str = Field(alias="baseUrl")
     api_key: str = Field(alias="apiKey")
+    extra_api_keys: list[str] = Field(default_factory=list, alias="extraApiKeys")
+    key_rotation: str = Field(default="round_robin", alias="keyRotation")
     allow_groups: list[str] = Field(default_factory=list, alias="allowGroups")
+    models: list[str] = Field(default_factory=list)
+    model_prefixes: list[str] = Field(default_factory=list, alias="modelPrefixes")
 
 
 class LlmChannelCreateResponse(BaseModel):
@@ -32,7 +49,11 @@ class LlmChannelUpdateRequest(BaseModel):
     name: str | None = None
     base_url: str | None = Field(default=None, alias="baseUrl")
     api_key: str | None = Field(default=None, alias="apiKey")
+    extra_api_keys: list[str] | None = Field(default=None, alias="extraApiKeys")
+    key_rotation: str | None = Field(default=None, alias="keyRotation")
     allow_groups: list[str] | None = Field(default=None, alias="allowGroups")
+    models: list[str] | None = None
+    model_prefixes: list[str] | None = Field(default=None, alias="modelPrefixes")
 
 
 class LlmChannelUpdateResponse(BaseModel):
@@ -9,6 +9,8 @@ class AdminModelItem(BaseModel):
     input_usd_per_m: str | None = Field(default=None, alias="inputUsdPerM")
     output_usd_per_m: str | None = Field(default=None, alias="outputUsdPerM")
     discount: float | None = Field(default=None, alias="discount")
+    response_cache: bool = Field(default=False, alias="responseCache")
+    hedge_ttft_ms: int | None = Field(default=None, alias="hedgeTtftMs")
     sources: int = 0
     available: bool = True
 
@@ -21,6 +23,8 @@ class AdminModelUpdateRequest(BaseModel):
     enabled: bool | None = None
     input_usd_per_m: str | None = Field(default=None, alias="inputUsdPerM")
     output_usd_per_m: str | None = Field(default=None, alias="outputUsdPerM")
+    response_cache: bool | None = Field(default=None, alias="responseCache")
+    hedge_ttft_ms: int | None = Field(default=None, alias="hedgeTtftMs", ge=0)
 
 
 class AdminModelUpdateResponse(BaseModel):
@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+from pydantic import BaseModel, Field
+
+
+class RateLimitPolicyItem(BaseModel):
+    id: str
+    scope: str
+    subject: str
+    rpm_limit: int | None = Field(default=None, alias="rpmLimit")
+    tpm_limit: int | None = Field(default=None, alias="tpmLimit")
+    max_concurrent_streams: int | None = Field(default=None, alias="maxConcurrentStreams")
+    created_at: str = Field(alias="createdAt")
+    updated_at: str = Field(alias="updatedAt")
+
+
+class RateLimitPoliciesListResponse(BaseModel):
+    items: list[RateLimitPolicyItem]
+
+
+class RateLimitPolicyUpsertRequest(BaseModel):
+    scope: str
+    subject: str = ""
+    rpm_limit: int | None = Field(default=None, alias="rpmLimit")
+    tpm_limit: int | None = Field(default=None, alias="tpmLimit")
+    max_concurrent_streams: int | None = Field(default=None, alias="maxConcurrentStreams")
+
+
+class RateLimitPolicyUpdateResponse(BaseModel):
+    item: RateLimitPolicyItem
+
+
+class RateLimitPolicyDeleteResponse(BaseModel):
+    ok: bool
+    id: str
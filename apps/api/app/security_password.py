@@ -1,9 +1,32 @@
 from __future__ import annotations
 
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, TypeVar
+
 from passlib.context import CryptContext
 
+from app.core.config import settings
+
 pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
 
+T = TypeVar("T")
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_STATS = {
+    "completed": 0,
+    "inFlight": 0,
+    "queued": 0,
+    "queueMsTotal": 0.0,
+    "queueMsMax": 0.0,
+    "runMsTotal": 0.0,
+}
+
 
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
@@ -12,3 +35,75 @@ def hash_password(password: str) -> str:
 def verify_password(password: str, password_hash: str) -> bool:
     return pwd_context.verify(password, password_hash)
 
+
+def _pool_size() -> int:
+    configured = int(settings.password_hash_workers or 0)
+    if configured > 0:
+        return configured
+    return max(1, min(4, os.cpu_count() or 1))
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # argon2-cffi releases the GIL while hashing, so a small thread pool keeps the loop responsive
+            # while capping how many CPU-heavy hashes run at once.
+            _executor = ThreadPoolExecutor(max_workers=_pool_size(), thread_name_prefix="password-hash")
+        return _executor
+
+
+def shutdown_password_hash_pool() -> None:
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _timed(fn: Callable[..., T], submitted: float, *args: object) -> T:
+    started = time.perf_counter()
+    queue_ms = (started - submitted) * 1000
+    with _stats_lock:
+        _STATS["queued"] -= 1
+        _STATS["inFlight"] += 1
+        _STATS["queueMsTotal"] += queue_ms
+        _STATS["queueMsMax"] = max(_STATS["queueMsMax"], queue_ms)
+    try:
+        return fn(*args)
+    finally:
+        run_ms = (time.perf_counter() - started) * 1000
+        with _stats_lock:
+            _STATS["inFlight"] -= 1
+            _STATS["completed"] += 1
+            _STATS["runMsTotal"] += run_ms
+
+
+async def _run_in_pool(fn: Callable[..., T], *args: object) -> T:
+    with _stats_lock:
+        _STATS["queued"] += 1
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), _timed, fn, time.perf_counter(), *args)
+
+
+async def hash_password_async(password: str) -> str:
+    return await _run_in_pool(hash_password, password)
+
+
+async def verify_password_async(password: str, password_hash: str) -> bool:
+    return await _run_in_pool(verify_password, password, password_hash)
+
+
+def password_hash_pool_stats() -> dict[str, float | int]:
+    with _stats_lock:
+        stats = dict(_STATS)
+    completed = int(stats["completed"])
+    return {
+        "workers": _pool_size(),
+        "completed": completed,
+        "inFlight": int(stats["inFlight"]),
+        "queued": int(stats["queued"]),
+        "queueMsAvg": round(stats["queueMsTotal"] / completed, 2) if completed else 0.0,
+        "queueMsMax": round(stats["queueMsMax"], 2),
+        "runMsAvg": round(stats["runMsTotal"] / completed, 2) if completed else 0.0,
+    }
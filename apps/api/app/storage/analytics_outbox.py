@@ -2,21 +2,49 @@ from __future__ import annotations
 
 import datetime as dt
 import logging
+import random
 import uuid
 import asyncio
+from collections import deque
+from dataclasses import dataclass
 from typing import Any
 
 import httpx
 from sqlalchemy import case, func, select
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError, InterfaceError, OperationalError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import settings
 from app.db import SessionLocal
 from app.models.analytics_outbox_event import AnalyticsOutboxEvent
+from app.models.session import Session
+from app.models.user import User
+from app.security import sha256_hex
 
 logger = logging.getLogger(__name__)
 
+DRAIN_MIN_BATCH_SIZE = 50
+DRAIN_MAX_BATCH_SIZE = 500
+DRAIN_MAX_CONCURRENCY = 4
+DRAIN_RATE_WINDOW_SECONDS = 300
+RETRY_BASE_SECONDS = 10
+RETRY_MAX_SECONDS = 3600
+
+_http_client: httpx.AsyncClient | None = None
+
+
+@dataclass
+class _BufferedEvent:
+    values: dict[str, Any]
+    # Resolved to a user id in bulk at flush time so the request path stays DB-free.
+    session_token_hash: str | None = None
+
+
+_EVENT_BUFFER: deque[_BufferedEvent] = deque()
+_BUFFER_STATS = {"buffered": 0, "flushed": 0, "dropped": 0, "rejected": 0, "flushFailures": 0}
+_buffer_wakeup: asyncio.Event | None = None
+
 
 def _now() -> dt.datetime:
     return dt.datetime.now(dt.timezone.utc)
@@ -25,10 +53,27 @@ def _now() -> dt.datetime:
 def _clean(value: object, max_len: int = 120) -> str | None:
     if not isinstance(value, str):
         return None
-    cleaned = value.strip()
+    cleaned = value.replace("\x00", "").strip()
     return cleaned[:max_len] if cleaned else None
 
 
+def _strip_nul(value: Any) -> Any:
+    # Postgres text and jsonb reject NUL characters; one such event would fail every batch it lands in.
+    if isinstance(value, str):
+        return value.replace("\x00", "")
+    if isinstance(value, dict):
+        return {_strip_nul(key): _strip_nul(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_strip_nul(item) for item in value]
+    return value
+
+
+def _utc(value: dt.datetime) -> dt.datetime:
+    if value.tzinfo is None:
+        return value.replace(tzinfo=dt.timezone.utc)
+    return value.astimezone(dt.timezone.utc)
+
+
 def _project_id() -> str:
     return settings.dataocean_project_id.strip() or "uni-api-web"
 
@@ -60,12 +105,7 @@ async def enqueue_analytics_event(
     if not dataocean_enabled():
         return None
 
-    ts = occurred_at or _now()
-    if ts.tzinfo is None:
-        ts = ts.replace(tzinfo=dt.timezone.utc)
-    else:
-        ts = ts.astimezone(dt.timezone.utc)
-
+    ts = _utc(occurred_at or _now())
     row = AnalyticsOutboxEvent(
         event_id=_clean(event_id, 120) or f"uni:{event_name}:{uuid.uuid4()}",
         event_name=event_name,
@@ -105,7 +145,187 @@ async def enqueue_analytics_event_best_effort(**kwargs: Any) -> None:
         logger.exception("dataocean: enqueue failed")
 
 
-async def process_pending_analytics_events(*, limit: int = 50) -> int:
+def _buffer_max_events() -> int:
+    return max(1, int(settings.analytics_buffer_max_events or 10000))
+
+
+def _buffer_flush_events() -> int:
+    return max(1, min(int(settings.analytics_buffer_flush_events or 200), _buffer_max_events()))
+
+
+def buffer_analytics_event(
+    *,
+    name: str,
+    anonymous_id: str | None = None,
+    session_id: str | None = None,
+    occurred_at: dt.datetime | None = None,
+    properties: dict[str, Any] | None = None,
+    context: dict[str, Any] | None = None,
+    event_id: str | None = None,
+    session_token: str | None = None,
+) -> str | None:
+    event_name = _clean(name, 96)
+    if not event_name or not dataocean_enabled():
+        return None
+    if len(_EVENT_BUFFER) >= _buffer_max_events():
+        _BUFFER_STATS["dropped"] += 1
+        return None
+
+    now = _now()
+    ts = _utc(occurred_at or now)
+    values = {
+        "id": uuid.uuid4(),
+        "event_id": _clean(event_id, 120) or f"uni:{event_name}:{uuid.uuid4()}",
+        "event_name": event_name,
+        "project_id": _project_id(),
+        "user_id": None,
+        "anonymous_id": _clean(anonymous_id, 120),
+        "session_id": _clean(session_id, 120),
+        "occurred_at": ts,
+        "payload": {"properties": _strip_nul(properties or {}), "context": _strip_nul(context or {})},
+        "status": "pending",
+        "attempts": 0,
+        "next_attempt_at": ts,
+        "created_at": now,
+        "updated_at": now,
+    }
+    _EVENT_BUFFER.append(
+        _BufferedEvent(values=values, session_token_hash=sha256_hex(session_token) if session_token else None)
+    )
+    _BUFFER_STATS["buffered"] += 1
+    if len(_EVENT_BUFFER) >= _buffer_flush_events() and _buffer_wakeup is not None:
+        _buffer_wakeup.set()
+    return values["event_id"]
+
+
+async def _resolve_session_users(session: AsyncSession, token_hashes: set[str]) -> dict[str, str]:
+    if not token_hashes:
+        return {}
+    rows = (
+        await session.execute(
+            select(Session.token_hash, Session.user_id)
+            .join(User, User.id == Session.user_id)
+            .where(
+                Session.token_hash.in_(token_hashes),
+                Session.revoked_at.is_(None),
+                Session.expires_at > _now(),
+                User.banned_at.is_(None),
+            )
+        )
+    ).all()
+    return {str(token_hash): str(user_id) for token_hash, user_id in rows}
+
+
+def _is_connection_error(exc: BaseException) -> bool:
+    if isinstance(exc, (OperationalError, InterfaceError, OSError, asyncio.TimeoutError)):
+        return True
+    return bool(getattr(exc, "connection_invalidated", False))
+
+
+def _buffered_insert(rows: list[dict[str, Any]]) -> Any:
+    return insert(AnalyticsOutboxEvent).values(rows).on_conflict_do_nothing(index_elements=["event_id"])
+
+
+async def flush_buffered_analytics_events(*, limit: int | None = None) -> int:
+    """Returns how many events left the buffer, inserted or rejected by the database."""
+    count = len(_EVENT_BUFFER) if limit is None else min(len(_EVENT_BUFFER), max(0, int(limit)))
+    if count <= 0:
+        return 0
+    batch = [_EVENT_BUFFER.popleft() for _ in range(count)]
+    remaining = batch
+    flushed = 0
+    try:
+        async with SessionLocal() as session:
+            users = await _resolve_session_users(
+                session, {item.session_token_hash for item in batch if item.session_token_hash}
+            )
+            rows: list[dict[str, Any]] = []
+            for item in batch:
+                values = dict(item.values)
+                user_id = users.get(item.session_token_hash or "")
+                if user_id:
+                    values["user_id"] = user_id
+                    values["payload"] = {
+                        **values["payload"],
+                        "context": {**values["payload"]["context"], "userId": user_id},
+                    }
+                rows.append(values)
+            try:
+                await session.execute(_buffered_insert(rows))
+                await session.commit()
+                flushed = len(rows)
+            except Exception as exc:
+                if _is_connection_error(exc):
+                    raise
+                await session.rollback()
+                # One bad row fails the whole multi-row insert; find it instead of retrying the batch forever.
+                logger.warning("dataocean: buffered batch rejected, inserting %s events one by one", len(rows))
+                for index, values in enumerate(rows):
+                    try:
+                        await session.execute(_buffered_insert([values]))
+                        await session.commit()
+                        flushed += 1
+                    except Exception as row_exc:
+                        if _is_connection_error(row_exc):
+                            remaining = batch[index:]
+                            raise
+                        await session.rollback()
+                        _BUFFER_STATS["rejected"] += 1
+                        logger.warning(
+                            "dataocean: dropping buffered event %s rejected by the database",
+                            values["event_id"],
+                            exc_info=True,
+                        )
+            remaining = []
+    except Exception:
+        _BUFFER_STATS["flushFailures"] += 1
+        logger.exception("dataocean: buffered flush failed")
+        # Put the unwritten events back in front of newer ones, dropping whatever no longer fits under the cap.
+        room = max(0, _buffer_max_events() - len(_EVENT_BUFFER))
+        kept = remaining[:room]
+        _BUFFER_STATS["dropped"] += len(remaining) - len(kept)
+        _EVENT_BUFFER.extendleft(reversed(kept))
+    _BUFFER_STATS["flushed"] += flushed
+    return len(batch) - len(remaining)
+
+
+def analytics_buffer_stats() -> dict[str, int]:
+    return {"pending": len(_EVENT_BUFFER), "capacity": _buffer_max_events(), **_BUFFER_STATS}
+
+
+async def run_analytics_buffer_flusher(stop_event: asyncio.Event) -> None:
+    global _buffer_wakeup
+    wakeup = asyncio.Event()
+    _buffer_wakeup = wakeup
+    interval = max(0.05, int(settings.analytics_buffer_flush_interval_ms or 250) / 1000)
+    try:
+        while not stop_event.is_set():
+            stop_wait = asyncio.ensure_future(stop_event.wait())
+            wake_wait = asyncio.ensure_future(wakeup.wait())
+            try:
+                await asyncio.wait({stop_wait, wake_wait}, timeout=interval, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                stop_wait.cancel()
+                wake_wait.cancel()
+            wakeup.clear()
+            while _EVENT_BUFFER:
+                if await flush_buffered_analytics_events(limit=_buffer_flush_events()) == 0:
+                    break
+    finally:
+        _buffer_wakeup = None
+        # Drain on shutdown; anything still failing here is lost with the process.
+        while _EVENT_BUFFER:
+            if await flush_buffered_analytics_events(limit=_buffer_flush_events()) == 0:
+                break
+
+
+def _retry_delay_seconds(attempts: int) -> float:
+    exponent = min(max(int(attempts), 1) - 1, 16)
+    delay = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * (2**exponent))
+    return delay * random.uniform(0.5, 1.0)
+
+
+async def process_pending_analytics_events(*, limit: int = DRAIN_MIN_BATCH_SIZE) -> int:
     if not dataocean_enabled():
         return 0
 
@@ -118,7 +338,7 @@ async def process_pending_analytics_events(*, limit: int = 50) -> int:
                     (AnalyticsOutboxEvent.next_attempt_at.is_(None) | (AnalyticsOutboxEvent.next_attempt_at <= _now())),
                 )
                 .order_by(AnalyticsOutboxEvent.created_at.asc())
-                .limit(max(1, min(int(limit), 100)))
+                .limit(max(1, min(int(limit), DRAIN_MAX_BATCH_SIZE)))
                 .with_for_update(skip_locked=True)
             )
         ).scalars().all()
@@ -130,12 +350,12 @@ async def process_pending_analytics_events(*, limit: int = 50) -> int:
         try:
             await _post_batch(events)
         except Exception as exc:
-            retry_at = _now() + dt.timedelta(seconds=min(300, 10 * max(1, max((row.attempts for row in rows), default=0) + 1)))
+            now = _now()
             message = str(exc)[:500]
             for row in rows:
                 row.status = "failed"
                 row.attempts = int(row.attempts or 0) + 1
-                row.next_attempt_at = retry_at
+                row.next_attempt_at = now + dt.timedelta(seconds=_retry_delay_seconds(row.attempts))
                 row.last_error = message
             await session.commit()
             logger.warning("dataocean: batch push failed: %s", message)
@@ -152,6 +372,24 @@ async def process_pending_analytics_events(*, limit: int = 50) -> int:
         return len(rows)
 
 
+async def drain_pending_analytics_events(*, batch_size: int, concurrency: int) -> tuple[int, bool]:
+    size = max(DRAIN_MIN_BATCH_SIZE, min(int(batch_size), DRAIN_MAX_BATCH_SIZE))
+    workers = max(1, min(int(concurrency), DRAIN_MAX_CONCURRENCY))
+    results = await asyncio.gather(
+        *(process_pending_analytics_events(limit=size) for _ in range(workers)),
+        return_exceptions=True,
+    )
+    sent = 0
+    saturated = False
+    for result in results:
+        if isinstance(result, BaseException):
+            logger.warning("dataocean: drain batch failed: %s", result)
+            continue
+        sent += int(result)
+        saturated = saturated or int(result) >= size
+    return sent, saturated
+
+
 async def get_dataocean_status(session: AsyncSession) -> dict[str, Any]:
     status_expr = AnalyticsOutboxEvent.status
     row = (
@@ -166,6 +404,23 @@ async def get_dataocean_status(session: AsyncSession) -> dict[str, Any]:
             )
         )
     ).first()
+    now = _now()
+    backlog_row = (
+        await session.execute(
+            select(func.min(AnalyticsOutboxEvent.created_at)).where(
+                AnalyticsOutboxEvent.status.in_(["pending", "failed"])
+            )
+        )
+    ).first()
+    oldest_pending_at = backlog_row[0] if backlog_row else None
+    sent_recent = (
+        await session.execute(
+            select(func.count(AnalyticsOutboxEvent.id)).where(
+                AnalyticsOutboxEvent.status == "sent",
+                AnalyticsOutboxEvent.sent_at >= now - dt.timedelta(seconds=DRAIN_RATE_WINDOW_SECONDS),
+            )
+        )
+    ).scalar()
     last_error_row = (
         await session.execute(
             select(AnalyticsOutboxEvent.last_error)
@@ -188,20 +443,40 @@ async def get_dataocean_status(session: AsyncSession) -> dict[str, Any]:
         "lastSentAt": _dt_iso(getattr(row, "last_sent_at", None)) if row else None,
         "lastQueuedAt": _dt_iso(getattr(row, "last_queued_at", None)) if row else None,
         "lastError": str(getattr(last_error_row, "last_error", "") or "")[:500] if last_error_row else None,
+        "backlogOldestAt": _dt_iso(oldest_pending_at),
+        "backlogAgeSeconds": (
+            max(0, int((now - oldest_pending_at).total_seconds())) if oldest_pending_at else 0
+        ),
+        "drainRatePerMinute": round(int(sent_recent or 0) * 60 / DRAIN_RATE_WINDOW_SECONDS, 2),
+        "buffer": analytics_buffer_stats(),
     }
 
 
 async def run_dataocean_outbox_worker(stop_event) -> None:
     interval = max(5, int(settings.dataocean_flush_interval_seconds or 30))
-    while not stop_event.is_set():
-        try:
-            await process_pending_analytics_events()
-        except Exception:
-            logger.exception("dataocean: worker failed")
-        try:
-            await asyncio.wait_for(stop_event.wait(), timeout=interval)
-        except asyncio.TimeoutError:
-            pass
+    batch_size = DRAIN_MIN_BATCH_SIZE
+    concurrency = 1
+    try:
+        while not stop_event.is_set():
+            saturated = False
+            try:
+                _, saturated = await drain_pending_analytics_events(batch_size=batch_size, concurrency=concurrency)
+            except Exception:
+                logger.exception("dataocean: worker failed")
+            if saturated:
+                # Backlog is larger than what we just drained: grow and go again without sleeping.
+                batch_size = min(DRAIN_MAX_BATCH_SIZE, batch_size * 2)
+                concurrency = min(DRAIN_MAX_CONCURRENCY, concurrency + 1)
+                await asyncio.sleep(0)
+                continue
+            batch_size = DRAIN_MIN_BATCH_SIZE
+            concurrency = 1
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        await close_dataocean_client()
 
 
 def _to_dataocean_event(row: AnalyticsOutboxEvent) -> dict[str, Any]:
@@ -221,17 +496,33 @@ def _to_dataocean_event(row: AnalyticsOutboxEvent) -> dict[str, Any]:
     }
 
 
+def _get_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            timeout=8.0,
+            limits=httpx.Limits(max_connections=DRAIN_MAX_CONCURRENCY, max_keepalive_connections=DRAIN_MAX_CONCURRENCY),
+        )
+    return _http_client
+
+
+async def close_dataocean_client() -> None:
+    global _http_client
+    client, _http_client = _http_client, None
+    if client is not None and not client.is_closed:
+        await client.aclose()
+
+
 async def _post_batch(events: list[dict[str, Any]]) -> None:
     base = settings.dataocean_collect_url.strip().rstrip("/")
     if not base:
         raise RuntimeError("DATAOCEAN_COLLECT_URL is not configured")
-    async with httpx.AsyncClient(timeout=8.0) as client:
-        res = await client.post(
-            f"{base}/api/collect/batch",
-            headers={"X-DataOcean-Key": settings.dataocean_server_key.strip()},
-            json={"projectId": _project_id(), "events": events},
-        )
-        res.raise_for_status()
+    res = await _get_http_client().post(
+        f"{base}/api/collect/batch",
+        headers={"X-DataOcean-Key": settings.dataocean_server_key.strip()},
+        json={"projectId": _project_id(), "events": events},
+    )
+    res.raise_for_status()
 
 
 def _dt_iso(value: dt.datetime | None) -> str | None:
@@ -11,7 +11,7 @@ from app.models.session import Session
 from app.models.user import User
 from app.schemas.auth import AuthResponse, LoginRequest, RegisterRequest, UserPublic
 from app.security import sha256_hex
-from app.security_password import hash_password, verify_password
+from app.security_password import hash_password_async, verify_password_async
 from app.storage.balance_math import remaining_usd_2
 from app.storage.analytics_outbox import enqueue_analytics_event
 from app.storage.invites_db import find_user_by_invite_code, generate_unique_invite_code
@@ -96,7 +96,7 @@ async def create_user(
 
     row = User(
         email=email,
-        password_hash=hash_password(input.password),
+        password_hash=await hash_password_async(input.password),
         password_set_at=now,
         role="user",
         invite_code=await generate_unique_invite_code(session),
@@ -131,7 +131,7 @@ async def authenticate_user(session: AsyncSession, input: LoginRequest) -> User
         return None
     if row.banned_at is not None:
         raise ValueError("banned")
-    if not verify_password(input.password, row.password_hash):
+    if not await verify_password_async(input.password, row.password_hash):
         return None
 
     now = dt.datetime.now(dt.timezone.utc)
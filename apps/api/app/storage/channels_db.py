@@ -14,13 +14,17 @@ from app.schemas.channels import (
     LlmChannelCreateResponse,
     LlmChannelDeleteResponse,
     LlmChannelItem,
+    LlmChannelKeyHealth,
     LlmChannelsListResponse,
     LlmChannelUpdateRequest,
     LlmChannelUpdateResponse,
 )
+from app.upstream_keys import DEFAULT_KEY_ROTATION, KEY_ROTATION_STRATEGIES, get_upstream_key_pool
 
 ALLOWED_SCHEMES: set[str] = {"http", "https"}
 WILDCARD_GROUPS: set[str] = {"*", "all"}
+MAX_CHANNEL_MODEL_PATTERNS = 500
+MAX_CHANNEL_API_KEYS = 64
 
 
 def _dt_iso(value: dt.datetime) -> str:
@@ -34,6 +38,31 @@ def _mask_api_key(value: str) -> str:
     return f"{raw[:6]}…{raw[-4:]}"
 
 
+def _normalize_api_key(value: str) -> str:
+    api_key = str(value).strip()
+    if len(api_key) < 8:
+        raise ValueError("api key too small (min 8)")
+    return api_key
+
+
+def _normalize_extra_api_keys(values: list[str], *, primary: str) -> list[str]:
+    normalized: list[str] = []
+    for value in values:
+        api_key = _normalize_api_key(value)
+        if api_key != primary and api_key not in normalized:
+            normalized.append(api_key)
+    if len(normalized) + 1 > MAX_CHANNEL_API_KEYS:
+        raise ValueError(f"too many api keys (max {MAX_CHANNEL_API_KEYS})")
+    return normalized
+
+
+def _normalize_key_rotation(value: str) -> str:
+    rotation = value.strip().lower()
+    if rotation not in KEY_ROTATION_STRATEGIES:
+        raise ValueError("invalid key rotation")
+    return rotation
+
+
 def _normalize_base_url(value: str) -> str:
     raw = value.strip()
     parsed = urlparse(raw)
@@ -67,6 +96,51 @@ def _normalize_group(value: str) -> str:
     return group
 
 
+def _normalize_model_patterns(values: list[str], *, prefix: bool = False) -> list[str]:
+    normalized: set[str] = set()
+    for value in values:
+        pattern = str(value).strip()
+        if prefix:
+            pattern = pattern.rstrip("*").strip()
+        if pattern == "":
+            continue
+        if "\n" in pattern or "\r" in pattern:
+            raise ValueError("invalid model")
+        if len(pattern) > 200:
+            raise ValueError("model too large (max 200)")
+        normalized.add(pattern)
+    if len(normalized) > MAX_CHANNEL_MODEL_PATTERNS:
+        raise ValueError(f"too many models (max {MAX_CHANNEL_MODEL_PATTERNS})")
+    return sorted(normalized)
+
+
+def channel_declared_models(channel: LlmChannel) -> tuple[list[str], list[str]]:
+    models = channel.models if isinstance(channel.models, list) else []
+    prefixes = channel.model_prefixes if isinstance(channel.model_prefixes, list) else []
+    return [str(m) for m in models], [str(p) for p in prefixes]
+
+
+def channel_api_keys(channel: LlmChannel) -> list[str]:
+    extra = getattr(channel, "extra_api_keys", None)
+    extra = extra if isinstance(extra, list) else []
+    keys = [str(channel.api_key)]
+    for value in extra:
+        if str(value) not in keys:
+            keys.append(str(value))
+    return keys
+
+
+def channel_key_rotation(channel: LlmChannel) -> str:
+    rotation = getattr(channel, "key_rotation", None)
+    return rotation if rotation in KEY_ROTATION_STRATEGIES else DEFAULT_KEY_ROTATION
+
+
+def pick_channel_api_key(channel: LlmChannel) -> str:
+    return get_upstream_key_pool().pick(
+        getattr(channel, "id", None), channel_api_keys(channel), strategy=channel_key_rotation(channel)
+    )
+
+
 async def _get_groups(session: AsyncSession, channel_id: uuid.UUID) -> list[str]:
     rows = (
         await session.execute(
@@ -97,12 +171,19 @@ async def _get_groups_by_channel_ids(
 
 
 def _to_item(row: LlmChannel, groups: list[str]) -> LlmChannelItem:
+    models, model_prefixes = channel_declared_models(row)
+    keys = channel_api_keys(row)
+    health = get_upstream_key_pool().health(row.id, keys)
     return LlmChannelItem(
         id=str(row.id),
         name=row.name,
         baseUrl=row.base_url,
         apiKeyMasked=_mask_api_key(row.api_key),
+        apiKeys=[LlmChannelKeyHealth(masked=_mask_api_key(key), **state) for key, state in zip(keys, health)],
+        keyRotation=channel_key_rotation(row),
         allowGroups=sorted(set(groups)),
+        models=models,
+        modelPrefixes=model_prefixes,
         createdAt=_dt_iso(row.created_at),
         updatedAt=_dt_iso(row.updated_at),
     )
@@ -123,43 +204,6 @@ async def list_channels(session: AsyncSession, *, org_id: uuid.UUID) -> LlmChann
     return LlmChannelsListResponse(items=items)
 
 
-async def pick_channel_for_group(
-    session: AsyncSession, *, org_id: uuid.UUID, group_name: str
-) -> LlmChannel | None:
-    group = group_name.strip() or "default"
-    channels = (
-        await session.execute(
-            select(LlmChannel)
-            .where(LlmChannel.org_id == org_id)
-            .order_by(LlmChannel.created_at.asc())
-        )
-    ).scalars().all()
-    if not channels:
-        return None
-
-    ids = [c.id for c in channels]
-    group_rows = (
-        await session.execute(
-            select(LlmChannelGroup.channel_id, LlmChannelGroup.group_name).where(
-                LlmChannelGroup.channel_id.in_(ids)
-            )
-        )
-    ).all()
-    allow_map: dict[uuid.UUID, set[str]] = {}
-    for channel_id, group_name_value in group_rows:
-        allow_map.setdefault(channel_id, set()).add(str(group_name_value))
-
-    for c in channels:
-        allow = allow_map.get(c.id, set())
-        if not allow:
-            return c
-        if group in allow:
-            return c
-        if allow.intersection(WILDCARD_GROUPS):
-            return c
-    return None
-
-
 async def list_channels_for_group(
     session: AsyncSession, *, org_id: uuid.UUID, group_name: str
 ) -> list[LlmChannel]:
@@ -206,11 +250,18 @@ async def create_channel(
 ) -> LlmChannelCreateResponse:
     name = _normalize_name(input.name)
     base_url = _normalize_base_url(input.base_url)
-    api_key = str(input.api_key).strip()
-    if len(api_key) < 8:
-        raise ValueError("api key too small (min 8)")
-
-    row = LlmChannel(org_id=org_id, name=name, base_url=base_url, api_key=api_key)
+    api_key = _normalize_api_key(input.api_key)
+
+    row = LlmChannel(
+        org_id=org_id,
+        name=name,
+        base_url=base_url,
+        api_key=api_key,
+        extra_api_keys=_normalize_extra_api_keys(input.extra_api_keys, primary=api_key),
+        key_rotation=_normalize_key_rotation(input.key_rotation),
+        models=_normalize_model_patterns(input.models),
+        model_prefixes=_normalize_model_patterns(input.model_prefixes, prefix=True),
+    )
     session.add(row)
     await session.commit()
     await session.refresh(row)
@@ -238,10 +289,17 @@ async def update_channel(
     if input.base_url is not None:
         row.base_url = _normalize_base_url(input.base_url)
     if input.api_key is not None:
-        api_key = str(input.api_key).strip()
-        if len(api_key) < 8:
-            raise ValueError("api key too small (min 8)")
-        row.api_key = api_key
+        row.api_key = _normalize_api_key(input.api_key)
+    if input.extra_api_keys is not None:
+        row.extra_api_keys = _normalize_extra_api_keys(input.extra_api_keys, primary=row.api_key)
+    elif input.api_key is not None:
+        row.extra_api_keys = _normalize_extra_api_keys(channel_api_keys(row)[1:], primary=row.api_key)
+    if input.key_rotation is not None:
+        row.key_rotation = _normalize_key_rotation(input.key_rotation)
+    if input.models is not None:
+        row.models = _normalize_model_patterns(input.models)
+    if input.model_prefixes is not None:
+        row.model_prefixes = _normalize_model_patterns(input.model_prefixes, prefix=True)
 
     if input.allow_groups is not None:
         normalized: list[str] = []
@@ -266,4 +324,5 @@ async def delete_channel(
         return None
     await session.delete(row)
     await session.commit()
+    get_upstream_key_pool().forget(channel_id)
     return LlmChannelDeleteResponse(ok=True, id=str(channel_id))
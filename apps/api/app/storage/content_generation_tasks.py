@@ -0,0 +1,218 @@
+from __future__ import annotations
+
+import datetime as dt
+import logging
+import uuid
+from dataclasses import dataclass
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+
+from app.db import SessionLocal
+from app.models.llm_content_generation_task import CONTENT_GENERATION_TERMINAL_STATUSES, LlmContentGenerationTask
+from app.pricing import UsagePricing, estimate_cost_usd_micros
+from app.rate_limit import charge_rate_limit_tokens
+from app.storage.usage_db import record_usage_event
+
+logger = logging.getLogger(__name__)
+
+# Seconds between upstream polls for one task: generation usually takes tens of seconds to a few
+# minutes, so poll briskly at first and back off for long-running jobs.
+POLL_BACKOFF_SECONDS = (5, 5, 10, 10, 15, 15, 30, 30, 60, 120, 300)
+
+
+@dataclass(frozen=True)
+class ContentGenerationResult:
+    status_code: int
+    content_type: str
+    body: bytes
+
+
+def is_terminal_content_generation_status(status: str | None) -> bool:
+    return (status or "").strip().lower() in CONTENT_GENERATION_TERMINAL_STATUSES
+
+
+def next_content_generation_poll_delay_seconds(attempts: int) -> int:
+    index = min(max(int(attempts), 0), len(POLL_BACKOFF_SECONDS) - 1)
+    return POLL_BACKOFF_SECONDS[index]
+
+
+def cached_content_generation_result(row: LlmContentGenerationTask) -> ContentGenerationResult | None:
+    if row.result_status_code is None or row.result_body is None or row.status == "deleted":
+        return None
+    return ContentGenerationResult(
+        status_code=int(row.result_status_code),
+        content_type=row.result_content_type or "application/json",
+        body=bytes(row.result_body),
+    )
+
+
+async def settle_content_generation_task(
+    *,
+    task_id: str,
+    org_id: uuid.UUID,
+    user_id: uuid.UUID,
+    api_key_id: uuid.UUID | None,
+    channel_id: uuid.UUID | None,
+    model_id: str,
+    pricing: UsagePricing,
+    source_ip: str | None,
+    status: str | None,
+    usage_tokens: tuple[int, int, int, int] | None,
+    result: ContentGenerationResult | None,
+    status_code: int,
+    total_duration_ms: int,
+    ttft_ms: int,
+    request_endpoint: str | None,
+) -> tuple[int, int, int, int, int]:
+    if status is None:
+        return 0, 0, 0, 0, 0
+
+    billable = status == "succeeded" and usage_tokens is not None and usage_tokens[3] > 0
+    input_tokens, cached_tokens, output_tokens, total_tokens = usage_tokens if billable else (0, 0, 0, 0)
+    cost_micros = (
+        estimate_cost_usd_micros(
+            pricing=pricing,
+            input_tokens=input_tokens,
+            cached_tokens=cached_tokens,
+            output_tokens=output_tokens,
+        )
+        if billable
+        else 0
+    )
+    now = dt.datetime.now(dt.timezone.utc)
+
+    try:
+        async with SessionLocal() as s:
+            row = (
+                await s.execute(
+                    select(LlmContentGenerationTask)
+                    .where(LlmContentGenerationTask.upstream_task_id == task_id)
+                    .with_for_update()
+                )
+            ).scalar_one_or_none()
+            if row is None:
+                row = LlmContentGenerationTask(
+                    upstream_task_id=task_id,
+                    org_id=org_id,
+                    user_id=user_id,
+                    api_key_id=api_key_id,
+                    channel_id=channel_id,
+                    model_id=model_id,
+                    created_at=now,
+                    updated_at=now,
+                )
+                s.add(row)
+
+            row.status = status
+            row.updated_at = now
+            row.channel_id = channel_id or row.channel_id
+            row.api_key_id = row.api_key_id or api_key_id
+            if is_terminal_content_generation_status(status):
+                row.next_poll_at = None
+                if result is not None:
+                    row.result_status_code = result.status_code
+                    row.result_content_type = result.content_type[:200]
+                    row.result_body = result.body
+
+            if not billable or row.billed_at is not None:
+                await s.commit()
+                return 0, 0, 0, 0, 0
+
+            api_key_id = row.api_key_id
+            row.billed_at = now
+            row.billed_input_tokens = input_tokens
+            row.billed_cached_tokens = cached_tokens
+            row.billed_output_tokens = output_tokens
+            row.billed_total_tokens = total_tokens
+            row.billed_cost_usd_micros = cost_micros
+
+            await record_usage_event(
+                s,
+                org_id=org_id,
+                user_id=user_id,
+                api_key_id=api_key_id,
+                model_id=model_id,
+                ok=True,
+                status_code=status_code,
+                input_tokens=input_tokens,
+                cached_tokens=cached_tokens,
+                output_tokens=output_tokens,
+                total_tokens=total_tokens,
+                cost_usd_micros=cost_micros,
+                total_duration_ms=total_duration_ms,
+                ttft_ms=ttft_ms,
+                source_ip=source_ip,
+                request_endpoint=request_endpoint,
+                is_streaming=False,
+            )
+    except Exception:
+        logger.exception("content generation task: settle failed")
+        return 0, 0, 0, 0, 0
+    await charge_rate_limit_tokens(
+        api_key_id=api_key_id,
+        user_id=user_id,
+        org_id=org_id,
+        tokens=total_tokens,
+    )
+    return input_tokens, cached_tokens, output_tokens, total_tokens, cost_micros
+
+
+async def record_content_generation_task_created(
+    *,
+    task_id: str,
+    org_id: uuid.UUID,
+    user_id: uuid.UUID,
+    api_key_id: uuid.UUID | None,
+    channel_id: uuid.UUID | None,
+    model_id: str,
+    source_ip: str | None,
+    status_code: int,
+    total_duration_ms: int,
+    ttft_ms: int,
+    request_endpoint: str | None,
+) -> bool:
+    now = dt.datetime.now(dt.timezone.utc)
+    try:
+        async with SessionLocal() as s:
+            # The task mapping commits with the creating usage event, so later GETs never have to guess
+            # the model or channel.
+            await s.execute(
+                insert(LlmContentGenerationTask)
+                .values(
+                    upstream_task_id=task_id,
+                    org_id=org_id,
+                    user_id=user_id,
+                    api_key_id=api_key_id,
+                    channel_id=channel_id,
+                    model_id=model_id,
+                    created_at=now,
+                    updated_at=now,
+                    billed_input_tokens=0,
+                    billed_cached_tokens=0,
+                    billed_output_tokens=0,
+                    billed_total_tokens=0,
+                    billed_cost_usd_micros=0,
+                    poll_attempts=0,
+                    next_poll_at=now + dt.timedelta(seconds=next_content_generation_poll_delay_seconds(0)),
+                )
+                .on_conflict_do_nothing(index_elements=[LlmContentGenerationTask.upstream_task_id])
+            )
+            await record_usage_event(
+                s,
+                org_id=org_id,
+                user_id=user_id,
+                api_key_id=api_key_id,
+                model_id=model_id,
+                ok=True,
+                status_code=status_code,
+                total_duration_ms=total_duration_ms,
+                ttft_ms=ttft_ms,
+                source_ip=source_ip,
+                request_endpoint=request_endpoint,
+                is_streaming=False,
+            )
+    except Exception:
+        logger.exception("content generation task: create record failed")
+        return False
+    return True
@@ -0,0 +1,290 @@
+from __future__ import annotations
+
+import asyncio
+import datetime as dt
+import logging
+import random
+import uuid
+from dataclasses import dataclass
+from typing import Awaitable
+
+import httpx
+from sqlalchemy import or_, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db import SessionLocal
+from app.models.email_outbox_message import EmailOutboxMessage
+
+logger = logging.getLogger(__name__)
+
+RETRY_BACKOFF_SECONDS = (2, 5, 15, 30, 60, 120, 300)
+# A claimed message whose worker died becomes claimable again after this long.
+CLAIM_LEASE_SECONDS = 60
+
+_http_client: httpx.AsyncClient | None = None
+_wakeup: asyncio.Event | None = None
+_STATS = {"sent": 0, "retried": 0, "failed": 0, "expired": 0}
+
+
+class EmailDeliveryError(Exception):
+    def __init__(self, message: str, *, retryable: bool) -> None:
+        super().__init__(message)
+        self.retryable = retryable
+
+
+@dataclass(frozen=True)
+class ClaimedEmail:
+    id: uuid.UUID
+    version: int
+    attempts: int
+    to_email: str
+    subject: str
+    body_text: str
+
+
+def _now() -> dt.datetime:
+    return dt.datetime.now(dt.timezone.utc)
+
+
+def resend_configured() -> bool:
+    return bool(settings.resend_api_key.strip())
+
+
+def next_email_retry_delay_seconds(attempts: int) -> float:
+    index = min(max(int(attempts), 1) - 1, len(RETRY_BACKOFF_SECONDS) - 1)
+    return RETRY_BACKOFF_SECONDS[index] * random.uniform(0.8, 1.2)
+
+
+async def enqueue_email(
+    session: AsyncSession,
+    *,
+    to_email: str,
+    purpose: str,
+    subject: str,
+    text: str,
+    expires_at: dt.datetime,
+) -> None:
+    # Runs in the caller's transaction, so the message commits together with whatever it announces.
+    now = _now()
+    values = {
+        "to_email": to_email,
+        "purpose": purpose,
+        "subject": subject,
+        "body_text": text,
+        "status": "pending",
+        "attempts": 0,
+        "next_attempt_at": now,
+        "expires_at": expires_at,
+        "last_error": None,
+        "sent_at": None,
+        "updated_at": now,
+    }
+    stmt = insert(EmailOutboxMessage).values(id=uuid.uuid4(), dedupe_key=f"{purpose}:{to_email}", version=1, **values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[EmailOutboxMessage.dedupe_key],
+        set_={**values, "version": EmailOutboxMessage.version + 1},
+    )
+    await session.execute(stmt)
+
+
+def wake_email_outbox() -> None:
+    if _wakeup is not None:
+        _wakeup.set()
+
+
+async def _claim_next_email() -> ClaimedEmail | None:
+    while True:
+        now = _now()
+        async with SessionLocal() as session:
+            row = (
+                await session.execute(
+                    select(EmailOutboxMessage)
+                    .where(
+                        EmailOutboxMessage.status.in_(["pending", "sending"]),
+                        or_(EmailOutboxMessage.next_attempt_at.is_(None), EmailOutboxMessage.next_attempt_at <= now),
+                    )
+                    .order_by(EmailOutboxMessage.next_attempt_at.asc().nulls_first())
+                    .limit(1)
+                    .with_for_update(skip_locked=True)
+                )
+            ).scalar_one_or_none()
+            if row is None:
+                return None
+            if row.expires_at <= now:
+                # The code in the body is already dead; sending it would only confuse the user.
+                row.status = "expired"
+                row.body_text = None
+                row.next_attempt_at = None
+                await session.commit()
+                _STATS["expired"] += 1
+                continue
+            row.status = "sending"
+            row.attempts = int(row.attempts or 0) + 1
+            row.next_attempt_at = now + dt.timedelta(seconds=CLAIM_LEASE_SECONDS)
+            claimed = ClaimedEmail(
+                id=row.id,
+                version=int(row.version),
+                attempts=int(row.attempts),
+                to_email=row.to_email,
+                subject=row.subject,
+                body_text=row.body_text or "",
+            )
+            await session.commit()
+            return claimed
+
+
+async def _finish_email(claimed: ClaimedEmail, *, error: EmailDeliveryError | None) -> None:
+    now = _now()
+    if error is None:
+        values: dict[str, object] = {
+            "status": "sent",
+            "sent_at": now,
+            "next_attempt_at": None,
+            "last_error": None,
+            "body_text": None,
+        }
+    elif error.retryable and claimed.attempts < max(1, int(settings.email_outbox_max_attempts)):
+        values = {
+            "status": "pending",
+            "next_attempt_at": now + dt.timedelta(seconds=next_email_retry_delay_seconds(claimed.attempts)),
+            "last_error": str(error)[:500],
+        }
+    else:
+        values = {"status": "failed", "next_attempt_at": None, "last_error": str(error)[:500], "body_text": None}
+    async with SessionLocal() as session:
+        # A newer enqueue bumped the version and reset the row to pending; leave it for the next claim.
+        await session.execute(
+            update(EmailOutboxMessage)
+            .where(EmailOutboxMessage.id == claimed.id, EmailOutboxMessage.version == claimed.version)
+            .values(**values)
+        )
+        await session.commit()
+
+
+async def _deliver_email(claimed: ClaimedEmail) -> None:
+    error: EmailDeliveryError | None = None
+    try:
+        await send_resend_email(
+            to_email=claimed.to_email,
+            subject=claimed.subject,
+            text=claimed.body_text,
+            idempotency_key=f"{claimed.id}:{claimed.version}",
+        )
+        _STATS["sent"] += 1
+    except EmailDeliveryError as exc:
+        error = exc
+    if error is not None:
+        _STATS["retried" if error.retryable else "failed"] += 1
+        logger.warning("email outbox: delivery of %s failed: %s", claimed.id, error)
+    await _finish_email(claimed, error=error)
+
+
+async def deliver_next_email() -> bool:
+    if not resend_configured():
+        return False
+    claimed = await _claim_next_email()
+    if claimed is None:
+        return False
+    await _deliver_email(claimed)
+    return True
+
+
+def email_outbox_stats() -> dict[str, int]:
+    return dict(_STATS)
+
+
+async def _deliver_email_logged(claimed: ClaimedEmail) -> None:
+    try:
+        await _deliver_email(claimed)
+    except Exception:
+        logger.exception("email outbox: delivery of %s failed", claimed.id)
+
+
+async def _wait_for_any(*aws: Awaitable[object], timeout: float | None) -> None:
+    waiters = [asyncio.ensure_future(aw) for aw in aws]
+    try:
+        await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for waiter in waiters:
+            waiter.cancel()
+
+
+async def run_email_outbox_worker(stop_event: asyncio.Event) -> None:
+    """One poller per process claims due messages and hands each to a sender task.
+
+    Claims use SKIP LOCKED, so processes share the outbox without leader election.
+    """
+    global _wakeup
+    wakeup = _wakeup = asyncio.Event()
+    interval = max(1, int(settings.email_outbox_poll_interval_seconds or 5))
+    workers = max(1, int(settings.email_outbox_workers or 1))
+    sends: set[asyncio.Task[None]] = set()
+    try:
+        while not stop_event.is_set():
+            # Clear before claiming so a message enqueued mid-claim still wakes us up.
+            wakeup.clear()
+            drained = False
+            try:
+                while len(sends) < workers and not stop_event.is_set():
+                    claimed = await _claim_next_email() if resend_configured() else None
+                    if claimed is None:
+                        drained = True
+                        break
+                    task = asyncio.create_task(_deliver_email_logged(claimed))
+                    sends.add(task)
+                    task.add_done_callback(sends.discard)
+            except Exception:
+                logger.exception("email outbox: claim failed")
+                drained = True
+            if drained:
+                await _wait_for_any(stop_event.wait(), wakeup.wait(), timeout=interval)
+            else:
+                await _wait_for_any(stop_event.wait(), *sends, timeout=None)
+    finally:
+        if _wakeup is wakeup:
+            _wakeup = None
+        if sends:
+            await asyncio.gather(*sends, return_exceptions=True)
+        await close_email_client()
+
+
+def _get_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        workers = max(1, int(settings.email_outbox_workers or 1))
+        _http_client = httpx.AsyncClient(
+            base_url=settings.resend_api_base_url.strip().rstrip("/"),
+            timeout=httpx.Timeout(12.0, connect=6.0),
+            limits=httpx.Limits(max_connections=workers, max_keepalive_connections=workers),
+        )
+    return _http_client
+
+
+async def close_email_client() -> None:
+    global _http_client
+    client, _http_client = _http_client, None
+    if client is not None and not client.is_closed:
+        await client.aclose()
+
+
+async def send_resend_email(*, to_email: str, subject: str, text: str, idempotency_key: str) -> None:
+    api_key = settings.resend_api_key.strip()
+    if not api_key:
+        raise EmailDeliveryError("resend not configured", retryable=True)
+
+    payload = {
+        "from": settings.resend_from_email,
+        "to": [to_email],
+        "subject": subject,
+        "text": text,
+    }
+    headers = {"authorization": f"Bearer {api_key}", "idempotency-key": idempotency_key}
+    try:
+        res = await _get_http_client().post("/emails", json=payload, headers=headers)
+    except httpx.HTTPError as exc:
+        raise EmailDeliveryError(f"resend request failed: {type(exc).__name__}", retryable=True) from exc
+    if res.status_code >= 400:
+        retryable = res.status_code == 429 or res.status_code >= 500
+        raise EmailDeliveryError(f"resend returned {res.status_code}: {res.text[:200]}", retryable=retryable)
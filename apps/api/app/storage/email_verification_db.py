@@ -4,12 +4,12 @@ import datetime as dt
 import secrets
 from typing import Final
 
-import httpx
 from sqlalchemy import func, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import settings
 from app.models.email_verification_code import EmailVerificationCode
+from app.storage.email_outbox import enqueue_email, resend_configured, wake_email_outbox
 from app.security import sha256_hex
 
 
@@ -54,25 +54,6 @@ def _generate_code() -> str:
     return f"{secrets.randbelow(1_000_000):06d}"
 
 
-async def _send_resend_email(*, to_email: str, subject: str, text: str) -> None:
-    api_key = settings.resend_api_key.strip()
-    if not api_key:
-        raise ValueError("resend not configured")
-
-    payload = {
-        "from": settings.resend_from_email,
-        "to": [to_email],
-        "subject": subject,
-        "text": text,
-    }
-    headers = {"authorization": f"Bearer {api_key}", "content-type": "application/json"}
-    timeout = httpx.Timeout(12.0, connect=6.0)
-    async with httpx.AsyncClient(timeout=timeout) as client:
-        res = await client.post("https://api.resend.com/emails", json=payload, headers=headers)
-    if res.status_code >= 400:
-        raise ValueError("failed to send email")
-
-
 async def request_email_code(
     session: AsyncSession,
     *,
@@ -115,6 +96,9 @@ async def request_email_code(
         if (now - latest) < dt.timedelta(seconds=30):
             raise ValueError("please wait")
 
+    if send_email and not resend_configured():
+        raise ValueError("resend not configured")
+
     code = _generate_code()
     expires_at = now + dt.timedelta(minutes=int(settings.email_verification_ttl_minutes))
     row = EmailVerificationCode(
@@ -125,21 +109,22 @@ async def request_email_code(
         source_ip=(client_ip.strip()[:64] if client_ip else None),
     )
     session.add(row)
+    if send_email:
+        await enqueue_email(
+            session,
+            to_email=normalized_email,
+            purpose=normalized_purpose,
+            subject="Your verification code",
+            text=(
+                "Your verification code is:\n\n"
+                f"{code}\n\n"
+                f"This code expires in {settings.email_verification_ttl_minutes} minutes."
+            ),
+            expires_at=expires_at,
+        )
     await session.commit()
-
-    subject = "Your verification code"
-    text = (
-        "Your verification code is:\n\n"
-        f"{code}\n\n"
-        f"This code expires in {settings.email_verification_ttl_minutes} minutes."
-    )
     if send_email:
-        try:
-            await _send_resend_email(to_email=normalized_email, subject=subject, text=text)
-        except Exception:
-            row.used_at = now
-            await session.commit()
-            raise
+        wake_email_outbox()
     return int((expires_at - now).total_seconds())
 
 
@@ -3,22 +3,30 @@ from __future__ import annotations
 import asyncio
 import datetime as dt
 import json
+import logging
+import time
 import uuid
+from dataclasses import dataclass
 from decimal import Decimal, InvalidOperation, ROUND_DOWN
 from pathlib import Path
 from typing import Literal, TypedDict
 
 import httpx
-from sqlalchemy import Integer, case, cast, func, select
+from sqlalchemy import func, select
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.config import settings
+from app.db import SessionLocal
 from app.models.llm_channel import LlmChannel
+from app.models.llm_model_availability_stat import LlmModelAvailabilityStat
 from app.models.llm_model_config import LlmModelConfig
 from app.models.llm_model_pricing_rule import LlmModelPricingRule
-from app.models.llm_usage_event import LlmUsageEvent
 from app.models.organization import Organization
-from app.storage.channels_db import list_channels_for_group
+from app.pricing import UsagePricing
+from app.storage.channels_db import channel_declared_models, list_channels_for_group
+
+logger = logging.getLogger(__name__)
 
 
 USD_MICROS = Decimal("1000000")
@@ -261,12 +269,6 @@ class ModelAvailabilityBucket(TypedDict):
     status: ModelAvailabilityStatus
 
 
-def _model_availability_relevant_filter():
-    return (LlmUsageEvent.status_code < 400) | (
-        LlmUsageEvent.status_code >= MODEL_AVAILABILITY_FAILURE_STATUS_MIN
-    )
-
-
 def model_availability_bucket(total: int, failed: int) -> ModelAvailabilityBucket:
     total_count = max(0, int(total))
     failed_count = min(max(0, int(failed)), total_count)
@@ -291,60 +293,60 @@ def _availability_legacy_slots(buckets: list[ModelAvailabilityBucket]) -> list[i
     return [1 if bucket["status"] == "down" else 0 for bucket in buckets]
 
 
+def model_availability_bucket_start(value: dt.datetime) -> dt.datetime:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=dt.timezone.utc)
+    epoch = int(value.timestamp())
+    return dt.datetime.fromtimestamp(epoch - epoch % AVAILABILITY_24H_BUCKET_SECONDS, tz=dt.timezone.utc)
+
+
+def model_availability_counts(status_code: int) -> tuple[int, int] | None:
+    code = int(status_code)
+    if code >= MODEL_AVAILABILITY_FAILURE_STATUS_MIN:
+        return 1, 1
+    if code < 400:
+        return 1, 0
+    return None
+
+
 async def fetch_model_availability_24h(
     session: AsyncSession, *, org_id: uuid.UUID, model_ids: list[str]
 ) -> dict[str, list[ModelAvailabilityBucket]]:
     if not model_ids:
         return {}
-    now = dt.datetime.now(dt.timezone.utc)
-    start = now - dt.timedelta(hours=24)
-    start_epoch = start.timestamp()
-
-    bucket_expr = cast(
-        func.floor(
-            (func.extract("epoch", LlmUsageEvent.created_at) - start_epoch) / AVAILABILITY_24H_BUCKET_SECONDS
-        ),
-        Integer,
-    )
-
-    total_count_expr = func.count().label("total_count")
-    failed_count_expr = func.coalesce(
-        func.sum(
-            case(
-                (LlmUsageEvent.status_code >= MODEL_AVAILABILITY_FAILURE_STATUS_MIN, 1),
-                else_=0,
-            )
-        ),
-        0,
-    ).label("failed_count")
+    current_bucket = model_availability_bucket_start(dt.datetime.now(dt.timezone.utc))
+    start = current_bucket - dt.timedelta(seconds=AVAILABILITY_24H_BUCKET_SECONDS * (AVAILABILITY_24H_BUCKETS - 1))
 
     rows = (
         await session.execute(
-            select(LlmUsageEvent.model_id, bucket_expr, total_count_expr, failed_count_expr)
-            .where(
-                LlmUsageEvent.org_id == org_id,
-                LlmUsageEvent.created_at >= start,
-                LlmUsageEvent.model_id.in_(model_ids),
-                _model_availability_relevant_filter(),
+            select(
+                LlmModelAvailabilityStat.model_id,
+                LlmModelAvailabilityStat.bucket_start,
+                LlmModelAvailabilityStat.total,
+                LlmModelAvailabilityStat.failed,
+            ).where(
+                LlmModelAvailabilityStat.org_id == org_id,
+                LlmModelAvailabilityStat.bucket_start >= start,
+                LlmModelAvailabilityStat.model_id.in_(model_ids),
             )
-            .group_by(LlmUsageEvent.model_id, bucket_expr)
         )
     ).all()
 
     availability: dict[str, list[ModelAvailabilityBucket]] = {
         mid: _empty_availability_24h_buckets() for mid in model_ids
     }
-    for mid, bucket, total_count, failed_count in rows:
-        model = str(mid)
-        idx = int(bucket) if bucket is not None else None
-        if idx is None or idx < 0:
+    for mid, bucket_start, total_count, failed_count in rows:
+        if not isinstance(bucket_start, dt.datetime):
+            continue
+        idx = int((bucket_start - start).total_seconds() // AVAILABILITY_24H_BUCKET_SECONDS)
+        if idx < 0:
             continue
         if idx >= AVAILABILITY_24H_BUCKETS:
             idx = AVAILABILITY_24H_BUCKETS - 1
-        slots = availability.get(model)
+        slots = availability.get(str(mid))
         if slots is None:
             slots = _empty_availability_24h_buckets()
-            availability[model] = slots
+            availability[str(mid)] = slots
         slots[idx] = model_availability_bucket(int(total_count or 0), int(failed_count or 0))
     return availability
 
@@ -367,6 +369,8 @@ async def upsert_model_config(
     enabled: bool | None,
     input_usd_per_m: str | None | object,
     output_usd_per_m: str | None | object,
+    response_cache_enabled: bool | None = None,
+    hedge_ttft_ms: int | None | object = UNSET,
 ) -> LlmModelConfig:
     model = _normalize_model_id(model_id)
     row = await get_model_config(session, org_id=org_id, model_id=model)
@@ -378,6 +382,10 @@ async def upsert_model_config(
 
     if enabled is not None:
         row.enabled = bool(enabled)
+    if response_cache_enabled is not None:
+        row.response_cache_enabled = bool(response_cache_enabled)
+    if hedge_ttft_ms is not UNSET:
+        row.hedge_ttft_ms = int(hedge_ttft_ms) if hedge_ttft_ms else None  # type: ignore[arg-type]
 
     if input_usd_per_m is not UNSET:
         row.input_usd_micros_per_m = _parse_usd_per_m(input_usd_per_m)  # type: ignore[arg-type]
@@ -529,14 +537,29 @@ async def get_price_detail_for_model(
     )
 
 
-async def fetch_models_for_channel(channel: LlmChannel) -> set[str]:
-    url = f"{channel.base_url.rstrip('/')}/models"
-    headers = {"authorization": f"Bearer {channel.api_key}"}
+async def resolve_usage_pricing(
+    session: AsyncSession, *, org_id: uuid.UUID, cfg: object | None, model_id: str
+) -> UsagePricing:
+    rule_in, rule_out, _, _, _ = await get_price_detail_for_model(
+        session, org_id=org_id, model_id=model_id.strip()
+    )
+    input_price = getattr(cfg, "input_usd_micros_per_m", None)
+    output_price = getattr(cfg, "output_usd_micros_per_m", None)
+
+    return UsagePricing(
+        input_usd_micros_per_m=input_price if input_price is not None else rule_in,
+        output_usd_micros_per_m=output_price if output_price is not None else rule_out,
+    )
+
+
+async def _fetch_channel_models(base_url: str, api_key: str) -> set[str]:
+    url = f"{base_url.rstrip('/')}/models"
+    headers = {"authorization": f"Bearer {api_key}"}
     timeout = httpx.Timeout(20.0, connect=8.0)
     async with httpx.AsyncClient(timeout=timeout) as client:
         res = await client.get(url, headers=headers)
     if res.status_code != 200:
-        return set()
+        raise ValueError(f"upstream /models returned {res.status_code}")
     data = res.json()
     models: set[str] = set()
 
@@ -559,6 +582,166 @@ async def fetch_models_for_channel(channel: LlmChannel) -> set[str]:
     return models
 
 
+MODEL_CATALOG_FAILURE_RETRY_SECONDS = 30
+
+
+@dataclass
+class _ChannelModelCatalogEntry:
+    fingerprint: tuple[str, str]
+    models: frozenset[str]
+    checked_at: float
+    refreshed_at: float | None
+    last_error: str | None = None
+
+
+_MODEL_CATALOG: dict[uuid.UUID, _ChannelModelCatalogEntry] = {}
+_MODEL_CATALOG_INFLIGHT: dict[uuid.UUID, asyncio.Task[frozenset[str]]] = {}
+
+
+def _model_catalog_ttl_seconds() -> int:
+    return max(30, int(settings.model_catalog_refresh_interval_seconds or 300))
+
+
+async def _refresh_channel_model_catalog(
+    channel_id: uuid.UUID, fingerprint: tuple[str, str]
+) -> frozenset[str]:
+    base_url, api_key = fingerprint
+    try:
+        models = frozenset(await _fetch_channel_models(base_url, api_key))
+    except Exception as exc:
+        now = time.monotonic()
+        existing = _MODEL_CATALOG.get(channel_id)
+        if existing and existing.fingerprint == fingerprint:
+            existing.checked_at = now
+            existing.last_error = str(exc)[:200] or type(exc).__name__
+            return existing.models
+        _MODEL_CATALOG[channel_id] = _ChannelModelCatalogEntry(
+            fingerprint=fingerprint,
+            models=frozenset(),
+            checked_at=now,
+            refreshed_at=None,
+            last_error=str(exc)[:200] or type(exc).__name__,
+        )
+        return frozenset()
+    now = time.monotonic()
+    _MODEL_CATALOG[channel_id] = _ChannelModelCatalogEntry(
+        fingerprint=fingerprint,
+        models=models,
+        checked_at=now,
+        refreshed_at=now,
+    )
+    return models
+
+
+def _start_channel_model_refresh(
+    channel_id: uuid.UUID, fingerprint: tuple[str, str]
+) -> asyncio.Task[frozenset[str]]:
+    task = _MODEL_CATALOG_INFLIGHT.get(channel_id)
+    if task is not None and not task.done():
+        return task
+    task = asyncio.create_task(_refresh_channel_model_catalog(channel_id, fingerprint))
+    _MODEL_CATALOG_INFLIGHT[channel_id] = task
+
+    def _done(done_task: asyncio.Task[frozenset[str]]) -> None:
+        if _MODEL_CATALOG_INFLIGHT.get(channel_id) is done_task:
+            _MODEL_CATALOG_INFLIGHT.pop(channel_id, None)
+
+    task.add_done_callback(_done)
+    return task
+
+
+async def get_channel_models(channel: LlmChannel) -> frozenset[str]:
+    fingerprint = (channel.base_url, channel.api_key)
+    entry = _MODEL_CATALOG.get(channel.id)
+    if entry is not None and entry.fingerprint == fingerprint:
+        ttl = _model_catalog_ttl_seconds() if entry.last_error is None else MODEL_CATALOG_FAILURE_RETRY_SECONDS
+        if time.monotonic() - entry.checked_at >= ttl:
+            _start_channel_model_refresh(channel.id, fingerprint)
+        return entry.models
+    return await asyncio.shield(_start_channel_model_refresh(channel.id, fingerprint))
+
+
+def peek_channel_models(channel: LlmChannel) -> frozenset[str] | None:
+    fingerprint = (channel.base_url, channel.api_key)
+    entry = _MODEL_CATALOG.get(channel.id)
+    if entry is None or entry.fingerprint != fingerprint:
+        _start_channel_model_refresh(channel.id, fingerprint)
+        return None
+    if entry.refreshed_at is None:
+        return None
+    return entry.models
+
+
+def channel_serves_model(channel: LlmChannel, model_id: str, discovered: frozenset[str] | None) -> bool:
+    models, prefixes = channel_declared_models(channel)
+    if models or prefixes:
+        return model_id in models or any(model_id.startswith(prefix) for prefix in prefixes)
+    if not discovered:
+        return True
+    return model_id in discovered
+
+
+def channel_advertised_models(channel: LlmChannel, discovered: frozenset[str]) -> set[str]:
+    models, prefixes = channel_declared_models(channel)
+    if not models and not prefixes:
+        return set(discovered)
+    advertised = set(models)
+    advertised.update(mid for mid in discovered if any(mid.startswith(prefix) for prefix in prefixes))
+    return advertised
+
+
+async def list_channels_for_model(
+    session: AsyncSession, *, org_id: uuid.UUID, group_name: str, model_id: str
+) -> tuple[list[LlmChannel], list[LlmChannel]]:
+    group_channels = await list_channels_for_group(session, org_id=org_id, group_name=group_name)
+    eligible = [c for c in group_channels if channel_serves_model(c, model_id, peek_channel_models(c))]
+    return group_channels, eligible
+
+
+def forget_channel_models(channel_id: uuid.UUID) -> None:
+    _MODEL_CATALOG.pop(channel_id, None)
+
+
+async def refresh_model_catalog(session: AsyncSession) -> int:
+    channels = (await session.execute(select(LlmChannel))).scalars().all()
+    live_ids = {c.id for c in channels}
+    for channel_id in list(_MODEL_CATALOG.keys()):
+        if channel_id not in live_ids:
+            _MODEL_CATALOG.pop(channel_id, None)
+    if not channels:
+        return 0
+    await asyncio.gather(
+        *(_start_channel_model_refresh(c.id, (c.base_url, c.api_key)) for c in channels),
+        return_exceptions=True,
+    )
+    return len(channels)
+
+
+async def refresh_channel_models_by_id(channel_id: uuid.UUID) -> None:
+    try:
+        async with SessionLocal() as session:
+            channel = await session.get(LlmChannel, channel_id)
+        if not channel:
+            forget_channel_models(channel_id)
+            return
+        await _start_channel_model_refresh(channel.id, (channel.base_url, channel.api_key))
+    except Exception:
+        logger.exception("model catalog refresh failed for channel %s", channel_id)
+
+
+async def run_model_catalog_refresh_worker(stop_event: asyncio.Event) -> None:
+    while not stop_event.is_set():
+        try:
+            async with SessionLocal() as session:
+                await refresh_model_catalog(session)
+        except Exception:
+            logger.exception("model catalog refresh failed")
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=_model_catalog_ttl_seconds())
+        except asyncio.TimeoutError:
+            continue
+
+
 async def fetch_available_models(
     session: AsyncSession, *, org_id: uuid.UUID
 ) -> dict[str, int]:
@@ -571,12 +754,12 @@ async def fetch_available_models(
 async def fetch_available_models_for_channels(channels: list[LlmChannel]) -> dict[str, int]:
     if not channels:
         return {}
-    results = await asyncio.gather(*(fetch_models_for_channel(c) for c in channels), return_exceptions=True)
+    results = await asyncio.gather(*(get_channel_models(c) for c in channels), return_exceptions=True)
     counts: dict[str, int] = {}
-    for res in results:
+    for channel, res in zip(channels, results):
         if isinstance(res, Exception):
             continue
-        for mid in res:
+        for mid in channel_advertised_models(channel, res):
             counts[mid] = counts.get(mid, 0) + 1
     return counts
 
@@ -617,6 +800,8 @@ async def list_admin_models(
                 "inputUsdPerM": _micros_to_str(input_micros),
                 "outputUsdPerM": _micros_to_str(output_micros),
                 "discount": discount_out,
+                "responseCache": bool(cfg and cfg.response_cache_enabled),
+                "hedgeTtftMs": cfg.hedge_ttft_ms if cfg else None,
                 "sources": int(available_counts.get(mid, 0)),
                 "available": mid in available_counts,
             }
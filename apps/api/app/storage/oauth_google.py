@@ -12,7 +12,7 @@ from app.core.config import settings
 from app.models.oauth_identity import OAuthIdentity
 from app.models.user import User
 from app.schemas.auth import AuthResponse, UserPublic
-from app.security_password import hash_password
+from app.security_password import hash_password_async
 from app.storage.balance_math import remaining_usd_2
 from app.storage.auth_db import create_session
 from app.storage.analytics_outbox import enqueue_analytics_event
@@ -173,7 +173,7 @@ async def login_with_google(
 
         user = User(
             email=profile.email,
-            password_hash=hash_password(secrets.token_urlsafe(32)),
+            password_hash=await hash_password_async(secrets.token_urlsafe(32)),
             invite_code=await generate_unique_invite_code(session),
             invited_by_user_id=inviter_user_id,
             invited_at=(now if inviter_user_id else None),
@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from sqlalchemy import select
+from sqlalchemy import select, text
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.models.membership import Membership
@@ -43,3 +43,22 @@ async def ensure_membership(
     await session.refresh(row)
     return row
 
+
+async def backfill_default_memberships(session: AsyncSession, *, org_id) -> int:
+    result = await session.execute(
+        text(
+            "INSERT INTO memberships (id, org_id, user_id, role, created_at) "
+            "SELECT gen_random_uuid(), :org_id, u.id, "
+            "  CASE WHEN u.id = (SELECT id FROM users ORDER BY created_at ASC LIMIT 1) "
+            "  THEN 'owner' ELSE 'developer' END, "
+            "  now() "
+            "FROM users u "
+            "WHERE NOT EXISTS ("
+            "  SELECT 1 FROM memberships m WHERE m.org_id = :org_id AND m.user_id = u.id"
+            ") "
+            "ON CONFLICT (org_id, user_id) DO NOTHING"
+        ),
+        {"org_id": org_id},
+    )
+    await session.commit()
+    return max(int(result.rowcount or 0), 0)
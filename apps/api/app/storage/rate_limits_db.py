@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+import datetime as dt
+import time
+import uuid
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.api_key import ApiKey
+from app.models.membership import Membership
+from app.models.rate_limit_policy import RateLimitPolicy
+from app.rate_limit import RateLimitRule
+
+RATE_LIMIT_SCOPES = ("org", "group", "api_key")
+MAX_RATE_LIMIT_VALUE = 1_000_000_000
+
+# org_id -> (loaded_at, {(scope, subject): (rpm, tpm, max_concurrent_streams)})
+_POLICY_CACHE: dict[uuid.UUID, tuple[float, dict[tuple[str, str], tuple[int | None, int | None, int | None]]]] = {}
+
+
+def _dt_iso(value: dt.datetime | None) -> str:
+    if not value:
+        return dt.datetime.now(dt.timezone.utc).isoformat()
+    return value.astimezone(dt.timezone.utc).isoformat()
+
+
+def rate_limit_policy_to_item(row: RateLimitPolicy) -> dict:
+    return {
+        "id": str(row.id),
+        "scope": row.scope,
+        "subject": row.subject,
+        "rpmLimit": row.rpm_limit,
+        "tpmLimit": row.tpm_limit,
+        "maxConcurrentStreams": row.max_concurrent_streams,
+        "createdAt": _dt_iso(row.created_at),
+        "updatedAt": _dt_iso(row.updated_at),
+    }
+
+
+def _normalize_limit(value: int | None, name: str) -> int | None:
+    if value is None:
+        return None
+    limit = int(value)
+    if limit <= 0 or limit > MAX_RATE_LIMIT_VALUE:
+        raise ValueError(f"invalid {name}")
+    return limit
+
+
+async def _normalize_subject(session: AsyncSession, *, org_id: uuid.UUID, scope: str, subject: str) -> str:
+    raw = (subject or "").strip()
+    if scope == "org":
+        return ""
+    if scope == "group":
+        if not raw or len(raw) > 64:
+            raise ValueError("invalid group")
+        return raw
+    try:
+        key_id = uuid.UUID(raw)
+    except ValueError as e:
+        raise ValueError("invalid api key") from e
+    owner = (
+        await session.execute(
+            select(ApiKey.id)
+            .join(Membership, Membership.user_id == ApiKey.user_id)
+            .where(ApiKey.id == key_id, Membership.org_id == org_id)
+        )
+    ).first()
+    if owner is None:
+        raise ValueError("api key not found")
+    return str(key_id)
+
+
+async def list_rate_limit_policies(session: AsyncSession, *, org_id: uuid.UUID) -> list[RateLimitPolicy]:
+    return list(
+        (
+            await session.execute(
+                select(RateLimitPolicy)
+                .where(RateLimitPolicy.org_id == org_id)
+                .order_by(RateLimitPolicy.scope.asc(), RateLimitPolicy.subject.asc())
+            )
+        )
+        .scalars()
+        .all()
+    )
+
+
+async def upsert_rate_limit_policy(
+    session: AsyncSession,
+    *,
+    org_id: uuid.UUID,
+    scope: str,
+    subject: str,
+    rpm_limit: int | None,
+    tpm_limit: int | None,
+    max_concurrent_streams: int | None,
+) -> RateLimitPolicy:
+    normalized_scope = (scope or "").strip().lower()
+    if normalized_scope not in RATE_LIMIT_SCOPES:
+        raise ValueError("invalid scope")
+    normalized_subject = await _normalize_subject(
+        session, org_id=org_id, scope=normalized_scope, subject=subject
+    )
+    rpm = _normalize_limit(rpm_limit, "rpm limit")
+    tpm = _normalize_limit(tpm_limit, "tpm limit")
+    streams = _normalize_limit(max_concurrent_streams, "concurrent stream limit")
+    if rpm is None and tpm is None and streams is None:
+        raise ValueError("at least one limit is required")
+
+    row = (
+        await session.execute(
+            select(RateLimitPolicy).where(
+                RateLimitPolicy.org_id == org_id,
+                RateLimitPolicy.scope == normalized_scope,
+                RateLimitPolicy.subject == normalized_subject,
+            )
+        )
+    ).scalar_one_or_none()
+    if row is None:
+        row = RateLimitPolicy(org_id=org_id, scope=normalized_scope, subject=normalized_subject)
+        session.add(row)
+    row.rpm_limit = rpm
+    row.tpm_limit = tpm
+    row.max_concurrent_streams = streams
+    try:
+        await session.commit()
+    except IntegrityError as e:
+        await session.rollback()
+        raise ValueError("rate limit policy already exists") from e
+    await session.refresh(row)
+    _POLICY_CACHE.pop(org_id, None)
+    return row
+
+
+async def delete_rate_limit_policy(session: AsyncSession, *, org_id: uuid.UUID, policy_id: uuid.UUID) -> bool:
+    row = await session.get(RateLimitPolicy, policy_id)
+    if row is None or row.org_id != org_id:
+        return False
+    await session.delete(row)
+    await session.commit()
+    _POLICY_CACHE.pop(org_id, None)
+    return True
+
+
+async def _load_org_policies(
+    session: AsyncSession, *, org_id: uuid.UUID
+) -> dict[tuple[str, str], tuple[int | None, int | None, int | None]]:
+    ttl = max(0, int(settings.rate_limit_policy_cache_seconds or 0))
+    now = time.monotonic()
+    cached = _POLICY_CACHE.get(org_id)
+    if cached is not None and now - cached[0] < ttl:
+        return cached[1]
+    rows = (
+        await session.execute(
+            select(
+                RateLimitPolicy.scope,
+                RateLimitPolicy.subject,
+                RateLimitPolicy.rpm_limit,
+                RateLimitPolicy.tpm_limit,
+                RateLimitPolicy.max_concurrent_streams,
+            ).where(RateLimitPolicy.org_id == org_id)
+        )
+    ).all()
+    policies = {(str(scope), str(subject)): (rpm, tpm, streams) for scope, subject, rpm, tpm, streams in rows}
+    _POLICY_CACHE[org_id] = (now, policies)
+    return policies
+
+
+async def rate_limit_rules_for_request(
+    session: AsyncSession,
+    *,
+    org_id: uuid.UUID,
+    user_id: uuid.UUID,
+    group_name: str,
+    api_key_id: uuid.UUID,
+) -> list[RateLimitRule]:
+    if not settings.rate_limit_enabled:
+        return []
+    policies = await _load_org_policies(session, org_id=org_id)
+    if not policies:
+        return []
+    # Group policies are tiers: each user in the group gets their own buckets.
+    candidates = [
+        (f"api_key:{api_key_id}", policies.get(("api_key", str(api_key_id)))),
+        (f"user:{user_id}", policies.get(("group", (group_name or "").strip()))),
+        (f"org:{org_id}", policies.get(("org", ""))),
+    ]
+    return [
+        RateLimitRule(bucket=bucket, rpm=limits[0], tpm=limits[1], max_concurrent_streams=limits[2])
+        for bucket, limits in candidates
+        if limits is not None
+    ]
@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import datetime as dt
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any
+
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.models.llm_content_generation_task import CONTENT_GENERATION_TERMINAL_STATUSES
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class RetentionPolicy:
+    name: str
+    table: str
+    key: str
+    # SQL predicate selecting purgeable rows; must reference :cutoff.
+    condition: str
+    retention_days: int
+    batch_size: int
+
+
+def retention_policies() -> list[RetentionPolicy]:
+    batch_size = max(100, min(int(settings.retention_batch_size), 100000))
+    terminal = ", ".join(f"'{status}'" for status in CONTENT_GENERATION_TERMINAL_STATUSES)
+    policies = [
+        RetentionPolicy(
+            name="analytics_outbox_sent",
+            table="analytics_outbox_events",
+            key="id",
+            condition="status = 'sent' AND sent_at < :cutoff",
+            retention_days=int(settings.analytics_outbox_sent_retention_days),
+            batch_size=batch_size,
+        ),
+        RetentionPolicy(
+            name="analytics_outbox_failed",
+            table="analytics_outbox_events",
+            key="id",
+            condition="status = 'failed' AND created_at < :cutoff",
+            retention_days=int(settings.analytics_outbox_failed_retention_days),
+            batch_size=batch_size,
+        ),
+        RetentionPolicy(
+            name="sessions",
+            table="sessions",
+            key="id",
+            condition="(expires_at < :cutoff OR revoked_at < :cutoff)",
+            retention_days=int(settings.sessions_retention_days),
+            batch_size=batch_size,
+        ),
+        RetentionPolicy(
+            name="email_verification_codes",
+            table="email_verification_codes",
+            key="id",
+            condition="(expires_at < :cutoff OR used_at < :cutoff)",
+            retention_days=int(settings.email_verification_codes_retention_days),
+            batch_size=batch_size,
+        ),
+        RetentionPolicy(
+            name="email_outbox_messages",
+            table="email_outbox_messages",
+            key="id",
+            condition="status IN ('sent', 'failed', 'expired') AND updated_at < :cutoff",
+            retention_days=int(settings.email_outbox_retention_days),
+            batch_size=batch_size,
+        ),
+        RetentionPolicy(
+            name="invite_visits",
+            table="invite_visits",
+            key="id",
+            condition="created_at < :cutoff",
+            retention_days=int(settings.invite_visits_retention_days),
+            batch_size=batch_size,
+        ),
+        RetentionPolicy(
+            name="content_generation_tasks",
+            table="llm_content_generation_tasks",
+            key="upstream_task_id",
+            condition=f"status IN ({terminal}) AND updated_at < :cutoff",
+            retention_days=int(settings.content_generation_tasks_retention_days),
+            batch_size=batch_size,
+        ),
+        RetentionPolicy(
+            name="rate_limit_buckets",
+            table="rate_limit_buckets",
+            key="bucket_key",
+            condition="updated_at < :cutoff",
+            retention_days=int(settings.rate_limit_state_retention_days),
+            batch_size=batch_size,
+        ),
+        RetentionPolicy(
+            name="rate_limit_stream_leases",
+            table="rate_limit_stream_leases",
+            key="id",
+            condition="expires_at < :cutoff",
+            retention_days=int(settings.rate_limit_state_retention_days),
+            batch_size=batch_size,
+        ),
+    ]
+    # A retention of 0 days keeps the table forever.
+    return [policy for policy in policies if policy.retention_days > 0]
+
+
+def _purge_statement(policy: RetentionPolicy) -> str:
+    return (
+        f"WITH doomed AS ("
+        f"  SELECT {policy.key} FROM {policy.table} "
+        f"  WHERE {policy.condition} "
+        f"  LIMIT :batch_size"
+        f") "
+        f"DELETE FROM {policy.table} t "
+        f"USING doomed "
+        f"WHERE t.{policy.key} = doomed.{policy.key}"
+    )
+
+
+async def purge_expired_rows(
+    conn: Any,
+    *,
+    policies: list[RetentionPolicy] | None = None,
+    max_batches: int | None = None,
+    now: dt.datetime | None = None,
+) -> list[dict[str, Any]]:
+    ts = now or dt.datetime.now(dt.timezone.utc)
+    batches = max(1, int(max_batches if max_batches is not None else settings.retention_max_batches))
+    report: list[dict[str, Any]] = []
+    for policy in policies if policies is not None else retention_policies():
+        started = time.perf_counter()
+        statement = text(_purge_statement(policy))
+        cutoff = ts - dt.timedelta(days=policy.retention_days)
+        purged = 0
+        try:
+            for _ in range(batches):
+                result = await conn.execute(statement, {"cutoff": cutoff, "batch_size": policy.batch_size})
+                deleted = max(int(result.rowcount or 0), 0)
+                purged += deleted
+                if deleted < policy.batch_size:
+                    break
+        except Exception:
+            logger.exception("retention: purging %s failed", policy.name)
+        duration_ms = int((time.perf_counter() - started) * 1000)
+        report.append({"policy": policy.name, "table": policy.table, "purged": purged, "durationMs": duration_ms})
+        if purged > 0:
+            logger.info(
+                "retention: purged %s rows from %s (%s) in %sms",
+                purged,
+                policy.table,
+                policy.name,
+                duration_ms,
+            )
+    return report
@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import asyncio
+import datetime as dt
+import logging
+
+from sqlalchemy import and_, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.zhupay import ZhupayError
+from app.core.zhupay import is_configured as zhupay_is_configured
+from app.core.zhupay import query_order as zhupay_query_order
+from app.db import SessionLocal
+from app.models.billing_topup import BillingTopup
+from app.storage.topups_db import complete_billing_topup, mark_billing_topup_failed, set_billing_topup_status
+
+logger = logging.getLogger(__name__)
+
+# Seconds between provider queries for one pending topup: quick while the user is on the
+# checkout page, then backing off for payments that settle late.
+RECONCILE_BACKOFF_SECONDS = (5, 5, 10, 10, 15, 30, 60, 120, 300, 600, 1800)
+RECONCILE_BATCH_SIZE = 50
+
+
+def next_reconcile_delay_seconds(attempts: int) -> int:
+    index = min(max(int(attempts), 0), len(RECONCILE_BACKOFF_SECONDS) - 1)
+    return RECONCILE_BACKOFF_SECONDS[index]
+
+
+async def sync_pending_topup_from_zhupay(session: AsyncSession, *, topup: BillingTopup) -> BillingTopup:
+    if str(getattr(topup, "status", "") or "").strip().lower() != "pending":
+        return topup
+    if not zhupay_is_configured():
+        return topup
+
+    remote = await zhupay_query_order(out_trade_no=str(topup.request_id))
+
+    expected_cents = int(getattr(topup, "amount_total_cents", 0) or 0) or None
+    if expected_cents is not None and remote.money_cents is not None and remote.money_cents != expected_cents:
+        synced = await mark_billing_topup_failed(
+            session,
+            request_id=str(topup.request_id),
+            provider="zhupay",
+            checkout_id=remote.trade_no,
+            order_id=remote.api_trade_no,
+            currency="CNY",
+            amount_total_cents=remote.money_cents,
+        )
+        return synced or topup
+
+    if remote.status == 1:
+        synced = await complete_billing_topup(
+            session,
+            request_id=str(topup.request_id),
+            provider="zhupay",
+            checkout_id=remote.trade_no,
+            order_id=remote.api_trade_no,
+            currency="CNY",
+            amount_total_cents=remote.money_cents,
+            payer_email=None,
+        )
+        return synced or topup
+
+    if remote.status in {2, 3, 4}:
+        synced = await mark_billing_topup_failed(
+            session,
+            request_id=str(topup.request_id),
+            provider="zhupay",
+            checkout_id=remote.trade_no,
+            order_id=remote.api_trade_no,
+            currency="CNY",
+            amount_total_cents=remote.money_cents,
+        )
+        return synced or topup
+
+    if (
+        getattr(topup, "checkout_id", None) != remote.trade_no
+        or (remote.api_trade_no and getattr(topup, "order_id", None) != remote.api_trade_no)
+    ):
+        synced = await set_billing_topup_status(
+            session,
+            request_id=str(topup.request_id),
+            status="pending",
+            provider="zhupay",
+            checkout_id=remote.trade_no,
+            order_id=remote.api_trade_no,
+            currency="CNY",
+            amount_total_cents=remote.money_cents,
+        )
+        return synced or topup
+
+    return topup
+
+
+async def _due_topup_ids(session: AsyncSession, *, now: dt.datetime, limit: int) -> list[str]:
+    max_age = dt.timedelta(hours=max(1, int(settings.zhupay_reconcile_max_age_hours or 48)))
+    rows = (
+        await session.execute(
+            select(BillingTopup.request_id)
+            .where(
+                BillingTopup.status == "pending",
+                # Older topups were stored without a provider; CNY ones were always ZhuPay.
+                or_(
+                    BillingTopup.provider == "zhupay",
+                    and_(
+                        or_(BillingTopup.provider.is_(None), BillingTopup.provider == ""),
+                        BillingTopup.currency == "CNY",
+                    ),
+                ),
+                BillingTopup.created_at >= now - max_age,
+                or_(BillingTopup.next_reconcile_at.is_(None), BillingTopup.next_reconcile_at <= now),
+            )
+            .order_by(BillingTopup.next_reconcile_at.asc().nulls_first())
+            .limit(limit)
+        )
+    ).all()
+    return [str(row[0]) for row in rows]
+
+
+async def reconcile_topup(request_id: str) -> None:
+    async with SessionLocal() as session:
+        topup = (
+            await session.execute(select(BillingTopup).where(BillingTopup.request_id == request_id))
+        ).scalar_one_or_none()
+        if topup is None or topup.status != "pending":
+            return
+        attempts = int(topup.reconcile_attempts or 0)
+        try:
+            topup = await sync_pending_topup_from_zhupay(session, topup=topup)
+        except ZhupayError as exc:
+            logger.warning("zhupay reconcile: query for %s failed: %s", request_id, exc)
+        if topup.status != "pending":
+            return
+        now = dt.datetime.now(dt.timezone.utc)
+        topup.reconcile_attempts = attempts + 1
+        topup.last_reconciled_at = now
+        topup.next_reconcile_at = now + dt.timedelta(seconds=next_reconcile_delay_seconds(attempts + 1))
+        await session.commit()
+
+
+async def reconcile_pending_zhupay_topups(*, limit: int = RECONCILE_BATCH_SIZE) -> int:
+    if not zhupay_is_configured():
+        return 0
+    now = dt.datetime.now(dt.timezone.utc)
+    async with SessionLocal() as session:
+        request_ids = await _due_topup_ids(session, now=now, limit=limit)
+    for request_id in request_ids:
+        try:
+            await reconcile_topup(request_id)
+        except Exception:
+            logger.exception("zhupay reconcile: topup %s failed", request_id)
+    return len(request_ids)
+
+
+async def run_zhupay_reconcile_worker(stop_event: asyncio.Event) -> None:
+    interval = max(1, int(settings.zhupay_reconcile_interval_seconds or 5))
+    while not stop_event.is_set():
+        try:
+            await reconcile_pending_zhupay_topups()
+        except Exception:
+            logger.exception("zhupay reconcile worker failed")
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            continue
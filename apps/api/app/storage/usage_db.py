@@ -11,10 +11,12 @@ from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.models.api_key import ApiKey
+from app.models.llm_model_availability_stat import LlmModelAvailabilityStat
 from app.models.llm_usage_event import LlmUsageEvent
 from app.models.llm_usage_hourly_stat import LlmUsageHourlyStat
 from app.models.user import User
 from app.storage.analytics_outbox import enqueue_analytics_event
+from app.storage.models_db import model_availability_bucket_start, model_availability_counts
 
 
 USD_MICROS = Decimal("1000000")
@@ -101,6 +103,45 @@ async def _upsert_usage_hourly_stat(
     await session.execute(statement)
 
 
+async def _upsert_model_availability_stat(
+    session: AsyncSession,
+    *,
+    org_id: uuid.UUID,
+    model_id: str,
+    created_at: dt.datetime,
+    status_code: int,
+) -> None:
+    counts = model_availability_counts(status_code)
+    if counts is None:
+        return
+    total, failed = counts
+    now = dt.datetime.now(dt.timezone.utc)
+    statement = (
+        insert(LlmModelAvailabilityStat)
+        .values(
+            org_id=org_id,
+            model_id=model_id,
+            bucket_start=model_availability_bucket_start(created_at),
+            total=total,
+            failed=failed,
+            updated_at=now,
+        )
+        .on_conflict_do_update(
+            index_elements=[
+                LlmModelAvailabilityStat.org_id,
+                LlmModelAvailabilityStat.model_id,
+                LlmModelAvailabilityStat.bucket_start,
+            ],
+            set_={
+                "total": LlmModelAvailabilityStat.total + total,
+                "failed": LlmModelAvailabilityStat.failed + failed,
+                "updated_at": now,
+            },
+        )
+    )
+    await session.execute(statement)
+
+
 async def record_usage_event(
     session: AsyncSession,
     *,
@@ -160,6 +201,13 @@ async def record_usage_event(
         total_tokens=total_tokens,
         cost_usd_micros=computed_cost,
     )
+    await _upsert_model_availability_stat(
+        session,
+        org_id=org_id,
+        model_id=model_id,
+        created_at=created_at,
+        status_code=status_code,
+    )
 
     first_call_marked = (
         await session.execute(
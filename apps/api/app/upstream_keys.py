@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import datetime as dt
+import hashlib
+import time
+import uuid
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Callable, Mapping
+
+from app.core.config import settings
+
+KEY_ROTATION_STRATEGIES: set[str] = {"round_robin", "least_recently_limited"}
+DEFAULT_KEY_ROTATION = "round_robin"
+
+
+@dataclass
+class _KeyState:
+    requests: int = 0
+    rate_limited: int = 0
+    cooldown_until: float = 0.0
+    last_limited_at: float | None = None
+
+
+def upstream_key_fingerprint(api_key: str) -> str:
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+def parse_retry_after_seconds(value: str | None, *, now: float) -> float | None:
+    raw = (value or "").strip()
+    if not raw:
+        return None
+    try:
+        return max(float(raw), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(raw)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=dt.timezone.utc)
+    return max(when.timestamp() - now, 0.0)
+
+
+class UpstreamKeyPool:
+    """Per-process rotation and 429 cooldown state for the upstream keys of each channel."""
+
+    def __init__(self, *, clock: Callable[[], float] = time.time) -> None:
+        self._clock = clock
+        self._states: dict[tuple[uuid.UUID | None, str], _KeyState] = {}
+        self._cursors: dict[uuid.UUID | None, int] = {}
+
+    def _state(self, channel_id: uuid.UUID | None, api_key: str) -> _KeyState:
+        slot = (channel_id, upstream_key_fingerprint(api_key))
+        state = self._states.get(slot)
+        if state is None:
+            state = self._states[slot] = _KeyState()
+        return state
+
+    def pick(self, channel_id: uuid.UUID | None, keys: list[str], *, strategy: str = DEFAULT_KEY_ROTATION) -> str:
+        if not keys:
+            raise ValueError("channel has no api keys")
+        if len(keys) == 1:
+            self._state(channel_id, keys[0]).requests += 1
+            return keys[0]
+
+        now = self._clock()
+        states = [self._state(channel_id, key) for key in keys]
+        ready = [i for i, state in enumerate(states) if state.cooldown_until <= now]
+        cursor = self._cursors.get(channel_id, 0)
+        if not ready:
+            # Every key is cooling down; use the one that becomes usable first.
+            index = min(range(len(keys)), key=lambda i: states[i].cooldown_until)
+        elif strategy == "least_recently_limited":
+            index = min(
+                ready,
+                key=lambda i: (states[i].last_limited_at or float("-inf"), (i - cursor) % len(keys)),
+            )
+        else:
+            index = min(ready, key=lambda i: (i - cursor) % len(keys))
+        self._cursors[channel_id] = (index + 1) % len(keys)
+        states[index].requests += 1
+        return keys[index]
+
+    def observe(
+        self, channel_id: uuid.UUID | None, api_key: str, *, status_code: int, headers: Mapping[str, str] | None = None
+    ) -> None:
+        if status_code != 429 or not api_key:
+            return
+        now = self._clock()
+        retry_after = None
+        for name, value in (headers or {}).items():
+            if name.lower() == "retry-after":
+                retry_after = parse_retry_after_seconds(value, now=now)
+                break
+        if retry_after is None:
+            retry_after = float(settings.upstream_key_cooldown_seconds or 0)
+        cap = float(settings.upstream_key_max_cooldown_seconds or 0)
+        if cap > 0:
+            retry_after = min(retry_after, cap)
+        state = self._state(channel_id, api_key)
+        state.rate_limited += 1
+        state.last_limited_at = now
+        state.cooldown_until = max(state.cooldown_until, now + retry_after)
+
+    def exhausted(self, channel_id: uuid.UUID | None, keys: list[str]) -> bool:
+        now = self._clock()
+        for key in keys:
+            state = self._states.get((channel_id, upstream_key_fingerprint(key)))
+            if state is None or state.cooldown_until <= now:
+                return False
+        return bool(keys)
+
+    def health(self, channel_id: uuid.UUID | None, keys: list[str]) -> list[dict[str, object]]:
+        now = self._clock()
+        out: list[dict[str, object]] = []
+        for key in keys:
+            state = self._states.get((channel_id, upstream_key_fingerprint(key))) or _KeyState()
+            cooling = state.cooldown_until > now
+            out.append(
+                {
+                    "healthy": not cooling,
+                    "cooldownUntil": (
+                        dt.datetime.fromtimestamp(state.cooldown_until, dt.timezone.utc).isoformat() if cooling else None
+                    ),
+                    "lastRateLimitedAt": (
+                        dt.datetime.fromtimestamp(state.last_limited_at, dt.timezone.utc).isoformat()
+                        if state.last_limited_at is not None
+                        else None
+                    ),
+                    "requests": state.requests,
+                    "rateLimited": state.rate_limited,
+                }
+            )
+        return out
+
+    def forget(self, channel_id: uuid.UUID) -> None:
+        for slot in [slot for slot in self._states if slot[0] == channel_id]:
+            del self._states[slot]
+        self._cursors.pop(channel_id, None)
+
+
+_pool = UpstreamKeyPool()
+
+
+def get_upstream_key_pool() -> UpstreamKeyPool:
+    return _pool
@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import asyncio
+import uuid
+from typing import Any, Callable
+
+import httpx
+from starlette.datastructures import Headers
+
+import app.api.router as router_module
+from app.api.llm_proxy import LlmProxyContext
+from app.pricing import UsagePricing
+
+_AsyncClient = httpx.AsyncClient
+
+ClientFactory = Callable[..., httpx.AsyncClient]
+
+
+class FakeRequestUrl:
+    def __init__(self, path: str, query: str = "") -> None:
+        self.path = path
+        self.query = query
+
+
+class FakeProxyRequest:
+    """Just enough of a Starlette request for the proxy handlers in app.api.router.
+
+    `disconnect_after` makes `receive()` report a client disconnect after that many seconds.
+    """
+
+    def __init__(
+        self,
+        body: bytes = b"",
+        headers: dict[str, str] | None = None,
+        *,
+        path: str = "/v1/chat/completions",
+        query: str = "",
+        disconnect_after: float | None = None,
+    ) -> None:
+        self.method = "POST"
+        self.url = FakeRequestUrl(path, query)
+        self.headers = Headers({"content-type": "application/json", **(headers or {})})
+        self.query_params: dict[str, str] = {}
+        self.client = None
+        self._body = body
+        self._disconnect_after = disconnect_after
+
+    async def body(self) -> bytes:
+        return self._body
+
+    async def receive(self) -> dict[str, object]:
+        if self._disconnect_after is None:
+            await asyncio.Event().wait()
+        await asyncio.sleep(self._disconnect_after)
+        return {"type": "http.disconnect"}
+
+
+def proxy_context(**overrides: Any) -> LlmProxyContext:
+    fields: dict[str, Any] = {
+        "api_key_id": uuid.uuid4(),
+        "user_id": uuid.uuid4(),
+        "user_email": "user@example.com",
+        "org_id": uuid.uuid4(),
+        "model_id": "gpt-test",
+        "source_ip": None,
+        "upstream_base_url": "https://upstream.example/v1",
+        "upstream_api_key": "upstream-key",
+        "pricing": UsagePricing(None, None),
+    }
+    fields.update(overrides)
+    return LlmProxyContext(**fields)
+
+
+def mock_client_factory(handler: Callable[[httpx.Request], Any]) -> ClientFactory:
+    """Stands in for `httpx.AsyncClient` in the router, answering every request with `handler`."""
+
+    def factory(*, timeout: object) -> httpx.AsyncClient:
+        return _AsyncClient(transport=httpx.MockTransport(handler), timeout=timeout)
+
+    return factory
+
+
+class FakeProxyRouter:
+    """Routes the proxy handlers to a fixed `context` and a fake upstream, collecting usage records.
+
+    Call `install()` in setUp and `restore()` in tearDown. Extra router attributes to patch can be
+    passed to `install()` and are restored along with the rest.
+    """
+
+    def __init__(self, context: LlmProxyContext, upstream: ClientFactory) -> None:
+        self.context = context
+        self.upstream = upstream
+        self.records: list[dict[str, object]] = []
+        self._originals: dict[str, object] = {}
+        self._original_async_client: object = None
+
+    async def resolve(self, request: object, session: object, *, model_id: str, **kwargs: object) -> LlmProxyContext:
+        _ = request, session, model_id, kwargs
+        return self.context
+
+    async def record(self, **kwargs: object) -> None:
+        self.records.append(kwargs)
+
+    def install(self, **patches: object) -> FakeProxyRouter:
+        patches = {
+            "_resolve_llm_proxy_context": self.resolve,
+            "_record_usage_event_best_effort": self.record,
+            **patches,
+        }
+        self._originals = {name: getattr(router_module, name) for name in patches}
+        self._original_async_client = router_module.httpx.AsyncClient
+        for name, value in patches.items():
+            setattr(router_module, name, value)
+        self.use_upstream(self.upstream)
+        return self
+
+    def use_upstream(self, upstream: ClientFactory) -> None:
+        self.upstream = upstream
+        router_module.httpx.AsyncClient = upstream  # type: ignore[assignment]
+
+    def restore(self) -> None:
+        for name, value in self._originals.items():
+            setattr(router_module, name, value)
+        router_module.httpx.AsyncClient = self._original_async_client  # type: ignore[assignment]
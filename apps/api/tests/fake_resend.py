@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+from dataclasses import dataclass, field
+from typing import Any
+
+
+@dataclass
+class ReceivedEmail:
+    path: str
+    headers: dict[str, str]
+    payload: dict[str, Any]
+
+
+@dataclass
+class FakeResendServer:
+    """Minimal HTTP/1.1 stand-in for the Resend `POST /emails` endpoint.
+
+    Point `settings.resend_api_base_url` at `base_url`. Queue status codes in
+    `responses` to simulate provider failures; once empty every request succeeds.
+    """
+
+    host: str = "127.0.0.1"
+    port: int = 0
+    responses: list[int] = field(default_factory=list)
+    received: list[ReceivedEmail] = field(default_factory=list)
+    connections: int = 0
+    _server: asyncio.AbstractServer | None = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> "FakeResendServer":
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self) -> "FakeResendServer":
+        return await self.start()
+
+    async def __aexit__(self, *exc: object) -> None:
+        await self.stop()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    return
+                _, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers: dict[str, str] = {}
+                while True:
+                    line = (await reader.readline()).decode("latin-1").strip()
+                    if not line:
+                        break
+                    name, _, value = line.partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", "0") or 0))
+                self.received.append(ReceivedEmail(path=path, headers=headers, payload=json.loads(body or b"{}")))
+
+                status = self.responses.pop(0) if self.responses else 200
+                if status < 400:
+                    response: dict[str, Any] = {"id": f"email_{len(self.received)}"}
+                else:
+                    response = {"name": "fake_error", "message": f"status {status}", "statusCode": status}
+                data = json.dumps(response).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} Fake\r\ncontent-type: application/json\r\ncontent-length: {len(data)}\r\n\r\n".encode()
+                    + data
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            return
+        finally:
+            writer.close()
+
+
+async def _serve(host: str, port: int) -> None:
+    async with FakeResendServer(host=host, port=port) as server:
+        print(f"fake resend listening on {server.base_url}", flush=True)
+        while True:
+            await asyncio.sleep(3600)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local fake Resend API (set RESEND_API_BASE_URL to it).")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8025)
+    args = parser.parse_args()
+    asyncio.run(_serve(args.host, args.port))
@@ -0,0 +1,242 @@
+from __future__ import annotations
+
+import asyncio
+import unittest
+import uuid
+
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import DataError, OperationalError
+
+from app.core.config import settings
+from app.security import sha256_hex
+from app.storage import analytics_outbox
+
+
+class RetryDelayTests(unittest.TestCase):
+    def test_retry_delay_grows_exponentially_with_jitter_and_cap(self) -> None:
+        for attempts, base in [(1, 10), (2, 20), (4, 80)]:
+            for _ in range(20):
+                delay = analytics_outbox._retry_delay_seconds(attempts)
+                self.assertGreaterEqual(delay, base * 0.5)
+                self.assertLessEqual(delay, base)
+
+        for _ in range(20):
+            self.assertLessEqual(analytics_outbox._retry_delay_seconds(50), analytics_outbox.RETRY_MAX_SECONDS)
+
+
+class DrainWorkerTests(unittest.IsolatedAsyncioTestCase):
+    async def test_worker_scales_up_without_sleeping_while_backlog_is_saturated(self) -> None:
+        calls: list[tuple[int, int]] = []
+        stop_event = asyncio.Event()
+        original_drain = analytics_outbox.drain_pending_analytics_events
+        original_close = analytics_outbox.close_dataocean_client
+
+        async def fake_drain(*, batch_size: int, concurrency: int) -> tuple[int, bool]:
+            calls.append((batch_size, concurrency))
+            if len(calls) >= 3:
+                stop_event.set()
+            saturated = len(calls) <= 2
+            return (batch_size * concurrency if saturated else 3), saturated
+
+        async def fake_close() -> None:
+            return None
+
+        analytics_outbox.drain_pending_analytics_events = fake_drain
+        analytics_outbox.close_dataocean_client = fake_close
+        try:
+            await asyncio.wait_for(analytics_outbox.run_dataocean_outbox_worker(stop_event), timeout=1)
+        except asyncio.TimeoutError:
+            self.fail("saturated drains should not wait for the flush interval")
+        finally:
+            analytics_outbox.drain_pending_analytics_events = original_drain
+            analytics_outbox.close_dataocean_client = original_close
+
+        self.assertEqual(calls[0], (50, 1))
+        self.assertEqual(calls[1], (100, 2))
+        self.assertEqual(calls[2], (200, 3))
+
+    async def test_http_client_is_reused_between_batches(self) -> None:
+        first = analytics_outbox._get_http_client()
+        second = analytics_outbox._get_http_client()
+        try:
+            self.assertIs(first, second)
+        finally:
+            await analytics_outbox.close_dataocean_client()
+        self.assertTrue(first.is_closed)
+
+
+class _FakeRows:
+    def __init__(self, rows: list[tuple[object, ...]]) -> None:
+        self._rows = rows
+
+    def all(self) -> list[tuple[object, ...]]:
+        return self._rows
+
+
+class _FakeFlushSession:
+    def __init__(
+        self,
+        *,
+        session_users: list[tuple[object, ...]],
+        fail_insert: bool = False,
+        reject_event_ids: frozenset[str] = frozenset(),
+    ) -> None:
+        self.session_users = session_users
+        self.fail_insert = fail_insert
+        self.reject_event_ids = reject_event_ids
+        self.statements: list[object] = []
+        self.commits = 0
+        self.rollbacks = 0
+
+    async def __aenter__(self) -> "_FakeFlushSession":
+        return self
+
+    async def __aexit__(self, *exc: object) -> None:
+        return None
+
+    async def execute(self, statement: object) -> _FakeRows:
+        self.statements.append(statement)
+        if "INSERT" in str(statement).upper():
+            if self.fail_insert:
+                raise OperationalError("INSERT", {}, ConnectionRefusedError("db down"))
+            params = statement.compile(dialect=postgresql.dialect()).params  # type: ignore[attr-defined]
+            event_ids = {value for key, value in params.items() if key.startswith("event_id")}
+            if event_ids & self.reject_event_ids:
+                raise DataError("INSERT", {}, ValueError("unsupported Unicode escape sequence"))
+            return _FakeRows([])
+        return _FakeRows(self.session_users)
+
+    async def commit(self) -> None:
+        self.commits += 1
+
+    async def rollback(self) -> None:
+        self.rollbacks += 1
+
+
+class BufferedIngestionTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self._original_settings = {
+            "analytics_buffer_max_events": settings.analytics_buffer_max_events,
+            "analytics_buffer_flush_events": settings.analytics_buffer_flush_events,
+        }
+        self._original_enabled = analytics_outbox.dataocean_enabled
+        self._original_session_local = analytics_outbox.SessionLocal
+        self._original_stats = dict(analytics_outbox._BUFFER_STATS)
+        analytics_outbox.dataocean_enabled = lambda: True
+        analytics_outbox._EVENT_BUFFER.clear()
+        for key in analytics_outbox._BUFFER_STATS:
+            analytics_outbox._BUFFER_STATS[key] = 0
+
+    def tearDown(self) -> None:
+        for key, value in self._original_settings.items():
+            setattr(settings, key, value)
+        analytics_outbox.dataocean_enabled = self._original_enabled
+        analytics_outbox.SessionLocal = self._original_session_local
+        analytics_outbox._EVENT_BUFFER.clear()
+        analytics_outbox._BUFFER_STATS.update(self._original_stats)
+
+    def _buffer(self, name: str = "page_view", **kwargs: object) -> str | None:
+        return analytics_outbox.buffer_analytics_event(
+            name=name,
+            anonymous_id="anon",
+            session_id="sess",
+            properties={"path": "/"},
+            context={},
+            **kwargs,  # type: ignore[arg-type]
+        )
+
+    async def test_buffer_is_capped_and_counts_dropped_events(self) -> None:
+        settings.analytics_buffer_max_events = 2
+
+        self.assertIsNotNone(self._buffer(event_id="evt-1"))
+        self.assertIsNotNone(self._buffer())
+        self.assertIsNone(self._buffer())
+
+        stats = analytics_outbox.analytics_buffer_stats()
+        self.assertEqual(stats["pending"], 2)
+        self.assertEqual(stats["buffered"], 2)
+        self.assertEqual(stats["dropped"], 1)
+        self.assertEqual(analytics_outbox._EVENT_BUFFER[0].values["event_id"], "evt-1")
+
+    async def test_flush_bulk_inserts_with_conflict_skip_and_resolves_session_users(self) -> None:
+        user_id = uuid.uuid4()
+        fake_session = _FakeFlushSession(session_users=[(sha256_hex("token-a"), user_id)])
+        analytics_outbox.SessionLocal = lambda: fake_session  # type: ignore[assignment]
+        self._buffer(event_id="evt-1", session_token="token-a")
+        self._buffer(event_id="evt-2", session_token="token-b")
+        self._buffer(event_id="evt-3")
+
+        flushed = await analytics_outbox.flush_buffered_analytics_events()
+
+        self.assertEqual(flushed, 3)
+        self.assertEqual(len(analytics_outbox._EVENT_BUFFER), 0)
+        self.assertEqual(fake_session.commits, 1)
+        inserts = [stmt for stmt in fake_session.statements if "INSERT" in str(stmt).upper()]
+        self.assertEqual(len(inserts), 1)
+        sql = str(inserts[0].compile(dialect=postgresql.dialect()))  # type: ignore[attr-defined]
+        self.assertIn("ON CONFLICT (event_id) DO NOTHING", sql)
+        params = inserts[0].compile(dialect=postgresql.dialect()).params  # type: ignore[attr-defined]
+        self.assertEqual(params["event_id_m0"], "evt-1")
+        self.assertEqual(params["user_id_m0"], str(user_id))
+        self.assertEqual(params["payload_m0"]["context"]["userId"], str(user_id))
+        self.assertIsNone(params["user_id_m1"])
+        self.assertIsNone(params["user_id_m2"])
+        self.assertEqual(analytics_outbox.analytics_buffer_stats()["flushed"], 3)
+
+    async def test_failed_flush_keeps_events_in_order(self) -> None:
+        analytics_outbox.SessionLocal = lambda: _FakeFlushSession(session_users=[], fail_insert=True)  # type: ignore[assignment]
+        self._buffer(event_id="evt-1")
+        self._buffer(event_id="evt-2")
+        self._buffer(event_id="evt-3")
+
+        flushed = await analytics_outbox.flush_buffered_analytics_events(limit=2)
+
+        self.assertEqual(flushed, 0)
+        self.assertEqual(
+            [item.values["event_id"] for item in analytics_outbox._EVENT_BUFFER], ["evt-1", "evt-2", "evt-3"]
+        )
+        self.assertEqual(analytics_outbox.analytics_buffer_stats()["flushFailures"], 1)
+
+    async def test_rejected_event_is_dropped_without_blocking_the_rest_of_the_batch(self) -> None:
+        fake_session = _FakeFlushSession(session_users=[], reject_event_ids=frozenset({"evt-bad"}))
+        analytics_outbox.SessionLocal = lambda: fake_session  # type: ignore[assignment]
+        self._buffer(event_id="evt-1")
+        self._buffer(event_id="evt-bad")
+        self._buffer(event_id="evt-3")
+
+        handled = await analytics_outbox.flush_buffered_analytics_events()
+
+        self.assertEqual(handled, 3)
+        self.assertEqual(len(analytics_outbox._EVENT_BUFFER), 0)
+        self.assertEqual(fake_session.commits, 2)
+        stats = analytics_outbox.analytics_buffer_stats()
+        self.assertEqual((stats["flushed"], stats["rejected"], stats["flushFailures"]), (2, 1, 0))
+
+    async def test_nul_characters_are_stripped_when_buffered(self) -> None:
+        analytics_outbox.buffer_analytics_event(
+            name="page\x00_view",
+            anonymous_id="an\x00on",
+            properties={"q\x00": ["a\x00b", {"c": "d\x00"}], "n": 1},
+            context={"ua": "x\x00"},
+        )
+
+        values = analytics_outbox._EVENT_BUFFER[0].values
+        self.assertEqual(values["event_name"], "page_view")
+        self.assertEqual(values["anonymous_id"], "anon")
+        self.assertEqual(values["payload"], {"properties": {"q": ["ab", {"c": "d"}], "n": 1}, "context": {"ua": "x"}})
+
+    async def test_flusher_drains_remaining_events_on_shutdown(self) -> None:
+        fake_session = _FakeFlushSession(session_users=[])
+        analytics_outbox.SessionLocal = lambda: fake_session  # type: ignore[assignment]
+        stop_event = asyncio.Event()
+        stop_event.set()
+        self._buffer(event_id="evt-1")
+
+        await asyncio.wait_for(analytics_outbox.run_analytics_buffer_flusher(stop_event), timeout=1)
+
+        self.assertEqual(len(analytics_outbox._EVENT_BUFFER), 0)
+        self.assertEqual(fake_session.commits, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
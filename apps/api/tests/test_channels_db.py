@@ -5,7 +5,7 @@ import unittest
 import uuid
 
 from app.models.llm_channel import LlmChannel
-from app.storage.channels_db import list_channels
+from app.storage.channels_db import _normalize_extra_api_keys, _normalize_model_patterns, _to_item, list_channels
 
 
 class _FakeScalars:
@@ -82,6 +82,40 @@ class ChannelDbTests(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(response.items[0].allow_groups, ["default", "public"])
         self.assertEqual(response.items[1].allow_groups, ["*"])
 
+    def test_model_patterns_are_deduplicated_and_prefix_wildcards_trimmed(self) -> None:
+        self.assertEqual(_normalize_model_patterns([" gpt-4.1 ", "gpt-4.1", ""]), ["gpt-4.1"])
+        self.assertEqual(_normalize_model_patterns(["claude-*", "gpt-"], prefix=True), ["claude-", "gpt-"])
+        with self.assertRaises(ValueError):
+            _normalize_model_patterns(["bad\nmodel"])
+
+    def test_extra_api_keys_are_deduplicated_against_the_primary_key(self) -> None:
+        self.assertEqual(
+            _normalize_extra_api_keys([" sk-second-key ", "sk-primary-key", "sk-second-key"], primary="sk-primary-key"),
+            ["sk-second-key"],
+        )
+        with self.assertRaises(ValueError):
+            _normalize_extra_api_keys(["short"], primary="sk-primary-key")
+
+    def test_item_lists_every_key_masked_with_health(self) -> None:
+        now = dt.datetime(2026, 5, 1, 12, 0, tzinfo=dt.timezone.utc)
+        row = LlmChannel(
+            id=uuid.uuid4(),
+            org_id=uuid.uuid4(),
+            name="alpha",
+            base_url="https://alpha.example.com",
+            api_key="sk-primary-0000001111",
+            extra_api_keys=["sk-second-0000002222"],
+            key_rotation="least_recently_limited",
+            created_at=now,
+            updated_at=now,
+        )
+
+        item = _to_item(row, [])
+
+        self.assertEqual([key.masked for key in item.api_keys], ["sk-pri…1111", "sk-sec…2222"])
+        self.assertTrue(all(key.healthy for key in item.api_keys))
+        self.assertEqual(item.key_rotation, "least_recently_limited")
+
 
 if __name__ == "__main__":
     unittest.main()
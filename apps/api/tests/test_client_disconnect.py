@@ -0,0 +1,211 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+import unittest
+import uuid
+
+import httpx
+from fastapi import HTTPException
+
+import app.api.router as router_module
+from app.api.llm_proxy import LlmProxyContext
+from fake_proxy import FakeProxyRequest, FakeProxyRouter, proxy_context
+
+_AsyncClient = httpx.AsyncClient
+
+
+class _SlowUpstreamStream(httpx.AsyncByteStream):
+    """Response body that sends `first_chunk` and then stalls like a slow model."""
+
+    def __init__(self, first_chunk: bytes | None) -> None:
+        self.first_chunk = first_chunk
+        self.closed = False
+
+    async def __aiter__(self):
+        if self.first_chunk is not None:
+            yield self.first_chunk
+        await asyncio.sleep(30)
+        yield b""
+
+    async def aclose(self) -> None:
+        self.closed = True
+
+
+class _SlowUpstream:
+    def __init__(
+        self,
+        *,
+        first_chunk: bytes | None = None,
+        content_type: str = "application/json",
+        header_delay: float = 0.0,
+    ) -> None:
+        self.first_chunk = first_chunk
+        self.content_type = content_type
+        self.header_delay = header_delay
+        self.streams: list[_SlowUpstreamStream] = []
+        self.requests: list[httpx.Request] = []
+
+    async def _handle(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        if self.header_delay:
+            await asyncio.sleep(self.header_delay)
+        stream = _SlowUpstreamStream(self.first_chunk)
+        self.streams.append(stream)
+        return httpx.Response(200, headers={"content-type": self.content_type}, stream=stream)
+
+    def __call__(self, *, timeout: object) -> httpx.AsyncClient:
+        return _AsyncClient(transport=httpx.MockTransport(self._handle), timeout=timeout)
+
+
+class ClientDisconnectTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.context = proxy_context(
+            source_ip="127.0.0.1",
+            channel_id=uuid.uuid4(),
+            rate_limit_grant=object(),  # type: ignore[arg-type]
+        )
+        self.released: list[object] = []
+
+        async def fake_release(grant: object) -> None:
+            self.released.append(grant)
+
+        self.proxy = FakeProxyRouter(self.context, _SlowUpstream()).install(release_rate_limit_grant=fake_release)
+        self.records = self.proxy.records
+
+    def tearDown(self) -> None:
+        self.proxy.restore()
+
+    async def _assert_fast_499(self, call) -> None:
+        started = time.perf_counter()
+        with self.assertRaises(HTTPException) as raised:
+            await asyncio.wait_for(call, timeout=5)
+        self.assertEqual(raised.exception.status_code, 499)
+        self.assertLess(time.perf_counter() - started, 2)
+
+    def _assert_recorded_499(self, *, is_streaming: bool) -> dict[str, object]:
+        self.assertEqual(len(self.records), 1)
+        record = self.records[0]
+        self.assertEqual(record["status_code"], 499)
+        self.assertFalse(record["ok"])
+        self.assertEqual(record["is_streaming"], is_streaming)
+        self.assertEqual(self.released, [self.context.rate_limit_grant])
+        return record
+
+    async def test_chat_completions_non_stream_cancels_upstream_on_disconnect(self) -> None:
+        upstream = _SlowUpstream(first_chunk=b'{"id":')
+        self.proxy.use_upstream(upstream)
+        request = FakeProxyRequest(
+            json.dumps({"model": "gpt-test", "messages": []}).encode(),
+            path="/api/v1/chat/completions",
+            disconnect_after=0.05,
+        )
+
+        await self._assert_fast_499(router_module.chat_completions(request, object()))  # type: ignore[arg-type]
+
+        self.assertEqual(len(upstream.streams), 1)
+        self.assertTrue(upstream.streams[0].closed)
+        self._assert_recorded_499(is_streaming=False)
+
+    async def test_responses_non_stream_cancels_upstream_on_disconnect(self) -> None:
+        upstream = _SlowUpstream()
+        self.proxy.use_upstream(upstream)
+        request = FakeProxyRequest(
+            json.dumps({"model": "gpt-test", "input": "hi"}).encode(),
+            path="/api/v1/responses",
+            disconnect_after=0.05,
+        )
+
+        await self._assert_fast_499(
+            router_module._proxy_responses_request(
+                request,  # type: ignore[arg-type]
+                object(),  # type: ignore[arg-type]
+                upstream_path="/responses",
+            )
+        )
+
+        self.assertTrue(upstream.streams[0].closed)
+        self._assert_recorded_499(is_streaming=False)
+
+    async def test_content_generation_task_get_cancels_upstream_on_disconnect(self) -> None:
+        upstream = _SlowUpstream()
+        self.proxy.use_upstream(upstream)
+        original_task_context = router_module._resolve_content_generation_task_context
+
+        async def fake_task_context(*args: object, **kwargs: object) -> LlmProxyContext:
+            _ = args, kwargs
+            return self.context
+
+        router_module._resolve_content_generation_task_context = fake_task_context
+        request = FakeProxyRequest(path="/api/v1/contents/generations/tasks/cgt-1", disconnect_after=0.05)
+        try:
+            await self._assert_fast_499(
+                router_module._proxy_content_generation_task_request(
+                    request,  # type: ignore[arg-type]
+                    object(),  # type: ignore[arg-type]
+                    method="GET",
+                    upstream_path="/contents/generations/tasks/cgt-1",
+                    task_id="cgt-1",
+                )
+            )
+        finally:
+            router_module._resolve_content_generation_task_context = original_task_context
+
+        self.assertTrue(upstream.streams[0].closed)
+        self._assert_recorded_499(is_streaming=False)
+
+    async def test_stream_disconnect_before_upstream_headers_returns_499(self) -> None:
+        upstream = _SlowUpstream(content_type="text/event-stream", header_delay=30)
+        self.proxy.use_upstream(upstream)
+        request = FakeProxyRequest(
+            json.dumps({"model": "gpt-test", "messages": [], "stream": True}).encode(),
+            path="/api/v1/chat/completions",
+            disconnect_after=0.05,
+        )
+
+        await self._assert_fast_499(router_module.chat_completions(request, object()))  # type: ignore[arg-type]
+
+        self.assertEqual(upstream.streams, [])
+        self._assert_recorded_499(is_streaming=True)
+
+    async def test_chat_completions_stream_disconnect_records_partial_usage(self) -> None:
+        usage_line = {
+            "choices": [],
+            "usage": {"prompt_tokens": 12, "completion_tokens": 3, "total_tokens": 15},
+        }
+        upstream = _SlowUpstream(
+            first_chunk=f"data: {json.dumps(usage_line)}\n\n".encode(),
+            content_type="text/event-stream",
+        )
+        self.proxy.use_upstream(upstream)
+        request = FakeProxyRequest(
+            json.dumps({"model": "gpt-test", "messages": [], "stream": True}).encode(),
+            path="/api/v1/chat/completions",
+            disconnect_after=None,
+        )
+
+        response = await router_module.chat_completions(request, object())  # type: ignore[arg-type]
+        body = response.body_iterator
+        first = await body.__anext__()
+        self.assertIn(b"prompt_tokens", first)
+        # Starlette cancels the body iterator when the client goes away mid-stream.
+        consumer = asyncio.ensure_future(body.__anext__())
+        await asyncio.sleep(0.05)
+        consumer.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await consumer
+        for _ in range(20):
+            if self.records:
+                break
+            await asyncio.sleep(0.01)
+
+        self.assertTrue(upstream.streams[0].closed)
+        record = self._assert_recorded_499(is_streaming=True)
+        self.assertEqual(record["input_tokens"], 12)
+        self.assertEqual(record["output_tokens"], 3)
+        self.assertEqual(record["total_tokens"], 15)
+
+
+if __name__ == "__main__":
+    unittest.main()
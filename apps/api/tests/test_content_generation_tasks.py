@@ -0,0 +1,380 @@
+from __future__ import annotations
+
+import datetime as dt
+import json
+import types
+import unittest
+import uuid
+
+import httpx
+from sqlalchemy import create_engine
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session
+
+import app.api.router as router_module
+from app.api import content_generation_poller
+from app.api.metrics import PROXY_SPEND_USD_MICROS, PROXY_TOKENS
+from app.models.llm_content_generation_task import LlmContentGenerationTask
+from app.pricing import UsagePricing
+from app.storage import content_generation_tasks
+
+
+def _build_task(**overrides: object) -> LlmContentGenerationTask:
+    values: dict[str, object] = {
+        "upstream_task_id": "cgt-20260530233354-abcde",
+        "org_id": uuid.uuid4(),
+        "user_id": uuid.uuid4(),
+        "api_key_id": uuid.uuid4(),
+        "channel_id": uuid.uuid4(),
+        "model_id": "seedance-2-0",
+        "status": "running",
+        "poll_attempts": 0,
+    }
+    values.update(overrides)
+    return LlmContentGenerationTask(**values)
+
+
+class _ScalarResult:
+    def __init__(self, value: object) -> None:
+        self._value = value
+
+    def scalar_one_or_none(self) -> object:
+        return self._value
+
+
+class _FakeSession:
+    def __init__(self, *objects: object) -> None:
+        self.objects = {getattr(obj, "upstream_task_id", None) or getattr(obj, "id"): obj for obj in objects}
+        self.commits = 0
+        self.closed = False
+
+    async def __aenter__(self) -> "_FakeSession":
+        return self
+
+    async def __aexit__(self, *exc: object) -> None:
+        return None
+
+    async def get(self, model: object, key: object) -> object:
+        _ = model
+        return self.objects.get(key)
+
+    async def execute(self, statement: object) -> _ScalarResult:
+        _ = statement
+        task = next(obj for obj in self.objects.values() if isinstance(obj, LlmContentGenerationTask))
+        return _ScalarResult(task)
+
+    async def commit(self) -> None:
+        self.commits += 1
+
+    async def close(self) -> None:
+        self.closed = True
+
+
+class _SyncSession:
+    def __init__(self, session: Session) -> None:
+        self.session = session
+
+    async def execute(self, statement: object) -> object:
+        return self.session.execute(statement)  # type: ignore[call-overload]
+
+
+class SettleContentGenerationTaskTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self._originals = {
+            name: getattr(content_generation_tasks, name)
+            for name in ("SessionLocal", "record_usage_event", "charge_rate_limit_tokens")
+        }
+        self.recorded: list[dict[str, object]] = []
+
+        async def fake_record(session_arg: object, **kwargs: object) -> None:
+            self.recorded.append(kwargs)
+            await session_arg.commit()  # type: ignore[attr-defined]
+
+        async def fake_charge(**kwargs: object) -> None:
+            _ = kwargs
+
+        content_generation_tasks.record_usage_event = fake_record
+        content_generation_tasks.charge_rate_limit_tokens = fake_charge
+
+    def tearDown(self) -> None:
+        for name, value in self._originals.items():
+            setattr(content_generation_tasks, name, value)
+
+    async def _settle(self, task: LlmContentGenerationTask, *, status: str, body: bytes) -> tuple[int, ...]:
+        return await content_generation_tasks.settle_content_generation_task(
+            task_id=task.upstream_task_id,
+            org_id=task.org_id,
+            user_id=task.user_id,
+            api_key_id=task.api_key_id,
+            channel_id=task.channel_id,
+            model_id=task.model_id,
+            pricing=UsagePricing(1_000_000, 2_000_000),
+            source_ip=None,
+            status=status,
+            usage_tokens=(0, 0, 100, 100) if status == "succeeded" else None,
+            result=content_generation_tasks.ContentGenerationResult(200, "application/json", body),
+            status_code=200,
+            total_duration_ms=40,
+            ttft_ms=40,
+            request_endpoint="/v1/contents/generations/tasks/x",
+        )
+
+    async def test_success_caches_body_and_bills_once(self) -> None:
+        task = _build_task(next_poll_at=dt.datetime.now(dt.timezone.utc))
+        content_generation_tasks.SessionLocal = lambda: _FakeSession(task)  # type: ignore[assignment]
+
+        first = await self._settle(task, status="succeeded", body=b'{"status":"succeeded"}')
+        second = await self._settle(task, status="succeeded", body=b'{"status":"succeeded"}')
+
+        self.assertEqual(first, (0, 0, 100, 100, 200))
+        self.assertEqual(second, (0, 0, 0, 0, 0))
+        self.assertEqual(len(self.recorded), 1)
+        self.assertIsNone(task.next_poll_at)
+        cached = content_generation_tasks.cached_content_generation_result(task)
+        self.assertEqual(cached.body, b'{"status":"succeeded"}')
+
+    async def test_running_status_is_not_cached(self) -> None:
+        task = _build_task()
+        content_generation_tasks.SessionLocal = lambda: _FakeSession(task)  # type: ignore[assignment]
+
+        await self._settle(task, status="running", body=b'{"status":"running"}')
+
+        self.assertEqual(task.status, "running")
+        self.assertIsNone(content_generation_tasks.cached_content_generation_result(task))
+        self.assertEqual(self.recorded, [])
+
+
+class RecordTaskCreatedTests(unittest.IsolatedAsyncioTestCase):
+    async def test_mapping_and_usage_event_share_one_transaction(self) -> None:
+        statements: list[object] = []
+        recorded: list[tuple[object, dict[str, object]]] = []
+
+        class _Session(_FakeSession):
+            async def execute(self, statement: object) -> None:
+                statements.append(statement)
+
+        session = _Session()
+        originals = (content_generation_tasks.SessionLocal, content_generation_tasks.record_usage_event)
+
+        async def fake_record(session_arg: object, **kwargs: object) -> None:
+            recorded.append((session_arg, kwargs))
+            await session_arg.commit()  # type: ignore[attr-defined]
+
+        content_generation_tasks.SessionLocal = lambda: session  # type: ignore[assignment]
+        content_generation_tasks.record_usage_event = fake_record
+        channel_id = uuid.uuid4()
+        try:
+            ok = await content_generation_tasks.record_content_generation_task_created(
+                task_id="cgt-new",
+                org_id=uuid.uuid4(),
+                user_id=uuid.uuid4(),
+                api_key_id=None,
+                channel_id=channel_id,
+                model_id="seedance-2-0",
+                source_ip=None,
+                status_code=200,
+                total_duration_ms=10,
+                ttft_ms=5,
+                request_endpoint="/v1/contents/generations/tasks",
+            )
+        finally:
+            content_generation_tasks.SessionLocal, content_generation_tasks.record_usage_event = originals
+
+        self.assertTrue(ok)
+        self.assertEqual(session.commits, 1)
+        self.assertEqual(len(recorded), 1)
+        self.assertIs(recorded[0][0], session)
+        self.assertEqual(recorded[0][1]["model_id"], "seedance-2-0")
+        compiled = statements[0].compile(dialect=postgresql.dialect())
+        self.assertIn("ON CONFLICT (upstream_task_id) DO NOTHING", str(compiled))
+        self.assertEqual(compiled.params["channel_id"], channel_id)
+
+
+class CachedTaskGetTests(unittest.IsolatedAsyncioTestCase):
+    async def test_terminal_task_is_served_from_database(self) -> None:
+        task = _build_task(
+            status="succeeded",
+            result_status_code=200,
+            result_content_type="application/json",
+            result_body=b'{"id":"cgt","status":"succeeded"}',
+        )
+        session = _FakeSession(task)
+        user = types.SimpleNamespace(id=task.user_id, balance=100, spend_usd_micros_total=0, email="a@example.com")
+        originals = (
+            router_module.authenticate_api_key,
+            router_module._require_default_membership,
+            router_module.httpx.AsyncClient,
+        )
+
+        async def fake_auth(session_arg: object, *, authorization: str | None) -> tuple[object, object]:
+            _ = session_arg, authorization
+            return types.SimpleNamespace(id=task.api_key_id), user
+
+        async def fake_membership(session_arg: object, *, user_id: uuid.UUID) -> object:
+            _ = session_arg, user_id
+            return types.SimpleNamespace(org_id=task.org_id)
+
+        def unexpected_client(**kwargs: object) -> object:
+            raise AssertionError("terminal tasks must not hit the upstream")
+
+        request = types.SimpleNamespace(
+            headers={"authorization": "Bearer sk-test"},
+            query_params={},
+            body=_async_value(b""),
+        )
+        router_module.authenticate_api_key = fake_auth
+        router_module._require_default_membership = fake_membership
+        router_module.httpx.AsyncClient = unexpected_client  # type: ignore[assignment]
+        try:
+            response = await router_module._proxy_content_generation_task_request(
+                request,  # type: ignore[arg-type]
+                session,  # type: ignore[arg-type]
+                method="GET",
+                upstream_path=f"/contents/generations/tasks/{task.upstream_task_id}",
+                task_id=task.upstream_task_id,
+            )
+        finally:
+            (
+                router_module.authenticate_api_key,
+                router_module._require_default_membership,
+                router_module.httpx.AsyncClient,
+            ) = originals
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.body, b'{"id":"cgt","status":"succeeded"}')
+        self.assertTrue(session.closed)
+
+
+def _async_value(value: object):
+    async def getter() -> object:
+        return value
+
+    return getter
+
+
+class ContentGenerationPollerTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self._originals = {
+            name: getattr(content_generation_poller, name)
+            for name in (
+                "SessionLocal",
+                "get_model_config",
+                "resolve_usage_pricing",
+                "settle_content_generation_task",
+                "_http_client",
+            )
+        }
+        self.settled: list[dict[str, object]] = []
+        self.settle_result = (0, 0, 0, 0, 0)
+
+        async def fake_config(session_arg: object, **kwargs: object) -> None:
+            _ = session_arg, kwargs
+
+        async def fake_pricing(session_arg: object, **kwargs: object) -> UsagePricing:
+            _ = session_arg, kwargs
+            return UsagePricing(None, None)
+
+        async def fake_settle(**kwargs: object) -> tuple[int, int, int, int, int]:
+            self.settled.append(kwargs)
+            return self.settle_result
+
+        content_generation_poller.get_model_config = fake_config
+        content_generation_poller.resolve_usage_pricing = fake_pricing
+        content_generation_poller.settle_content_generation_task = fake_settle
+
+    def tearDown(self) -> None:
+        for name, value in self._originals.items():
+            setattr(content_generation_poller, name, value)
+
+    def _use_upstream(self, payload: dict[str, object], calls: list[httpx.Request]) -> None:
+        def handler(request: httpx.Request) -> httpx.Response:
+            calls.append(request)
+            return httpx.Response(200, json=payload)
+
+        content_generation_poller._http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    async def test_poll_advances_schedule_and_settles_status(self) -> None:
+        task = _build_task(poll_attempts=2)
+        channel = types.SimpleNamespace(
+            id=task.channel_id, org_id=task.org_id, base_url="https://upstream.example/v1/", api_key="up-key"
+        )
+        session = _FakeSession(task, channel)
+        calls: list[httpx.Request] = []
+        content_generation_poller.SessionLocal = lambda: session  # type: ignore[assignment]
+        self._use_upstream({"id": task.upstream_task_id, "status": "succeeded", "usage": {"completion_tokens": 50, "total_tokens": 50}}, calls)
+        before = dt.datetime.now(dt.timezone.utc)
+        self.settle_result = (0, 0, 50, 50, 7)
+        tokens_before = PROXY_TOKENS.value(model=task.model_id, kind="output")
+        spend_before = PROXY_SPEND_USD_MICROS.value(model=task.model_id)
+
+        await content_generation_poller.poll_content_generation_task(task.upstream_task_id)
+        await content_generation_poller.close_content_generation_poll_client()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(
+            str(calls[0].url), f"https://upstream.example/v1/contents/generations/tasks/{task.upstream_task_id}"
+        )
+        self.assertEqual(calls[0].headers["authorization"], "Bearer up-key")
+        self.assertEqual(task.poll_attempts, 3)
+        self.assertGreaterEqual(
+            (task.next_poll_at - before).total_seconds(),
+            content_generation_tasks.next_content_generation_poll_delay_seconds(3),
+        )
+        self.assertEqual(session.commits, 1)
+        self.assertEqual(len(self.settled), 1)
+        self.assertEqual(self.settled[0]["status"], "succeeded")
+        self.assertEqual(self.settled[0]["usage_tokens"], (0, 0, 50, 50))
+        self.assertEqual(json.loads(self.settled[0]["result"].body)["status"], "succeeded")
+        self.assertEqual(PROXY_TOKENS.value(model=task.model_id, kind="output"), tokens_before + 50)
+        self.assertEqual(PROXY_SPEND_USD_MICROS.value(model=task.model_id), spend_before + 7)
+
+    async def test_terminal_tasks_are_not_polled(self) -> None:
+        task = _build_task(status="failed")
+        calls: list[httpx.Request] = []
+        content_generation_poller.SessionLocal = lambda: _FakeSession(task)  # type: ignore[assignment]
+        self._use_upstream({}, calls)
+
+        await content_generation_poller.poll_content_generation_task(task.upstream_task_id)
+        await content_generation_poller.close_content_generation_poll_client()
+
+        self.assertEqual(calls, [])
+        self.assertEqual(self.settled, [])
+
+
+    async def test_task_on_another_orgs_channel_is_parked(self) -> None:
+        task = _build_task()
+        channel = types.SimpleNamespace(id=task.channel_id, org_id=uuid.uuid4(), base_url="https://x/v1", api_key="k")
+        calls: list[httpx.Request] = []
+        content_generation_poller.SessionLocal = lambda: _FakeSession(task, channel)  # type: ignore[assignment]
+        self._use_upstream({}, calls)
+
+        await content_generation_poller.poll_content_generation_task(task.upstream_task_id)
+        await content_generation_poller.close_content_generation_poll_client()
+
+        self.assertEqual(calls, [])
+        self.assertIsNone(task.channel_id)
+        engine = create_engine("sqlite://")
+        LlmContentGenerationTask.__table__.create(engine)
+        try:
+            with Session(engine) as session:
+                session.add(task)
+                session.commit()
+                due = await content_generation_poller._due_task_ids(
+                    _SyncSession(session),  # type: ignore[arg-type]
+                    now=dt.datetime.now(dt.timezone.utc) + dt.timedelta(hours=1),
+                    limit=10,
+                )
+        finally:
+            engine.dispose()
+        self.assertEqual(due, [])
+
+
+class PollScheduleTests(unittest.TestCase):
+    def test_backoff_is_monotonic_and_capped(self) -> None:
+        delays = [content_generation_tasks.next_content_generation_poll_delay_seconds(n) for n in range(30)]
+        self.assertEqual(delays, sorted(delays))
+        self.assertEqual(delays[-1], content_generation_tasks.POLL_BACKOFF_SECONDS[-1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,300 @@
+from __future__ import annotations
+
+import asyncio
+import datetime as dt
+import unittest
+import uuid
+
+from sqlalchemy.dialects import postgresql
+
+from app.core.config import settings
+from app.storage import email_outbox, email_verification_db
+from fake_resend import FakeResendServer
+
+
+class _Result:
+    def __init__(self, value: object) -> None:
+        self._value = value
+
+    def scalar_one(self) -> object:
+        return self._value
+
+    def scalar_one_or_none(self) -> object:
+        return self._value
+
+
+class _CodeSession:
+    def __init__(self) -> None:
+        self.results = [_Result(0), _Result(None)]
+        self.added: list[object] = []
+        self.commits = 0
+
+    async def execute(self, statement: object) -> _Result:
+        _ = statement
+        return self.results.pop(0)
+
+    def add(self, obj: object) -> None:
+        self.added.append(obj)
+
+    async def commit(self) -> None:
+        self.commits += 1
+
+
+class _ResendSettingsMixin:
+    def setUp(self) -> None:
+        self._settings = {
+            name: getattr(settings, name)
+            for name in ("resend_api_key", "resend_api_base_url", "email_outbox_max_attempts")
+        }
+        settings.resend_api_key = "re_test"
+
+    async def asyncTearDown(self) -> None:
+        await email_outbox.close_email_client()
+
+    def tearDown(self) -> None:
+        for name, value in self._settings.items():
+            setattr(settings, name, value)
+
+
+class RequestEmailCodeTests(_ResendSettingsMixin, unittest.IsolatedAsyncioTestCase):
+    async def test_code_is_persisted_with_an_outbox_message_and_no_inline_send(self) -> None:
+        session = _CodeSession()
+        enqueued: list[dict[str, object]] = []
+        original_enqueue = email_verification_db.enqueue_email
+        original_send = email_outbox.send_resend_email
+
+        async def fake_enqueue(session_arg: object, **kwargs: object) -> None:
+            self.assertIs(session_arg, session)
+            self.assertEqual(session.commits, 0)
+            enqueued.append(kwargs)
+
+        async def unexpected_send(**kwargs: object) -> None:
+            raise AssertionError("request path must not call the provider")
+
+        email_verification_db.enqueue_email = fake_enqueue
+        email_outbox.send_resend_email = unexpected_send
+        try:
+            expires = await email_verification_db.request_email_code(
+                session,  # type: ignore[arg-type]
+                email=" Alice@Example.com ",
+                purpose="register",
+                client_ip=None,
+            )
+        finally:
+            email_verification_db.enqueue_email = original_enqueue
+            email_outbox.send_resend_email = original_send
+
+        self.assertEqual(session.commits, 1)
+        self.assertEqual(len(session.added), 1)
+        self.assertEqual(expires, int(settings.email_verification_ttl_minutes) * 60)
+        self.assertEqual(len(enqueued), 1)
+        self.assertEqual(enqueued[0]["to_email"], "alice@example.com")
+        self.assertEqual(enqueued[0]["purpose"], "register")
+        self.assertEqual(enqueued[0]["expires_at"], session.added[0].expires_at)
+
+    async def test_unconfigured_resend_is_rejected_before_persisting(self) -> None:
+        settings.resend_api_key = ""
+        session = _CodeSession()
+
+        with self.assertRaisesRegex(ValueError, "resend not configured"):
+            await email_verification_db.request_email_code(
+                session,  # type: ignore[arg-type]
+                email="alice@example.com",
+                purpose="register",
+                client_ip=None,
+            )
+        self.assertEqual(session.added, [])
+        self.assertEqual(session.commits, 0)
+
+
+class EnqueueEmailTests(unittest.IsolatedAsyncioTestCase):
+    async def test_enqueue_upserts_per_recipient_and_purpose(self) -> None:
+        statements: list[object] = []
+
+        class _Session:
+            async def execute(self, statement: object) -> None:
+                statements.append(statement)
+
+        await email_outbox.enqueue_email(
+            _Session(),  # type: ignore[arg-type]
+            to_email="alice@example.com",
+            purpose="password",
+            subject="s",
+            text="t",
+            expires_at=dt.datetime.now(dt.timezone.utc),
+        )
+
+        compiled = statements[0].compile(dialect=postgresql.dialect())
+        sql = str(compiled)
+        self.assertIn("ON CONFLICT (dedupe_key) DO UPDATE", sql)
+        self.assertIn("version = (email_outbox_messages.version +", sql)
+        self.assertEqual(compiled.params["dedupe_key"], "password:alice@example.com")
+
+
+class SendResendEmailTests(_ResendSettingsMixin, unittest.IsolatedAsyncioTestCase):
+    async def test_sends_reuse_one_pooled_connection(self) -> None:
+        async with FakeResendServer() as server:
+            settings.resend_api_base_url = server.base_url
+            for index in range(3):
+                await email_outbox.send_resend_email(
+                    to_email="alice@example.com", subject="Code", text=f"body {index}", idempotency_key=f"k{index}"
+                )
+
+        self.assertEqual(server.connections, 1)
+        self.assertEqual([item.path for item in server.received], ["/emails"] * 3)
+        first = server.received[0]
+        self.assertEqual(first.headers["authorization"], "Bearer re_test")
+        self.assertEqual(first.headers["idempotency-key"], "k0")
+        self.assertEqual(first.payload["to"], ["alice@example.com"])
+        self.assertEqual(first.payload["text"], "body 0")
+
+    async def test_provider_errors_are_classified(self) -> None:
+        async with FakeResendServer(responses=[429, 503, 422]) as server:
+            settings.resend_api_base_url = server.base_url
+            outcomes = []
+            for _ in range(3):
+                with self.assertRaises(email_outbox.EmailDeliveryError) as raised:
+                    await email_outbox.send_resend_email(
+                        to_email="alice@example.com", subject="Code", text="x", idempotency_key="k"
+                    )
+                outcomes.append(raised.exception.retryable)
+
+        self.assertEqual(outcomes, [True, True, False])
+
+    async def test_unreachable_provider_is_retryable(self) -> None:
+        server = await FakeResendServer().start()
+        settings.resend_api_base_url = server.base_url
+        await server.stop()
+
+        with self.assertRaises(email_outbox.EmailDeliveryError) as raised:
+            await email_outbox.send_resend_email(
+                to_email="alice@example.com", subject="Code", text="x", idempotency_key="k"
+            )
+        self.assertTrue(raised.exception.retryable)
+
+
+class DeliverNextEmailTests(_ResendSettingsMixin, unittest.IsolatedAsyncioTestCase):
+    def _claimed(self, attempts: int = 1) -> email_outbox.ClaimedEmail:
+        return email_outbox.ClaimedEmail(
+            id=uuid.uuid4(), version=3, attempts=attempts, to_email="alice@example.com", subject="Code", body_text="123456"
+        )
+
+    async def _deliver(self, server: FakeResendServer, claimed: email_outbox.ClaimedEmail) -> list[object]:
+        finished: list[object] = []
+        original_claim = email_outbox._claim_next_email
+        original_finish = email_outbox._finish_email
+
+        async def fake_claim() -> email_outbox.ClaimedEmail:
+            return claimed
+
+        async def fake_finish(claimed_arg: object, *, error: object) -> None:
+            self.assertIs(claimed_arg, claimed)
+            finished.append(error)
+
+        email_outbox._claim_next_email = fake_claim
+        email_outbox._finish_email = fake_finish
+        settings.resend_api_base_url = server.base_url
+        try:
+            self.assertTrue(await email_outbox.deliver_next_email())
+        finally:
+            email_outbox._claim_next_email = original_claim
+            email_outbox._finish_email = original_finish
+        return finished
+
+    async def test_successful_delivery_uses_versioned_idempotency_key(self) -> None:
+        claimed = self._claimed()
+        async with FakeResendServer() as server:
+            finished = await self._deliver(server, claimed)
+
+        self.assertEqual(finished, [None])
+        self.assertEqual(server.received[0].headers["idempotency-key"], f"{claimed.id}:3")
+
+    async def test_transient_failure_is_handed_back_for_retry(self) -> None:
+        async with FakeResendServer(responses=[500]) as server:
+            finished = await self._deliver(server, self._claimed())
+
+        self.assertEqual(len(finished), 1)
+        self.assertTrue(finished[0].retryable)
+
+    async def test_nothing_is_claimed_without_resend_configured(self) -> None:
+        settings.resend_api_key = ""
+        original_claim = email_outbox._claim_next_email
+
+        async def unexpected_claim() -> None:
+            raise AssertionError("must not claim without a provider")
+
+        email_outbox._claim_next_email = unexpected_claim
+        try:
+            self.assertFalse(await email_outbox.deliver_next_email())
+        finally:
+            email_outbox._claim_next_email = original_claim
+
+
+class OutboxWorkerTests(_ResendSettingsMixin, unittest.IsolatedAsyncioTestCase):
+    async def test_one_poller_fans_claims_out_to_senders_and_wakes_on_enqueue(self) -> None:
+        original_workers = settings.email_outbox_workers
+        originals = (email_outbox._claim_next_email, email_outbox._deliver_email)
+        queue: list[email_outbox.ClaimedEmail] = []
+        claims = 0
+        in_flight: list[str] = []
+        release = asyncio.Event()
+        delivered: list[str] = []
+
+        def message(to_email: str) -> email_outbox.ClaimedEmail:
+            return email_outbox.ClaimedEmail(
+                id=uuid.uuid4(), version=1, attempts=1, to_email=to_email, subject="Code", body_text="1"
+            )
+
+        async def fake_claim() -> email_outbox.ClaimedEmail | None:
+            nonlocal claims
+            claims += 1
+            return queue.pop(0) if queue else None
+
+        async def fake_deliver(claimed: email_outbox.ClaimedEmail) -> None:
+            in_flight.append(claimed.to_email)
+            await release.wait()
+            delivered.append(claimed.to_email)
+
+        async def wait_until(predicate) -> None:
+            for _ in range(200):
+                if predicate():
+                    return
+                await asyncio.sleep(0.005)
+            self.fail("condition not reached")
+
+        settings.email_outbox_workers = 2
+        email_outbox._claim_next_email = fake_claim
+        email_outbox._deliver_email = fake_deliver
+        queue.extend([message("a@example.com"), message("b@example.com"), message("c@example.com")])
+        stop = asyncio.Event()
+        worker = asyncio.create_task(email_outbox.run_email_outbox_worker(stop))
+        try:
+            await wait_until(lambda: len(in_flight) == 2)
+            self.assertEqual(claims, 2)
+            release.set()
+            await wait_until(lambda: len(delivered) == 3)
+
+            claims_when_idle = claims
+            queue.append(message("d@example.com"))
+            email_outbox.wake_email_outbox()
+            await wait_until(lambda: "d@example.com" in delivered)
+            self.assertEqual(claims, claims_when_idle + 2)
+        finally:
+            stop.set()
+            await asyncio.wait_for(worker, timeout=2)
+            settings.email_outbox_workers = original_workers
+            email_outbox._claim_next_email, email_outbox._deliver_email = originals
+
+        self.assertIsNone(email_outbox._wakeup)
+
+
+class RetryDelayTests(unittest.TestCase):
+    def test_backoff_grows_and_caps(self) -> None:
+        for attempts, base in [(1, 2), (3, 15), (50, email_outbox.RETRY_BACKOFF_SECONDS[-1])]:
+            delay = email_outbox.next_email_retry_delay_seconds(attempts)
+            self.assertGreaterEqual(delay, base * 0.8)
+            self.assertLessEqual(delay, base * 1.2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+import asyncio
+import unittest
+
+from app import leader as leader_module
+from app.core.config import settings
+
+
+class _FakeLease:
+    def __init__(self, state: dict[str, object], lock_id: int) -> None:
+        self.state = state
+        self.lock_id = lock_id
+
+    async def acquire(self) -> bool:
+        holder = self.state.get("holder")
+        if holder is not None:
+            return False
+        self.state["holder"] = self
+        return True
+
+    async def heartbeat(self) -> bool:
+        return self.state.get("holder") is self and not self.state.get("lost")
+
+    async def release(self) -> None:
+        if self.state.get("holder") is self:
+            self.state["holder"] = None
+            self.state["lost"] = False
+
+
+class _FakeLockResult:
+    def __init__(self, value: object) -> None:
+        self.value = value
+
+    def scalar(self) -> object:
+        return self.value
+
+
+class _FakeLockConnection:
+    def __init__(self, server_locks: set[int]) -> None:
+        self.server_locks = server_locks
+        self.held: set[int] = set()
+        self.closed = False
+        self.broken = False
+
+    async def execution_options(self, **options: object) -> _FakeLockConnection:
+        _ = options
+        return self
+
+    async def execute(self, statement: object, params: dict[str, int] | None = None) -> _FakeLockResult:
+        if self.broken:
+            raise ConnectionError("connection lost")
+        sql = str(statement)
+        lock_id = (params or {}).get("lock_id")
+        if "pg_try_advisory_lock" in sql:
+            if lock_id in self.server_locks and lock_id not in self.held:
+                return _FakeLockResult(False)
+            self.server_locks.add(lock_id)
+            self.held.add(lock_id)
+            return _FakeLockResult(True)
+        if "pg_advisory_unlock" in sql:
+            self.held.discard(lock_id)
+            self.server_locks.discard(lock_id)
+        return _FakeLockResult(1)
+
+    async def close(self) -> None:
+        self.closed = True
+        self.server_locks.difference_update(self.held)
+        self.held.clear()
+
+
+class _FakeLockEngine:
+    def __init__(self) -> None:
+        self.server_locks: set[int] = set()
+        self.connections: list[_FakeLockConnection] = []
+
+    async def connect(self) -> _FakeLockConnection:
+        conn = _FakeLockConnection(self.server_locks)
+        self.connections.append(conn)
+        return conn
+
+
+class AdvisoryLockLeaseTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.original_engine = leader_module.engine
+        self.engine = _FakeLockEngine()
+        leader_module.engine = self.engine
+
+    def tearDown(self) -> None:
+        leader_module.engine = self.original_engine
+
+    async def test_leases_share_one_connection(self) -> None:
+        connection = leader_module.AdvisoryLockConnection()
+        first = leader_module.AdvisoryLockLease(1, connection=connection)
+        second = leader_module.AdvisoryLockLease(2, connection=connection)
+        duplicate = leader_module.AdvisoryLockLease(1, connection=connection)
+
+        self.assertTrue(await first.acquire())
+        self.assertTrue(await second.acquire())
+        self.assertFalse(await duplicate.acquire())
+        self.assertEqual(len(self.engine.connections), 1)
+        self.assertTrue(await first.heartbeat())
+
+        await first.release()
+        self.assertFalse(self.engine.connections[0].closed)
+        await second.release()
+        self.assertTrue(self.engine.connections[0].closed)
+        self.assertEqual(self.engine.server_locks, set())
+
+    async def test_lost_connection_ends_every_lease(self) -> None:
+        connection = leader_module.AdvisoryLockConnection()
+        first = leader_module.AdvisoryLockLease(1, connection=connection)
+        second = leader_module.AdvisoryLockLease(2, connection=connection)
+        self.assertTrue(await first.acquire())
+        self.assertTrue(await second.acquire())
+
+        self.engine.connections[0].broken = True
+        with self.assertLogs("app.leader", level="WARNING"):
+            self.assertFalse(await first.heartbeat())
+            self.assertFalse(await second.heartbeat())
+        await first.release()
+        await second.release()
+
+        self.assertTrue(await leader_module.AdvisoryLockLease(2, connection=connection).acquire())
+        self.assertEqual(len(self.engine.connections), 2)
+
+
+class RunAsLeaderTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.original_retry = settings.leader_election_retry_seconds
+        self.original_heartbeat = settings.leader_election_heartbeat_seconds
+        self.original_enabled = settings.leader_election_enabled
+        settings.leader_election_retry_seconds = 1
+        settings.leader_election_heartbeat_seconds = 1
+        settings.leader_election_enabled = True
+        self.original_wait = leader_module._wait
+
+        async def fast_wait(stop_event: asyncio.Event, timeout: float) -> bool:
+            _ = timeout
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=0.01)
+            except asyncio.TimeoutError:
+                return False
+            return True
+
+        leader_module._wait = fast_wait
+
+    def tearDown(self) -> None:
+        settings.leader_election_retry_seconds = self.original_retry
+        settings.leader_election_heartbeat_seconds = self.original_heartbeat
+        settings.leader_election_enabled = self.original_enabled
+        leader_module._wait = self.original_wait
+
+    async def test_only_one_process_runs_the_job_and_follower_takes_over(self) -> None:
+        state: dict[str, object] = {"holder": None}
+        running: list[str] = []
+        started: list[str] = []
+
+        def make_job(name: str):
+            async def job(leader_stop: asyncio.Event) -> None:
+                started.append(name)
+                running.append(name)
+                try:
+                    await leader_stop.wait()
+                finally:
+                    running.remove(name)
+
+            return job
+
+        stop_a = asyncio.Event()
+        stop_b = asyncio.Event()
+        task_a = asyncio.create_task(
+            leader_module.run_as_leader(
+                "job", 1, stop_a, make_job("a"), lease_factory=lambda lock_id: _FakeLease(state, lock_id)
+            )
+        )
+        await asyncio.sleep(0.05)
+        task_b = asyncio.create_task(
+            leader_module.run_as_leader(
+                "job", 1, stop_b, make_job("b"), lease_factory=lambda lock_id: _FakeLease(state, lock_id)
+            )
+        )
+        await asyncio.sleep(0.05)
+        self.assertEqual(running, ["a"])
+
+        stop_a.set()
+        await task_a
+        await asyncio.sleep(0.05)
+        self.assertEqual(running, ["b"])
+
+        stop_b.set()
+        await task_b
+        self.assertEqual(started, ["a", "b"])
+        self.assertEqual(running, [])
+
+    async def test_lost_heartbeat_stops_the_job(self) -> None:
+        state: dict[str, object] = {"holder": None}
+        stopped = asyncio.Event()
+
+        async def job(leader_stop: asyncio.Event) -> None:
+            try:
+                await leader_stop.wait()
+            finally:
+                stopped.set()
+
+        stop_event = asyncio.Event()
+        task = asyncio.create_task(
+            leader_module.run_as_leader(
+                "job", 1, stop_event, job, lease_factory=lambda lock_id: _FakeLease(state, lock_id)
+            )
+        )
+        await asyncio.sleep(0.02)
+        state["lost"] = True
+        await asyncio.wait_for(stopped.wait(), timeout=1)
+
+        stop_event.set()
+        await task
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import asyncio
+import time
+import unittest
+
+import app.api.loop_monitor as loop_monitor_module
+from app.api.loop_monitor import LoopMonitor, loop_monitor_stats, run_loop_monitor
+from app.api.metrics import EVENT_LOOP_LAG_SECONDS, EVENT_LOOP_SLOW_CALLBACKS
+from app.core.config import settings
+
+
+def _block_the_loop(seconds: float) -> None:
+    time.sleep(seconds)
+
+
+class LoopMonitorTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self._originals = {
+            name: getattr(settings, name)
+            for name in ("loop_monitor_enabled", "loop_monitor_interval_ms", "loop_slow_callback_ms")
+        }
+        self._monitor = loop_monitor_module._monitor
+        settings.loop_monitor_enabled = True
+        settings.loop_monitor_interval_ms = 10
+        settings.loop_slow_callback_ms = 50
+
+    def tearDown(self) -> None:
+        for name, value in self._originals.items():
+            setattr(settings, name, value)
+        loop_monitor_module._monitor = self._monitor
+
+    async def _monitored(self, blocking_seconds: float) -> dict:
+        stop = asyncio.Event()
+        task = asyncio.create_task(run_loop_monitor(stop))
+        try:
+            await asyncio.sleep(0.05)
+            _block_the_loop(blocking_seconds)
+            await asyncio.sleep(0.05)
+            return loop_monitor_stats()
+        finally:
+            stop.set()
+            await task
+
+    async def test_blocking_call_is_captured_with_its_stack(self) -> None:
+        slow_before = EVENT_LOOP_SLOW_CALLBACKS.value()
+        lag_before = EVENT_LOOP_LAG_SECONDS.count()
+
+        stats = await self._monitored(0.3)
+
+        self.assertTrue(stats["running"])
+        self.assertGreaterEqual(stats["lag"]["maxMs"], 200)
+        self.assertEqual(stats["slowCallbacks"]["total"], 1)
+        stall = stats["slowCallbacks"]["items"][0]
+        self.assertIn("_block_the_loop", stall["stack"])
+        self.assertGreaterEqual(stall["blockedMs"], 50)
+        self.assertGreaterEqual(stall["lagMs"], 200)
+        self.assertEqual(EVENT_LOOP_SLOW_CALLBACKS.value(), slow_before + 1)
+        self.assertGreater(EVENT_LOOP_LAG_SECONDS.count(), lag_before)
+        self.assertFalse(loop_monitor_stats()["running"])
+
+    async def test_short_work_is_not_reported(self) -> None:
+        stats = await self._monitored(0.005)
+
+        self.assertEqual(stats["slowCallbacks"], {"total": 0, "items": []})
+        self.assertGreater(stats["lag"]["samples"], 0)
+
+    async def test_disabled_monitor_does_not_start(self) -> None:
+        settings.loop_monitor_enabled = False
+        loop_monitor_module._monitor = None
+
+        await asyncio.wait_for(run_loop_monitor(asyncio.Event()), timeout=1)
+
+        self.assertEqual(loop_monitor_stats(), {"running": False})
+
+
+class LoopMonitorCheckTests(unittest.TestCase):
+    def test_one_stall_is_recorded_once_until_the_loop_recovers(self) -> None:
+        monitor = LoopMonitor(interval_ms=10, slow_callback_ms=20, buffer_size=2)
+        monitor._last_beat = time.perf_counter() - 1
+
+        monitor.check(0)
+        monitor.check(0)
+        with self.assertLogs("app.api.loop_monitor", level="WARNING"):
+            monitor.beat(0.99)
+
+        self.assertEqual(monitor.slow_total, 1)
+        self.assertEqual(monitor.stats()["slowCallbacks"]["items"][0]["lagMs"], 990.0)
+        monitor.check(0)
+        self.assertEqual(monitor.slow_total, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import unittest
+import uuid
+
+import httpx
+
+import app.api.router as router_module
+from app.api.metrics import (
+    OVERFLOW_LABEL,
+    PROXY_RESPONSES,
+    PROXY_TOKENS,
+    UPSTREAM_TTFT_SECONDS,
+    Counter,
+    Histogram,
+    route_label,
+)
+from app.core.config import settings
+from app.main import create_app
+
+
+class MetricTypesTests(unittest.TestCase):
+    def test_histogram_renders_cumulative_buckets(self) -> None:
+        histogram = Histogram("t_seconds", "Test.", ("route",), buckets=(0.1, 1.0))
+        histogram.observe(0.05, route="/a")
+        histogram.observe(0.5, route="/a")
+        histogram.observe(5, route="/a")
+
+        self.assertEqual(
+            histogram.render(),
+            [
+                "# HELP t_seconds Test.",
+                "# TYPE t_seconds histogram",
+                't_seconds_bucket{route="/a",le="0.1"} 1',
+                't_seconds_bucket{route="/a",le="1"} 2',
+                't_seconds_bucket{route="/a",le="+Inf"} 3',
+                't_seconds_count{route="/a"} 3',
+                't_seconds_sum{route="/a"} 5.55',
+            ],
+        )
+
+    def test_label_values_are_escaped(self) -> None:
+        counter = Counter("t_total", "Test.", ("model",))
+        counter.inc(model='a"b\\c')
+
+        self.assertEqual(counter.render()[-1], 't_total{model="a\\"b\\\\c"} 1')
+
+    def test_new_label_sets_past_the_budget_share_an_overflow_series(self) -> None:
+        original = settings.metrics_max_series_per_metric
+        settings.metrics_max_series_per_metric = 2
+        try:
+            counter = Counter("t_total", "Test.", ("model",))
+            for model in ("a", "b", "c", "d"):
+                counter.inc(model=model)
+            counter.inc(model="a")
+        finally:
+            settings.metrics_max_series_per_metric = original
+
+        self.assertEqual(counter.value(model="a"), 2)
+        self.assertEqual(counter.value(model=OVERFLOW_LABEL), 2)
+        self.assertEqual(len(counter.render()), 2 + 3)
+
+    def test_route_label_collapses_ids(self) -> None:
+        self.assertEqual(route_label("/v1/chat/completions"), "/v1/chat/completions")
+        self.assertEqual(
+            route_label("/v1/contents/generations/tasks/cgt-20260101123456-abcd?x=1"),
+            "/v1/contents/generations/tasks/{id}",
+        )
+        self.assertEqual(route_label(None), "unknown")
+
+
+class _FailingSession:
+    async def __aenter__(self) -> object:
+        raise RuntimeError("database unavailable")
+
+    async def __aexit__(self, *args: object) -> None:
+        return None
+
+
+class UsageMetricsTests(unittest.IsolatedAsyncioTestCase):
+    async def test_recorded_usage_updates_proxy_metrics(self) -> None:
+        originals = {name: getattr(router_module, name) for name in ("SessionLocal", "charge_rate_limit_tokens")}
+        model_id = f"metrics-{uuid.uuid4()}"
+        channel_id = uuid.uuid4()
+
+        async def fake_charge(**kwargs: object) -> None:
+            return None
+
+        router_module.SessionLocal = _FailingSession
+        router_module.charge_rate_limit_tokens = fake_charge
+        try:
+            with self.assertLogs("app.api.router", level="ERROR"):
+                await router_module._record_usage_event_best_effort(
+                    org_id=uuid.uuid4(),
+                    user_id=uuid.uuid4(),
+                    api_key_id=None,
+                    model_id=model_id,
+                    ok=True,
+                    status_code=200,
+                    input_tokens=100,
+                    cached_tokens=40,
+                    output_tokens=10,
+                    total_tokens=110,
+                    cost_usd_micros=25,
+                    total_duration_ms=1500,
+                    ttft_ms=300,
+                    source_ip=None,
+                    request_endpoint="/v1/chat/completions",
+                    is_streaming=True,
+                    recompute_cost=False,
+                    channel_id=channel_id,
+                )
+        finally:
+            for name, value in originals.items():
+                setattr(router_module, name, value)
+
+        self.assertEqual(PROXY_RESPONSES.value(route="/v1/chat/completions", model=model_id, code="200"), 1)
+        self.assertEqual(PROXY_TOKENS.value(model=model_id, kind="input"), 60)
+        self.assertEqual(PROXY_TOKENS.value(model=model_id, kind="cached"), 40)
+        self.assertEqual(
+            UPSTREAM_TTFT_SECONDS.count(route="/v1/chat/completions", model=model_id, channel=str(channel_id)), 1
+        )
+
+
+class MetricsEndpointTests(unittest.IsolatedAsyncioTestCase):
+    async def _get(self, headers: dict[str, str] | None = None) -> httpx.Response:
+        transport = httpx.ASGITransport(app=create_app())
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get("/metrics", headers=headers)
+
+    async def asyncSetUp(self) -> None:
+        self._original_token = settings.metrics_bearer_token
+        settings.metrics_bearer_token = "scrape-secret"
+
+    async def asyncTearDown(self) -> None:
+        settings.metrics_bearer_token = self._original_token
+
+    async def test_metrics_are_served_in_prometheus_text_format(self) -> None:
+        response = await self._get({"authorization": "Bearer scrape-secret"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("text/plain; version=0.0.4"))
+        self.assertIn("# TYPE uni_upstream_ttft_seconds histogram", response.text)
+        self.assertIn("uni_db_pool_checked_out ", response.text)
+        self.assertIn('uni_background_queue_depth{queue="stream_finalizer"}', response.text)
+        self.assertIn('uni_single_flight_calls_total{outcome="shared"}', response.text)
+
+    async def test_bearer_token_is_required(self) -> None:
+        denied = await self._get()
+        allowed = await self._get({"authorization": "Bearer scrape-secret"})
+
+        self.assertEqual(denied.status_code, 401)
+        self.assertEqual(allowed.status_code, 200)
+
+    async def test_metrics_are_not_served_without_a_configured_token(self) -> None:
+        settings.metrics_bearer_token = ""
+
+        response = await self._get({"authorization": "Bearer "})
+
+        self.assertEqual(response.status_code, 404)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,16 +1,38 @@
 from __future__ import annotations
 
+import datetime as dt
 import unittest
+import uuid
 
 from sqlalchemy.dialects import postgresql
 
+from app.storage import models_db
 from app.storage.models_db import (
     _availability_legacy_slots,
-    _model_availability_relevant_filter,
     model_availability_bucket,
+    model_availability_bucket_start,
+    model_availability_counts,
 )
 
 
+class _FakeRowsResult:
+    def __init__(self, rows: list[tuple[object, ...]]) -> None:
+        self._rows = rows
+
+    def all(self) -> list[tuple[object, ...]]:
+        return self._rows
+
+
+class _FakeSession:
+    def __init__(self, rows: list[tuple[object, ...]]) -> None:
+        self.rows = rows
+        self.executed: list[str] = []
+
+    async def execute(self, statement: object) -> _FakeRowsResult:
+        self.executed.append(str(statement.compile(dialect=postgresql.dialect())))  # type: ignore[attr-defined]
+        return _FakeRowsResult(self.rows)
+
+
 class ModelAvailabilityTests(unittest.TestCase):
     def test_low_sample_bucket_is_unknown_even_with_failure(self) -> None:
         bucket = model_availability_bucket(total=1, failed=1)
@@ -36,21 +58,54 @@ class ModelAvailabilityTests(unittest.TestCase):
 
         self.assertEqual(slots, [0, 0, 1, 0])
 
-    def test_relevant_filter_excludes_client_statuses(self) -> None:
-        sql = str(
-            _model_availability_relevant_filter().compile(
-                dialect=postgresql.dialect(),
-                compile_kwargs={"literal_binds": True},
-            )
+    def test_client_statuses_do_not_count_towards_availability(self) -> None:
+        self.assertEqual(model_availability_counts(399), (1, 0))
+        self.assertEqual(model_availability_counts(500), (1, 1))
+        for status_code in (400, 401, 403, 408, 429, 499):
+            self.assertIsNone(model_availability_counts(status_code))
+
+    def test_bucket_start_aligns_to_half_hour(self) -> None:
+        value = dt.datetime(2026, 5, 30, 8, 52, 33, 222849, tzinfo=dt.timezone.utc)
+
+        self.assertEqual(
+            model_availability_bucket_start(value),
+            dt.datetime(2026, 5, 30, 8, 30, tzinfo=dt.timezone.utc),
+        )
+
+    def test_counts_skip_client_statuses(self) -> None:
+        self.assertEqual(model_availability_counts(200), (1, 0))
+        self.assertEqual(model_availability_counts(502), (1, 1))
+        self.assertIsNone(model_availability_counts(429))
+        self.assertIsNone(model_availability_counts(499))
+
+
+class FetchModelAvailabilityTests(unittest.IsolatedAsyncioTestCase):
+    async def test_reads_rollup_buckets_instead_of_raw_events(self) -> None:
+        current = model_availability_bucket_start(dt.datetime.now(dt.timezone.utc))
+        previous = current - dt.timedelta(minutes=30)
+        session = _FakeSession(
+            [
+                ("gpt-4.1", current, 10, 3),
+                ("gpt-4.1", previous, 20, 0),
+            ]
+        )
+
+        availability = await models_db.fetch_model_availability_24h(
+            session,  # type: ignore[arg-type]
+            org_id=uuid.uuid4(),
+            model_ids=["gpt-4.1", "claude-sonnet"],
         )
 
-        self.assertIn("llm_usage_events.status_code < 400", sql)
-        self.assertIn("llm_usage_events.status_code >= 500", sql)
-        self.assertNotIn("401", sql)
-        self.assertNotIn("403", sql)
-        self.assertNotIn("408", sql)
-        self.assertNotIn("429", sql)
-        self.assertNotIn("499", sql)
+        statement = session.executed[-1]
+        self.assertIn("llm_model_availability_stats", statement)
+        self.assertNotIn("llm_usage_events", statement)
+        self.assertNotIn("GROUP BY", statement.upper())
+        buckets = availability["gpt-4.1"]
+        self.assertEqual(len(buckets), models_db.AVAILABILITY_24H_BUCKETS)
+        self.assertEqual(buckets[-1]["status"], "down")
+        self.assertEqual(buckets[-2]["status"], "healthy")
+        self.assertEqual(buckets[-3]["total"], 0)
+        self.assertTrue(all(bucket["total"] == 0 for bucket in availability["claude-sonnet"]))
 
 
 if __name__ == "__main__":
@@ -1,9 +1,13 @@
 from __future__ import annotations
 
+import asyncio
+import time
 import unittest
 import uuid
 
+from app.models.llm_channel import LlmChannel
 from app.models.llm_model_pricing_rule import LlmModelPricingRule
+from app.storage import models_db
 from app.storage.models_db import model_pricing_rule_to_item, price_detail_for_model_from_rules
 
 
@@ -49,5 +53,161 @@ class ModelPricingRuleTests(unittest.TestCase):
         self.assertEqual(item["discount"], 0.15)
 
 
+class ModelCatalogCacheTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        models_db._MODEL_CATALOG.clear()
+        models_db._MODEL_CATALOG_INFLIGHT.clear()
+        self.calls: list[str] = []
+        self.responses: list[object] = []
+        self.original_fetch = models_db._fetch_channel_models
+
+        async def fake_fetch(base_url: str, api_key: str) -> set[str]:
+            _ = api_key
+            self.calls.append(base_url)
+            result = self.responses.pop(0)
+            if isinstance(result, Exception):
+                raise result
+            return set(result)  # type: ignore[arg-type]
+
+        models_db._fetch_channel_models = fake_fetch
+
+    def tearDown(self) -> None:
+        models_db._fetch_channel_models = self.original_fetch
+        models_db._MODEL_CATALOG.clear()
+        models_db._MODEL_CATALOG_INFLIGHT.clear()
+
+    def _channel(self, base_url: str = "https://a.example/v1") -> LlmChannel:
+        return LlmChannel(id=uuid.uuid4(), org_id=uuid.uuid4(), name="a", base_url=base_url, api_key="sk-a")
+
+    def _expire(self, channel: LlmChannel) -> None:
+        models_db._MODEL_CATALOG[channel.id].checked_at = time.monotonic() - 10_000
+
+    async def test_fresh_entries_are_served_without_upstream_calls(self) -> None:
+        channel = self._channel()
+        self.responses = [{"gpt-4.1", "gpt-4.1-mini"}]
+
+        first = await models_db.fetch_available_models_for_channels([channel])
+        second = await models_db.fetch_available_models_for_channels([channel])
+
+        self.assertEqual(first, {"gpt-4.1": 1, "gpt-4.1-mini": 1})
+        self.assertEqual(second, first)
+        self.assertEqual(len(self.calls), 1)
+
+    async def test_stale_entry_is_served_while_refreshing_in_background(self) -> None:
+        channel = self._channel()
+        self.responses = [{"gpt-4.1"}, {"gpt-5"}]
+        await models_db.get_channel_models(channel)
+        self._expire(channel)
+
+        stale = await models_db.get_channel_models(channel)
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        fresh = await models_db.get_channel_models(channel)
+
+        self.assertEqual(stale, frozenset({"gpt-4.1"}))
+        self.assertEqual(fresh, frozenset({"gpt-5"}))
+        self.assertEqual(len(self.calls), 2)
+
+    async def test_failed_refresh_keeps_last_good_models(self) -> None:
+        channel = self._channel()
+        self.responses = [{"gpt-4.1"}, ValueError("upstream /models returned 502")]
+        await models_db.get_channel_models(channel)
+        self._expire(channel)
+
+        await models_db.get_channel_models(channel)
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+
+        entry = models_db._MODEL_CATALOG[channel.id]
+        self.assertEqual(entry.models, frozenset({"gpt-4.1"}))
+        self.assertIn("502", entry.last_error or "")
+        self.assertEqual(await models_db.get_channel_models(channel), frozenset({"gpt-4.1"}))
+
+    async def test_changed_base_url_bypasses_cached_entry(self) -> None:
+        channel = self._channel()
+        self.responses = [{"gpt-4.1"}, {"claude-sonnet"}]
+        await models_db.get_channel_models(channel)
+
+        channel.base_url = "https://b.example/v1"
+        models = await models_db.get_channel_models(channel)
+
+        self.assertEqual(models, frozenset({"claude-sonnet"}))
+        self.assertEqual(self.calls, ["https://a.example/v1", "https://b.example/v1"])
+
+
+class ModelRoutingTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        models_db._MODEL_CATALOG.clear()
+        models_db._MODEL_CATALOG_INFLIGHT.clear()
+
+    def tearDown(self) -> None:
+        models_db._MODEL_CATALOG.clear()
+        models_db._MODEL_CATALOG_INFLIGHT.clear()
+
+    def _channel(self, name: str, *, models: list[str] | None = None, prefixes: list[str] | None = None) -> LlmChannel:
+        return LlmChannel(
+            id=uuid.uuid4(),
+            org_id=uuid.uuid4(),
+            name=name,
+            base_url=f"https://{name}.example/v1",
+            api_key=f"sk-{name}",
+            models=models or [],
+            model_prefixes=prefixes or [],
+        )
+
+    def _remember(self, channel: LlmChannel, models: set[str]) -> None:
+        now = time.monotonic()
+        models_db._MODEL_CATALOG[channel.id] = models_db._ChannelModelCatalogEntry(
+            fingerprint=(channel.base_url, channel.api_key),
+            models=frozenset(models),
+            checked_at=now,
+            refreshed_at=now,
+        )
+
+    def test_declared_models_and_prefixes_restrict_channel(self) -> None:
+        channel = self._channel("a", models=["gpt-4.1"], prefixes=["claude-"])
+        discovered = frozenset({"gpt-4.1", "gpt-5", "claude-sonnet-4"})
+
+        self.assertTrue(models_db.channel_serves_model(channel, "gpt-4.1", discovered))
+        self.assertTrue(models_db.channel_serves_model(channel, "claude-opus-4", discovered))
+        self.assertFalse(models_db.channel_serves_model(channel, "gpt-5", discovered))
+        self.assertEqual(
+            models_db.channel_advertised_models(channel, discovered),
+            {"gpt-4.1", "claude-sonnet-4"},
+        )
+
+    def test_undeclared_channel_uses_discovered_models_and_fails_open_when_unknown(self) -> None:
+        channel = self._channel("a")
+
+        self.assertTrue(models_db.channel_serves_model(channel, "gpt-5", frozenset({"gpt-5"})))
+        self.assertFalse(models_db.channel_serves_model(channel, "gpt-4.1", frozenset({"gpt-5"})))
+        self.assertTrue(models_db.channel_serves_model(channel, "gpt-4.1", None))
+
+    async def test_routing_skips_group_channels_that_do_not_serve_model(self) -> None:
+        first = self._channel("first")
+        second = self._channel("second")
+        self._remember(first, {"gpt-4.1"})
+        self._remember(second, {"claude-sonnet-4"})
+        original = models_db.list_channels_for_group
+
+        async def fake_list_channels_for_group(session: object, **kwargs: object) -> list[LlmChannel]:
+            _ = session, kwargs
+            return [first, second]
+
+        models_db.list_channels_for_group = fake_list_channels_for_group
+        try:
+            group_channels, eligible = await models_db.list_channels_for_model(
+                object(),  # type: ignore[arg-type]
+                org_id=uuid.uuid4(),
+                group_name="default",
+                model_id="claude-sonnet-4",
+            )
+        finally:
+            models_db.list_channels_for_group = original
+
+        self.assertEqual(group_channels, [first, second])
+        self.assertEqual(eligible, [second])
+
+
 if __name__ == "__main__":
     unittest.main()
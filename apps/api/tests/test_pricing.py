@@ -2,7 +2,7 @@ from __future__ import annotations
 
 import unittest
 
-from app.api.llm_proxy import UsagePricing, estimate_cost_usd_micros
+from app.pricing import UsagePricing, estimate_cost_usd_micros
 
 
 class EstimateCostUsdMicrosTests(unittest.TestCase):
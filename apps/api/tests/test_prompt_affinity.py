@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import types
+import unittest
+import uuid
+
+import app.api.prompt_affinity as prompt_affinity
+from app.api.prompt_affinity import (
+    channel_is_healthy,
+    observe_channel_outcome,
+    order_by_affinity,
+    prompt_affinity_key,
+    prompt_affinity_stats,
+    prompt_prefix_fingerprint,
+)
+from app.core.config import settings
+
+SYSTEM = {"role": "system", "content": "You are a careful assistant. " * 20}
+
+
+def _conversation(*turns: str) -> dict[str, object]:
+    messages: list[dict[str, str]] = [SYSTEM]
+    for index, text in enumerate(turns):
+        messages.append({"role": "user" if index % 2 == 0 else "assistant", "content": text})
+    return {"model": "gpt-test", "messages": messages}
+
+
+class PromptPrefixFingerprintTests(unittest.TestCase):
+    def test_later_turns_of_a_conversation_share_the_fingerprint(self) -> None:
+        first = prompt_prefix_fingerprint(_conversation("plan a trip"))
+        third = prompt_prefix_fingerprint(_conversation("plan a trip", "sure, where?", "Lisbon"))
+
+        self.assertIsNotNone(first)
+        self.assertEqual(first, third)
+
+    def test_different_prompts_get_different_fingerprints(self) -> None:
+        base = prompt_prefix_fingerprint(_conversation("plan a trip"))
+
+        self.assertNotEqual(base, prompt_prefix_fingerprint(_conversation("write a poem")))
+        self.assertNotEqual(
+            base, prompt_prefix_fingerprint({**_conversation("plan a trip"), "tools": [{"type": "function"}]})
+        )
+        self.assertIsNone(prompt_prefix_fingerprint({"model": "gpt-test"}))
+
+    def test_key_is_scoped_to_api_key_or_user_and_disabled_by_default(self) -> None:
+        original = (settings.prompt_affinity_enabled, settings.prompt_affinity_scope)
+        payload = _conversation("plan a trip")
+        user_id = uuid.uuid4()
+        try:
+            settings.prompt_affinity_enabled = False
+            self.assertIsNone(prompt_affinity_key(payload, api_key_id=uuid.uuid4(), user_id=user_id))
+
+            settings.prompt_affinity_enabled = True
+            settings.prompt_affinity_scope = "api_key"
+            self.assertNotEqual(
+                prompt_affinity_key(payload, api_key_id=uuid.uuid4(), user_id=user_id),
+                prompt_affinity_key(payload, api_key_id=uuid.uuid4(), user_id=user_id),
+            )
+            settings.prompt_affinity_scope = "user"
+            self.assertEqual(
+                prompt_affinity_key(payload, api_key_id=uuid.uuid4(), user_id=user_id),
+                prompt_affinity_key(payload, api_key_id=uuid.uuid4(), user_id=user_id),
+            )
+        finally:
+            settings.prompt_affinity_enabled, settings.prompt_affinity_scope = original
+
+
+class OrderByAffinityTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.channels = [types.SimpleNamespace(id=uuid.uuid4()) for _ in range(4)]
+
+    def _order(self, channels: list[object], key: str, unhealthy: set[object] = frozenset()) -> list[object]:
+        return order_by_affinity(
+            channels, key=key, id_of=lambda c: c.id, healthy=lambda c: c.id not in unhealthy
+        )
+
+    def test_same_key_always_prefers_the_same_channel(self) -> None:
+        preferred = {self._order(self.channels, "conversation")[0].id for _ in range(5)}
+        reversed_input = self._order(list(reversed(self.channels)), "conversation")[0].id
+
+        self.assertEqual(len(preferred), 1)
+        self.assertEqual(preferred, {reversed_input})
+
+    def test_keys_spread_across_channels(self) -> None:
+        preferred = {self._order(self.channels, f"conversation-{i}")[0].id for i in range(64)}
+
+        self.assertEqual(preferred, {c.id for c in self.channels})
+
+    def test_removing_another_channel_keeps_the_preferred_one(self) -> None:
+        ordered = self._order(self.channels, "conversation")
+        remaining = [c for c in self.channels if c is not ordered[-1]]
+
+        self.assertIs(self._order(remaining, "conversation")[0], ordered[0])
+
+    def test_unhealthy_preferred_channel_falls_back_to_the_next_one(self) -> None:
+        ordered = self._order(self.channels, "conversation")
+        before = dict(prompt_affinity._STATS)
+
+        fallback = self._order(self.channels, "conversation", unhealthy={ordered[0].id})
+
+        self.assertEqual(fallback[0], ordered[1])
+        self.assertEqual(sorted(c.id for c in fallback), sorted(c.id for c in self.channels))
+        self.assertEqual(prompt_affinity._STATS["fallbacks"], before["fallbacks"] + 1)
+
+
+class ChannelOutcomeTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.channel_id = uuid.uuid4()
+        self._threshold = settings.prompt_affinity_failure_threshold
+
+    def tearDown(self) -> None:
+        settings.prompt_affinity_failure_threshold = self._threshold
+        prompt_affinity.forget_channel(self.channel_id)
+
+    def test_consecutive_failures_mark_the_channel_unhealthy_until_a_success(self) -> None:
+        settings.prompt_affinity_failure_threshold = 2
+        observe_channel_outcome(self.channel_id, status_code=502)
+        self.assertTrue(channel_is_healthy(self.channel_id))
+        observe_channel_outcome(self.channel_id, status_code=499)
+        observe_channel_outcome(self.channel_id, status_code=429)
+        self.assertFalse(channel_is_healthy(self.channel_id))
+
+        observe_channel_outcome(self.channel_id, status_code=200)
+        self.assertTrue(channel_is_healthy(self.channel_id))
+
+    def test_stats_report_cache_hit_ratio_per_channel(self) -> None:
+        observe_channel_outcome(self.channel_id, status_code=200, input_tokens=1000, cached_tokens=900)
+        observe_channel_outcome(self.channel_id, status_code=200, input_tokens=1000, cached_tokens=0)
+        observe_channel_outcome(self.channel_id, status_code=400, input_tokens=50, cached_tokens=50)
+
+        entry = next(c for c in prompt_affinity_stats()["channels"] if c["channelId"] == str(self.channel_id))
+        self.assertEqual(entry["requests"], 2)
+        self.assertEqual(entry["cachedTokens"], 900)
+        self.assertEqual(entry["cacheHitRatio"], 0.45)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import unittest
+
+import httpx
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import OperationalError
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+import app.query_profiler as query_profiler
+from app.db import engine as app_engine
+from app.query_profiler import (
+    QueryProfilerMiddleware,
+    fingerprint_statement,
+    install_query_profiler,
+    profile_queries,
+    query_budget,
+)
+
+
+def _engine():
+    engine = create_engine("sqlite://")
+    install_query_profiler(engine)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE api_keys (id INTEGER PRIMARY KEY, name TEXT)"))
+    return engine
+
+
+class FingerprintTests(unittest.TestCase):
+    def test_literals_and_parameters_are_normalized(self) -> None:
+        self.assertEqual(
+            fingerprint_statement("SELECT * FROM users\n WHERE id = $1 AND email = 'a@b.c' LIMIT 10"),
+            "SELECT * FROM users WHERE id = ? AND email = ? LIMIT ?",
+        )
+        self.assertEqual(
+            fingerprint_statement("SELECT 1 FROM t WHERE id IN ($1, $2, $3)"),
+            fingerprint_statement("SELECT 1 FROM t WHERE id IN (%(id_1)s, %(id_2)s)"),
+        )
+
+
+class QueryProfileTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.engine = _engine()
+
+    def tearDown(self) -> None:
+        self.engine.dispose()
+
+    def test_queries_are_attributed_to_the_active_profile(self) -> None:
+        with self.engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+            with profile_queries() as outer:
+                conn.execute(text("SELECT name FROM api_keys WHERE id = 1"))
+                with profile_queries() as inner:
+                    conn.execute(text("SELECT name FROM api_keys WHERE id = 2"))
+                with self.assertRaises(OperationalError):
+                    conn.execute(text("SELECT missing FROM api_keys"))
+
+        self.assertEqual(inner.count, 1)
+        self.assertEqual(outer.count, 3)
+        self.assertGreaterEqual(outer.total_ms, inner.total_ms)
+        top = outer.top()
+        self.assertEqual(
+            {entry["fingerprint"]: entry["count"] for entry in top},
+            {"SELECT name FROM api_keys WHERE id = ?": 2, "SELECT missing FROM api_keys": 1},
+        )
+
+    def test_query_budget_reports_the_statements_over_budget(self) -> None:
+        with self.engine.connect() as conn:
+            with query_budget(1):
+                conn.execute(text("SELECT 1"))
+
+            with self.assertRaises(AssertionError) as raised:
+                with query_budget(1):
+                    for key_id in range(3):
+                        conn.execute(text(f"SELECT name FROM api_keys WHERE id = {key_id}"))
+
+        message = str(raised.exception)
+        self.assertIn("3 queries", message)
+        self.assertIn("3x", message)
+        self.assertIn("SELECT name FROM api_keys WHERE id = ?", message)
+
+    def test_app_engine_is_instrumented(self) -> None:
+        self.assertTrue(
+            event.contains(app_engine.sync_engine, "after_cursor_execute", query_profiler._after_cursor_execute)
+        )
+
+
+class QueryProfilerMiddlewareTests(unittest.IsolatedAsyncioTestCase):
+    async def test_response_reports_the_request_query_count(self) -> None:
+        engine = _engine()
+
+        async def endpoint(request: object) -> JSONResponse:
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+                conn.execute(text("SELECT 2"))
+            return JSONResponse({"ok": True})
+
+        app = QueryProfilerMiddleware(Starlette(routes=[Route("/", endpoint)]))
+        try:
+            with self.assertLogs("app.query_profiler", level="INFO") as logs:
+                async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+                    response = await client.get("/")
+        finally:
+            engine.dispose()
+
+        self.assertEqual(response.headers["x-db-query-count"], "2")
+        self.assertIn("x-db-time-ms", response.headers)
+        self.assertEqual(logs.records[0].queries["queries"], 2)
+        self.assertEqual(logs.records[0].queries["statements"][0]["fingerprint"], "SELECT ?")
+
+
+if __name__ == "__main__":
+    unittest.main()
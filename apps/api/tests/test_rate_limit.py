@@ -0,0 +1,234 @@
+from __future__ import annotations
+
+import types
+import unittest
+import uuid
+
+import app.api.router as router_module
+from app import rate_limit
+from app.core.config import settings
+from app.rate_limit import GcraBuckets, MemoryRateLimitBackend, RateLimitExceeded, RateLimitRule
+from app.storage import rate_limits_db
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class GcraBucketsTests(unittest.TestCase):
+    def test_requests_per_minute_allow_burst_then_refill_evenly(self) -> None:
+        clock = _Clock()
+        buckets = GcraBuckets(clock=clock)
+
+        states = [buckets.take("k", limit=3) for _ in range(4)]
+
+        self.assertEqual([state.allowed for state in states], [True, True, True, False])
+        self.assertEqual([state.remaining for state in states[:3]], [2, 1, 0])
+        self.assertAlmostEqual(states[3].retry_after_seconds, 20.0)
+
+        clock.now += 20
+        self.assertTrue(buckets.take("k", limit=3).allowed)
+        self.assertFalse(buckets.take("k", limit=3).allowed)
+
+    def test_token_charges_put_bucket_into_debt_until_repaid(self) -> None:
+        clock = _Clock()
+        buckets = GcraBuckets(clock=clock)
+
+        self.assertTrue(buckets.take("tpm", limit=600, consume=False).allowed)
+        buckets.charge("tpm", 1200)
+        blocked = buckets.take("tpm", limit=600, consume=False)
+
+        self.assertFalse(blocked.allowed)
+        self.assertAlmostEqual(blocked.retry_after_seconds, 60.1)
+        clock.now += 61
+        self.assertTrue(buckets.take("tpm", limit=600, consume=False).allowed)
+
+    def test_charge_ignores_buckets_without_a_limit(self) -> None:
+        buckets = GcraBuckets(clock=_Clock())
+        buckets.charge("unknown", 500)
+        self.assertEqual(len(buckets), 0)
+
+    def test_lru_cap_bounds_tracked_keys(self) -> None:
+        buckets = GcraBuckets(max_keys=2, clock=_Clock())
+        for key in ("a", "b", "c"):
+            buckets.take(key, limit=10)
+        self.assertEqual(len(buckets), 2)
+
+
+class EnforceRateLimitsTests(unittest.IsolatedAsyncioTestCase):
+    async def test_rpm_rejection_carries_ratelimit_headers(self) -> None:
+        backend = MemoryRateLimitBackend(clock=_Clock())
+        rules = [RateLimitRule(bucket="api_key:k1", rpm=1)]
+
+        await rate_limit.enforce_rate_limits(rules, stream=False, backend=backend)
+        with self.assertRaises(RateLimitExceeded) as raised:
+            await rate_limit.enforce_rate_limits(rules, stream=False, backend=backend)
+
+        headers = raised.exception.headers
+        self.assertEqual(raised.exception.detail, "request rate limit exceeded")
+        self.assertEqual(headers["x-ratelimit-limit-requests"], "1")
+        self.assertEqual(headers["x-ratelimit-remaining-requests"], "0")
+        self.assertEqual(headers["retry-after"], "60")
+        self.assertIn("x-ratelimit-reset-requests", headers)
+
+    async def test_concurrent_streams_are_released_with_the_grant(self) -> None:
+        backend = MemoryRateLimitBackend(clock=_Clock())
+        rules = [
+            RateLimitRule(bucket="api_key:k1", max_concurrent_streams=2),
+            RateLimitRule(bucket="org:o1", max_concurrent_streams=1),
+        ]
+
+        grant = await rate_limit.enforce_rate_limits(rules, stream=True, backend=backend)
+        self.assertEqual(len(grant.stream_leases), 2)
+        with self.assertRaises(RateLimitExceeded) as raised:
+            await rate_limit.enforce_rate_limits(rules, stream=True, backend=backend)
+        self.assertEqual(raised.exception.headers["x-ratelimit-limit-streams"], "1")
+        # The rejected attempt must not keep the key-level slot it grabbed first.
+        self.assertEqual(len(backend._streams["streams:api_key:k1"]), 1)
+
+        await rate_limit.release_rate_limit_grant(grant, backend=backend)
+        self.assertEqual(backend._streams, {})
+        self.assertEqual(len((await rate_limit.enforce_rate_limits(rules, stream=True, backend=backend)).stream_leases), 2)
+
+    async def test_rejected_requests_do_not_spend_other_rpm_buckets(self) -> None:
+        backend = MemoryRateLimitBackend(clock=_Clock())
+        key_rule = RateLimitRule(bucket="api_key:k1", rpm=2)
+        org_rule = RateLimitRule(bucket="org:o1", rpm=1)
+
+        await rate_limit.enforce_rate_limits([org_rule], stream=False, backend=backend)
+        for _ in range(3):
+            with self.assertRaises(RateLimitExceeded):
+                await rate_limit.enforce_rate_limits([key_rule, org_rule], stream=False, backend=backend)
+
+        self.assertEqual((await backend.take("rpm:api_key:k1", limit=2, consume=False)).remaining, 1)
+
+    async def test_stream_rejection_refunds_the_request(self) -> None:
+        backend = MemoryRateLimitBackend(clock=_Clock())
+        rules = [RateLimitRule(bucket="api_key:k1", rpm=2, max_concurrent_streams=1)]
+
+        await rate_limit.enforce_rate_limits(rules, stream=True, backend=backend)
+        with self.assertRaises(RateLimitExceeded) as raised:
+            await rate_limit.enforce_rate_limits(rules, stream=True, backend=backend)
+
+        self.assertEqual(raised.exception.detail, "too many concurrent streams")
+        grant = await rate_limit.enforce_rate_limits(rules, stream=False, backend=backend)
+        self.assertEqual(grant.stream_leases, ())
+
+    async def test_non_stream_requests_skip_stream_slots(self) -> None:
+        backend = MemoryRateLimitBackend(clock=_Clock())
+        rules = [RateLimitRule(bucket="org:o1", max_concurrent_streams=1)]
+
+        for _ in range(3):
+            grant = await rate_limit.enforce_rate_limits(rules, stream=False, backend=backend)
+            self.assertEqual(grant.stream_leases, ())
+
+    async def test_recorded_usage_is_charged_to_tpm_buckets(self) -> None:
+        backend = MemoryRateLimitBackend(clock=_Clock())
+        key_id, user_id, org_id = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+        rules = [RateLimitRule(bucket=f"api_key:{key_id}", tpm=1000)]
+
+        await rate_limit.enforce_rate_limits(rules, stream=False, backend=backend)
+        await rate_limit.charge_rate_limit_tokens(
+            api_key_id=key_id, user_id=user_id, org_id=org_id, tokens=5000, backend=backend
+        )
+
+        with self.assertRaises(RateLimitExceeded) as raised:
+            await rate_limit.enforce_rate_limits(rules, stream=False, backend=backend)
+        self.assertEqual(raised.exception.detail, "token rate limit exceeded")
+        self.assertEqual(raised.exception.headers["x-ratelimit-limit-tokens"], "1000")
+
+
+class _PolicyRows:
+    def __init__(self, rows: list[tuple[object, ...]]) -> None:
+        self._rows = rows
+
+    def all(self) -> list[tuple[object, ...]]:
+        return self._rows
+
+
+class _PolicySession:
+    def __init__(self, rows: list[tuple[object, ...]]) -> None:
+        self.rows = rows
+        self.queries = 0
+
+    async def execute(self, statement: object) -> _PolicyRows:
+        _ = statement
+        self.queries += 1
+        return _PolicyRows(self.rows)
+
+
+class RateLimitRulesTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        rate_limits_db._POLICY_CACHE.clear()
+
+    def tearDown(self) -> None:
+        rate_limits_db._POLICY_CACHE.clear()
+
+    async def test_rules_cover_key_group_and_org_and_are_cached(self) -> None:
+        org_id, user_id, key_id = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+        session = _PolicySession(
+            [
+                ("api_key", str(key_id), 60, None, None),
+                ("group", "pro", None, 100000, 4),
+                ("group", "default", 5, None, None),
+                ("org", "", 1000, None, None),
+            ]
+        )
+
+        rules = await rate_limits_db.rate_limit_rules_for_request(
+            session, org_id=org_id, user_id=user_id, group_name="pro", api_key_id=key_id  # type: ignore[arg-type]
+        )
+        await rate_limits_db.rate_limit_rules_for_request(
+            session, org_id=org_id, user_id=user_id, group_name="pro", api_key_id=key_id  # type: ignore[arg-type]
+        )
+
+        self.assertEqual(session.queries, 1)
+        self.assertEqual(
+            rules,
+            [
+                RateLimitRule(bucket=f"api_key:{key_id}", rpm=60),
+                RateLimitRule(bucket=f"user:{user_id}", tpm=100000, max_concurrent_streams=4),
+                RateLimitRule(bucket=f"org:{org_id}", rpm=1000),
+            ],
+        )
+
+
+class ProxyRateLimitTests(unittest.IsolatedAsyncioTestCase):
+    async def test_proxy_rejection_maps_to_429_with_headers(self) -> None:
+        original_backend = rate_limit._backend
+        original_rules = router_module.rate_limit_rules_for_request
+        original_enabled = settings.rate_limit_enabled
+        api_key = types.SimpleNamespace(id=uuid.uuid4())
+        user = types.SimpleNamespace(id=uuid.uuid4(), group_name="default")
+
+        async def fake_rules(session_arg: object, **kwargs: object) -> list[RateLimitRule]:
+            _ = session_arg
+            return [RateLimitRule(bucket=f"api_key:{kwargs['api_key_id']}", rpm=1)]
+
+        rate_limit._backend = MemoryRateLimitBackend()
+        router_module.rate_limit_rules_for_request = fake_rules
+        settings.rate_limit_enabled = True
+        try:
+            await router_module._enforce_proxy_rate_limits(
+                object(), api_key=api_key, user=user, org_id=uuid.uuid4(), stream=False  # type: ignore[arg-type]
+            )
+            with self.assertRaises(router_module.HTTPException) as raised:
+                await router_module._enforce_proxy_rate_limits(
+                    object(), api_key=api_key, user=user, org_id=uuid.uuid4(), stream=False  # type: ignore[arg-type]
+                )
+        finally:
+            rate_limit._backend = original_backend
+            router_module.rate_limit_rules_for_request = original_rules
+            settings.rate_limit_enabled = original_enabled
+
+        self.assertEqual(raised.exception.status_code, 429)
+        self.assertEqual(raised.exception.headers["x-ratelimit-limit-requests"], "1")
+        self.assertIn("retry-after", raised.exception.headers)
+
+
+if __name__ == "__main__":
+    unittest.main()
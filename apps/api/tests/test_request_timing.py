@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import json
+import time
+import unittest
+import uuid
+
+import httpx
+from fastapi import HTTPException
+from starlette.responses import StreamingResponse
+
+import app.api.request_timing as request_timing
+import app.api.router as router_module
+from app.api.request_timing import (
+    note_request_model,
+    note_upstream_started,
+    record_stage_ms,
+    slow_request_samples,
+    timed_proxy_request,
+)
+from app.core.config import settings
+from fake_proxy import FakeProxyRequest, FakeProxyRouter, mock_client_factory, proxy_context
+
+
+def _stages(server_timing: str) -> list[str]:
+    return [part.split(";", 1)[0].strip() for part in server_timing.split(",")]
+
+
+class ChatCompletionsTimingTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self._original_slow_ms = settings.request_timing_slow_ms
+        context = proxy_context(channel_id=uuid.uuid4())
+
+        async def fake_resolve(request, session, *, model_id: str, **kwargs: object):
+            record_stage_ms("resolve", 1.5)
+            note_request_model(model_id)
+            return context
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(200, json={"id": "chatcmpl-1", "choices": [], "usage": {}})
+
+        self.proxy = FakeProxyRouter(context, mock_client_factory(handler)).install(
+            _resolve_llm_proxy_context=fake_resolve
+        )
+
+    async def asyncTearDown(self) -> None:
+        self.proxy.restore()
+        settings.request_timing_slow_ms = self._original_slow_ms
+
+    async def _post(self, headers: dict[str, str] | None = None):
+        body = json.dumps({"model": "gpt-test", "messages": []}).encode()
+        return await router_module.chat_completions(FakeProxyRequest(body, headers), object())  # type: ignore[arg-type]
+
+    async def test_server_timing_is_only_sent_when_requested(self) -> None:
+        plain = await self._post()
+        timed = await self._post({"x-uni-timing": "1"})
+
+        self.assertNotIn("server-timing", plain.headers)
+        stages = _stages(timed.headers["server-timing"])
+        for stage in ("body", "parse", "resolve", "ttfb", "upstream", "finalize", "total"):
+            self.assertIn(stage, stages)
+        self.assertEqual(stages[-1], "total")
+
+    async def test_requests_over_the_threshold_are_sampled(self) -> None:
+        request_timing._SLOW.clear()
+        settings.request_timing_slow_ms = 10_000_000
+        await self._post()
+        self.assertEqual(slow_request_samples()["items"], [])
+
+        settings.request_timing_slow_ms = 1
+        original_elapsed = request_timing.RequestTiming.elapsed_ms
+        request_timing.RequestTiming.elapsed_ms = lambda self: 5.0  # type: ignore[method-assign]
+        try:
+            await self._post()
+        finally:
+            request_timing.RequestTiming.elapsed_ms = original_elapsed  # type: ignore[method-assign]
+
+        samples = slow_request_samples()
+        self.assertEqual(samples["thresholdMs"], 1)
+        self.assertEqual(len(samples["items"]), 1)
+        item = samples["items"][0]
+        self.assertEqual(
+            (item["route"], item["model"], item["status"], item["totalMs"]),
+            ("/v1/chat/completions", "gpt-test", 200, 5.0),
+        )
+        self.assertEqual(item["stagesMs"]["resolve"], 1.5)
+
+
+class TimedProxyRequestTests(unittest.IsolatedAsyncioTestCase):
+    async def test_http_errors_carry_server_timing_when_opted_in(self) -> None:
+        @timed_proxy_request
+        async def handler(request: object) -> object:
+            record_stage_ms("auth", 2)
+            raise HTTPException(status_code=401, detail="invalid api key")
+
+        with self.assertRaises(HTTPException) as raised:
+            await handler(FakeProxyRequest(headers={"x-uni-timing": "true"}))
+
+        self.assertEqual(_stages(raised.exception.headers["server-timing"]), ["auth", "total"])
+
+    async def test_streams_are_logged_once_the_body_is_drained(self) -> None:
+        async def body():
+            yield b"data: 1\n\n"
+            yield b"data: [DONE]\n\n"
+
+        @timed_proxy_request
+        async def handler(request: object) -> StreamingResponse:
+            note_upstream_started(time.perf_counter())
+            return StreamingResponse(body(), media_type="text/event-stream")
+
+        with self.assertLogs("app.api.request_timing", level="INFO") as logs:
+            response = await handler(FakeProxyRequest())
+            self.assertEqual(logs.records, [])
+            chunks = [chunk async for chunk in response.body_iterator]
+
+        self.assertEqual(len(chunks), 2)
+        self.assertEqual(len(logs.records), 1)
+        timing = logs.records[0].timing
+        self.assertTrue(timing["stream"])
+        self.assertIn("ttfb", timing["stagesMs"])
+        self.assertIn("upstream", timing["stagesMs"])
+        self.assertNotIn("finalize", timing["stagesMs"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import json
+import unittest
+import uuid
+
+import httpx
+
+import app.api.response_cache as response_cache_module
+import app.api.router as router_module
+from app.api.llm_proxy import LlmProxyContext
+from app.api.response_cache import CachedResponse, ResponseCache, response_cache_key
+from app.pricing import UsagePricing
+from fake_proxy import FakeProxyRequest, FakeProxyRouter, mock_client_factory, proxy_context
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _cached(body: bytes) -> CachedResponse:
+    return CachedResponse(content_type="application/json", body=body, usage_tokens=(1, 0, 1, 2))
+
+
+class ResponseCacheKeyTests(unittest.TestCase):
+    def test_key_ignores_json_formatting_but_not_content(self) -> None:
+        org_id = uuid.uuid4()
+        a = response_cache_key(
+            org_id=org_id, model_id="m", upstream_path="/chat/completions", raw=b'{"a": 1, "b": [1, 2]}'
+        )
+        b = response_cache_key(org_id=org_id, model_id="m", upstream_path="/chat/completions", raw=b'{"b":[1,2],"a":1}')
+        c = response_cache_key(org_id=org_id, model_id="m", upstream_path="/chat/completions", raw=b'{"b":[2,1],"a":1}')
+
+        self.assertIsNotNone(a)
+        self.assertEqual(a, b)
+        self.assertNotEqual(a, c)
+
+    def test_key_is_scoped_by_org_model_and_path(self) -> None:
+        raw = b'{"model":"m","messages":[]}'
+        org_id = uuid.uuid4()
+        base = response_cache_key(org_id=org_id, model_id="m", upstream_path="/chat/completions", raw=raw)
+
+        self.assertNotEqual(
+            base, response_cache_key(org_id=uuid.uuid4(), model_id="m", upstream_path="/chat/completions", raw=raw)
+        )
+        self.assertNotEqual(
+            base, response_cache_key(org_id=org_id, model_id="n", upstream_path="/chat/completions", raw=raw)
+        )
+        self.assertNotEqual(base, response_cache_key(org_id=org_id, model_id="m", upstream_path="/messages", raw=raw))
+
+    def test_key_varies_with_query_and_version_headers(self) -> None:
+        raw = b'{"model":"m","messages":[]}'
+        org_id = uuid.uuid4()
+
+        def key(query: str = "", **headers: str) -> str | None:
+            return response_cache_key(
+                org_id=org_id,
+                model_id="m",
+                upstream_path="/messages",
+                raw=raw,
+                query=query,
+                headers={name.replace("_", "-"): value for name, value in headers.items()},
+            )
+
+        base = key()
+        self.assertEqual(base, key(user_agent="curl"))
+        self.assertNotEqual(base, key("api-version=2024-10-21"))
+        self.assertNotEqual(base, key(anthropic_version="2023-06-01"))
+        self.assertNotEqual(key(anthropic_beta="a"), key(anthropic_beta="b"))
+
+    def test_uncacheable_paths_and_bodies_have_no_key(self) -> None:
+        org_id = uuid.uuid4()
+        self.assertIsNone(response_cache_key(org_id=org_id, model_id="m", upstream_path="/images/edits", raw=b"{}"))
+        self.assertIsNone(response_cache_key(org_id=org_id, model_id="m", upstream_path="/responses", raw=b"not json"))
+        self.assertIsNone(response_cache_key(org_id=org_id, model_id="m", upstream_path="/responses", raw=b"[1]"))
+
+
+class ResponseCacheTests(unittest.TestCase):
+    def test_entries_expire_after_ttl(self) -> None:
+        clock = _Clock()
+        cache = ResponseCache(max_bytes=100, ttl_seconds=10, max_entry_bytes=100, clock=clock)
+        cache.put("k", _cached(b"abc"))
+
+        clock.now += 9
+        self.assertIsNotNone(cache.get("k"))
+        clock.now += 2
+        self.assertIsNone(cache.get("k"))
+        self.assertEqual(cache.stats()["bytes"], 0)
+
+    def test_least_recently_used_entries_are_evicted_under_the_byte_budget(self) -> None:
+        cache = ResponseCache(max_bytes=10, ttl_seconds=60, max_entry_bytes=10, clock=_Clock())
+        cache.put("a", _cached(b"aaaa"))
+        cache.put("b", _cached(b"bbbb"))
+        cache.get("a")
+        cache.put("c", _cached(b"cccc"))
+
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("c"))
+        stats = cache.stats()
+        self.assertEqual(stats["bytes"], 8)
+        self.assertEqual(stats["evictions"], 1)
+
+    def test_oversized_entries_are_not_stored(self) -> None:
+        cache = ResponseCache(max_bytes=100, ttl_seconds=60, max_entry_bytes=3, clock=_Clock())
+
+        self.assertFalse(cache.put("k", _cached(b"abcd")))
+        self.assertEqual(cache.stats()["entries"], 0)
+
+    def test_stats_report_hit_rate(self) -> None:
+        cache = ResponseCache(max_bytes=100, ttl_seconds=60, max_entry_bytes=100, clock=_Clock())
+        cache.put("k", _cached(b"x"))
+        cache.get("k")
+        cache.get("k")
+        cache.get("missing")
+
+        stats = cache.stats()
+        self.assertEqual(stats["hits"], 2)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["hitRate"], 0.6667)
+
+
+class ChatCompletionsResponseCacheTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.upstream_calls = 0
+        self._original_cache = response_cache_module._cache
+        response_cache_module._cache = ResponseCache(max_bytes=10_000, ttl_seconds=60, max_entry_bytes=10_000)
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            _ = request
+            self.upstream_calls += 1
+            return httpx.Response(
+                200,
+                json={"id": f"chatcmpl-{self.upstream_calls}", "usage": {"prompt_tokens": 5, "completion_tokens": 7}},
+            )
+
+        context = proxy_context(
+            source_ip="127.0.0.1", pricing=UsagePricing(1_000_000, 2_000_000), response_cache_enabled=True
+        )
+        self.proxy = FakeProxyRouter(context, mock_client_factory(handler)).install()
+        self.records = self.proxy.records
+
+    def tearDown(self) -> None:
+        self.proxy.restore()
+        response_cache_module._cache = self._original_cache
+
+    async def _call(self, payload: dict[str, object], headers: dict[str, str]):
+        request = FakeProxyRequest(json.dumps(payload).encode(), headers)
+        return await router_module.chat_completions(request, object())  # type: ignore[arg-type]
+
+    async def test_identical_opted_in_request_is_served_from_cache_at_zero_cost(self) -> None:
+        payload = {"model": "gpt-test", "temperature": 0, "messages": [{"role": "user", "content": "hi"}]}
+
+        first = await self._call(payload, {"x-uni-cache": "on"})
+        second = await self._call(dict(reversed(list(payload.items()))), {"x-uni-cache": "on"})
+
+        self.assertEqual(self.upstream_calls, 1)
+        self.assertEqual(first.headers["x-uni-cache"], "miss")
+        self.assertEqual(second.headers["x-uni-cache"], "hit")
+        self.assertEqual(second.body, first.body)
+        self.assertEqual(len(self.records), 2)
+        self.assertGreater(self.records[0]["cost_usd_micros"], 0)
+        hit = self.records[1]
+        self.assertTrue(hit["ok"])
+        self.assertEqual(hit["cost_usd_micros"], 0)
+        self.assertEqual((hit["input_tokens"], hit["output_tokens"], hit["total_tokens"]), (5, 7, 12))
+
+    async def test_cache_requires_header_opt_in_and_model_opt_in(self) -> None:
+        payload = {"model": "gpt-test", "messages": []}
+
+        await self._call(payload, {})
+        await self._call(payload, {})
+        self.proxy.context = LlmProxyContext(**{**self.proxy.context.__dict__, "response_cache_enabled": False})
+        await self._call(payload, {"x-uni-cache": "on"})
+        await self._call(payload, {"x-uni-cache": "on"})
+
+        self.assertEqual(self.upstream_calls, 4)
+        self.assertEqual(response_cache_module._cache.stats()["entries"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import unittest
+
+from app.core.config import settings
+from app.storage import retention_db
+
+
+class _FakeResult:
+    def __init__(self, rowcount: int) -> None:
+        self.rowcount = rowcount
+
+
+class _FakeConnection:
+    def __init__(self, rowcounts: dict[str, list[int]]) -> None:
+        self.rowcounts = rowcounts
+        self.executed: list[tuple[str, dict[str, object]]] = []
+
+    async def execute(self, statement: object, params: dict[str, object]) -> _FakeResult:
+        sql = str(statement)
+        self.executed.append((sql, params))
+        for table, counts in self.rowcounts.items():
+            if f"DELETE FROM {table} " in sql:
+                return _FakeResult(counts.pop(0) if counts else 0)
+        return _FakeResult(0)
+
+
+class RetentionPolicyTests(unittest.TestCase):
+    def test_zero_day_policies_are_disabled(self) -> None:
+        original = settings.invite_visits_retention_days
+        settings.invite_visits_retention_days = 0
+        try:
+            names = {policy.name for policy in retention_db.retention_policies()}
+        finally:
+            settings.invite_visits_retention_days = original
+
+        self.assertNotIn("invite_visits", names)
+        self.assertIn("sessions", names)
+        self.assertIn("analytics_outbox_sent", names)
+
+    def test_email_outbox_policy_has_its_own_retention(self) -> None:
+        original = settings.email_outbox_retention_days
+        settings.email_outbox_retention_days = 3
+        try:
+            policy = next(p for p in retention_db.retention_policies() if p.name == "email_outbox_messages")
+        finally:
+            settings.email_outbox_retention_days = original
+
+        self.assertEqual(policy.retention_days, 3)
+
+    def test_content_task_policy_only_targets_terminal_statuses(self) -> None:
+        policy = next(p for p in retention_db.retention_policies() if p.name == "content_generation_tasks")
+
+        self.assertIn("'succeeded'", policy.condition)
+        self.assertNotIn("'running'", policy.condition)
+        self.assertIn(":cutoff", policy.condition)
+
+
+class PurgeExpiredRowsTests(unittest.IsolatedAsyncioTestCase):
+    async def test_purges_in_batches_and_reports_per_policy(self) -> None:
+        policies = [
+            retention_db.RetentionPolicy(
+                name="sessions",
+                table="sessions",
+                key="id",
+                condition="expires_at < :cutoff",
+                retention_days=30,
+                batch_size=10,
+            ),
+            retention_db.RetentionPolicy(
+                name="invite_visits",
+                table="invite_visits",
+                key="id",
+                condition="created_at < :cutoff",
+                retention_days=180,
+                batch_size=10,
+            ),
+        ]
+        conn = _FakeConnection({"sessions": [10, 10, 3], "invite_visits": [0]})
+
+        report = await retention_db.purge_expired_rows(conn, policies=policies, max_batches=5)
+
+        self.assertEqual([(row["policy"], row["purged"]) for row in report], [("sessions", 23), ("invite_visits", 0)])
+        self.assertTrue(all(isinstance(row["durationMs"], int) for row in report))
+        self.assertEqual(len(conn.executed), 4)
+        self.assertIn("LIMIT :batch_size", conn.executed[0][0])
+        self.assertEqual(conn.executed[0][1]["batch_size"], 10)
+
+    async def test_max_batches_bounds_work_per_run(self) -> None:
+        policy = retention_db.RetentionPolicy(
+            name="sessions",
+            table="sessions",
+            key="id",
+            condition="expires_at < :cutoff",
+            retention_days=30,
+            batch_size=10,
+        )
+        conn = _FakeConnection({"sessions": [10, 10, 10, 10]})
+
+        report = await retention_db.purge_expired_rows(conn, policies=[policy], max_batches=2)
+
+        self.assertEqual(report[0]["purged"], 20)
+        self.assertEqual(len(conn.executed), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -5,8 +5,10 @@ import unittest
 import uuid
 
 import app.api.router as router_module
+import app.storage.models_db as models_db_module
 from app.constants import ACCOUNT_TEMPORARILY_LIMITED_DETAIL
-from app.api.llm_proxy import LlmProxyContext, UsagePricing
+from app.api.llm_proxy import LlmProxyContext
+from app.pricing import UsagePricing
 
 
 class _RequestUrl:
@@ -114,8 +116,9 @@ class ResolveLlmProxyContextTests(unittest.IsolatedAsyncioTestCase):
         original_authenticate_api_key = router_module.authenticate_api_key
         original_require_default_membership = router_module._require_default_membership
         original_get_model_config = router_module.get_model_config
-        original_get_price_detail_for_model = router_module.get_price_detail_for_model
-        original_pick_channel_for_group = router_module.pick_channel_for_group
+        original_get_price_detail_for_model = models_db_module.get_price_detail_for_model
+        original_list_channels_for_model = router_module.list_channels_for_model
+        original_rate_limit_rules_for_request = router_module.rate_limit_rules_for_request
 
         async def fake_authenticate_api_key(session_arg: object, *, authorization: str | None):
             self.assertIs(session_arg, session)
@@ -141,25 +144,45 @@ class ResolveLlmProxyContextTests(unittest.IsolatedAsyncioTestCase):
             self.assertEqual(model_id, "gpt-4.1")
             return (None, None, None, None, None)
 
-        async def fake_pick_channel_for_group(session_arg: object, *, org_id: uuid.UUID, group_name: str):
+        async def fake_list_channels_for_model(
+            session_arg: object, *, org_id: uuid.UUID, group_name: str, model_id: str
+        ):
             self.assertIs(session_arg, session)
             self.assertEqual(org_id, membership.org_id)
             self.assertEqual(group_name, "default")
-            return channel
+            self.assertEqual(model_id, "gpt-4.1")
+            return [channel], [channel]
+
+        async def fake_rate_limit_rules_for_request(
+            session_arg: object,
+            *,
+            org_id: uuid.UUID,
+            user_id: uuid.UUID,
+            group_name: str,
+            api_key_id: uuid.UUID,
+        ):
+            self.assertIs(session_arg, session)
+            self.assertEqual(org_id, membership.org_id)
+            self.assertEqual(user_id, user.id)
+            self.assertEqual(group_name, "default")
+            self.assertEqual(api_key_id, api_key.id)
+            return []
 
         router_module.authenticate_api_key = fake_authenticate_api_key
         router_module._require_default_membership = fake_require_default_membership
         router_module.get_model_config = fake_get_model_config
-        router_module.get_price_detail_for_model = fake_get_price_detail_for_model
-        router_module.pick_channel_for_group = fake_pick_channel_for_group
+        models_db_module.get_price_detail_for_model = fake_get_price_detail_for_model
+        router_module.list_channels_for_model = fake_list_channels_for_model
+        router_module.rate_limit_rules_for_request = fake_rate_limit_rules_for_request
         try:
             context = await router_module._resolve_llm_proxy_context(request, session, model_id="gpt-4.1")
         finally:
             router_module.authenticate_api_key = original_authenticate_api_key
             router_module._require_default_membership = original_require_default_membership
             router_module.get_model_config = original_get_model_config
-            router_module.get_price_detail_for_model = original_get_price_detail_for_model
-            router_module.pick_channel_for_group = original_pick_channel_for_group
+            models_db_module.get_price_detail_for_model = original_get_price_detail_for_model
+            router_module.list_channels_for_model = original_list_channels_for_model
+            router_module.rate_limit_rules_for_request = original_rate_limit_rules_for_request
 
         self.assertEqual(context.api_key_id, api_key.id)
         self.assertEqual(context.user_id, user.id)
@@ -199,8 +222,9 @@ class ResolveLlmProxyContextTests(unittest.IsolatedAsyncioTestCase):
         original_authenticate_api_key = router_module.authenticate_api_key
         original_require_default_membership = router_module._require_default_membership
         original_get_model_config = router_module.get_model_config
-        original_get_price_detail_for_model = router_module.get_price_detail_for_model
-        original_pick_channel_for_group = router_module.pick_channel_for_group
+        original_get_price_detail_for_model = models_db_module.get_price_detail_for_model
+        original_list_channels_for_model = router_module.list_channels_for_model
+        original_rate_limit_rules_for_request = router_module.rate_limit_rules_for_request
 
         async def fake_authenticate_api_key(session_arg: object, *, authorization: str | None):
             self.assertIs(session_arg, session)
@@ -226,25 +250,45 @@ class ResolveLlmProxyContextTests(unittest.IsolatedAsyncioTestCase):
             self.assertEqual(model_id, "gpt-4.1")
             return (None, None, None, None, None)
 
-        async def fake_pick_channel_for_group(session_arg: object, *, org_id: uuid.UUID, group_name: str):
+        async def fake_list_channels_for_model(
+            session_arg: object, *, org_id: uuid.UUID, group_name: str, model_id: str
+        ):
             self.assertIs(session_arg, session)
             self.assertEqual(org_id, membership.org_id)
             self.assertEqual(group_name, "default")
-            return channel
+            self.assertEqual(model_id, "gpt-4.1")
+            return [channel], [channel]
+
+        async def fake_rate_limit_rules_for_request(
+            session_arg: object,
+            *,
+            org_id: uuid.UUID,
+            user_id: uuid.UUID,
+            group_name: str,
+            api_key_id: uuid.UUID,
+        ):
+            self.assertIs(session_arg, session)
+            self.assertEqual(org_id, membership.org_id)
+            self.assertEqual(user_id, user.id)
+            self.assertEqual(group_name, "default")
+            self.assertEqual(api_key_id, api_key.id)
+            return []
 
         router_module.authenticate_api_key = fake_authenticate_api_key
         router_module._require_default_membership = fake_require_default_membership
         router_module.get_model_config = fake_get_model_config
-        router_module.get_price_detail_for_model = fake_get_price_detail_for_model
-        router_module.pick_channel_for_group = fake_pick_channel_for_group
+        models_db_module.get_price_detail_for_model = fake_get_price_detail_for_model
+        router_module.list_channels_for_model = fake_list_channels_for_model
+        router_module.rate_limit_rules_for_request = fake_rate_limit_rules_for_request
         try:
             context = await router_module._resolve_llm_proxy_context(request, session, model_id="gpt-4.1")
         finally:
             router_module.authenticate_api_key = original_authenticate_api_key
             router_module._require_default_membership = original_require_default_membership
             router_module.get_model_config = original_get_model_config
-            router_module.get_price_detail_for_model = original_get_price_detail_for_model
-            router_module.pick_channel_for_group = original_pick_channel_for_group
+            models_db_module.get_price_detail_for_model = original_get_price_detail_for_model
+            router_module.list_channels_for_model = original_list_channels_for_model
+            router_module.rate_limit_rules_for_request = original_rate_limit_rules_for_request
 
         self.assertEqual(context.source_ip, "198.51.100.42")
 
@@ -7,13 +7,13 @@ from fastapi import HTTPException
 from starlette.requests import ClientDisconnect
 
 import app.api.router as router_module
+from app.api.llm_proxy import extract_content_generation_status_and_usage
+from app.pricing import UsagePricing
 from app.api.router import (
     _SseLineBuffer,
     _build_llm_upstream_url,
-    _extract_content_generation_status_and_usage,
     _extract_content_generation_task_id,
     _extract_usage_tokens_from_sse_line,
-    _parse_content_generation_task_id_timestamp,
     _parse_proxy_request,
     _proxy_content_generation_task_request,
     _read_request_body_or_499,
@@ -276,13 +276,7 @@ class ResponsesRoutesTests(unittest.IsolatedAsyncioTestCase):
         )
 
         self.assertEqual(_extract_content_generation_task_id(raw), "cgt-test")
-        self.assertEqual(_extract_content_generation_status_and_usage(raw), ("succeeded", (0, 0, 108900, 108900)))
-
-    def test_parse_content_generation_task_id_timestamp_as_beijing_time(self) -> None:
-        parsed = _parse_content_generation_task_id_timestamp("cgt-20260530233354-fmfxq")
-
-        self.assertIsNotNone(parsed)
-        self.assertEqual(parsed.isoformat(), "2026-05-30T15:33:54+00:00")
+        self.assertEqual(extract_content_generation_status_and_usage(raw), ("succeeded", (0, 0, 108900, 108900)))
 
     async def test_content_generation_create_remembers_text_plain_json_task_response(self) -> None:
         class DummyHeaders:
@@ -323,7 +317,7 @@ class ResponsesRoutesTests(unittest.IsolatedAsyncioTestCase):
             async def __aexit__(self, exc_type, exc, tb) -> None:
                 return None
 
-            def stream(self, method, url, headers, content):
+            def stream(self, method, url, headers, content, extensions=None):
                 self.method = method
                 self.url = url
                 self.headers = headers
@@ -347,29 +341,32 @@ class ResponsesRoutesTests(unittest.IsolatedAsyncioTestCase):
             source_ip="127.0.0.1",
             upstream_base_url="https://upstream.example/v1",
             upstream_api_key="upstream-key",
-            pricing=router_module.UsagePricing(None, None),
+            pricing=UsagePricing(None, None),
             channel_id=uuid.uuid4(),
         )
         remembered: list[str] = []
+        fallback_records: list[dict[str, object]] = []
         factory = DummyAsyncClientFactory()
         original_resolve = router_module._resolve_llm_proxy_context
-        original_remember = router_module._remember_content_generation_task
+        original_created = router_module._record_content_generation_task_created
         original_record = router_module._record_usage_event_best_effort
         original_async_client = router_module.httpx.AsyncClient
 
-        async def fake_resolve(request, session, *, model_id: str):
+        async def fake_resolve(request, session, *, model_id: str, rotate_api_key: bool = True):
             self.assertEqual(model_id, "seedance-2-0")
+            self.assertFalse(rotate_api_key)
             return context
 
-        async def fake_remember(*, task_id: str, context: object, status: str | None = None) -> None:
-            _ = context, status
+        async def fake_created(*, task_id: str, context: object, **kwargs: object) -> bool:
+            _ = context, kwargs
             remembered.append(task_id)
+            return True
 
         async def fake_record(**kwargs) -> None:
-            _ = kwargs
+            fallback_records.append(kwargs)
 
         router_module._resolve_llm_proxy_context = fake_resolve
-        router_module._remember_content_generation_task = fake_remember
+        router_module._record_content_generation_task_created = fake_created
         router_module._record_usage_event_best_effort = fake_record
         router_module.httpx.AsyncClient = factory  # type: ignore[assignment]
         try:
@@ -381,13 +378,15 @@ class ResponsesRoutesTests(unittest.IsolatedAsyncioTestCase):
             )
         finally:
             router_module._resolve_llm_proxy_context = original_resolve
-            router_module._remember_content_generation_task = original_remember
+            router_module._record_content_generation_task_created = original_created
             router_module._record_usage_event_best_effort = original_record
             router_module.httpx.AsyncClient = original_async_client
 
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.body, b'{"id":"cgt-text-plain"}')
         self.assertEqual(remembered, ["cgt-text-plain"])
+        # The creating usage event is written together with the task mapping.
+        self.assertEqual(fallback_records, [])
 
     def test_parse_proxy_request_reads_multipart_model_without_rewriting_body(self) -> None:
         boundary = "----uni-api-test-boundary"
@@ -8,7 +8,8 @@ from types import SimpleNamespace
 import httpx
 
 import app.api.router as router_module
-from app.api.llm_proxy import LlmProxyContext, UsagePricing
+from app.api.llm_proxy import LlmProxyContext
+from app.pricing import UsagePricing
 from app.api.router import (
     _llm_upstream_timeout,
     _llm_upstream_timeout_seconds,
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+import types
+import unittest
+
+from passlib.hash import argon2
+
+from app import security_password
+from app.schemas.auth import LoginRequest
+from app.storage import auth_db
+
+
+class _ScalarResult:
+    def __init__(self, value: object) -> None:
+        self._value = value
+
+    def scalar_one_or_none(self) -> object:
+        return self._value
+
+
+class _LoginSession:
+    def __init__(self, user: object) -> None:
+        self.user = user
+
+    async def execute(self, statement: object) -> _ScalarResult:
+        _ = statement
+        return _ScalarResult(self.user)
+
+    async def commit(self) -> None:
+        return None
+
+    async def refresh(self, obj: object) -> None:
+        _ = obj
+
+
+class PasswordHashPoolTests(unittest.IsolatedAsyncioTestCase):
+    async def test_async_helpers_round_trip(self) -> None:
+        password_hash = await security_password.hash_password_async("correct horse")
+
+        self.assertTrue(await security_password.verify_password_async("correct horse", password_hash))
+        self.assertFalse(await security_password.verify_password_async("wrong", password_hash))
+        stats = security_password.password_hash_pool_stats()
+        self.assertGreaterEqual(stats["completed"], 3)
+        self.assertEqual(stats["inFlight"], 0)
+        self.assertEqual(stats["queued"], 0)
+
+    async def test_loop_lag_stays_flat_during_login_burst(self) -> None:
+        password_hash = argon2.using(memory_cost=16384, time_cost=2).hash("hunter22")
+        started = time.perf_counter()
+        security_password.verify_password("hunter22", password_hash)
+        single_verify_ms = (time.perf_counter() - started) * 1000
+        completed_before = security_password.password_hash_pool_stats()["completed"]
+        verify_password = security_password.verify_password
+        verify_threads: list[str] = []
+        gaps: list[float] = []
+        done = asyncio.Event()
+
+        def recording_verify(password: str, password_hash: str) -> bool:
+            verify_threads.append(threading.current_thread().name)
+            return verify_password(password, password_hash)
+
+        async def ticker() -> None:
+            last = time.perf_counter()
+            while not done.is_set():
+                await asyncio.sleep(0.002)
+                now = time.perf_counter()
+                gaps.append((now - last) * 1000)
+                last = now
+
+        def login() -> object:
+            user = types.SimpleNamespace(banned_at=None, password_hash=password_hash, password_set_at=None)
+            return auth_db.authenticate_user(
+                _LoginSession(user),  # type: ignore[arg-type]
+                LoginRequest(email="alice@example.com", password="hunter22"),
+            )
+
+        security_password.verify_password = recording_verify  # type: ignore[assignment]
+        ticker_task = asyncio.create_task(ticker())
+        try:
+            results = await asyncio.gather(*[login() for _ in range(8)])
+        finally:
+            done.set()
+            await ticker_task
+            security_password.verify_password = verify_password  # type: ignore[assignment]
+
+        self.assertTrue(all(result is not None for result in results))
+        self.assertEqual(len(verify_threads), 8)
+        self.assertTrue(all(name.startswith("password-hash") for name in verify_threads))
+        self.assertEqual(security_password.password_hash_pool_stats()["completed"], completed_before + 8)
+        # Inline verification would stall the loop for ~8 verifies; half of that leaves room for a busy machine.
+        self.assertLess(max(gaps), single_verify_ms * 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import unittest
+
+import httpx
+
+import app.api.router as router_module
+from app.api.single_flight import SingleFlight
+from app.core.config import settings
+from app.pricing import UsagePricing
+from fake_proxy import FakeProxyRequest, FakeProxyRouter, mock_client_factory, proxy_context
+
+
+class SingleFlightTests(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrent_duplicates_share_one_call(self) -> None:
+        flights: SingleFlight[str] = SingleFlight()
+        calls = 0
+
+        async def call() -> str:
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.02)
+            return f"result-{calls}"
+
+        results = await asyncio.gather(*(flights.run("k", call, max_wait=5) for _ in range(5)))
+
+        self.assertEqual(calls, 1)
+        self.assertEqual([value for value, _ in results], ["result-1"] * 5)
+        self.assertEqual([shared for _, shared in results], [False, True, True, True, True])
+        self.assertEqual(len(flights), 0)
+        self.assertEqual(flights.stats()["shared"], 4)
+
+    async def test_slow_leader_lets_followers_fall_back_after_max_wait(self) -> None:
+        flights: SingleFlight[str] = SingleFlight()
+        release = asyncio.Event()
+
+        async def slow() -> str:
+            await release.wait()
+            return "slow"
+
+        async def fast() -> str:
+            return "fast"
+
+        leader = asyncio.ensure_future(flights.run("k", slow, max_wait=5))
+        await asyncio.sleep(0)
+        follower = await flights.run("k", fast, max_wait=0.01)
+        release.set()
+
+        self.assertEqual(follower, ("fast", False))
+        self.assertEqual(await leader, ("slow", False))
+        self.assertEqual(flights.stats()["fallbacks"], 1)
+
+    async def test_failed_leader_lets_followers_make_their_own_call(self) -> None:
+        flights: SingleFlight[str] = SingleFlight()
+
+        async def failing() -> str:
+            await asyncio.sleep(0.01)
+            raise httpx.ConnectError("boom")
+
+        async def ok() -> str:
+            return "ok"
+
+        leader = asyncio.ensure_future(flights.run("k", failing, max_wait=5))
+        await asyncio.sleep(0)
+        follower = await flights.run("k", ok, max_wait=5)
+
+        self.assertEqual(follower, ("ok", False))
+        with self.assertRaises(httpx.ConnectError):
+            await leader
+        self.assertEqual(len(flights), 0)
+
+
+class ChatCompletionsSingleFlightTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.upstream_calls = 0
+        self.upstream_status = 200
+        self._settings = {
+            name: getattr(settings, name) for name in ("single_flight_enabled", "single_flight_billing")
+        }
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            _ = request
+            self.upstream_calls += 1
+            await asyncio.sleep(0.05)
+            return httpx.Response(
+                self.upstream_status,
+                json={"id": f"chatcmpl-{self.upstream_calls}", "usage": {"prompt_tokens": 5, "completion_tokens": 7}},
+            )
+
+        context = proxy_context(source_ip="127.0.0.1", pricing=UsagePricing(1_000_000, 2_000_000))
+        self.proxy = FakeProxyRouter(context, mock_client_factory(handler)).install(_upstream_flights=SingleFlight())
+        self.records = self.proxy.records
+
+    def tearDown(self) -> None:
+        self.proxy.restore()
+        for name, value in self._settings.items():
+            setattr(settings, name, value)
+
+    async def _burst(
+        self, count: int, *, temperature: float | None = 0, headers: dict[str, str] | None = None
+    ) -> list[object]:
+        payload: dict[str, object] = {"model": "gpt-test", "messages": [{"role": "user", "content": "hi"}]}
+        if temperature is not None:
+            payload["temperature"] = temperature
+        body = json.dumps(payload).encode()
+        return await asyncio.gather(
+            *(
+                router_module.chat_completions(FakeProxyRequest(body, headers), object())  # type: ignore[arg-type]
+                for _ in range(count)
+            )
+        )
+
+    async def test_identical_concurrent_requests_reach_upstream_once(self) -> None:
+        settings.single_flight_enabled = True
+        settings.single_flight_billing = "each"
+
+        responses = await self._burst(4)
+
+        self.assertEqual(self.upstream_calls, 1)
+        self.assertEqual({response.body for response in responses}, {responses[0].body})
+        self.assertEqual(len(self.records), 4)
+        self.assertEqual({record["cost_usd_micros"] for record in self.records}, {19})
+        self.assertTrue(all(record["total_tokens"] == 12 for record in self.records))
+
+    async def test_leader_billing_charges_only_the_upstream_call(self) -> None:
+        settings.single_flight_enabled = True
+        settings.single_flight_billing = "leader"
+
+        await self._burst(3)
+
+        self.assertEqual(sorted(record["cost_usd_micros"] for record in self.records), [0, 0, 19])
+
+    async def test_sampled_requests_are_only_coalesced_when_opted_in(self) -> None:
+        settings.single_flight_enabled = True
+
+        await self._burst(3, temperature=0.7)
+        await self._burst(3, temperature=None)
+        self.assertEqual(self.upstream_calls, 6)
+
+        await self._burst(3, temperature=0.7, headers={"x-uni-cache": "on"})
+        self.assertEqual(self.upstream_calls, 7)
+
+    async def test_error_replies_are_not_shared(self) -> None:
+        settings.single_flight_enabled = True
+        self.upstream_status = 429
+
+        responses = await self._burst(3)
+
+        self.assertEqual(self.upstream_calls, 3)
+        self.assertEqual({response.status_code for response in responses}, {429})
+        self.assertEqual(router_module.single_flight_stats()["fallbacks"], 2)
+
+    async def test_disabled_single_flight_sends_every_request(self) -> None:
+        settings.single_flight_enabled = False
+
+        await self._burst(3)
+
+        self.assertEqual(self.upstream_calls, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,10 @@
 from __future__ import annotations
 
+import asyncio
 import unittest
 
-from app.main import _StartupMigrationConnection, create_app
+import app.main as main_module
+from app.main import _StartupMigrationConnection, _migration_checksum, create_app
 
 _ColumnMetadata = tuple[str, str, int | None, str, str | None]
 
@@ -27,12 +29,18 @@ class _FakeConnection:
         self.existing_indexes = existing_indexes or set()
         self.column_metadata = column_metadata or {}
         self.driver_sql: list[str] = []
+        self.ledger_inserts: list[dict[str, object]] = []
+        self.catalog_queries = 0
 
     async def run_sync(self, *args: object, **kwargs: object) -> object:
         return None
 
     async def execute(self, statement: object, params: dict[str, object]) -> _FakeResult:
         query = str(statement)
+        if "INSERT INTO schema_migrations" in query:
+            self.ledger_inserts.append(params)
+            return _FakeResult(None)
+        self.catalog_queries += 1
         table_name = str(params.get("table_name") or "")
         column_name = str(params.get("column_name") or "")
         index_name = str(params.get("index_name") or "")
@@ -51,6 +59,89 @@ class _FakeConnection:
         return "executed"
 
 
+class _BackfillResult:
+    def __init__(self, *, rowcount: int = 0, rows: list[tuple[object, ...]] | None = None) -> None:
+        self.rowcount = rowcount
+        self._rows = rows or []
+
+    def scalar(self) -> object:
+        return True
+
+    def first(self) -> tuple[object, ...] | None:
+        return self._rows[0] if self._rows else None
+
+    def all(self) -> list[tuple[object, ...]]:
+        return self._rows
+
+
+class _BackfillConnection:
+    def __init__(self, *, applied: list[str], rowcounts: list[int]) -> None:
+        self.applied = applied
+        self.rowcounts = rowcounts
+        self.statements: list[str] = []
+        self.params: list[dict[str, object]] = []
+
+    async def __aenter__(self) -> _BackfillConnection:
+        return self
+
+    async def __aexit__(self, *args: object) -> None:
+        return None
+
+    async def execution_options(self, **kwargs: object) -> _BackfillConnection:
+        return self
+
+    async def execute(self, statement: object, params: dict[str, object] | None = None) -> _BackfillResult:
+        query = str(statement)
+        self.statements.append(query)
+        self.params.append(params or {})
+        if query.startswith("SELECT checksum FROM schema_migrations"):
+            return _BackfillResult(rows=[(checksum,) for checksum in self.applied])
+        if query == main_module._CONTENT_GENERATION_TASK_BACKFILL:
+            return _BackfillResult(rowcount=self.rowcounts.pop(0))
+        return _BackfillResult()
+
+
+class BackgroundBackfillTests(unittest.IsolatedAsyncioTestCase):
+    async def test_content_generation_candidates_are_materialized_once(self) -> None:
+        conn = _BackfillConnection(
+            applied=[_migration_checksum(main_module._BACKGROUND_BACKFILLS[0])],
+            rowcounts=[main_module._BACKGROUND_BACKFILL_BATCH_SIZE, 3],
+        )
+        original_engine = main_module.engine
+        main_module.engine = type("_Engine", (), {"connect": lambda self: conn})()
+        try:
+            await main_module._run_background_backfills(asyncio.Event())
+        finally:
+            main_module.engine = original_engine
+
+        scans = [query for query in conn.statements if "FROM llm_usage_events" in query]
+        batches = [query for query in conn.statements if query == main_module._CONTENT_GENERATION_TASK_BACKFILL]
+        self.assertEqual(len(scans), 1)
+        self.assertTrue(scans[0].startswith("CREATE TEMP TABLE content_generation_task_backfill"))
+        self.assertEqual(len(batches), 2)
+        self.assertLess(conn.statements.index(scans[0]), conn.statements.index(batches[0]))
+        self.assertTrue(any(query.startswith("INSERT INTO schema_migrations") for query in conn.statements))
+
+
+class UsageMaintenanceTests(unittest.IsolatedAsyncioTestCase):
+    async def test_rollup_windows_start_on_bucket_boundaries(self) -> None:
+        conn = _BackfillConnection(applied=[], rowcounts=[])
+        original_engine = main_module.engine
+        main_module.engine = type("_Engine", (), {"connect": lambda self: conn})()
+        try:
+            await main_module._run_usage_table_maintenance_once()
+        finally:
+            main_module.engine = original_engine
+
+        rollups = [params for query, params in zip(conn.statements, conn.params) if "WITH rollup AS" in query]
+        self.assertEqual(len(rollups), 2)
+        hourly_cutoff = rollups[0]["hourly_cutoff"]
+        availability_cutoff = rollups[1]["availability_cutoff"]
+        self.assertEqual((hourly_cutoff.minute, hourly_cutoff.second, hourly_cutoff.microsecond), (0, 0, 0))
+        self.assertEqual(availability_cutoff.minute % 30, 0)
+        self.assertEqual((availability_cutoff.second, availability_cutoff.microsecond), (0, 0))
+
+
 class StartupMigrationTests(unittest.IsolatedAsyncioTestCase):
     async def test_existing_add_column_if_not_exists_is_skipped_before_postgres_lock(self) -> None:
         raw = _FakeConnection(existing_columns={("users", "balance")})
@@ -196,6 +287,61 @@ class StartupMigrationTests(unittest.IsolatedAsyncioTestCase):
         self.assertIsNone(result)
         self.assertEqual(raw.driver_sql, [])
 
+    async def test_ledger_skips_applied_steps_without_catalog_queries(self) -> None:
+        statement = "ALTER TABLE IF EXISTS users ADD COLUMN IF NOT EXISTS banned_at timestamptz"
+        raw = _FakeConnection()
+        conn = _StartupMigrationConnection(raw, applied={_migration_checksum(statement)})
+
+        result = await conn.exec_driver_sql(statement)
+
+        self.assertIsNone(result)
+        self.assertEqual(raw.driver_sql, [])
+        self.assertEqual(raw.catalog_queries, 0)
+        self.assertEqual(raw.ledger_inserts, [])
+
+    async def test_ledger_records_new_steps_in_order(self) -> None:
+        first = "UPDATE organizations SET registration_enabled = true WHERE registration_enabled IS NULL"
+        second = "CREATE INDEX IF NOT EXISTS ix_users_invited_by_user_id ON users(invited_by_user_id)"
+        raw = _FakeConnection(existing_indexes={"ix_users_invited_by_user_id"})
+        applied: set[str] = set()
+        conn = _StartupMigrationConnection(raw, applied=applied)
+
+        await conn.exec_driver_sql(first)
+        await conn.exec_driver_sql(second)
+        await conn.exec_driver_sql(first)
+
+        self.assertEqual(raw.driver_sql, [first])
+        self.assertEqual(
+            [(row["checksum"], row["position"]) for row in raw.ledger_inserts],
+            [(_migration_checksum(first), 1), (_migration_checksum(second), 2)],
+        )
+        self.assertEqual(applied, {_migration_checksum(first), _migration_checksum(second)})
+
+    async def test_usage_total_backfill_is_never_recorded_in_ledger(self) -> None:
+        raw = _FakeConnection()
+        conn = _StartupMigrationConnection(raw, applied=set())
+
+        await conn.exec_driver_sql(
+            "WITH sums AS ("
+            "  SELECT user_id, COALESCE(SUM(cost_usd_micros), 0) AS cost_micros "
+            "  FROM llm_usage_events "
+            "  GROUP BY user_id"
+            ") "
+            "UPDATE users u "
+            "SET spend_usd_micros_total = sums.cost_micros "
+            "FROM sums "
+            "WHERE u.id = sums.user_id"
+        )
+
+        self.assertEqual(raw.driver_sql, [])
+        self.assertEqual(raw.ledger_inserts, [])
+
+    def test_checksum_ignores_whitespace_layout(self) -> None:
+        self.assertEqual(
+            _migration_checksum("ALTER TABLE users\n  ADD COLUMN x int"),
+            _migration_checksum("ALTER TABLE users ADD COLUMN x int"),
+        )
+
     def test_healthz_route_is_registered_without_api_prefix(self) -> None:
         app = create_app()
         paths = {route.path for route in app.routes}
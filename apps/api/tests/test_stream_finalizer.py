@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import asyncio
+import unittest
+
+from app.api import stream_finalizer
+from app.core.config import settings
+
+
+class StreamFinalizerTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self._workers = settings.stream_finalizer_workers
+        self._stats = dict(stream_finalizer._STATS)
+        settings.stream_finalizer_workers = 2
+
+    def tearDown(self) -> None:
+        settings.stream_finalizer_workers = self._workers
+        stream_finalizer._STATS.update(self._stats)
+
+    async def test_pool_bounds_concurrent_finalizations(self) -> None:
+        stop = asyncio.Event()
+        pool = asyncio.create_task(stream_finalizer.run_stream_finalizer(stop))
+        await asyncio.sleep(0)
+        active = 0
+        peak = 0
+        done: list[int] = []
+
+        def job(index: int):
+            async def finalize() -> None:
+                nonlocal active, peak
+                active += 1
+                peak = max(peak, active)
+                await asyncio.sleep(0.01)
+                active -= 1
+                done.append(index)
+
+            return finalize
+
+        for index in range(10):
+            stream_finalizer.submit_stream_finalization(job(index))
+        stats = stream_finalizer.stream_finalizer_stats()
+        self.assertEqual(stats["workers"], 2)
+        self.assertEqual(stats["pending"], 10)
+
+        stop.set()
+        await asyncio.wait_for(pool, timeout=5)
+
+        self.assertEqual(sorted(done), list(range(10)))
+        self.assertEqual(peak, 2)
+        self.assertEqual(stream_finalizer.stream_finalizer_stats()["pending"], 0)
+
+    async def test_failed_finalization_does_not_stop_the_worker(self) -> None:
+        stop = asyncio.Event()
+        pool = asyncio.create_task(stream_finalizer.run_stream_finalizer(stop))
+        await asyncio.sleep(0)
+        done: list[str] = []
+        failed_before = stream_finalizer._STATS["failed"]
+
+        async def broken() -> None:
+            raise RuntimeError("db down")
+
+        async def fine() -> None:
+            done.append("ok")
+
+        stream_finalizer.submit_stream_finalization(broken)
+        stream_finalizer.submit_stream_finalization(fine)
+        stop.set()
+        await asyncio.wait_for(pool, timeout=5)
+
+        self.assertEqual(done, ["ok"])
+        self.assertEqual(stream_finalizer._STATS["failed"], failed_before + 1)
+
+    async def test_shutdown_deadline_abandons_stuck_finalizations(self) -> None:
+        stop = asyncio.Event()
+        pool = asyncio.create_task(stream_finalizer.run_stream_finalizer(stop))
+        await asyncio.sleep(0)
+        abandoned_before = stream_finalizer._STATS["abandoned"]
+
+        async def stuck() -> None:
+            await asyncio.sleep(30)
+
+        for _ in range(3):
+            stream_finalizer.submit_stream_finalization(stuck)
+        stop.set()
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(pool, timeout=0.2)
+
+        stats = stream_finalizer.stream_finalizer_stats()
+        self.assertEqual(stats["pending"], 0)
+        self.assertEqual(stats["inFlight"], 0)
+        self.assertEqual(stats["workers"], 0)
+        self.assertEqual(stream_finalizer._STATS["abandoned"], abandoned_before + 3)
+
+    async def test_finalizations_run_without_a_pool(self) -> None:
+        done = asyncio.Event()
+
+        async def finalize() -> None:
+            done.set()
+
+        stream_finalizer.submit_stream_finalization(finalize)
+        await asyncio.wait_for(done.wait(), timeout=1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,233 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import unittest
+import uuid
+
+import httpx
+
+import app.api.router as router_module
+import app.api.stream_hedging as stream_hedging
+from app.api.llm_proxy import UpstreamTarget
+from app.core.config import settings
+from fake_proxy import FakeProxyRequest, FakeProxyRouter, proxy_context
+
+_AsyncClient = httpx.AsyncClient
+
+PRIMARY = UpstreamTarget(channel_id=uuid.uuid4(), base_url="https://primary.example/v1", api_key="k1")
+ALTERNATE = UpstreamTarget(channel_id=uuid.uuid4(), base_url="https://alternate.example/v1", api_key="k2")
+
+
+def _sse(content: str, tokens: int) -> bytes:
+    payload = {"choices": [{"delta": {"content": content}}], "usage": {"prompt_tokens": tokens, "completion_tokens": 1}}
+    return f"data: {json.dumps(payload)}\n\n".encode()
+
+
+class _Body(httpx.AsyncByteStream):
+    def __init__(self, chunks: list[bytes], first_byte_delay: float) -> None:
+        self.chunks = chunks
+        self.first_byte_delay = first_byte_delay
+        self.closed = False
+
+    async def __aiter__(self):
+        await asyncio.sleep(self.first_byte_delay)
+        for chunk in self.chunks:
+            yield chunk
+
+    async def aclose(self) -> None:
+        self.closed = True
+
+
+class _Upstreams:
+    """Both channels answer headers at once; `delays` sets how long each waits before the first byte."""
+
+    def __init__(self, delays: dict[str, float]) -> None:
+        self.delays = delays
+        self.bodies: dict[str, _Body] = {}
+        self.auth: dict[str, str] = {}
+
+    def _handle(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        self.auth[host] = request.headers.get("authorization", "")
+        body = _Body([_sse(host, 3 if host.startswith("primary") else 4)], self.delays[host])
+        self.bodies[host] = body
+        return httpx.Response(200, headers={"content-type": "text/event-stream"}, stream=body)
+
+    def __call__(self, *, timeout: object) -> httpx.AsyncClient:
+        return _AsyncClient(transport=httpx.MockTransport(self._handle), timeout=timeout)
+
+
+def _build(client: httpx.AsyncClient, target: UpstreamTarget) -> httpx.Request:
+    return client.build_request(
+        "POST", f"{target.base_url}/chat/completions", headers={"authorization": f"Bearer {target.api_key}"}
+    )
+
+
+class HedgeDeadlineTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self._samples = dict(stream_hedging._TTFT_SAMPLES)
+        stream_hedging._TTFT_SAMPLES.clear()
+
+    def tearDown(self) -> None:
+        stream_hedging._TTFT_SAMPLES.clear()
+        stream_hedging._TTFT_SAMPLES.update(self._samples)
+
+    def test_configured_deadline_wins(self) -> None:
+        self.assertEqual(stream_hedging.hedge_deadline_ms("m", 1234), 1234)
+
+    def test_default_deadline_until_history_is_long_enough(self) -> None:
+        for _ in range(stream_hedging.TTFT_MIN_SAMPLES - 1):
+            stream_hedging.observe_stream_ttft("m", 100)
+        self.assertEqual(stream_hedging.hedge_deadline_ms("m", None), settings.stream_hedging_default_ttft_ms)
+
+    def test_learned_deadline_is_p95_clamped(self) -> None:
+        for value in range(1, 101):
+            stream_hedging.observe_stream_ttft("m", value * 10)
+        self.assertEqual(stream_hedging.learned_ttft_p95_ms("m"), 950)
+        self.assertEqual(stream_hedging.hedge_deadline_ms("m", None), max(950, settings.stream_hedging_min_ttft_ms))
+
+        for _ in range(stream_hedging.TTFT_SAMPLE_WINDOW):
+            stream_hedging.observe_stream_ttft("slow", 120_000)
+        self.assertEqual(stream_hedging.hedge_deadline_ms("slow", None), settings.stream_hedging_max_ttft_ms)
+
+
+class OpenHedgedStreamTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self._original_async_client = httpx.AsyncClient
+        self._stats = dict(stream_hedging._STATS)
+        self._recent = list(stream_hedging._RECENT_HEDGES)
+        self._max_hedge_percent = settings.stream_hedging_max_hedge_percent
+        stream_hedging._RECENT_HEDGES.clear()
+
+    def tearDown(self) -> None:
+        httpx.AsyncClient = self._original_async_client  # type: ignore[misc]
+        stream_hedging._STATS.update(self._stats)
+        stream_hedging._RECENT_HEDGES.clear()
+        stream_hedging._RECENT_HEDGES.extend(self._recent)
+        settings.stream_hedging_max_hedge_percent = self._max_hedge_percent
+
+    async def test_slow_first_byte_is_hedged_and_the_loser_closed(self) -> None:
+        upstreams = _Upstreams({"primary.example": 5, "alternate.example": 0})
+        httpx.AsyncClient = upstreams  # type: ignore[misc,assignment]
+        before = dict(stream_hedging._STATS)
+
+        attempt = await asyncio.wait_for(
+            stream_hedging.open_hedged_stream(
+                PRIMARY, (ALTERNATE,), build_request=_build, timeout=httpx.Timeout(10.0), deadline_ms=50
+            ),
+            timeout=2,
+        )
+        chunks = [chunk async for chunk in attempt.chunks]
+        await attempt.aclose()
+
+        self.assertIs(attempt.target, ALTERNATE)
+        self.assertEqual(upstreams.auth["alternate.example"], "Bearer k2")
+        self.assertIn(b"alternate.example", b"".join(chunks))
+        self.assertTrue(upstreams.bodies["primary.example"].closed)
+        self.assertEqual(stream_hedging._STATS["hedged"], before["hedged"] + 1)
+        self.assertEqual(stream_hedging._STATS["hedgeWins"], before["hedgeWins"] + 1)
+
+    async def test_fast_primary_is_not_hedged(self) -> None:
+        upstreams = _Upstreams({"primary.example": 0, "alternate.example": 0})
+        httpx.AsyncClient = upstreams  # type: ignore[misc,assignment]
+        before = dict(stream_hedging._STATS)
+
+        attempt = await stream_hedging.open_hedged_stream(
+            PRIMARY, (ALTERNATE,), build_request=_build, timeout=httpx.Timeout(10.0), deadline_ms=500
+        )
+        await attempt.aclose()
+
+        self.assertIs(attempt.target, PRIMARY)
+        self.assertNotIn("alternate.example", upstreams.bodies)
+        self.assertEqual(stream_hedging._STATS["hedged"], before["hedged"])
+        self.assertEqual(stream_hedging._STATS["streams"], before["streams"] + 1)
+
+    async def test_hedge_key_is_picked_only_when_the_hedge_starts(self) -> None:
+        picks: list[str] = []
+
+        def pick() -> str:
+            picks.append("k-picked")
+            return "k-picked"
+
+        lazy = UpstreamTarget(
+            channel_id=ALTERNATE.channel_id, base_url=ALTERNATE.base_url, api_key="", pick_api_key=pick
+        )
+        fast = _Upstreams({"primary.example": 0, "alternate.example": 0})
+        httpx.AsyncClient = fast  # type: ignore[misc,assignment]
+        attempt = await stream_hedging.open_hedged_stream(
+            PRIMARY, (lazy,), build_request=_build, timeout=httpx.Timeout(10.0), deadline_ms=500
+        )
+        await attempt.aclose()
+        self.assertEqual(picks, [])
+
+        slow = _Upstreams({"primary.example": 5, "alternate.example": 0})
+        httpx.AsyncClient = slow  # type: ignore[misc,assignment]
+        attempt = await asyncio.wait_for(
+            stream_hedging.open_hedged_stream(
+                PRIMARY, (lazy,), build_request=_build, timeout=httpx.Timeout(10.0), deadline_ms=50
+            ),
+            timeout=2,
+        )
+        await attempt.aclose()
+
+        self.assertEqual(picks, ["k-picked"])
+        self.assertEqual(attempt.target.api_key, "k-picked")
+        self.assertEqual(slow.auth["alternate.example"], "Bearer k-picked")
+
+    async def test_hedging_stops_once_the_budget_is_spent(self) -> None:
+        upstreams = _Upstreams({"primary.example": 0.2, "alternate.example": 0})
+        httpx.AsyncClient = upstreams  # type: ignore[misc,assignment]
+        settings.stream_hedging_max_hedge_percent = 1
+        stream_hedging._RECENT_HEDGES.extend([True, True])
+        before = dict(stream_hedging._STATS)
+
+        attempt = await asyncio.wait_for(
+            stream_hedging.open_hedged_stream(
+                PRIMARY, (ALTERNATE,), build_request=_build, timeout=httpx.Timeout(10.0), deadline_ms=20
+            ),
+            timeout=2,
+        )
+        await attempt.aclose()
+
+        self.assertIs(attempt.target, PRIMARY)
+        self.assertNotIn("alternate.example", upstreams.bodies)
+        self.assertEqual(stream_hedging._STATS["hedged"], before["hedged"])
+        self.assertEqual(stream_hedging._STATS["hedgesOverBudget"], before["hedgesOverBudget"] + 1)
+
+
+class ChatCompletionsHedgingTests(unittest.IsolatedAsyncioTestCase):
+    async def test_only_the_winning_attempt_is_billed(self) -> None:
+        context = proxy_context(
+            upstream_base_url=PRIMARY.base_url,
+            upstream_api_key=PRIMARY.api_key,
+            channel_id=PRIMARY.channel_id,
+            hedge_targets=(ALTERNATE,),
+            hedge_ttft_ms=50,
+        )
+        upstreams = _Upstreams({"primary.example": 5, "alternate.example": 0})
+        finalizations: list[object] = []
+        proxy = FakeProxyRouter(context, upstreams).install(submit_stream_finalization=finalizations.append)
+        try:
+            body = json.dumps({"model": "gpt-test", "messages": [], "stream": True}).encode()
+            response = await asyncio.wait_for(
+                router_module.chat_completions(FakeProxyRequest(body), object()),  # type: ignore[arg-type]
+                timeout=2,
+            )
+            streamed = b"".join([chunk async for chunk in response.body_iterator])
+            for finalize in finalizations:
+                await finalize()  # type: ignore[operator]
+        finally:
+            proxy.restore()
+
+        records = proxy.records
+        self.assertIn(b"alternate.example", streamed)
+        self.assertTrue(upstreams.bodies["primary.example"].closed)
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]["status_code"], 200)
+        self.assertEqual(records[0]["input_tokens"], 4)
+        self.assertEqual(records[0]["channel_id"], ALTERNATE.channel_id)
+
+
+if __name__ == "__main__":
+    unittest.main()
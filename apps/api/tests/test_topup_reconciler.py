@@ -0,0 +1,232 @@
+from __future__ import annotations
+
+import datetime as dt
+import types
+import unittest
+import uuid
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+import app.api.router as router_module
+from app.core.zhupay import ZhupayError
+from app.models.billing_topup import BillingTopup
+from app.storage import topup_reconciler
+
+
+class _ScalarResult:
+    def __init__(self, value: object) -> None:
+        self._value = value
+
+    def scalar_one_or_none(self) -> object:
+        return self._value
+
+
+class _FakeSession:
+    def __init__(self, topup: BillingTopup) -> None:
+        self.topup = topup
+        self.commits = 0
+
+    async def __aenter__(self) -> "_FakeSession":
+        return self
+
+    async def __aexit__(self, *exc: object) -> None:
+        return None
+
+    async def execute(self, statement: object) -> _ScalarResult:
+        _ = statement
+        return _ScalarResult(self.topup)
+
+    async def commit(self) -> None:
+        self.commits += 1
+
+
+def _build_topup(**overrides: object) -> BillingTopup:
+    values: dict[str, object] = {
+        "id": uuid.uuid4(),
+        "org_id": uuid.uuid4(),
+        "user_id": uuid.uuid4(),
+        "request_id": f"topup_{uuid.uuid4().hex}",
+        "units": 10,
+        "status": "pending",
+        "provider": "zhupay",
+        "currency": "CNY",
+        "amount_total_cents": 7200,
+        "reconcile_attempts": 0,
+    }
+    values.update(overrides)
+    return BillingTopup(**values)
+
+
+def _remote(status: int, *, money_cents: int | None = 7200) -> object:
+    return types.SimpleNamespace(
+        trade_no="T1",
+        api_trade_no="A1",
+        buyer=None,
+        money_cents=money_cents,
+        payment_type="alipay",
+        status=status,
+    )
+
+
+class ReconcileScheduleTests(unittest.TestCase):
+    def test_backoff_starts_fast_and_caps(self) -> None:
+        delays = [topup_reconciler.next_reconcile_delay_seconds(attempt) for attempt in range(20)]
+        self.assertEqual(delays[0], 5)
+        self.assertEqual(delays, sorted(delays))
+        self.assertEqual(delays[-1], topup_reconciler.RECONCILE_BACKOFF_SECONDS[-1])
+
+
+class ReconcileTopupTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self._originals = {
+            name: getattr(topup_reconciler, name)
+            for name in (
+                "SessionLocal",
+                "zhupay_is_configured",
+                "zhupay_query_order",
+                "complete_billing_topup",
+                "set_billing_topup_status",
+            )
+        }
+        topup_reconciler.zhupay_is_configured = lambda: True
+
+    def tearDown(self) -> None:
+        for name, value in self._originals.items():
+            setattr(topup_reconciler, name, value)
+
+    async def test_still_pending_topup_is_rescheduled_with_backoff(self) -> None:
+        topup = _build_topup(checkout_id="T1", order_id="A1", reconcile_attempts=3)
+        session = _FakeSession(topup)
+        calls: list[str] = []
+
+        async def fake_query_order(*, out_trade_no: str) -> object:
+            calls.append(out_trade_no)
+            return _remote(0)
+
+        topup_reconciler.SessionLocal = lambda: session  # type: ignore[assignment]
+        topup_reconciler.zhupay_query_order = fake_query_order
+        before = dt.datetime.now(dt.timezone.utc)
+
+        await topup_reconciler.reconcile_topup(topup.request_id)
+
+        self.assertEqual(calls, [topup.request_id])
+        self.assertEqual(topup.reconcile_attempts, 4)
+        self.assertEqual(session.commits, 1)
+        delay = (topup.next_reconcile_at - before).total_seconds()
+        self.assertGreaterEqual(delay, topup_reconciler.next_reconcile_delay_seconds(4))
+        self.assertLess(delay, topup_reconciler.next_reconcile_delay_seconds(4) + 5)
+
+    async def test_provider_errors_still_advance_the_schedule(self) -> None:
+        topup = _build_topup()
+        session = _FakeSession(topup)
+
+        async def failing_query_order(*, out_trade_no: str) -> object:
+            raise ZhupayError("timeout")
+
+        topup_reconciler.SessionLocal = lambda: session  # type: ignore[assignment]
+        topup_reconciler.zhupay_query_order = failing_query_order
+
+        await topup_reconciler.reconcile_topup(topup.request_id)
+
+        self.assertEqual(topup.status, "pending")
+        self.assertEqual(topup.reconcile_attempts, 1)
+        self.assertIsNotNone(topup.next_reconcile_at)
+
+    async def test_paid_order_completes_topup(self) -> None:
+        topup = _build_topup()
+        session = _FakeSession(topup)
+        completed: list[dict[str, object]] = []
+
+        async def fake_query_order(*, out_trade_no: str) -> object:
+            return _remote(1)
+
+        async def fake_complete(session_arg: object, **kwargs: object) -> BillingTopup:
+            _ = session_arg
+            completed.append(kwargs)
+            topup.status = "completed"
+            return topup
+
+        topup_reconciler.SessionLocal = lambda: session  # type: ignore[assignment]
+        topup_reconciler.zhupay_query_order = fake_query_order
+        topup_reconciler.complete_billing_topup = fake_complete
+
+        await topup_reconciler.reconcile_topup(topup.request_id)
+
+        self.assertEqual(len(completed), 1)
+        self.assertEqual(completed[0]["request_id"], topup.request_id)
+        self.assertEqual(completed[0]["amount_total_cents"], 7200)
+        self.assertEqual(topup.reconcile_attempts, 0)
+        self.assertEqual(session.commits, 0)
+
+
+class _SyncSession:
+    def __init__(self, session: Session) -> None:
+        self.session = session
+
+    async def execute(self, statement: object) -> object:
+        return self.session.execute(statement)  # type: ignore[call-overload]
+
+
+class DueTopupTests(unittest.IsolatedAsyncioTestCase):
+    async def test_legacy_cny_topups_without_provider_are_reconciled(self) -> None:
+        engine = create_engine("sqlite://")
+        BillingTopup.__table__.create(engine)
+        now = dt.datetime.now(dt.timezone.utc)
+        topups = {
+            "zhupay": _build_topup(),
+            "legacy": _build_topup(provider=None),
+            "blank": _build_topup(provider=""),
+            "legacy_usd": _build_topup(provider=None, currency="USD"),
+            "creem": _build_topup(provider="creem", currency="USD"),
+        }
+        expected = sorted(topups[name].request_id for name in ("zhupay", "legacy", "blank"))
+        try:
+            with Session(engine) as session:
+                session.add_all(topups.values())
+                session.commit()
+                due = await topup_reconciler._due_topup_ids(
+                    _SyncSession(session),  # type: ignore[arg-type]
+                    now=now + dt.timedelta(seconds=1),
+                    limit=10,
+                )
+        finally:
+            engine.dispose()
+
+        self.assertEqual(sorted(due), expected)
+
+
+class TopupStatusEndpointTests(unittest.IsolatedAsyncioTestCase):
+    async def test_status_poll_is_a_database_read(self) -> None:
+        topup = _build_topup()
+        user = types.SimpleNamespace(id=topup.user_id)
+        membership = types.SimpleNamespace(org_id=topup.org_id)
+        original_get = router_module.get_billing_topup_for_user
+        original_query = topup_reconciler.zhupay_query_order
+
+        async def fake_get(session_arg: object, **kwargs: object) -> BillingTopup:
+            _ = session_arg, kwargs
+            return topup
+
+        async def unexpected_query(*, out_trade_no: str) -> object:
+            raise AssertionError("status polling must not query the provider")
+
+        router_module.get_billing_topup_for_user = fake_get
+        topup_reconciler.zhupay_query_order = unexpected_query
+        try:
+            out = await router_module.billing_topup_status(
+                request_id=topup.request_id,
+                request_id_alt=None,
+                session=object(),  # type: ignore[arg-type]
+                current_user=user,
+                membership=membership,
+            )
+        finally:
+            router_module.get_billing_topup_for_user = original_get
+            topup_reconciler.zhupay_query_order = original_query
+
+        self.assertEqual(out, {"requestId": topup.request_id, "status": "pending", "units": 10})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import json
+import types
+import unittest
+import uuid
+
+import httpx
+
+import app.api.router as router_module
+import app.upstream_keys as upstream_keys_module
+from app.core.config import settings
+from app.pricing import UsagePricing
+from app.upstream_keys import UpstreamKeyPool, parse_retry_after_seconds
+from fake_proxy import FakeProxyRequest, FakeProxyRouter, mock_client_factory, proxy_context
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 1_800_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class UpstreamKeyPoolTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.clock = _Clock()
+        self.pool = UpstreamKeyPool(clock=self.clock)
+        self.channel_id = uuid.uuid4()
+        self.keys = ["sk-key-a", "sk-key-b", "sk-key-c"]
+
+    def test_round_robin_spreads_requests_across_keys(self) -> None:
+        picks = [self.pool.pick(self.channel_id, self.keys) for _ in range(6)]
+
+        self.assertEqual(picks, self.keys * 2)
+        self.assertEqual([state["requests"] for state in self.pool.health(self.channel_id, self.keys)], [2, 2, 2])
+
+    def test_rate_limited_key_cools_down_for_retry_after(self) -> None:
+        self.pool.observe(self.channel_id, "sk-key-a", status_code=429, headers={"Retry-After": "20"})
+
+        picks = [self.pool.pick(self.channel_id, self.keys) for _ in range(4)]
+        self.assertNotIn("sk-key-a", picks)
+        health = self.pool.health(self.channel_id, self.keys)
+        self.assertFalse(health[0]["healthy"])
+        self.assertEqual(health[0]["rateLimited"], 1)
+
+        self.clock.now += 21
+        self.assertTrue(self.pool.health(self.channel_id, self.keys)[0]["healthy"])
+        self.assertIn("sk-key-a", [self.pool.pick(self.channel_id, self.keys) for _ in range(3)])
+
+    def test_missing_retry_after_uses_default_and_large_values_are_capped(self) -> None:
+        self.pool.observe(self.channel_id, "sk-key-a", status_code=429)
+        self.pool.observe(self.channel_id, "sk-key-b", status_code=429, headers={"retry-after": "86400"})
+        self.pool.observe(self.channel_id, "sk-key-c", status_code=500, headers={"retry-after": "60"})
+
+        self.clock.now += settings.upstream_key_cooldown_seconds + 1
+        health = self.pool.health(self.channel_id, self.keys)
+        self.assertTrue(health[0]["healthy"])
+        self.assertFalse(health[1]["healthy"])
+        self.assertTrue(health[2]["healthy"])
+        self.clock.now += settings.upstream_key_max_cooldown_seconds
+        self.assertTrue(self.pool.health(self.channel_id, self.keys)[1]["healthy"])
+
+    def test_all_keys_cooling_down_picks_the_one_ready_first(self) -> None:
+        self.pool.observe(self.channel_id, "sk-key-a", status_code=429, headers={"retry-after": "30"})
+        self.pool.observe(self.channel_id, "sk-key-b", status_code=429, headers={"retry-after": "5"})
+        self.pool.observe(self.channel_id, "sk-key-c", status_code=429, headers={"retry-after": "60"})
+
+        self.assertEqual(self.pool.pick(self.channel_id, self.keys), "sk-key-b")
+
+    def test_least_recently_limited_prefers_keys_never_limited(self) -> None:
+        self.pool.observe(self.channel_id, "sk-key-a", status_code=429, headers={"retry-after": "1"})
+        self.clock.now += 1
+        self.pool.observe(self.channel_id, "sk-key-c", status_code=429, headers={"retry-after": "1"})
+        self.clock.now += 5
+
+        picks = [self.pool.pick(self.channel_id, self.keys, strategy="least_recently_limited") for _ in range(3)]
+
+        self.assertEqual(picks, ["sk-key-b", "sk-key-b", "sk-key-b"])
+        self.pool.observe(self.channel_id, "sk-key-b", status_code=429, headers={"retry-after": "0"})
+        self.assertEqual(self.pool.pick(self.channel_id, self.keys, strategy="least_recently_limited"), "sk-key-a")
+
+    def test_retry_after_accepts_http_dates(self) -> None:
+        now = 1_800_000_000.0
+        self.assertEqual(parse_retry_after_seconds("Fri, 15 Jan 2027 08:00:10 GMT", now=now), 10.0)
+        self.assertIsNone(parse_retry_after_seconds("soon", now=now))
+        self.assertIsNone(parse_retry_after_seconds(None, now=now))
+
+
+class ChatCompletionsKeyCooldownTests(unittest.IsolatedAsyncioTestCase):
+    async def test_upstream_429_cools_down_the_key_that_was_used(self) -> None:
+        channel_id = uuid.uuid4()
+        context = proxy_context(upstream_api_key="sk-key-b", channel_id=channel_id)
+        pool = UpstreamKeyPool()
+        original_pool = upstream_keys_module._pool
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(429, headers={"retry-after": "120"}, json={"error": {"message": "slow down"}})
+
+        proxy = FakeProxyRouter(context, mock_client_factory(handler)).install()
+        upstream_keys_module._pool = pool
+        try:
+            body = json.dumps({"model": "gpt-test", "messages": []}).encode()
+            response = await router_module.chat_completions(FakeProxyRequest(body), object())  # type: ignore[arg-type]
+        finally:
+            proxy.restore()
+            upstream_keys_module._pool = original_pool
+
+        self.assertEqual(response.status_code, 429)
+        health = pool.health(channel_id, ["sk-key-a", "sk-key-b"])
+        self.assertTrue(health[0]["healthy"])
+        self.assertFalse(health[1]["healthy"])
+        self.assertEqual(pool.pick(channel_id, ["sk-key-a", "sk-key-b"]), "sk-key-a")
+
+
+class _Session:
+    async def close(self) -> None:
+        return None
+
+
+class ResolveContextKeyTests(unittest.IsolatedAsyncioTestCase):
+    async def test_content_generation_keeps_the_primary_key_of_a_pooled_channel(self) -> None:
+        channel = types.SimpleNamespace(
+            id=uuid.uuid4(),
+            base_url="https://upstream.example/v1",
+            api_key="sk-primary",
+            extra_api_keys=["sk-extra-a", "sk-extra-b"],
+            key_rotation="round_robin",
+        )
+        user = types.SimpleNamespace(
+            id=uuid.uuid4(), balance=100, spend_usd_micros_total=0, email="a@example.com", group_name="default"
+        )
+        names = (
+            "authenticate_api_key",
+            "_require_default_membership",
+            "get_model_config",
+            "_eligible_channels_for_model",
+            "resolve_usage_pricing",
+            "_enforce_proxy_rate_limits",
+        )
+        originals = {name: getattr(router_module, name) for name in names}
+        original_pool = upstream_keys_module._pool
+
+        async def fake_auth(session: object, *, authorization: str | None) -> tuple[object, object]:
+            return types.SimpleNamespace(id=uuid.uuid4()), user
+
+        async def fake_membership(session: object, *, user_id: uuid.UUID) -> object:
+            return types.SimpleNamespace(org_id=uuid.uuid4(), role="developer")
+
+        async def fake_none(*args: object, **kwargs: object) -> None:
+            return None
+
+        async def fake_channels(session: object, **kwargs: object) -> list[object]:
+            return [channel]
+
+        async def fake_pricing(session: object, **kwargs: object) -> UsagePricing:
+            return UsagePricing(None, None)
+
+        router_module.authenticate_api_key = fake_auth
+        router_module._require_default_membership = fake_membership
+        router_module.get_model_config = fake_none
+        router_module._eligible_channels_for_model = fake_channels
+        router_module.resolve_usage_pricing = fake_pricing
+        router_module._enforce_proxy_rate_limits = fake_none
+        upstream_keys_module._pool = UpstreamKeyPool()
+        try:
+            request = FakeProxyRequest()
+            pinned = [
+                (
+                    await router_module._resolve_llm_proxy_context(
+                        request, _Session(), model_id="seedance", rotate_api_key=False  # type: ignore[arg-type]
+                    )
+                ).upstream_api_key
+                for _ in range(3)
+            ]
+            rotated = [
+                (
+                    await router_module._resolve_llm_proxy_context(
+                        request, _Session(), model_id="gpt-test"  # type: ignore[arg-type]
+                    )
+                ).upstream_api_key
+                for _ in range(3)
+            ]
+        finally:
+            for name, value in originals.items():
+                setattr(router_module, name, value)
+            upstream_keys_module._pool = original_pool
+
+        self.assertEqual(pinned, ["sk-primary"] * 3)
+        self.assertEqual(rotated, ["sk-primary", "sk-extra-a", "sk-extra-b"])
+
+
+if __name__ == "__main__":
+    unittest.main()
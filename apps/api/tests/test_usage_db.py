@@ -143,6 +143,30 @@ class RecordUsageEventTests(unittest.IsolatedAsyncioTestCase):
         self.assertTrue(any("RETURNING" in text.upper() for text in session.executed))
         self.assertTrue(any("llm_usage_hourly_stats" in text for text in session.executed))
         self.assertTrue(any("ON CONFLICT" in text.upper() for text in session.executed))
+        self.assertTrue(any("llm_model_availability_stats" in text for text in session.executed))
+
+    async def test_client_errors_do_not_touch_availability_rollup(self) -> None:
+        user = User(
+            id=uuid.uuid4(),
+            email="bob@example.com",
+            password_hash="hash",
+            balance=0,
+            spend_usd_micros_total=0,
+            first_api_call_at=dt.datetime.now(dt.timezone.utc),
+        )
+        session = _FakeSession(user=user)
+
+        await usage_db.record_usage_event(
+            session,  # type: ignore[arg-type]
+            org_id=uuid.uuid4(),
+            user_id=user.id,
+            model_id="gpt-4.1",
+            ok=False,
+            status_code=429,
+        )
+
+        self.assertTrue(any("llm_usage_hourly_stats" in text for text in session.executed))
+        self.assertFalse(any("llm_model_availability_stats" in text for text in session.executed))
 
 
 class ListUsageEventsTests(unittest.IsolatedAsyncioTestCase):
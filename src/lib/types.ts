@@ -175,6 +175,8 @@ export interface LlmChannelItem {
   baseUrl: string;
   apiKeyMasked: string;
   allowGroups: string[];
+  models: string[];
+  modelPrefixes: string[];
   createdAt: string;
   updatedAt: string;
 }
@@ -188,6 +190,8 @@ export interface LlmChannelCreateRequest {
   baseUrl: string;
   apiKey: string;
   allowGroups: string[];
+  models?: string[];
+  modelPrefixes?: string[];
 }
 
 export interface LlmChannelCreateResponse {
@@ -199,6 +203,8 @@ export interface LlmChannelUpdateRequest {
   baseUrl?: string;
   apiKey?: string;
   allowGroups?: string[];
+  models?: string[];
+  modelPrefixes?: string[];
 }
 
 export interface LlmChannelUpdateResponse {